@@ -0,0 +1,234 @@
+"""
+Bas2Prg tokenizer benchmark and regression check.
+
+Converts the `resources/examples` corpus and a set of large synthetic programs
+with the lexer-based tokenizer and with a reference implementation of the
+original character loop and linear C `gettoken` scan. Every conversion must be byte-identical;
+throughput is reported in lines/sec for both engines.
+
+The edit latency section changes three lines of growing synthetic programs
+and compares a cold convert() with convert_delta() on a warm converter.
+
+Usage:
+    python benchmarks/bench_bas2prg.py [--repeat N] [--lines N]
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.bas2prg import Bas2Prg, TOKENS, line_changes
+from utils.c64_petscii import private_use_to_byte, macro_to_bytes
+
+EXAMPLES_DIR = Path(__file__).parent.parent / "resources" / "examples"
+
+OPTION_NAMES = ("invert_case", "auto_number", "trim_spaces", "collapse_spaces")
+
+
+class LinearScanBas2Prg(Bas2Prg):
+    """
+    Reference converter: the original per-character tokenizer, walking all 128
+    TOKENS on a fresh slice per character.
+    """
+
+    def _get_token(self, text, pos=0):
+        text_slice = text[pos:]
+        for index, token_str in enumerate(TOKENS):
+            if text_slice.startswith(token_str):
+                return (index + 128), len(token_str)
+        return None, 0
+
+    def _tokenize_line(self, content):
+        """The original character loop: tries a token at every position outside strings and REM."""
+        output = bytearray()
+        i = 0
+        length = len(content)
+        quoted = False
+        rem_mode = False
+        
+        # Token constants
+        TOKEN_REM = 0x8F # Index 15 + 128
+
+        while i < length:
+            char = content[i]
+            
+            # C logic: collapsespaces checks !(rem || quoted)
+            # It skips the character if it is whitespace.
+            if self.collapse_spaces and not (rem_mode or quoted):
+                if char.isspace():
+                    i += 1
+                    continue
+
+            if char == '"':
+                quoted = not quoted
+            elif quoted and char == '{' and self.brace_macros:
+                # Brace macro inside a string: one table lookup for the whole {...}
+                end = content.find('}', i + 1)
+                if end > 0:
+                    codes = macro_to_bytes(content[i + 1:end])
+                    if codes is not None:
+                        output.extend(codes)
+                        i = end + 1
+                        continue
+            
+            # C logic: attempt token match if not REM and not Quoted
+            found_token = False
+            if not rem_mode and not quoted:
+                token_val, token_len = self._get_token(content, i)
+                if token_val is not None:
+                    if token_val == TOKEN_REM:
+                        rem_mode = True
+                    output.append(token_val)
+                    i += token_len
+                    found_token = True
+            
+            if found_token:
+                continue
+
+            # Copy character if not tokenized
+            # The C code explicitly skips '\r' but copies others.
+            if char != '\r':
+                # Map unicode char to single byte. 
+                # C64 Pro Mono private use chars (U+EE00-U+EFFF) map to a PETSCII byte,
+                # anything else outside 0-255 range is replaced with '?' (standard safety)
+                val = ord(char)
+                if val > 255:
+                    petscii_val = private_use_to_byte(char)
+                    val = petscii_val if petscii_val is not None else 63
+                output.append(val)
+            
+            i += 1
+
+        # C Logic: C64 BASIC has a problem with zero-length lines
+        if len(output) == 0:
+            output.append(ord(' '))
+            
+        output.append(0) # Null terminator
+        return output
+
+
+def load_corpus():
+    corpus = {}
+    for filename in sorted(os.listdir(EXAMPLES_DIR)):
+        with open(EXAMPLES_DIR / filename, "r", encoding="utf-8", errors="replace") as f:
+            corpus[filename] = f.read()
+    return corpus
+
+
+def synthetic_program(num_lines, seed=64):
+    """Builds a deterministic program mixing every statement shape the agent emits."""
+    rng = random.Random(seed)
+    templates = [
+        'PRINT "SCORE:";S;" LIVES:";L',
+        "FOR I=1 TO {n} STEP 2:POKE 1024+I,{n}:NEXT I",
+        "IF X>{n} AND Y<{n} THEN GOSUB {t}",
+        "A$=LEFT$(B$,{n})+MID$(C$,2,3)+RIGHT$(D$,1)+CHR$(147)",
+        "GET K$:IF K$=\"\" THEN {t}",
+        "ON J GOTO {t},{t},{t}",
+        "REM *** SUBROUTINE {n}: MOVE PLAYER AND CHECK COLLISION ***",
+        "X = INT(RND(1)*{n}) + SQR(ABS(Y)) - PEEK(53280) / 2 ^ 3",
+        "DATA {n},{n},{n},{n},{n},{n},{n},{n}",
+        "print tab(10);\"lower case text\";spc(3)",
+        "INPUT \"YOUR NAME\";N$:PRINT#1,N$:INPUT#1,A",
+        "GOTO {t}",
+    ]
+    lines = []
+    for idx in range(num_lines):
+        line_num = 10 * (idx + 1)
+        stmt = rng.choice(templates).format(n=rng.randint(0, 255), t=10 * rng.randint(1, num_lines))
+        lines.append(f"{line_num} {stmt}")
+    return "\n".join(lines)
+
+
+def option_sets():
+    for values in itertools.product((False, True), repeat=len(OPTION_NAMES)):
+        yield dict(zip(OPTION_NAMES, values))
+
+
+def verify_identical(programs):
+    """Asserts byte-identical PRG output for every program and option combination."""
+    checked = 0
+    for name, source in programs.items():
+        for options in option_sets():
+            expected = LinearScanBas2Prg(**options).convert(source)
+            actual = Bas2Prg(**options).convert(source)
+            if actual != expected:
+                raise AssertionError(f"PRG mismatch for {name} with options {options}")
+            checked += 1
+    return checked
+
+
+def measure(converter_cls, programs, repeat):
+    total_lines = sum(len(source.splitlines()) for source in programs.values()) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for source in programs.values():
+            converter_cls().convert(source)
+    elapsed = time.perf_counter() - start
+    return total_lines / elapsed if elapsed > 0 else float("inf"), elapsed
+
+def measure_edit_latency(num_lines, repeat):
+    """Cold convert vs. convert_delta after editing three lines; returns seconds per edit."""
+    source = synthetic_program(num_lines)
+    lines = source.splitlines()
+    rng = random.Random(num_lines)
+    for idx in rng.sample(range(len(lines)), 3):
+        lines[idx] += ':PRINT "EDITED"'
+    edited = "\n".join(lines)
+
+    converter = Bas2Prg()
+    old_prg = converter.convert(source)
+    expected = Bas2Prg().convert(edited)
+    if converter.convert_delta(old_prg, line_changes(source, edited)) != expected:
+        raise AssertionError(f"convert_delta mismatch for {num_lines} lines")
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        Bas2Prg().convert(edited)
+    cold = (time.perf_counter() - start) / repeat
+    # As in the agent: the old PRG is the converter's last buffer, so its line index is reused
+    delta = 0.0
+    for _ in range(repeat):
+        converter.convert(source)
+        start = time.perf_counter()
+        converter.convert_delta(converter.buffer, line_changes(source, edited))
+        delta += time.perf_counter() - start
+    return cold, delta / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and verify the Bas2Prg tokenizer.")
+    parser.add_argument("--repeat", type=int, default=5, help="Conversions per program (default 5)")
+    # PRG link addresses are 16 bit, so a synthetic program has to fit below $FFFF
+    parser.add_argument("--lines", type=int, default=1500, help="Lines per synthetic program (default 1500)")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    synthetic = {
+        f"synthetic_{args.lines}_a": synthetic_program(args.lines),
+        f"synthetic_{args.lines}_b": synthetic_program(args.lines, seed=6502),
+    }
+
+    checked = verify_identical({**corpus, **synthetic})
+    print(f"Regression: {checked} conversions byte-identical to the original character loop")
+
+    for label, programs in (("examples corpus", corpus), ("synthetic", synthetic)):
+        ref_rate, ref_time = measure(LinearScanBas2Prg, programs, args.repeat)
+        new_rate, new_time = measure(Bas2Prg, programs, args.repeat)
+        print(f"{label:16s} linear: {ref_rate:10.0f} lines/sec ({ref_time:.3f}s)  "
+              f"lexer:    {new_rate:10.0f} lines/sec ({new_time:.3f}s)  "
+              f"speedup: {ref_time / new_time:.1f}x")
+
+    for num_lines in (250, 500, 1000, args.lines):
+        cold, delta = measure_edit_latency(num_lines, args.repeat)
+        print(f"edit 3 of {num_lines:5d} lines  convert: {cold * 1000:7.2f} ms  "
+              f"convert_delta: {delta * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark and verification of the compiled BASIC backend.
+
+Runs the `resources/examples` corpus and the stress programs in
+stress_programs.py with the tree-walking c64_basic.Interpreter and with
+c64_compiler.CompiledInterpreter. Both have to end the same way: status,
+message, line, statement count, screen and memory. The compiled backend looks
+at the statement limit, the infinite loop check and an idle GET loop only
+between blocks, so runs stopped by those agree on less: the status for the
+limit, the status, message and screen for the other two.
+
+Speed is measured on a game: space_invaders.bas with the fire button of
+joystick 2 held, so the game keeps moving and shooting. Both backends run the
+same statements in turns, each after a garbage collection, and the best of
+--repeat rounds counts, which keeps a busy host from favouring either.
+Compiling is timed separately.
+
+Usage:
+    python benchmarks/bench_interpreter.py [--repeat N] [--statements N] [--program game.bas]
+"""
+import argparse
+import gc
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stress_programs import STRESS_PROGRAMS, load_programs
+from utils.c64_basic import HANG, LIMIT, WAITING, Interpreter, Machine, Program
+from utils.c64_compiler import CompiledInterpreter, compile_program
+
+EXAMPLES_DIR = Path(__file__).parent.parent / "resources" / "examples"
+DEFAULT_PROGRAM = EXAMPLES_DIR / "space_invaders.bas"
+JOYSTICK_2 = 0xDC00
+FIRE_HELD = 0x6F  # bit 4 low
+VERIFY_STATEMENTS = 50000
+VERIFY_KEYS = b"Y\rBOB\r5\r1\r2\r3\rN\r"
+
+
+def _machine(keys=b"", seed=0, joystick=None):
+    machine = Machine(keys, seed=seed)
+    if joystick is not None:
+        machine.memory[JOYSTICK_2] = joystick
+    return machine
+
+
+def _outcome(interpreter, max_statements):
+    result = interpreter.run(max_statements)
+    machine = interpreter.machine
+    return {
+        "status": result.status, "message": result.message, "line": result.line,
+        "statements": result.statements, "screen": result.screen, "memory": bytes(machine.memory),
+    }
+
+
+def _compared(outcome):
+    if outcome["status"] == LIMIT:
+        return ("status",)
+    if outcome["status"] == HANG or (outcome["status"] == WAITING and "GET" in outcome["message"]):
+        return ("status", "message", "screen")
+    return tuple(outcome)
+
+
+def verify_identical(programs):
+    """Asserts that both backends end every program the same way; returns the runs compared."""
+    checked = 0
+    for name, source in programs.items():
+        program = Program(source)
+        compiled = compile_program(program)
+        for seed, keys in ((0, b""), (1, VERIFY_KEYS)):
+            expected = _outcome(Interpreter(program, _machine(keys, seed)), VERIFY_STATEMENTS)
+            actual = _outcome(CompiledInterpreter(compiled, _machine(keys, seed)), VERIFY_STATEMENTS)
+            keys_compared = _compared(expected)
+            different = [key for key in keys_compared if actual[key] != expected[key]]
+            if different:
+                raise AssertionError(f"{name} (seed {seed}, {len(keys)} keys): {', '.join(different)} differ")
+            checked += 1
+    return checked
+
+
+def measure_game(source, max_statements, repeat):
+    """Best statements/sec of each backend on the game, and the seconds compile_program() takes."""
+    program = Program(source)
+    start = time.perf_counter()
+    compiled = compile_program(program)
+    compile_time = time.perf_counter() - start
+
+    backends = {
+        "tree": lambda machine: Interpreter(program, machine),
+        "compiled": lambda machine: CompiledInterpreter(compiled, machine),
+    }
+    rates = {name: 0.0 for name in backends}
+    results = {}
+    for _ in range(repeat):
+        for name, make in backends.items():
+            interpreter = make(_machine(seed=1, joystick=FIRE_HELD))
+            # Neither backend collects the garbage the other left
+            gc.collect()
+            start = time.perf_counter()
+            result = interpreter.run(max_statements)
+            elapsed = time.perf_counter() - start
+            rates[name] = max(rates[name], result.statements / elapsed if elapsed > 0 else float("inf"))
+            results[name] = result
+    if (results["tree"].status, results["tree"].statements) != (results["compiled"].status, results["compiled"].statements):
+        raise AssertionError(f"The backends ran the game differently: {results['tree']} / {results['compiled']}")
+    return rates, results["compiled"], compile_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and verify the compiled BASIC backend.")
+    parser.add_argument("--repeat", type=int, default=5, help="Rounds of the game per backend (default 5)")
+    parser.add_argument("--statements", type=int, default=200000, help="Statements of the game (default 200000)")
+    parser.add_argument("--program", default=str(DEFAULT_PROGRAM), help="Game to measure (default space_invaders.bas)")
+    args = parser.parse_args()
+
+    programs = {}
+    for name in ["corpus"] + list(STRESS_PROGRAMS):
+        programs.update(load_programs(name))
+    checked = verify_identical(programs)
+    print(f"Regression: {checked} runs of {len(programs)} programs end the same way with both backends")
+
+    try:
+        with open(args.program, "r", encoding="utf-8", errors="replace") as f:
+            source = f.read()
+    except OSError as e:
+        print(f"Unable to read '{args.program}': {e}", file=sys.stderr)
+        sys.exit(2)
+    rates, result, compile_time = measure_game(source, args.statements, max(1, args.repeat))
+    print(f"{Path(args.program).name}: {result.statements} statements, {result.status}"
+          f"{' in ' + str(result.line) if result.line is not None else ''}, compiled in {compile_time * 1000:.1f} ms")
+    print(f"tree: {rates['tree']:10.0f} statements/sec  compiled: {rates['compiled']:10.0f} statements/sec  "
+          f"speedup: {rates['compiled'] / rates['tree']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
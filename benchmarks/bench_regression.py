@@ -0,0 +1,280 @@
+"""
+Performance regression suite for the parser, checker and converter.
+
+Runs every stage on the `resources/examples` corpus and on the generated
+stress programs in stress_programs.py, each stage/input pair in a fresh
+process so the measurements do not leak into each other:
+- parse:   c64_ast.parse_line() on every line, caches cleared
+- check:   SyntaxChecker load() + validate(), cold
+- session: CheckerSession.update() after editing two lines of a warm session
+- convert: Bas2Prg.convert(), cold (skips lines_10k, which does not fit into
+           the C64 address space)
+
+Recorded per pair: best wall time of --repeat runs, peak and retained
+tracemalloc bytes of one traced run, and the peak RSS of the process. Each
+timed run is paired with a fixed calibration workload, and the gate uses the
+time relative to it ("relative"), so a slower or busier host does not read as
+a regression. The results are compared with a JSON baseline; a metric
+regresses when it grows by more than its threshold (--threshold for time,
+--memory-threshold for the deterministic memory metrics) and by more than a
+small absolute floor that hides timer and allocator noise. A pair whose time
+regresses is measured once more and only fails if it regresses again. Any
+regression makes the run fail.
+
+Usage:
+    python benchmarks/bench_regression.py [--repeat N] [--threshold 0.25] [--only check]
+    python benchmarks/bench_regression.py --update   # record a new baseline
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.stress_programs import STRESS_PROGRAMS, load_programs
+from utils import c64_ast
+from utils.bas2prg import Bas2Prg
+from utils.c64_syntax_checker import LINE_RE, CheckerSession, SyntaxChecker
+
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+DEFAULT_THRESHOLD = 0.3
+DEFAULT_MEMORY_THRESHOLD = 0.1
+DEFAULT_REPEAT = 5
+
+INPUTS = ["corpus"] + list(STRESS_PROGRAMS)
+STAGE_INPUTS = {
+    "parse": INPUTS,
+    "check": INPUTS,
+    "session": INPUTS,
+    "convert": [name for name in INPUTS if name != "lines_10k"],
+}
+# Metric -> absolute growth below which a change is never a regression
+METRIC_FLOORS = {"relative": 0.2, "peak_alloc_kb": 256, "peak_rss_kb": 4096}
+TIME_METRICS = ("relative",)
+CALIBRATION_SOURCE = "\n".join(f"{10 * i} IF X>{i} THEN PRINT A$;MID$(B$,{i},2):GOTO {10 * i + 10}"
+                               for i in range(1, 101))
+
+
+def _calibrate():
+    """Seconds of a fixed mix of lexing, dict and string work, comparable to the stages."""
+    start = time.perf_counter()
+    for _ in range(5):
+        for raw in CALIBRATION_SOURCE.splitlines():
+            # Lex every line in full, not from the chunks of the line before
+            c64_ast.clear_chunk_cache()
+            c64_ast.lex.__wrapped__(raw)
+        Bas2Prg(line_cache_size=0).convert(CALIBRATION_SOURCE)
+    return time.perf_counter() - start
+
+
+def _clear_caches():
+    c64_ast.lex.cache_clear()
+    c64_ast.clear_chunk_cache()
+    c64_ast.parse_line.cache_clear()
+
+
+def _edited(source, seed):
+    """The program with two lines extended, as in a fix-loop iteration."""
+    rng = random.Random(seed)
+    lines = source.splitlines()
+    for idx in rng.sample(range(len(lines)), min(2, len(lines))):
+        lines[idx] += ':PRINT "EDITED"'
+    return "\n".join(lines)
+
+
+def _stage_runner(stage, programs):
+    """Returns a function running the stage once, plus an untimed setup to call before each run."""
+    if stage == "parse":
+        contents = [m.group(2) for source in programs.values()
+                    for m in map(LINE_RE.match, (raw.strip() for raw in source.splitlines())) if m]
+
+        def run():
+            for content in contents:
+                c64_ast.parse_line(content)
+        return run, _clear_caches
+
+    if stage == "check":
+        def run():
+            for source in programs.values():
+                checker = SyntaxChecker()
+                checker.load(source)
+                checker.validate()
+        return run, _clear_caches
+
+    if stage == "session":
+        pairs = [(source, _edited(source, len(source))) for source in programs.values()]
+        sessions = []
+
+        def setup():
+            sessions.clear()
+            for source, _ in pairs:
+                session = CheckerSession()
+                session.update(source)
+                sessions.append(session)
+
+        def run():
+            for session, (_, edited) in zip(sessions, pairs):
+                session.update(edited)
+        return run, setup
+
+    if stage == "convert":
+        def run():
+            for source in programs.values():
+                Bas2Prg().convert(source)
+        return run, _clear_caches
+
+    raise ValueError(f"Unknown stage '{stage}'")
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def measure_stage(stage, input_name, repeat):
+    """Pool worker: measures one stage on one input. Runs in a fresh process."""
+    programs = load_programs(input_name)
+    run, setup = _stage_runner(stage, programs)
+    best = float("inf")
+    best_relative = float("inf")
+    for _ in range(repeat):
+        setup()
+        calibration = _calibrate()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        best_relative = min(best_relative, elapsed / (calibration + _calibrate()) * 2)
+    setup()
+    tracemalloc.start()
+    run()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "lines": sum(len(source.splitlines()) for source in programs.values()),
+        "seconds": round(best, 6),
+        "relative": round(best_relative, 4),
+        "peak_alloc_kb": round(peak / 1024, 1),
+        "retained_kb": round(retained / 1024, 1),
+        "peak_rss_kb": _peak_rss_kb(),
+    }
+
+
+def measure_pair(key, repeat):
+    """Measures one 'stage:input' pair in a new process, so peak RSS and imports are not shared."""
+    stage, input_name = key.split(":", 1)
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        result = pool.submit(measure_stage, stage, input_name, repeat).result()
+    print(f"{key:20s} {result['seconds'] * 1000:10.2f} ms  "
+          f"alloc peak {result['peak_alloc_kb']:10.1f} KB  "
+          f"rss peak {result['peak_rss_kb'] or 0:8d} KB", file=sys.stderr)
+    return result
+
+
+def run_suite(repeat=DEFAULT_REPEAT, only=None):
+    """Measures every stage/input pair whose key ('stage:input') starts with only."""
+    keys = [f"{stage}:{input_name}" for stage, inputs in STAGE_INPUTS.items() for input_name in inputs]
+    return {key: measure_pair(key, repeat) for key in keys if not only or key.startswith(only)}
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD, memory_threshold=DEFAULT_MEMORY_THRESHOLD):
+    """Returns the regressions as (stage, metric, baseline value, current value)."""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        for metric, floor in METRIC_FLOORS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            limit = threshold if metric in TIME_METRICS else memory_threshold
+            if new > old * (1 + limit) and new - old > floor:
+                regressions.append((key, metric, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the checker and converter against a JSON baseline.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help=f"Timed runs per stage (default {DEFAULT_REPEAT})")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Allowed relative growth of the time (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--memory-threshold", type=float, default=DEFAULT_MEMORY_THRESHOLD,
+                        help=f"Allowed relative growth of the memory metrics (default {DEFAULT_MEMORY_THRESHOLD})")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Baseline JSON file")
+    parser.add_argument("--update", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--only", help="Only run stages whose 'stage:input' key starts with this")
+    args = parser.parse_args()
+
+    results = run_suite(repeat=max(1, args.repeat), only=args.only)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "repeat": args.repeat,
+        "stages": results,
+    }
+    for path in filter(None, (args.output, args.baseline if args.update else None)):
+        try:
+            if args.update and path == args.baseline and os.path.exists(path) and args.only:
+                # Keep the stages that were not run
+                with open(path, "r", encoding="utf-8") as f:
+                    report["stages"] = {**json.load(f)["stages"], **results}
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+                f.write("\n")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Unable to write '{path}': {e}", file=sys.stderr)
+            sys.exit(2)
+    if args.update:
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update to record one")
+        return
+    try:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["stages"]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Unable to read baseline '{args.baseline}': {e}", file=sys.stderr)
+        sys.exit(3)
+
+    regressions = compare(results, baseline, args.threshold, args.memory_threshold)
+    # Timing noise: a slow pair has to be slow twice
+    retry = sorted({key for key, metric, _, _ in regressions if metric in TIME_METRICS})
+    if retry:
+        print(f"Measuring again: {', '.join(retry)}", file=sys.stderr)
+        confirmed = compare({key: measure_pair(key, args.repeat) for key in retry}, baseline,
+                            args.threshold, args.memory_threshold)
+        confirmed_keys = {key for key, metric, _, _ in confirmed if metric in TIME_METRICS}
+        regressions = [r for r in regressions if r[1] not in TIME_METRICS or r[0] in confirmed_keys]
+    missing = sorted(key for key in results if key not in baseline)
+    if missing:
+        print(f"Not in the baseline: {', '.join(missing)}")
+    for key, metric, old, new in regressions:
+        print(f"REGRESSION {key} {metric}: {old} -> {new} (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+    print(f"{len(results)} stage(s) compared with {args.baseline}: {len(regressions)} regression(s) "
+          f"(time +{args.threshold * 100:.0f}%, memory +{args.memory_threshold * 100:.0f}%)")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
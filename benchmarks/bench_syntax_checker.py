@@ -0,0 +1,255 @@
+"""
+SyntaxChecker benchmark and regression check.
+
+Checks the `resources/examples` corpus, large synthetic programs and randomly
+damaged copies of the corpus with the AST-based checker. Every result must
+equal the structured() output stored in expected_issues.json; after an
+intended change of the checker, regenerate it with --update-expected and
+review the diff.
+
+Throughput in lines/sec is compared with the multi-pass checker of an
+earlier revision (--baseline), read from git history with `git show`. The
+comparison is skipped when git or the revision is not available.
+
+The tokenizer section compares the baseline's character loop with
+c64_ast.lex() and with the full parser on every line of the corpus, without
+lex()'s per-line cache. Every lexed line must join back to its text.
+
+The update latency section edits two lines of growing synthetic programs and
+compares a cold check with CheckerSession.update() on a warm session. Only
+the edited lines are analyzed again and the program-wide checks are updated
+from them, so an update should stay under a millisecond as the program grows.
+
+Usage:
+    python benchmarks/bench_syntax_checker.py [--repeat N] [--lines N] [--baseline REV]
+    python benchmarks/bench_syntax_checker.py --update-expected
+"""
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+import types
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.c64_ast import Parser, lex
+from utils.c64_syntax_checker import LINE_RE, SyntaxChecker, CheckerSession
+from benchmarks.bench_bas2prg import load_corpus, synthetic_program
+
+ROOT = Path(__file__).parent.parent
+EXPECTED_ISSUES = Path(__file__).parent / "expected_issues.json"
+# The multi-pass checker before the single-pass rewrite
+DEFAULT_BASELINE_REV = "d04ed17~1"
+
+# Fragments spliced into damaged programs: unbalanced structure, stray
+# keywords in comments, odd casing and bad targets
+NOISE = [
+    'FOR I=1 TO 10', 'NEXT J', 'NEXT', 'NEXT I,J', 'RETURN', 'GOSUB', 'GOSUB 99999', 'GOTO X',
+    'IF A=1 PRINT "NO THEN"', 'ON 3 GOTO 10,20', 'ON X', 'REM FOR GOSUB 10 RETURN', 'PRINT "OPEN',
+    'A=(1+2', 'B=1+2)', 'LET 1A=2', 'C$="A"+1', 'X=LEN("A","B")', 'get k$', 'END', 'STOP',
+    '@@', 'X=-"A"', 'IF X THEN 10:GOSUB 10', 'Q=', 'DEF FNA(X)=X*2', 'DIM A(20),B$(5)',
+]
+
+
+def damaged_program(source, seed):
+    """Inserts, duplicates, renumbers and truncates lines of a program."""
+    rng = random.Random(seed)
+    lines = source.splitlines()
+    for _ in range(max(1, len(lines) // 10)):
+        idx = rng.randrange(len(lines) + 1)
+        action = rng.randrange(5)
+        if action == 0 or not lines or idx == len(lines):
+            lines.insert(idx, f"{rng.randint(0, 70000)} {rng.choice(NOISE)}")
+        elif action == 1:
+            lines[idx] += ":" + rng.choice(NOISE)
+        elif action == 2:
+            lines.insert(idx, lines[idx])
+        elif action == 3:
+            lines[idx] = lines[idx][:rng.randint(0, len(lines[idx]))]
+        else:
+            lines[idx] = lines[idx].lower()
+    return "\n".join(lines)
+
+
+def check(checker_cls, source):
+    checker = checker_cls()
+    checker.load(source)
+    checker.validate()
+    return checker
+
+
+def load_baseline(rev):
+    """
+    The c64_syntax_checker module of an earlier revision, from git history.
+    Returns None if git or the revision is not available.
+    """
+    try:
+        source = subprocess.run(["git", "show", f"{rev}:utils/c64_syntax_checker.py"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    module = types.ModuleType("baseline_syntax_checker")
+    # dataclasses look the module up while the classes are created
+    sys.modules[module.__name__] = module
+    exec(compile(source, f"{rev}:utils/c64_syntax_checker.py", "exec"), module.__dict__)
+    return module
+
+
+def compare_with_expected(programs, update=False):
+    """
+    Names of the programs whose structured() output differs from
+    expected_issues.json, and of those without a stored expectation. With
+    update, the file is rewritten from the current results instead.
+    """
+    results = {name: check(SyntaxChecker, source).structured() for name, source in programs.items()}
+    if update:
+        # One program per line keeps the diff of a regenerated file readable
+        with open(EXPECTED_ISSUES, "w", encoding="utf-8") as f:
+            f.write("{\n" + ",\n".join(f"{json.dumps(name)}: {json.dumps(results[name], sort_keys=True)}"
+                                        for name in sorted(results)) + "\n}\n")
+        return [], []
+    expected = json.loads(EXPECTED_ISSUES.read_text(encoding="utf-8")) if EXPECTED_ISSUES.exists() else {}
+    # Through JSON, so tuples and lists compare alike
+    mismatched = [name for name, result in results.items()
+                  if name in expected and json.loads(json.dumps(result)) != expected[name]]
+    missing = [name for name in results if name not in expected]
+    return mismatched, missing
+
+
+def measure(checker_cls, programs, repeat):
+    total_lines = sum(len(source.splitlines()) for source in programs.values()) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for source in programs.values():
+            check(checker_cls, source)
+    elapsed = time.perf_counter() - start
+    return total_lines / elapsed if elapsed > 0 else float("inf"), elapsed
+
+
+def corpus_line_contents(programs):
+    contents = []
+    for source in programs.values():
+        for raw in source.splitlines():
+            m = LINE_RE.match(raw.strip())
+            if m:
+                contents.append(m.group(2))
+    return contents
+
+
+def lex_and_parse(content):
+    return Parser(content, lex.__wrapped__(content)).parse_line()
+
+
+def measure_tokenizer(contents, repeat, char_loop=None):
+    """
+    Lines/sec of lex() and of lex() plus parsing, all uncached, preceded by
+    the one of char_loop (the baseline's character loop) if given.
+    """
+    for content in contents:
+        if "".join(lexeme.text for lexeme in lex.__wrapped__(content)) != content:
+            raise AssertionError(f"Lexemes do not cover {content!r}")
+    num_lines = len(contents) * repeat
+    results = []
+    for tokenize in ((char_loop,) if char_loop else ()) + (lex.__wrapped__, lex_and_parse):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for content in contents:
+                tokenize(content)
+        elapsed = time.perf_counter() - start
+        results.append((num_lines / elapsed if elapsed > 0 else float("inf"), elapsed))
+    return results
+
+
+def measure_update_latency(num_lines, repeat):
+    """Cold check vs. CheckerSession.update() after editing two lines; returns seconds per check."""
+    source = synthetic_program(num_lines)
+    rng = random.Random(num_lines)
+    edits = []
+    for _ in range(repeat):
+        lines = source.splitlines()
+        for idx in rng.sample(range(len(lines)), 2):
+            lines[idx] += ":" + rng.choice(NOISE)
+        edits.append("\n".join(lines))
+
+    session = CheckerSession()
+    session.update(source)
+    for edited in edits:
+        if session.update(edited).structured() != check(SyntaxChecker, edited).structured():
+            raise AssertionError(f"CheckerSession mismatch for {num_lines} lines")
+        session.update(source)
+
+    start = time.perf_counter()
+    for edited in edits:
+        check(SyntaxChecker, edited)
+    cold = (time.perf_counter() - start) / repeat
+    elapsed = 0.0
+    for edited in edits:
+        start = time.perf_counter()
+        session.update(edited)
+        elapsed += time.perf_counter() - start
+        session.update(source)
+    return cold, elapsed / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and verify the AST-based SyntaxChecker.")
+    parser.add_argument("--repeat", type=int, default=3, help="Checks per program (default 3)")
+    parser.add_argument("--lines", type=int, default=2500, help="Lines per synthetic program (default 2500)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_REV,
+                        help=f"Git revision of the checker to compare speed with (default {DEFAULT_BASELINE_REV})")
+    parser.add_argument("--update-expected", action="store_true",
+                        help="Store the current results in expected_issues.json instead of comparing")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    synthetic = {
+        f"synthetic_{args.lines}_a": synthetic_program(args.lines),
+        f"synthetic_{args.lines}_b": synthetic_program(args.lines, seed=6502),
+        f"synthetic_{args.lines}_damaged": damaged_program(synthetic_program(args.lines, seed=1541), 1541),
+    }
+    damaged = {f"{name}_damaged_{seed}": damaged_program(source, seed)
+               for name, source in corpus.items() for seed in range(5)}
+
+    programs = {**corpus, **synthetic, **damaged}
+    mismatched, missing = compare_with_expected(programs, update=args.update_expected)
+    if args.update_expected:
+        print(f"Expected: stored the results of {len(programs)} programs in {EXPECTED_ISSUES.name}")
+    else:
+        print(f"Expected: {len(programs) - len(mismatched) - len(missing)} of {len(programs)} programs "
+              f"match {EXPECTED_ISSUES.name}" + (f", {len(missing)} without a stored result" if missing else ""))
+        if mismatched:
+            raise AssertionError(f"Issues differ from {EXPECTED_ISSUES.name} for: {', '.join(mismatched)}")
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"Baseline: revision {args.baseline} not found in git history, speed comparison skipped")
+    for label, programs in (("examples corpus", corpus), ("synthetic", synthetic)):
+        new_rate, new_time = measure(SyntaxChecker, programs, args.repeat)
+        if baseline is None:
+            print(f"{label:16s} AST: {new_rate:8.0f} lines/sec ({new_time:.3f}s)")
+            continue
+        ref_rate, ref_time = measure(baseline.SyntaxChecker, programs, args.repeat)
+        print(f"{label:16s} multi-pass: {ref_rate:8.0f} lines/sec ({ref_time:.3f}s)  "
+              f"AST: {new_rate:8.0f} lines/sec ({new_time:.3f}s)  "
+              f"speedup: {ref_time / new_time:.1f}x")
+
+    contents = corpus_line_contents(corpus)
+    rates = measure_tokenizer(contents, args.repeat * 10, baseline.SyntaxChecker()._tokenize if baseline else None)
+    (lex_rate, lex_time), (parse_rate, parse_time) = rates[-2:]
+    char_loop = f"char loop:  {rates[0][0]:8.0f} lines/sec ({rates[0][1]:.3f}s)  " if baseline else ""
+    speedup = f"  lex speedup: {rates[0][1] / lex_time:.1f}x" if baseline else ""
+    print(f"tokenizer        {char_loop}"
+          f"lex: {lex_rate:8.0f} lines/sec ({lex_time:.3f}s)  "
+          f"lex+parse: {parse_rate:8.0f} lines/sec ({parse_time:.3f}s){speedup}")
+
+    for num_lines in (250, 500, 1000, args.lines):
+        cold, update = measure_update_latency(num_lines, max(args.repeat, 5))
+        print(f"edit 2 of {num_lines:5d} lines  cold check: {cold * 1000:7.2f} ms  "
+              f"session update: {update * 1000:7.3f} ms ({cold / update:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
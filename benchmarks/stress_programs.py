@@ -0,0 +1,126 @@
+"""
+Generated stress programs for the benchmarks.
+
+Each generator is deterministic, so a benchmark baseline recorded on one run
+stays comparable with the next:
+- lines_10k:  10000 lines of mixed statements (line numbers stay below 64000)
+- deep_for:   blocks of FOR loops nested 40 deep, closed in reverse order
+- gosub_500:  a dispatcher calling 500 subroutines, each calling the next
+- data_block: 500 DATA lines (about 30 KB) read back by a READ loop
+
+Usage:
+    python benchmarks/stress_programs.py NAME > program.bas
+"""
+import random
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.bench_bas2prg import load_corpus
+
+MAX_LINE_NUMBER = 63999
+
+MIXED_TEMPLATES = [
+    'PRINT "SCORE:";S;" LIVES:";L',
+    "FOR I=1 TO {n} STEP 2:POKE 1024+I,{n}:NEXT I",
+    "IF X>{n} AND Y<{n} THEN GOSUB {t}",
+    "A$=LEFT$(B$,{n})+MID$(C$,2,3)+RIGHT$(D$,1)+CHR$(147)",
+    'GET K$:IF K$="" THEN {t}',
+    "ON J GOTO {t},{t},{t}",
+    "REM *** MOVE PLAYER {n} ***",
+    "X=INT(RND(1)*{n})+SQR(ABS(Y))-PEEK(53280)/2^3",
+    "DATA {n},{n},{n},{n}",
+    "IF X THEN GOTO {t}",
+    "GOTO {t}",
+    "RETURN",
+]
+
+
+def _variable(index):
+    """Distinct two-letter variable names that contain no keyword."""
+    letters = "ABCDEGHIJKLMPQUVWXYZ"
+    return letters[index // len(letters) % len(letters)] + letters[index % len(letters)]
+
+
+def lines_10k(num_lines=10000, seed=64):
+    rng = random.Random(seed)
+    step = min(10, MAX_LINE_NUMBER // num_lines)
+    numbers = [step * (idx + 1) for idx in range(num_lines)]
+    lines = []
+    for number in numbers:
+        stmt = rng.choice(MIXED_TEMPLATES).format(n=rng.randint(0, 255), t=rng.choice(numbers))
+        lines.append(f"{number} {stmt}")
+    return "\n".join(lines)
+
+
+def deep_for(depth=40, blocks=25):
+    lines = []
+    number = 10
+    for block in range(blocks):
+        names = [_variable(block * depth + level) for level in range(depth)]
+        for name in names:
+            lines.append(f"{number} FOR {name}=1 TO 2")
+            number += 10
+        lines.append(f"{number} C=C+1")
+        number += 10
+        for name in reversed(names):
+            lines.append(f"{number} NEXT {name}")
+            number += 10
+    lines.append(f"{number} END")
+    return "\n".join(lines)
+
+
+def gosub_500(count=500):
+    first_sub = 10 * (count + 2)
+    lines = [f"{10 * (idx + 1)} GOSUB {first_sub + 40 * idx}" for idx in range(count)]
+    lines.append(f"{10 * (count + 1)} END")
+    for idx in range(count):
+        entry = first_sub + 40 * idx
+        lines.append(f"{entry} S={idx}:T=T+S")
+        if idx + 1 < count:
+            lines.append(f"{entry + 10} IF T<0 THEN GOSUB {entry + 40}")
+        lines.append(f"{entry + 20} PRINT S;")
+        lines.append(f"{entry + 30} RETURN")
+    return "\n".join(lines)
+
+
+def data_block(count=500, seed=6502):
+    rng = random.Random(seed)
+    lines = [
+        "10 S=0",
+        f"20 FOR I=1 TO {count * 16}:READ V:S=S+V:NEXT I",
+        '30 READ N$:PRINT N$',
+        "40 END",
+    ]
+    for idx in range(count):
+        values = ",".join(str(rng.randint(0, 255)) for _ in range(16))
+        lines.append(f"{100 + 10 * idx} DATA {values}")
+    lines.append(f"{100 + 10 * count} DATA \"END OF DATA\"")
+    return "\n".join(lines)
+
+
+STRESS_PROGRAMS = {
+    "lines_10k": lines_10k,
+    "deep_for": deep_for,
+    "gosub_500": gosub_500,
+    "data_block": data_block,
+}
+
+
+def load_programs(name):
+    """Programs of one benchmark input: 'corpus' (all examples) or a stress program."""
+    if name == "corpus":
+        return load_corpus()
+    return {name: STRESS_PROGRAMS[name]()}
+
+
+def main():
+    if len(sys.argv) != 2 or sys.argv[1] not in STRESS_PROGRAMS:
+        print(f"Usage: python benchmarks/stress_programs.py {{{'|'.join(STRESS_PROGRAMS)}}}", file=sys.stderr)
+        sys.exit(2)
+    print(STRESS_PROGRAMS[sys.argv[1]]())
+
+
+if __name__ == "__main__":
+    main()
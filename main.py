@@ -34,6 +34,7 @@ from langchain.messages import AIMessage, AIMessageChunk, AnyMessage, ToolMessag
 
 from utils.llm_access import LLMAccessProvider
 from utils.chainlit_middleware import ChainlitMiddlewareTracer
+from utils.prg2bas import Prg2Bas
 
 from tools.agent_state import VibeC64AgentState
 from tools.coding_tools import CodingTools
@@ -115,6 +116,10 @@ async def initialize_agent():
        - The CreateUpdateC64BasicCode tool should recieve all the details from the game design plan, how the code should be generated, what features to include etc.
     - After generating the code, use the SyntaxChecker tool to ensure there are no syntax errors.
     - If there are syntax errors, correct them using the FixSyntaxErrors tool and re-check them using the SyntaxChecker tool until the code is error-free.
+    - When the code is free of syntax errors, use the RuntimeCheck tool to run it in the headless interpreter, with keys for the GET/INPUT prompts the game starts with. If it reports a runtime error or an infinite loop, fix it with the FixSyntaxErrors tool (pass the reported error as user-reported error) and check again.
+    - To check what the game shows (texts, layout, colours), use the CaptureVirtualScreen tool with the same keys; it runs the game headless and needs no C64 hardware.
+    - Then use the FuzzTest tool to play the game headless with many key sequences. Fix each crash site it reports with the FixSyntaxErrors tool (pass the error and its reproducing keys as user-reported error), confirm the fix with RuntimeCheck and those keys, and fuzz again.
+    - For action games, or when the user finds the game slow, use the ProfileSpeed tool (hold joystick bit 16 for fire if the game waits for it). If the main loop runs fewer than about 10 times per second, use the OptimizeSpeed tool, then check the syntax and the runtime again.
     - No need to persist and edit the source code during the creation process, as the agent has external memory to store the current source code.
 
     {testing_instructions}        
@@ -340,6 +345,14 @@ def get_messages_from_attachments(message: cl.Message):
                     file_is_binary = True
                 if not file_is_binary:
                     additional_messages.append({ "type": "text", "text": file_content })
+                else:
+                    # Binary uploads are expected to be tokenized BASIC programs (.prg)
+                    try:
+                        with open(uploaded_file.path, "rb") as prg_file:
+                            listing = Prg2Bas().detokenize(prg_file.read())
+                        additional_messages.append({ "type": "text", "text": f"BASIC listing of uploaded program {uploaded_file.name}:\n{listing}" })
+                    except Exception as e:
+                        logger.warning(f"Could not detokenize uploaded file {uploaded_file.name}: {e}")
     return additional_messages
 
 async def change_agent_settings(settings):
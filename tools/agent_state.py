@@ -3,4 +3,7 @@ from langchain.agents import AgentState
 
 class VibeC64AgentState(AgentState):
     current_source_code: NotRequired[str]
-    syntax_errors: NotRequired[str]  
\ No newline at end of file
+    syntax_errors: NotRequired[str]
+    syntax_check_mode: NotRequired[str]  # "static" or "llm": which checker produced syntax_errors
+    runtime_errors: NotRequired[str]
+    performance_report: NotRequired[str]  
\ No newline at end of file
@@ -5,17 +5,35 @@ from datetime import datetime
 from pydantic import BaseModel, Field
 import utils.agent_utils as agent_utils
 import utils.c64_syntax_checker as c64_syntax_checker
+import utils.c64_basic as c64_basic
+import utils.c64_compiler as c64_compiler
+import utils.c64_fuzz as c64_fuzz
+import utils.c64_profile as c64_profile
+from utils.check_cache import SyntaxCheckCache, check_cache_key
+from utils.bas_autofix import AutoFixer
+from utils.d64 import D64Image
+from utils.c64_memory import ProgramTooLargeError
 
 from tools.agent_state import VibeC64AgentState
 
 from langchain.tools import tool, ToolRuntime
-from typing import Annotated, Literal, NotRequired
+from typing import Annotated, List, Literal, NotRequired, Tuple
 from langgraph.types import Command
 from langchain_core.messages import ToolMessage
 
 from chainlit.utils import utc_now
 
+logger = logging.getLogger(__name__)
+
 LOAD_EXAMPLE_PROGRAMS = True
+# Upper bound for the statements of one RuntimeCheck run (a few seconds)
+MAX_RUNTIME_CHECK_STATEMENTS = 2000000
+# Upper bound for the runs of one FuzzTest call
+MAX_FUZZ_RUNS = 2000
+# Upper bound for the worker processes of one FuzzTest call, so parallel sessions share the CPUs
+MAX_FUZZ_JOBS = 4
+# Upper bound for the statements of one profiled run (the tree-walking interpreter, a few seconds)
+MAX_PROFILE_STATEMENTS = 500000
 
 class CodingTools:
     def __init__(self, llm_access, cl = None, hw_access_tools = None):
@@ -23,6 +41,20 @@ class CodingTools:
         self.llm_access = llm_access
         self.cl = cl
         self.hw_access_tools = hw_access_tools
+        # Every converted iteration of the session is collected on one disk image
+        self.session_disk = D64Image(disk_name="VIBEC64")
+        self.session_disk_iterations = 0
+        # (program name, disk file name) of the iterations on the disk, oldest first
+        self.session_disk_files: List[Tuple[str, str]] = []
+        # Keeps per-line results so re-checks in the fix loop only analyze edited lines
+        self.checker_session = c64_syntax_checker.CheckerSession()
+        # Repeated checks of an unchanged source reuse the earlier result
+        self.check_cache = SyntaxCheckCache.from_env()
+        # Mechanical errors are fixed by rules; only the residual ones cost an LLM call
+        self.autofixer = AutoFixer()
+        self.llm_fix_calls_avoided = 0
+        # Keeps the previous PRG so conversions of fix iterations only tokenize edited lines
+        self.prg_converter = agent_utils.IncrementalConverter()
 
     def tools(self):
 
@@ -57,16 +89,53 @@ class CodingTools:
                 ) -> Command:
             return self._fix_syntax_errors(runtime, user_reported_errors)
         
+        @tool("RuntimeCheck", description="Runs the C64 BASIC V2.0 source code stored in the agent's external memory in a headless C64 BASIC interpreter for a limited number of statements, typing the given keys for GET and INPUT. Reports the first runtime error (e.g. ?TYPE MISMATCH, ?OUT OF DATA, ?RETURN WITHOUT GOSUB) or infinite loop with its line number, and the screen at the end of the run. Use it after the syntax check passes.")
+        def runtime_check(
+                runtime: ToolRuntime[None, VibeC64AgentState],
+                keys: Annotated[str, "Keys typed in order for GET and INPUT, e.g. 'Y' or 'BOB{RETURN}5{RETURN}'. {RETURN} or a new line is the RETURN key; brace macros like {DOWN} or {F1} name other keys."] = "",
+                max_statements: Annotated[int, "Maximum number of BASIC statements to execute."] = c64_basic.DEFAULT_MAX_STATEMENTS,
+                ) -> Command:
+            return self._runtime_check(runtime, keys, max_statements)
+
+        @tool("FuzzTest", description="Play-tests the C64 BASIC V2.0 source code stored in the agent's external memory headless with many random and game-specific key sequences and joystick states. Reports every runtime error or infinite loop found, each with a short key sequence that reproduces it with RuntimeCheck, and the lines no run reached. Use it after the syntax check passes.")
+        def fuzz_test(
+                runtime: ToolRuntime[None, VibeC64AgentState],
+                runs: Annotated[int, "Number of runs, each with other keys."] = c64_fuzz.DEFAULT_RUNS,
+                ) -> Command:
+            return self._fuzz_test(runtime, runs)
+
+        @tool("ProfileSpeed", description="Estimates how fast the C64 BASIC V2.0 source code stored in the agent's external memory runs on a real C64: runs it headless, counts the executions of every line and weights them with the C64 interpreter's costs (GOTO line search, number and variable lookups, float math, string garbage collection, printing). Reports the frames per second of the main loop and the hot lines with what slows them down. Use it when a game may run too slowly.")
+        def profile_speed(
+                runtime: ToolRuntime[None, VibeC64AgentState],
+                keys: Annotated[str, "Keys typed in order for GET and INPUT, as for RuntimeCheck, to get into the game."] = "",
+                joystick: Annotated[int, "Joystick bits held pressed on both ports: 16 fire, 1 up, 2 down, 4 left, 8 right (e.g. 16 to start and play an action game)."] = 0,
+                max_statements: Annotated[int, "Maximum number of BASIC statements to execute."] = c64_profile.DEFAULT_PROFILE_STATEMENTS,
+                ) -> Command:
+            return self._profile_speed(runtime, keys, joystick, max_statements)
+
+        @tool("OptimizeSpeed", description="Speeds up the C64 BASIC V2.0 source code stored in the agent's external memory: profiles it like ProfileSpeed and rewrites the hot lines it finds with C64 BASIC speed techniques, keeping what the game does. Updates the source code in the agent's external memory. Check the syntax again afterwards.")
+        def optimize_speed(
+                runtime: ToolRuntime[None, VibeC64AgentState],
+                keys: Annotated[str, "Keys typed in order for GET and INPUT, as for RuntimeCheck, to get into the game."] = "",
+                joystick: Annotated[int, "Joystick bits held pressed on both ports: 16 fire, 1 up, 2 down, 4 left, 8 right."] = 0,
+                ) -> Command:
+            return self._optimize_speed(runtime, keys, joystick)
+
         @tool("ConvertCodeToPRG", description="Converts the C64 BASIC V2.0 source code stored in the agent's external memory to a .PRG file and offers the file for download or launching in an online C64 emulator.")
         async def convert_code_to_prg(
                 game_name: Annotated[str, "Name of the game, used for naming the output .PRG file."],
-                runtime: ToolRuntime[None, VibeC64AgentState]) -> str:
-            return await self._convert_code_to_prg(game_name, runtime)
+                runtime: ToolRuntime[None, VibeC64AgentState],
+                crunch: Annotated[bool, "Crunch the program (remove REMs and spaces, merge lines) for a smaller, faster PRG. The downloadable .bas file keeps the original source."] = False) -> str:
+            return await self._convert_code_to_prg(game_name, runtime, crunch)
 
         return [
             check_syntax,
             create_source_code,
             fix_syntax_errors,
+            runtime_check,
+            fuzz_test,
+            profile_speed,
+            optimize_speed,
             convert_code_to_prg,
             store_source_in_external_memory
         ]
@@ -77,6 +146,25 @@ class CodingTools:
                     llm_based: Annotated[bool, "The syntax check is performed by an LLM"] = True) -> str:
         source_code = runtime.state.get("current_source_code", "")
 
+        mode = "llm" if llm_based else "static"
+        model_id = getattr(self.llm_access, "model_name", "") if llm_based else ""
+        cache_key = check_cache_key(source_code, mode, str(c64_syntax_checker.CHECKER_VERSION), model_id or "")
+        cached = self.check_cache.get(cache_key)
+        if cached is not None:
+            syntax_check_errors, syntax_check_results = cached["syntax_errors"], cached["results"]
+            logger.info(f"Syntax check cache hit ({mode}): {self.check_cache.stats()}")
+        else:
+            syntax_check_errors, syntax_check_results = self._run_syntax_check(source_code, llm_based)
+            self.check_cache.put(cache_key, {"syntax_errors": syntax_check_errors, "results": syntax_check_results})
+
+        return Command(update={
+            "syntax_errors": syntax_check_errors,
+            "syntax_check_mode": mode,
+            "messages": [ToolMessage(content=f"Completed syntax check. {syntax_check_results}", tool_call_id=runtime.tool_call_id)]
+        })
+
+    def _run_syntax_check(self, source_code: str, llm_based: bool):
+        """Returns (syntax_errors, results summary)."""
         if llm_based:
             class SyntaxCheckResults(BaseModel):
                 has_syntax_errors: bool = Field(description="Indicates whether there are syntax errors in the source code")
@@ -99,12 +187,12 @@ class CodingTools:
                 syntax_check_results = "Found syntax errors."
                 
         else:
-            syntax_check_errors = c64_syntax_checker.check_source(source_code, return_structured=False, print_errors=False, return_warnings=False)    
-        
-        return Command(update={
-            "syntax_errors": syntax_check_errors,
-            "messages": [ToolMessage(content=f"Completed syntax check. {syntax_check_results}", tool_call_id=runtime.tool_call_id)]
-        })
+            syntax_check_errors = c64_syntax_checker.check_source(source_code, return_structured=False, print_errors=False, return_warnings=False,
+                                                                  session=self.checker_session)
+            has_errors = any(issue.severity == 'ERROR' for issue in self.checker_session.checker.issues)
+            syntax_check_results = "Found syntax errors." if has_errors else "No syntax errors found."
+
+        return syntax_check_errors, syntax_check_results
 
 
     def _create_source_code(self,
@@ -164,7 +252,7 @@ class CodingTools:
             - No lowercase letters, only uppercase
             - No special characters outside of those supported by C64 BASIC V2.0, only use PETSCII characters.
             - Don't use accented characters, even for non-English programs.
-            - Don't use pseudo control commands like {{CLR}} {{WHT}} {{DOWN}} {{DOWN}}, use CHR$() commands instead.
+            - Embed control codes inside strings as brace macros instead of CHR$() calls, e.g. PRINT "{{CLR}}{{WHT}}{{3*DOWN}}SCORE". Supported: {{CLR}} {{HOME}} {{UP}} {{DOWN}} {{LEFT}} {{RIGHT}} {{RVS ON}} {{RVS OFF}} {{DEL}} {{INST}}, colours {{BLK}} {{WHT}} {{RED}} {{CYN}} {{PUR}} {{GRN}} {{BLU}} {{YEL}} {{ORNG}} {{BRN}} {{LRED}} {{GRY1}} {{GRY2}} {{LGRN}} {{LBLU}} {{GRY3}}, and repeat counts like {{5*RIGHT}}.
             - Prefer keyboard control over joystick control for user inputs. 
             
             In case the game contains advanced graphics or requires more perforamnce, try to use memory locations and PEEK/POKE commands to set graphics modes, colors, etc.
@@ -198,6 +286,29 @@ class CodingTools:
             ) -> Command:
         source_code = runtime.state.get("current_source_code", "")
         syntax_errors = runtime.state.get("syntax_errors", "")
+        # Only errors of the static checker are all seen (and re-checked) by the rules
+        static_errors = runtime.state.get("syntax_check_mode") == "static"
+
+        autofix = self.autofixer.fix(source_code, session=self.checker_session)
+        if autofix.changed:
+            logger.info(f"{autofix.summary()}; totals: {self.autofixer.stats()}")
+            source_code = autofix.source
+            # Errors the static checker never saw (from the LLM check or the user) still go to the LLM
+            if static_errors and autofix.errors_before and not autofix.residual and user_reported_errors == "":
+                self.llm_fix_calls_avoided += 1
+                logger.info(f"LLM fix calls avoided: {self.llm_fix_calls_avoided}")
+                return Command(update={
+                    "current_source_code": source_code,
+                    "syntax_errors": "No syntax errors found.",
+                    "syntax_check_mode": "static",
+                    "messages": [ToolMessage(content=f"Fixed syntax errors with rule-based fixes ({autofix.summary()}) and updated source code in the agent's external memory.", tool_call_id=runtime.tool_call_id)]
+                })
+            if autofix.errors_before and static_errors:
+                # Earlier errors may refer to lines the rules already changed
+                syntax_errors = autofix.residual_report()
+            elif autofix.residual:
+                syntax_errors += f"\nStatic checker errors left after rule-based fixes:\n{autofix.residual_report()}"
+
         syntax_errors += f"\nUser-reported errors: {user_reported_errors}" if user_reported_errors != "" else ""
         fix_instructions = f""" The following C64 BASIC V2.0 source code contains syntax errors:
             {source_code}
@@ -214,7 +325,117 @@ class CodingTools:
             "messages": [ToolMessage(content=f"Fixed syntax errors and updated source code in the agent's external memory.", tool_call_id=runtime.tool_call_id)]
         })  
     
-    async def _convert_code_to_prg(self, game_name: str, runtime: ToolRuntime[None, VibeC64AgentState]) -> str:
+    def _runtime_check(self, runtime: ToolRuntime[None, VibeC64AgentState], keys: str, max_statements: int) -> Command:
+        source_code = runtime.state.get("current_source_code", "")
+        max_statements = max(1, min(max_statements, MAX_RUNTIME_CHECK_STATEMENTS))
+        result = c64_compiler.run_program(source_code, keys=keys, max_statements=max_statements)
+        logger.info(f"Runtime check ({result.status}): {result.summary()}")
+        runtime_errors = result.summary() if result.failed else "No runtime errors found."
+        return Command(update={
+            "runtime_errors": runtime_errors,
+            "messages": [ToolMessage(content=f"Completed runtime check. {result.summary()}\nScreen at the end of the run:\n{result.screen}", tool_call_id=runtime.tool_call_id)]
+        })
+
+    def _fuzz_test(self, runtime: ToolRuntime[None, VibeC64AgentState], runs: int) -> Command:
+        source_code = runtime.state.get("current_source_code", "")
+        report = c64_fuzz.fuzz_program(source_code, runs=max(1, min(runs, MAX_FUZZ_RUNS)),
+                                        jobs=min(os.cpu_count() or 1, MAX_FUZZ_JOBS))
+        logger.info(f"Fuzz test: {len(report.crashes)} crash site(s) in {report.runs} runs, {report.coverage * 100:.0f}% line coverage")
+        runtime_errors = "\n".join(crash.describe() for crash in report.crashes) or "No runtime errors found."
+        return Command(update={
+            "runtime_errors": runtime_errors,
+            "messages": [ToolMessage(content=f"Completed fuzz test. {report.summary()}", tool_call_id=runtime.tool_call_id)]
+        })
+
+    def _profile(self, source_code: str, keys: str, joystick: int, max_statements: int) -> c64_profile.ProfileReport:
+        max_statements = max(1, min(max_statements, MAX_PROFILE_STATEMENTS))
+        report = c64_profile.profile_program(source_code, keys=keys, max_statements=max_statements, joystick=joystick & 0x1F)
+        loop = report.main_loop
+        logger.info(f"Speed profile: {f'{loop.fps:.1f} main loop iterations/s' if loop else 'no main loop'}, "
+                    f"{report.seconds:.1f} s estimated for {report.result.statements} statements")
+        return report
+
+    def _profile_speed(self, runtime: ToolRuntime[None, VibeC64AgentState], keys: str, joystick: int, max_statements: int) -> Command:
+        source_code = runtime.state.get("current_source_code", "")
+        report = self._profile(source_code, keys, joystick, max_statements)
+        return Command(update={
+            "performance_report": report.summary(),
+            "messages": [ToolMessage(content=f"Completed speed profile. {report.summary()}", tool_call_id=runtime.tool_call_id)]
+        })
+
+    def _optimize_speed(self, runtime: ToolRuntime[None, VibeC64AgentState], keys: str, joystick: int) -> Command:
+        source_code = runtime.state.get("current_source_code", "")
+        report = self._profile(source_code, keys, joystick, c64_profile.DEFAULT_PROFILE_STATEMENTS)
+        if not report.hot_lines():
+            return Command(update={
+                "performance_report": report.summary(),
+                "messages": [ToolMessage(content=f"Nothing to optimize, no line ran. {report.summary()}", tool_call_id=runtime.tool_call_id)]
+            })
+        optimize_instructions = f""" The following C64 BASIC V2.0 game runs too slowly on a real Commodore 64:
+            {source_code}
+            A profile with a model of the C64 BASIC interpreter's costs found:
+            {report.summary()}
+            Make the hot lines faster without changing what the game does. What costs time in C64 BASIC V2.0:
+            - GOTO and GOSUB search their target line by line from the start of the program (from the next line if the target is in a higher block of 256 line numbers): put the main loop and the hot subroutines at the start of the program.
+            - Number literals are converted from text every time: keep the constants of the main loop in variables; . is a fast 0.
+            - Variables are searched in the order they were first assigned: assign the main loop's variables first, at the start of the program.
+            - SIN, COS, SQR, ^, LOG and EXP take thousands of cycles, multiplications and divisions hundreds: compute tables before the loop.
+            - Every new string (concatenation, CHR$, STR$, MID$, ...) fills memory until a garbage collection halts the game: build the strings before the loop.
+            - Printing costs per character and scrolling: print only what changed, POKE single characters into the screen RAM.
+            - REMs are read on every run of a line: remove them from hot lines.
+            Keep every feature, all line numbers that are jumped to and the C64 BASIC V2.0 syntax rules.
+            Provide only the optimized source code as output.
+            Don't use Markdown formatting, code blocks, or any additional explanations, just the pure source code text.
+            """
+        llm_coder_response = self.model_coder.invoke([{"role": "user", "content": optimize_instructions}])
+        optimized_source_code = agent_utils.get_message_content(llm_coder_response.content)
+
+        return Command(update={
+            "current_source_code": optimized_source_code,
+            "performance_report": report.summary(),
+            "messages": [ToolMessage(content=f"Optimized the hot lines for speed and updated source code in the agent's external memory. Profile before the change: {report.summary()}", tool_call_id=runtime.tool_call_id)]
+        })
+
+    def _add_to_session_disk(self, game_name: str, prg_data: bytes) -> Tuple[bytes, str]:
+        """
+        Adds the PRG as the next iteration to the session's D64 image. When the
+        disk is full, the oldest iterations of the same program make room for
+        it; only if that is not enough a new disk is started.
+
+        Returns:
+            The image and a note for the tool result if earlier iterations
+            are no longer on it ("" otherwise).
+        """
+        self.session_disk_iterations += 1
+        disk_file_name = f"{game_name[:12]}-{self.session_disk_iterations:03d}"
+        removed = []
+        while True:
+            try:
+                self.session_disk.add_file(disk_file_name, prg_data)
+                break
+            except ValueError as e:
+                older = [entry for entry in self.session_disk_files if entry[0] == game_name]
+                if not older:
+                    logger.warning(f"Session disk full, starting a new one: {e}")
+                    self.session_disk = D64Image(disk_name="VIBEC64")
+                    self.session_disk_files = []
+                    self.session_disk.add_file(disk_file_name, prg_data)
+                    self.session_disk_files.append((game_name, disk_file_name))
+                    return self.session_disk.to_bytes(), (
+                        "The session disk image was full, so a new one was started: it only holds this iteration, "
+                        "the earlier ones are on the previously downloaded disk image.")
+                self.session_disk.remove_file(older[0][1])
+                self.session_disk_files.remove(older[0])
+                removed.append(older[0][1])
+        self.session_disk_files.append((game_name, disk_file_name))
+        note = ""
+        if removed:
+            logger.info(f"Session disk full, removed {', '.join(removed)}")
+            note = (f"The session disk image was full, so the oldest iteration(s) {', '.join(removed)} "
+                    f"of this game were removed from it.")
+        return self.session_disk.to_bytes(), note
+
+    async def _convert_code_to_prg(self, game_name: str, runtime: ToolRuntime[None, VibeC64AgentState], crunch: bool = False) -> str:
 
         source_code = runtime.state.get("current_source_code", "")
         current_timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
@@ -224,14 +445,26 @@ class CodingTools:
             with open(temp_bas_path, "w") as temp_bas_file:
                 temp_bas_file.write(source_code)
 
-            temp_prg_path, _ = agent_utils.convert_c64_bas_to_prg(bas_file_path=temp_bas_path, write_to_file=True)
+            try:
+                temp_prg_path, prg_data = agent_utils.convert_c64_bas_to_prg(bas_file_path=temp_bas_path, write_to_file=True, crunch=crunch, converter=self.prg_converter)
+            except ProgramTooLargeError as e:
+                return f"The program was not converted: {e}. Reduce the program size, DIM sizes or number of variables."
+
+            d64_path = os.path.join("output", f"{game_name}_session.d64")
+            d64_data, disk_note = self._add_to_session_disk(game_name, prg_data)
+            with open(d64_path, "wb") as d64_file:
+                d64_file.write(d64_data)
 
-            return f"The source code has been saved to {temp_bas_path} and converted to PRG file at {temp_prg_path}."
+            return f"The source code has been saved to {temp_bas_path} and converted to PRG file at {temp_prg_path}. All iterations of this session are on the disk image {d64_path}. {disk_note}".rstrip()
 
         else:
 
             # Convert the source code to a PRG file
-            temp_prg_path, prg_data = agent_utils.convert_c64_bas_to_prg(bas_code=source_code, write_to_file=False)
+            try:
+                temp_prg_path, prg_data = agent_utils.convert_c64_bas_to_prg(bas_code=source_code, write_to_file=False, crunch=crunch, converter=self.prg_converter)
+            except ProgramTooLargeError as e:
+                return f"The program was not converted: {e}. Reduce the program size, DIM sizes or number of variables."
+            d64_data, disk_note = self._add_to_session_disk(game_name, prg_data)
             prg_base64 = base64.b64encode(prg_data).decode()
             props = { "button_label": "🎮 Launch Game in Online C64 Emulator",
                     "target_origin": "http://ty64.krissz.hu",
@@ -262,6 +495,11 @@ class CodingTools:
                     name=f"{game_name}_{current_timestamp}.prg",
                     content=prg_data,
                     display="inline",
+                ),
+                self.cl.File(
+                    name=f"{game_name}_session.d64",
+                    content=d64_data,
+                    display="inline",
                 )
             ]
 
@@ -269,12 +507,12 @@ class CodingTools:
             step.start = utc_now()
             step.default_open = True
             step.show_input = False
-            step.output = f"Converted source code to .PRG file for game '{game_name}'. Download the files below or directly launch the game in the online C64 emulator."
+            step.output = f"Converted source code to .PRG file for game '{game_name}'. Download the files below or directly launch the game in the online C64 emulator. The .D64 disk image contains all iterations of this session. {disk_note}".rstrip()
             step.end = utc_now()
 
             await step.send()   
 
             if temp_prg_path is None:
-                return "The files have been created and are available for download or launch in the online C64 emulator."
+                return f"The files have been created and are available for download or launch in the online C64 emulator. {disk_note}".rstrip()
             else:
-                return f"""The files have been created and are available for download or launch in the online C64 emulator. PRG file created at path: {temp_prg_path}"""
\ No newline at end of file
+                return f"""The files have been created and are available for download or launch in the online C64 emulator. PRG file created at path: {temp_prg_path} {disk_note}""".rstrip()
\ No newline at end of file
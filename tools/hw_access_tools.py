@@ -7,6 +7,7 @@ from typing_extensions import runtime
 
 from utils.kungfuflash_usb import KungFuFlashUSB
 from utils.c64u_api import C64UApiClient
+from utils.c64_memory import ProgramTooLargeError
 
 import utils.agent_utils as agent_utils
 from tools.agent_state import VibeC64AgentState
@@ -18,6 +19,8 @@ class HWAccessTools:
     def __init__(self):
         self._init_kungfu_flash()
         self._init_c64u_api()
+        # Keeps the previous PRG so uploads of fix iterations only tokenize edited lines
+        self.prg_converter = agent_utils.IncrementalConverter()
 
     def is_kungfuflash_connected(self):
         return self.kungfuflash_connected
@@ -84,19 +87,21 @@ class HWAccessTools:
     #     temp_prg_path = agent_utils.convert_c64_bas_to_prg(temp_bas_path)
     #     return temp_prg_path, temp_bas_file
     
+    def _convert_in_memory(self, source_code: str) -> memoryview:
+        """Converts the source to a PRG in memory; nothing is written to disk."""
+        _, prg_data = agent_utils.convert_c64_bas_to_prg(bas_code=source_code, write_to_file=False, converter=self.prg_converter)
+        return memoryview(prg_data).toreadonly()
+
     def run_c64_program_c64u_api(self, source_code: str) -> str:
         
 
         if not self.c64u_api_connected:
             return "Error: C64U API hardware not connected. Cannot run program on Commodore 64."
 
-        # Write / overwrite the source code to a temporary PRG file
-        temp_bas_path = os.path.join("output", "temp_program.bas")
-        with open(temp_bas_path, "w") as temp_bas_file:
-            temp_bas_file.write(source_code)
-        
-        # Convert the source code to a PRG file
-        _, prg_data = agent_utils.convert_c64_bas_to_prg(bas_file_path=temp_bas_path, write_to_file=True)
+        try:
+            prg_data = self._convert_in_memory(source_code)
+        except ProgramTooLargeError as e:
+            return f"Error: {e}"
 
         async def run_prg_via_api():
             async with C64UApiClient(self.c64u_api_base) as api:
@@ -117,20 +122,16 @@ class HWAccessTools:
         if not self.kungfuflash_connected:
             return "Error: KungFuFlash hardware not connected. Cannot run program on Commodore 64."
 
-        # Write / overwrite the source code to a temporary PRG file
-        temp_bas_path = os.path.join("output", "temp_program.bas")
-        with open(temp_bas_path, "w") as temp_bas_file:
-            temp_bas_file.write(source_code)
-        
-        # Convert the source code to a PRG file
-        temp_prg_path, _ = agent_utils.convert_c64_bas_to_prg(bas_file_path=temp_bas_path, write_to_file=True)
+        try:
+            prg_data = self._convert_in_memory(source_code)
+        except ProgramTooLargeError as e:
+            return f"Error: {e}"
 
         with self.kungfuflash as kff:
             kff.return_to_menu(reconnect=True)
             time.sleep(3)  # Wait for menu to load
             # print(f"Connected to KungFuFlash on {kff.get_port()}")
-            # print(f"Sending {temp_prg_path} program via USB...")
-            success = kff.send_prg(temp_prg_path)
+            success = kff.send_prg(prg_data)
             if success:
                 return "Program loaded and started on the Commodore 64 hardware."
             else:
@@ -16,6 +16,9 @@ from typing import Annotated, Literal, NotRequired
 from tools.agent_state import VibeC64AgentState
 from utils.c64_hw import C64HardwareAccess
 import utils.agent_utils as agent_utils
+import utils.c64_basic as c64_basic
+import utils.c64_display as c64_display
+from tools.coding_tools import MAX_RUNTIME_CHECK_STATEMENTS
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -38,6 +41,14 @@ class TestingTools:
                 self.model_screen_ocr = self.llm_access.get_llm_model(create_new=True, streaming=False)
             return self._capture_c64_screen(additional_context)
 
+        @tool("CaptureVirtualScreen", description="Runs the C64 BASIC V2.0 source code stored in the agent's external memory in a headless C64 for a limited number of statements, typing the given keys for GET and INPUT, and returns what the screen shows at the end of the run: the text, the border, background and character colours, and the character set. Needs no C64 hardware.")
+        def capture_virtual_screen(
+                runtime: ToolRuntime[None, VibeC64AgentState],
+                keys: Annotated[str, "Keys typed in order for GET and INPUT, e.g. 'Y' or 'BOB{RETURN}5{RETURN}'. {RETURN} or a new line is the RETURN key; brace macros like {DOWN} or {F1} name other keys."] = "",
+                max_statements: Annotated[int, "Maximum number of BASIC statements to execute before the screen is captured."] = c64_basic.DEFAULT_MAX_STATEMENTS,
+                ) -> str:
+            return self._capture_virtual_screen(runtime, keys, max_statements)
+
         @tool("RestartC64", description="Restarts the connected Commodore 64 hardware")
         def restart_c64(runtime: ToolRuntime[None, VibeC64AgentState]) -> str:
             return self._restart_c64()
@@ -59,7 +70,7 @@ class TestingTools:
                 self.model_coder = self.llm_access.get_llm_model(create_new=True, streaming=False)
             return self._analyze_game_mechanics(runtime)
         
-        tools = []
+        tools = [capture_virtual_screen]
         if self.capture_device_connected:
             tools.append(capture_c64_screen)
 
@@ -146,6 +157,26 @@ class TestingTools:
         ])
         return agent_utils.get_message_content(ocr_results.content)
 
+    def _capture_virtual_screen(self, runtime: ToolRuntime[None, VibeC64AgentState], keys: str, max_statements: int) -> str:
+        source_code = runtime.state.get("current_source_code", "")
+        max_statements = max(1, min(max_statements, MAX_RUNTIME_CHECK_STATEMENTS))
+        try:
+            chargen = c64_display.load_chargen()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load the character ROM ({e}), using the built-in font.")
+            chargen = None
+        result, display = c64_display.run_to_display(source_code, keys=keys, max_statements=max_statements, chargen=chargen)
+        picture_note = ""
+        try:
+            picture_path = os.path.join(os.getcwd(), 'output', 'virtual_screen.png')
+            with open(picture_path, 'wb') as f:
+                f.write(display.png(scale=2))
+            picture_note = f"\nPicture saved to {picture_path}"
+        except OSError as e:
+            logger.warning(f"Could not save the virtual screen picture: {e}")
+        logger.info(f"Virtual screen captured ({result.status}): {display.mode()}")
+        return f"{result.summary()}\nDisplay: {display.describe()}\nScreen:\n{display.text()}{picture_note}"
+
 def get_webcam_snapshot():
     usb_cam_index = os.getenv("USB_CAMERA_INDEX")
     if usb_cam_index is None or usb_cam_index.strip() == "":
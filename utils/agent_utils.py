@@ -1,11 +1,17 @@
 import os
 
 import sys
+import logging
+import threading
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).parent.parent))
 
-from utils.bas2prg import Bas2Prg
+from utils.bas2prg import Bas2Prg, line_changes
+from utils.bas_crunch import crunch_source, format_report
+from utils.c64_memory import ensure_fits
+
+logger = logging.getLogger(__name__)
 
 def get_message_content(content):
     """
@@ -34,14 +40,57 @@ def read_example_programs(num_examples: int = 5) -> str:
             examples.append(f"```basic\n{content}\n```")
     return "\n\n".join(examples)
 
-def convert_c64_bas_to_prg(bas_file_path: str = None, bas_code: str = None, write_to_file: bool = True) -> (tuple[str, bytes]):
+class IncrementalConverter:
+    """
+    Bas2Prg with the previous conversion of one session, so fix iterations
+    only tokenize the lines that changed. Each CodingTools / HWAccessTools
+    keeps its own; the lock covers the converter's line cache and the
+    previous conversion, as tool calls of a session can run in parallel.
+    """
+
+    def __init__(self):
+        self.converter = Bas2Prg()
+        self.last_conversion = None  # (source, prg) of the previous conversion
+        self.lock = threading.Lock()
+
+    def convert(self, source: str) -> bytearray:
+        """
+        Converts source, reusing the previous PRG through convert_delta when
+        both sources have ascending line numbers.
+
+        Raises:
+            ProgramTooLargeError: If the program does not fit into BASIC RAM.
+        """
+        with self.lock:
+            prg_data = None
+            if self.last_conversion is not None:
+                last_source, last_prg = self.last_conversion
+                changes = line_changes(last_source, source)
+                if changes is not None:
+                    try:
+                        prg_data = self.converter.convert_delta(last_prg, changes)
+                    except ValueError:
+                        prg_data = None
+            if prg_data is None:
+                prg_data = self.converter.convert(source)
+            # Kept by reference: the PRG is handed on as is (or as a read-only view), never modified
+            self.last_conversion = (source, prg_data)
+        # Fail before the program is written or uploaded if it would run out of memory
+        ensure_fits(source, program_bytes=len(prg_data) - 2)
+        return prg_data
+
+def convert_c64_bas_to_prg(bas_file_path: str = None, bas_code: str = None, write_to_file: bool = True, crunch: bool = False,
+                           converter: IncrementalConverter = None) -> (tuple[str, bytes]):
     prg_file_path = None
-    converter = Bas2Prg()
-    if bas_code is not None:
-        prg_data = converter.convert(source_text=bas_code)
-    else:
+    if bas_code is None:
         prg_file_path = bas_file_path.replace(".bas", ".prg")
-        prg_data = converter.convert(source_text=open(bas_file_path, "r").read())
+        bas_code = open(bas_file_path, "r").read()
+    if crunch:
+        # Smaller, faster PRG: no REMs/LETs/spaces, fall-through lines merged
+        bas_code, crunch_stats = crunch_source(bas_code)
+        logger.info(format_report(crunch_stats))
+    # Without a session converter every call starts from scratch
+    prg_data = (converter or IncrementalConverter()).convert(bas_code)
 
     if write_to_file and bas_file_path is not None:
         with open(prg_file_path, "wb") as prg_file:
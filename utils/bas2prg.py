@@ -1,122 +1,186 @@
 import struct
 import argparse
 import sys
+import os
 import re
+import json
+import time
+import hashlib
 import logging
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from utils.c64_petscii import private_use_to_byte, macro_to_bytes
+    from utils.c64_ast import TOKENS, TOKEN_BUCKETS, lex, KEYWORD, OPERATOR, NUMBER, STRING, SPACE, REM_TEXT
+except ModuleNotFoundError:
+    from c64_petscii import private_use_to_byte, macro_to_bytes
+    from c64_ast import TOKENS, TOKEN_BUCKETS, lex, KEYWORD, OPERATOR, NUMBER, STRING, SPACE, REM_TEXT
 
 logger = logging.getLogger(__name__)
 
-# Exact token list from tokens.c
-# Indices 0-127 correspond to bytes 0x80-0xFF
-TOKENS = [
-    "END",      "FOR",      "NEXT",     "DATA",     "INPUT#",   "INPUT",    "DIM",      "READ",
-    "LET",      "GOTO",     "RUN",      "IF",       "RESTORE",  "GOSUB",    "RETURN",   "REM",
-    "STOP",     "ON",       "WAIT",     "LOAD",     "SAVE",     "VERIFY",   "DEF",      "POKE",
-    "PRINT#",   "PRINT",    "CONT",     "LIST",     "CLR",      "CMD",      "SYS",      "OPEN",
-    "CLOSE",    "GET",      "NEW",      "TAB(",     "TO",       "FN",       "SPC(",     "THEN",
-    "NOT",      "STEP",     "+",        "-",        "*",        "/",        "^",        "AND",
-    "OR",       ">",        "=",        "<",        "SGN",      "INT",      "ABS",      "USR",
-    "FRE",      "POS",      "SQR",      "RND",      "LOG",      "EXP",      "COS",      "SIN",
-    "TAN",      "ATN",      "PEEK",     "LEN",      "STR$",     "VAL",      "ASC",      "CHR$",
-    "LEFT$",    "RIGHT$",   "MID$",     "GO",       "{cc}",     "{cd}",     "{ce}",     "{cf}",
-    "{d0}",     "{d1}",     "{d2}",     "{d3}",     "{d4}",     "{d5}",     "{d6}",     "{d7}",
-    "{d8}",     "{d9}",     "{da}",     "{db}",     "{dc}",     "{dd}",     "{de}",     "{df}",
-    "{e0}",     "{e1}",     "{e2}",     "{e3}",     "{e4}",     "{e5}",     "{e6}",     "{e7}",
-    "{e8}",     "{e9}",     "{ea}",     "{eb}",     "{ec}",     "{ed}",     "{ee}",     "{ef}",
-    "{f0}",     "{f1}",     "{f2}",     "{f3}",     "{f4}",     "{f5}",     "{f6}",     "{f7}",
-    "{f8}",     "{f9}",     "{fa}",     "{fb}",     "{fc}",     "{fd}",     "{fe}",     "{pi}"
-]
+LINE_NUMBER_RE = re.compile(r'^\s*(\d+)?(.*)')
+
+# Default number of tokenized line bodies kept per converter
+LINE_CACHE_SIZE = 4096
 
 class Bas2Prg:
     def __init__(self, start_addr=0x0801, invert_case=False, 
-                 auto_number=False, trim_spaces=False, collapse_spaces=False):
+                 auto_number=False, trim_spaces=False, collapse_spaces=False,
+                 line_cache_size=LINE_CACHE_SIZE, brace_macros=True):
         self.start_addr = start_addr
         self.invert_case = invert_case
         self.auto_number = auto_number
         self.trim_spaces = trim_spaces
         self.collapse_spaces = collapse_spaces
+        # Translate {CLR}, {3*DOWN}, {$a0} ... inside strings to PETSCII bytes
+        self.brace_macros = brace_macros
         self.last_line_num = -1
+        # LRU of tokenized line bodies: (content, options) -> bytes incl. terminator
+        self.line_cache_size = line_cache_size
+        self.line_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Buffer of the last converted PRG
+        self.buffer = None
+        # (line numbers, link field offsets + end marker offset) of self.buffer
+        self.line_index = None
 
-    def _get_token(self, text_slice):
+    def _get_token(self, text, pos=0):
         """
-        Mimics C gettoken: checks if text starts with a token by iterating 
-        the array from start to end. First match wins.
+        Mimics C gettoken: checks if text starts with a token at `pos`.
+        Only the tokens sharing the first character are tried, in the order
+        of the TOKENS array, so the first match wins exactly like in C.
         Returns (token_val, length) or (None, 0).
         """
-        for index, token_str in enumerate(TOKENS):
-            # C code uses strncmp, which is equivalent to startswith in this context
-            if text_slice.startswith(token_str):
-                # The C code maps index 0 to 0x80 (128)
-                return (index + 128), len(token_str)
+        bucket = TOKEN_BUCKETS.get(text[pos:pos + 1])
+        if bucket:
+            for token_str, token_val, token_len in bucket:
+                # C code uses strncmp, which is equivalent to startswith in this context
+                if text.startswith(token_str, pos):
+                    return token_val, token_len
         return None, 0
 
     def _tokenize_line(self, content):
         """
         Converts a line string into C64 byte tokens.
+        Keywords are found by the shared lexer (c64_ast.lex), which applies the
+        C gettoken rules: case-sensitive, first match in TOKENS order, nothing
+        inside strings or after REM.
         """
         output = bytearray()
-        i = 0
-        length = len(content)
-        quoted = False
-        rem_mode = False
-        
-        # Token constants
-        TOKEN_REM = 0x8F # Index 15 + 128
+        for lexeme in lex(content, fold_case=False):
+            kind = lexeme.kind
+            if kind == KEYWORD or kind == OPERATOR:
+                output.append(lexeme.token)
+            elif kind == SPACE:
+                # C logic: collapsespaces skips whitespace outside REM and strings
+                if not self.collapse_spaces:
+                    self._encode_text(output, lexeme.text, False)
+            elif kind == STRING or kind == REM_TEXT:
+                # Quotes toggle the string state inside REM text too
+                self._encode_text(output, lexeme.text, False)
+            elif kind == NUMBER and ('+' in lexeme.text or '-' in lexeme.text):
+                # The sign of an exponent (1E+5) is tokenized like any operator
+                for char in lexeme.text:
+                    if char == '+' or char == '-':
+                        output.append(self._get_token(char)[0])
+                    else:
+                        output.append(ord(char))
+            else:
+                self._encode_text(output, lexeme.text, False)
 
-        while i < length:
-            char = content[i]
+        # C Logic: C64 BASIC has a problem with zero-length lines
+        if len(output) == 0:
+            output.append(ord(' '))
             
-            # C logic: collapsespaces checks !(rem || quoted)
-            # It skips the character if it is whitespace.
-            if self.collapse_spaces and not (rem_mode or quoted):
-                if char.isspace():
-                    i += 1
-                    continue
+        output.append(0) # Null terminator
+        return output
 
+    def _encode_text(self, output, text, quoted):
+        """
+        Copies untokenized text to output. Brace macros are expanded while
+        quoted; '"' toggles the quoted state.
+        """
+        i = 0
+        length = len(text)
+        while i < length:
+            char = text[i]
             if char == '"':
                 quoted = not quoted
-            
-            # C logic: attempt token match if not REM and not Quoted
-            found_token = False
-            if not rem_mode and not quoted:
-                token_val, token_len = self._get_token(content[i:])
-                if token_val is not None:
-                    if token_val == TOKEN_REM:
-                        rem_mode = True
-                    output.append(token_val)
-                    i += token_len
-                    found_token = True
-            
-            if found_token:
-                continue
+            elif quoted and char == '{' and self.brace_macros:
+                # Brace macro inside a string: one table lookup for the whole {...}
+                end = text.find('}', i + 1)
+                if end > 0:
+                    codes = macro_to_bytes(text[i + 1:end])
+                    if codes is not None:
+                        output.extend(codes)
+                        i = end + 1
+                        continue
 
             # Copy character if not tokenized
             # The C code explicitly skips '\r' but copies others.
             if char != '\r':
                 # Map unicode char to single byte. 
-                # If outside 0-255 range, replace with '?' (standard safety)
+                # C64 Pro Mono private use chars (U+EE00-U+EFFF) map to a PETSCII byte,
+                # anything else outside 0-255 range is replaced with '?' (standard safety)
                 val = ord(char)
-                if val > 255: val = 63 
+                if val > 255:
+                    petscii_val = private_use_to_byte(char)
+                    val = petscii_val if petscii_val is not None else 63
                 output.append(val)
-            
             i += 1
 
-        # C Logic: C64 BASIC has a problem with zero-length lines
-        if len(output) == 0:
-            output.append(ord(' '))
-            
-        output.append(0) # Null terminator
-        return output
+    def _tokenize_cached(self, content):
+        """
+        _tokenize_line through the LRU line cache. Returns immutable bytes,
+        so a cached body can be shared by every PRG built from it.
+        """
+        if self.line_cache_size <= 0:
+            return bytes(self._tokenize_line(content))
+        key = (content, self.collapse_spaces, self.brace_macros)
+        cached = self.line_cache.get(key)
+        if cached is not None:
+            self.line_cache.move_to_end(key)
+            self.cache_hits += 1
+            return cached
+        self.cache_misses += 1
+        tokenized = bytes(self._tokenize_line(content))
+        self.line_cache[key] = tokenized
+        if len(self.line_cache) > self.line_cache_size:
+            self.line_cache.popitem(last=False)
+        return tokenized
+
+    @staticmethod
+    def _invert_case(text):
+        converted = []
+        for c in text:
+            if c.isupper():
+                converted.append(c.lower())
+            elif c.islower():
+                converted.append(c.upper())
+            else:
+                converted.append(c)
+        return "".join(converted)
+
+    def _prepare_content(self, content):
+        """Applies invert_case and trim_spaces to the text after a line number."""
+        if self.invert_case:
+            content = self._invert_case(content)
+        if self.trim_spaces:
+            content = content.strip()
+        return content
 
     def convert(self, source_text):
         """
         Convert a string of BASIC source code to PRG bytes.
+
+        All lines are tokenized first, then the PRG is packed into one
+        preallocated buffer (also available as self.buffer).
         """
-        prg = bytearray()
-        
-        # 1. Write Start Address (Little Endian)
-        current_addr = self.start_addr
-        prg.extend(struct.pack('<H', current_addr))
+        # (line number, tokenized body incl. null terminator)
+        program_lines = []
         
         # The C code uses fgets, so we iterate lines.
         lines = source_text.splitlines()
@@ -130,19 +194,11 @@ class Bas2Prg:
 
             # Invert Case logic (C code processes this before number parsing)
             if self.invert_case:
-                converted = []
-                for c in line:
-                    if c.isupper():
-                        converted.append(c.lower())
-                    elif c.islower():
-                        converted.append(c.upper())
-                    else:
-                        converted.append(c)
-                line = "".join(converted)
+                line = self._invert_case(line)
 
             # Parse Line Number
             # We look for leading digits.
-            match = re.match(r'^\s*(\d+)?(.*)', line)
+            match = LINE_NUMBER_RE.match(line)
             if not match:
                 # Should not happen with splitlines logic unless empty, handled above
                 continue
@@ -175,32 +231,328 @@ class Bas2Prg:
 
             # Tokenize content
             # The C code passes the pointer AFTER the line number to tokenize.
-            tokenized_bytes = self._tokenize_line(content_part)
-            
+            program_lines.append((linenum, self._tokenize_cached(content_part)))
+
+        # Size = 2 (load address) + per line 2 (next addr) + 2 (line num) +
+        # content length (incl null) + 2 (end of program)
+        prg = bytearray(4 + sum(len(body) + 4 for _, body in program_lines))
+        numbers = []
+        offsets = []
+
+        # 1. Write Start Address (Little Endian)
+        current_addr = self.start_addr
+        struct.pack_into('<H', prg, 0, current_addr)
+        pos = 2
+
+        for linenum, tokenized_bytes in program_lines:
             # Calculate logic for linked list
-            # Size = 2 (next addr) + 2 (line num) + content length (incl null)
-            tok_len = len(tokenized_bytes)
-            
             # The C code adds: startaddr += toklinelen + 4;
+            tok_len = len(tokenized_bytes)
             next_addr = current_addr + tok_len + 4
             
-            # Write Next Line Address
-            prg.extend(struct.pack('<H', next_addr))
-            
-            # Write Line Number
-            prg.extend(struct.pack('<H', linenum))
+            # Write Next Line Address and Line Number
+            struct.pack_into('<HH', prg, pos, next_addr, linenum)
+            numbers.append(linenum)
+            offsets.append(pos)
             
             # Write Content
-            prg.extend(tokenized_bytes)
+            prg[pos + 4:pos + 4 + tok_len] = tokenized_bytes
             
             # Update current address for next loop
+            pos += tok_len + 4
             current_addr = next_addr
 
-        # Write End of Program (Double Null: Link 00 00)
+        # End of Program (Double Null: Link 00 00) is already zero in the buffer
+        offsets.append(pos)
+        self.buffer = prg
+        self.line_index = (numbers, offsets)
+        return prg
+
+    def convert_view(self, source_text):
+        """
+        Like convert(), but returns a read-only memoryview of the PRG buffer,
+        which the transports (KungFuFlashUSB, C64UApiClient) send without copying.
+        """
+        return memoryview(self.convert(source_text)).toreadonly()
+
+    @staticmethod
+    def _index_lines(data):
+        """
+        Walks the line links of a PRG.
+
+        Returns:
+            tuple: (line numbers, offsets of their link fields followed by
+                the offset of the end marker).
+
+        Raises:
+            ValueError: If the PRG is malformed or its line numbers are not
+                strictly ascending.
+        """
+        view = memoryview(data)
+        numbers = []
+        offsets = []
+        pos = 2
+        while pos + 2 <= len(view) and struct.unpack_from('<H', view, pos)[0] != 0:
+            if pos + 4 > len(view):
+                raise ValueError(f"Truncated line header at offset {pos}")
+            line_num = struct.unpack_from('<H', view, pos + 2)[0]
+            if numbers and line_num <= numbers[-1]:
+                raise ValueError(f"Line numbers not ascending at line {line_num}")
+            end = data.find(0, pos + 4)
+            if end < 0:
+                raise ValueError(f"Line {line_num} is not terminated")
+            numbers.append(line_num)
+            offsets.append(pos)
+            pos = end + 1
+        offsets.append(pos)
+        return numbers, offsets
+
+    def convert_delta(self, old_prg, changed_lines):
+        """
+        Rebuild a PRG after a few lines changed, without re-tokenizing the rest.
+
+        Bytes before the first changed line are copied as they are, runs of
+        unchanged lines after it are copied in one slice each and only get
+        new link addresses. For sources with ascending line numbers the result
+        is identical to convert() on the edited source.
+
+        When old_prg is the last PRG this converter built (self.buffer), its
+        line index is reused instead of walking the old line links. Re-linking
+        the lines after the first change is still linear in their number.
+
+        Args:
+            old_prg: PRG bytes produced by convert() with the same options.
+            changed_lines: {line_number: text after the line number}; None
+                deletes the line, a new number inserts it.
+
+        Returns:
+            bytearray: The new PRG.
+
+        Raises:
+            ValueError: If old_prg is malformed or its line numbers are not
+                strictly ascending.
+        """
+        data = old_prg if isinstance(old_prg, (bytes, bytearray)) else bytes(old_prg)
+        view = memoryview(data)
+        if len(view) < 2:
+            raise ValueError("PRG too small (must be at least 2 bytes)")
+        load_addr = struct.unpack_from('<H', view, 0)[0]
+        if old_prg is self.buffer and self.line_index is not None:
+            numbers, offsets = self.line_index
+        else:
+            numbers, offsets = self._index_lines(data)
+
+        keep = len(numbers)
+        if load_addr != self.start_addr:
+            keep = 0
+        elif changed_lines:
+            keep = bisect_left(numbers, min(changed_lines))
+
+        prg = bytearray(struct.pack('<H', self.start_addr))
+        prg.extend(view[2:offsets[keep]])
+        new_numbers = numbers[:keep]
+        new_offsets = offsets[:keep]
+        # Address of PRG offset 0 (the load address field itself)
+        base_addr = self.start_addr - 2
+
+        def copy_run(first, last):
+            # Unchanged lines first..last-1 in one slice, then fix their links
+            if first >= last:
+                return
+            shift = len(prg) - offsets[first]
+            prg.extend(view[offsets[first]:offsets[last]])
+            for idx in range(first, last):
+                struct.pack_into('<H', prg, offsets[idx] + shift, base_addr + offsets[idx + 1] + shift)
+            new_numbers.extend(numbers[first:last])
+            new_offsets.extend(offset + shift for offset in offsets[first:last])
+
+        old_idx = keep
+        for line_num, text in sorted(changed_lines.items()):
+            next_idx = bisect_left(numbers, line_num, old_idx)
+            copy_run(old_idx, next_idx)
+            if next_idx < len(numbers) and numbers[next_idx] == line_num:
+                next_idx += 1
+            old_idx = next_idx
+            if text is not None:
+                body = self._tokenize_cached(self._prepare_content(text))
+                new_numbers.append(line_num)
+                new_offsets.append(len(prg))
+                prg.extend(struct.pack('<HH', base_addr + len(prg) + len(body) + 4, line_num))
+                prg.extend(body)
+        copy_run(old_idx, len(numbers))
+
+        new_offsets.append(len(prg))
         prg.extend(struct.pack('<H', 0))
-        
+        self.buffer = prg
+        self.line_index = (new_numbers, new_offsets)
         return prg
 
+def line_changes(old_source, new_source):
+    """
+    Changed lines between two sources, in the form convert_delta expects.
+
+    Only the lines between the common head and tail of both sources (plus
+    one neighbour on each side, for the ascending check) are parsed.
+
+    Returns:
+        dict: {line_number: new text after the number, or None if deleted},
+        or None if the edited region has unnumbered, duplicate or
+        non-ascending lines, in which case only convert() gives the same PRG.
+    """
+    old_lines = [line for line in old_source.splitlines() if line]
+    new_lines = [line for line in new_source.splitlines() if line]
+    limit = min(len(old_lines), len(new_lines))
+    head = 0
+    while head < limit and old_lines[head] == new_lines[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and old_lines[-1 - tail] == new_lines[-1 - tail]:
+        tail += 1
+
+    def numbered(lines):
+        parsed = {}
+        last = -1
+        for line in lines[max(head - 1, 0):len(lines) - tail + 1]:
+            match = LINE_NUMBER_RE.match(line)
+            if not match.group(1) or int(match.group(1)) <= last or int(match.group(1)) > 65535:
+                return None
+            last = int(match.group(1))
+            parsed[last] = match.group(2)
+        return parsed
+
+    old_window = numbered(old_lines)
+    new_window = numbered(new_lines)
+    if old_window is None or new_window is None:
+        return None
+    changes = {num: text for num, text in new_window.items() if old_window.get(num) != text}
+    changes.update({num: None for num in old_window if num not in new_window})
+    return changes
+
+# -----------------------------------------------------------------------------
+# Batch Conversion with Content-Addressed Cache
+# -----------------------------------------------------------------------------
+
+# Bump when the converter output changes, so stale cache entries are not reused
+CACHE_VERSION = 3
+
+def cache_key(source_bytes, options, crunch=False):
+    """
+    Content address of a conversion: hash of the source bytes, the converter
+    options, whether the source is crunched first and CACHE_VERSION.
+    """
+    h = hashlib.sha256()
+    h.update(source_bytes)
+    h.update(json.dumps({"options": options, "crunch": crunch, "version": CACHE_VERSION},
+                        sort_keys=True).encode())
+    return h.hexdigest()
+
+def _cache_path(cache_dir, key):
+    return os.path.join(cache_dir, key[:2], f"{key}.prg")
+
+def _convert_batch_file(source_path, output_path, cache_dir, options, crunch=False):
+    """
+    Worker for convert_batch: converts one file unless its PRG is already in
+    the cache. Runs in a pool process, so it only takes picklable arguments.
+    """
+    started = time.perf_counter()
+    with open(source_path, 'rb') as f:
+        source_bytes = f.read()
+    key = cache_key(source_bytes, options, crunch)
+    cached_path = _cache_path(cache_dir, key)
+
+    if os.path.exists(cached_path):
+        with open(cached_path, 'rb') as f:
+            prg_data = f.read()
+        cache_hit = True
+    else:
+        source_text = source_bytes.decode('utf-8', errors='replace')
+        if crunch:
+            try:
+                from utils.bas_crunch import crunch_source
+            except ModuleNotFoundError:
+                from bas_crunch import crunch_source
+            source_text, _ = crunch_source(source_text)
+        prg_data = Bas2Prg(**options).convert(source_text)
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        # Write to a temp name first so a concurrent reader never sees a partial entry
+        temp_path = f"{cached_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(prg_data)
+        os.replace(temp_path, cached_path)
+        cache_hit = False
+
+    with open(output_path, 'wb') as f:
+        f.write(prg_data)
+
+    return {
+        "source": source_path,
+        "output": output_path,
+        "key": key,
+        "source_bytes": len(source_bytes),
+        "prg_bytes": len(prg_data),
+        "cache": "hit" if cache_hit else "miss",
+        "seconds": round(time.perf_counter() - started, 6),
+    }
+
+def convert_batch(source_dir, output_dir=None, cache_dir=None, jobs=None, options=None, pattern=".bas",
+                  crunch=False):
+    """
+    Convert every BASIC file in source_dir to PRG using a process pool.
+
+    Args:
+        source_dir: Directory containing the BASIC sources.
+        output_dir: Where the PRGs are written (default: source_dir).
+        cache_dir: Content-addressed PRG cache (default: <output_dir>/.prg_cache).
+        jobs: Number of worker processes (default: CPU count).
+        options: Bas2Prg constructor arguments.
+        pattern: File name suffix of the sources to convert.
+        crunch: Crunch every source with bas_crunch before converting it.
+
+    Returns:
+        dict: Manifest with one entry per file and aggregate totals.
+    """
+    options = dict(options or {})
+    output_dir = output_dir or source_dir
+    cache_dir = cache_dir or os.path.join(output_dir, ".prg_cache")
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    sources = sorted(name for name in os.listdir(source_dir) if name.lower().endswith(pattern))
+    started = time.perf_counter()
+    files = []
+    errors = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {}
+        for name in sources:
+            source_path = os.path.join(source_dir, name)
+            output_path = os.path.join(output_dir, os.path.splitext(name)[0] + ".prg")
+            future = pool.submit(_convert_batch_file, source_path, output_path, cache_dir, options, crunch)
+            futures[future] = source_path
+        for future in as_completed(futures):
+            try:
+                files.append(future.result())
+            except Exception as e:
+                logger.error(f"Error converting {futures[future]}: {e}")
+                errors.append({"source": futures[future], "error": str(e)})
+
+    files.sort(key=lambda entry: entry["source"])
+    hits = sum(1 for entry in files if entry["cache"] == "hit")
+    return {
+        "options": options,
+        "crunch": crunch,
+        "cache_dir": cache_dir,
+        "files": files,
+        "errors": errors,
+        "totals": {
+            "files": len(files),
+            "cache_hits": hits,
+            "cache_misses": len(files) - hits,
+            "errors": len(errors),
+            "prg_bytes": sum(entry["prg_bytes"] for entry in files),
+            "seconds": round(time.perf_counter() - started, 6),
+        },
+    }
+
 # -----------------------------------------------------------------------------
 # Command Line Interface
 # -----------------------------------------------------------------------------
@@ -208,13 +560,19 @@ class Bas2Prg:
 def main():
     parser = argparse.ArgumentParser(description="Convert C64 BASIC text file to PRG.")
     parser.add_argument('filename', nargs='?', help="Input filename (stdin if empty)")
-    parser.add_argument('-o', '--output', help="Output filename")
+    parser.add_argument('-o', '--output', help="Output filename (output directory with --batch)")
     parser.add_argument('-a', '--autonumber', action='store_true', help="Auto-number lines if missing")
     parser.add_argument('-c', '--collapsespaces', action='store_true', help="Collapse spaces in non-quoted/rem sections")
     parser.add_argument('-i', '--invertcase', action='store_true', help="Invert case (Swap ASCII/PETSCII)")
     parser.add_argument('-s', '--startaddr', type=str, default="0x0801", help="Start address (default 0x0801)")
     parser.add_argument('-t', '--trimspaces', action='store_true', help="Trim spaces from beginning/end of lines")
     parser.add_argument('-d', '--debug', action='store_true', help="Enable debug output")
+    parser.add_argument('-m', '--nomacros', action='store_true', help="Keep {CLR}-style macros in strings as plain text")
+    parser.add_argument('-k', '--crunch', action='store_true', help="Crunch the program first (remove REMs/LETs/spaces, merge lines)")
+    parser.add_argument('-b', '--batch', metavar='DIR', help="Convert every .bas file in DIR")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Worker processes for --batch (default: CPU count)")
+    parser.add_argument('--cache-dir', help="PRG cache directory for --batch (default: <output>/.prg_cache)")
+    parser.add_argument('--manifest', help="Write the --batch JSON manifest to this file (default: stdout)")
 
     args = parser.parse_args()
 
@@ -234,6 +592,28 @@ def main():
     if args.debug:
         logger.debug(f"Load address: ${start_addr:04X}")
 
+    if args.batch:
+        options = {
+            "start_addr": start_addr,
+            "invert_case": args.invertcase,
+            "auto_number": args.autonumber,
+            "trim_spaces": args.trimspaces,
+            "collapse_spaces": args.collapsespaces,
+            "brace_macros": not args.nomacros,
+        }
+        manifest = convert_batch(args.batch, output_dir=args.output, cache_dir=args.cache_dir,
+                                 jobs=args.jobs, options=options, crunch=args.crunch)
+        manifest_json = json.dumps(manifest, indent=2)
+        if args.manifest:
+            with open(args.manifest, 'w', encoding='utf-8') as f:
+                f.write(manifest_json)
+        else:
+            print(manifest_json)
+        totals = manifest["totals"]
+        logger.info(f"Converted {totals['files']} file(s): {totals['cache_hits']} cache hit(s), "
+                    f"{totals['cache_misses']} miss(es), {totals['errors']} error(s)")
+        sys.exit(1 if totals["errors"] else 0)
+
     # Input handling
     if args.filename:
         try:
@@ -246,12 +626,21 @@ def main():
     else:
         source_text = sys.stdin.read()
 
+    if args.crunch:
+        try:
+            from utils.bas_crunch import crunch_source, format_report
+        except ModuleNotFoundError:
+            from bas_crunch import crunch_source, format_report
+        source_text, crunch_stats = crunch_source(source_text)
+        print(format_report(crunch_stats), file=sys.stderr)
+
     converter = Bas2Prg(
         start_addr=start_addr,
         invert_case=args.invertcase,
         auto_number=args.autonumber,
         trim_spaces=args.trimspaces,
-        collapse_spaces=args.collapsespaces
+        collapse_spaces=args.collapsespaces,
+        brace_macros=not args.nomacros
     )
 
     prg_data = converter.convert(source_text)
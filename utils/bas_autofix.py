@@ -0,0 +1,539 @@
+"""
+C64 BASIC Rule-Based Auto-Fixer
+
+Many issues reported by SyntaxChecker are mechanical and do not need an LLM
+round trip that re-emits the whole program. This module applies rewrites
+that do not change what the program does on a real C64, re-checks the
+result and reports which errors are left for the LLM:
+- lowercase_keywords: code outside strings and REM is upper-cased, so
+  Bas2Prg tokenizes the keywords.
+- brace_macros: {CLR}-style macros written outside a string are moved into
+  the adjacent string (or wrapped in quotes).
+- unmatched_quote: a closing quote is appended to lines with an odd number
+  of quotes. An open string runs to the end of the line on the C64 anyway.
+- missing_then: THEN is inserted in IF statements without one, before the
+  first statement keyword (IF X PRINT -> IF X THEN PRINT, IF X GOTO 100 ->
+  IF X THEN GOTO 100) or before a trailing line number (IF X 100).
+- duplicate_line_numbers: exact duplicates are dropped; a different line
+  with a repeated number is renumbered into the gap before the next line.
+- next_variable_mismatch: crossed NEXT variables of nested loops
+  (FOR I..FOR J..NEXT I..NEXT J) are swapped.
+- long_lines: lines over 80 screen characters are split at statement
+  boundaries into new lines numbered into the gap before the next line.
+  Lines with IF are never split, since everything after THEN is conditional.
+
+Lines are lexed with c64_ast.lex() (through the cruncher's pieces), which
+tokenizes the same way Bas2Prg does. Counts of applied fixes are kept per rule and summed over all
+calls, so the caller can tell how many LLM fix calls were avoided. A rewrite
+that leaves more errors than the input is discarded.
+
+Usage:
+    python bas_autofix.py program.bas [-o fixed.bas]
+"""
+import argparse
+import re
+import sys
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from utils import c64_ast as ast
+    from utils.bas_crunch import (CRUNCH_LINE_RE, MAX_LINE_LENGTH, TOKEN, STRING, REM_TEXT, SPACE, CHAR,
+                                  Piece, lex_line, join_pieces, split_statements)
+    from utils.c64_petscii import macro_to_bytes
+    from utils.c64_syntax_checker import SyntaxChecker, CheckerSession, Issue
+except ModuleNotFoundError:
+    import c64_ast as ast
+    from bas_crunch import (CRUNCH_LINE_RE, MAX_LINE_LENGTH, TOKEN, STRING, REM_TEXT, SPACE, CHAR,
+                            Piece, lex_line, join_pieces, split_statements)
+    from c64_petscii import macro_to_bytes
+    from c64_syntax_checker import SyntaxChecker, CheckerSession, Issue
+
+logger = logging.getLogger(__name__)
+
+RULES = ("lowercase_keywords", "brace_macros", "unmatched_quote", "missing_then",
+         "duplicate_line_numbers", "next_variable_mismatch", "long_lines")
+
+# Passes over the program; a fix can enable another (e.g. upper-casing reveals a missing THEN)
+MAX_PASSES = 3
+MAX_LINE_NUMBER = 63999
+
+# Keywords that start a statement, i.e. where the THEN branch of an IF begins
+STATEMENT_KEYWORDS = {
+    "END", "FOR", "NEXT", "DATA", "INPUT#", "INPUT", "DIM", "READ", "LET", "GOTO", "RUN", "IF",
+    "RESTORE", "GOSUB", "RETURN", "REM", "STOP", "ON", "WAIT", "LOAD", "SAVE", "VERIFY", "DEF",
+    "POKE", "PRINT#", "PRINT", "CONT", "LIST", "CLR", "CMD", "SYS", "OPEN", "CLOSE", "GET", "NEW",
+}
+
+MACRO_RE = re.compile(r"\{([^{}\"]*)\}")
+VARIABLE_RE = re.compile(r"^[A-Z][A-Z0-9]*[$%]?$")
+
+
+def screen_length(text: str) -> int:
+    """Characters the line takes on the C64 screen; a brace macro counts as the bytes it stands for."""
+    def macro_len(m):
+        codes = macro_to_bytes(m.group(1))
+        return "x" * len(codes) if codes is not None else m.group(0)
+    return len(MACRO_RE.sub(macro_len, text)) if "{" in text else len(text)
+
+
+def _upper_code(content: str) -> str:
+    """
+    Upper-cases the letters of code outside strings and REM text, which
+    c64_ast.lex() finds the way the C64 does once the keywords are upper case.
+    """
+    return "".join(content[lexeme.start:lexeme.end] if lexeme.kind in (ast.STRING, ast.REM_TEXT)
+                   else content[lexeme.start:lexeme.end].translate(ast.ASCII_UPPER)
+                   for lexeme in ast.lex(content))
+
+
+def _words(pieces: List[Piece], start: int, end: int) -> List[Tuple[int, int, str]]:
+    """Groups CHAR pieces in [start, end) into (first, end, text) runs of letters/digits/$/%."""
+    words = []
+    i = start
+    while i < end:
+        if pieces[i][0] == CHAR and pieces[i][1].isalnum():
+            j = i
+            while j < end and pieces[j][0] == CHAR and (pieces[j][1].isalnum() or pieces[j][1] in "$%"):
+                j += 1
+            words.append((i, j, join_pieces(pieces[i:j])))
+            i = j
+        else:
+            i += 1
+    return words
+
+
+@dataclass
+class ProgramLine:
+    number: Optional[int]  # None for lines without a line number, kept verbatim
+    content: str
+
+    def text(self) -> str:
+        return self.content if self.number is None else f"{self.number}{self.content}"
+
+
+@dataclass
+class AutoFixResult:
+    source: str
+    fixes: Dict[str, int] = field(default_factory=dict)  # rule -> fixes applied in this call
+    errors_before: int = 0
+    residual: List[Issue] = field(default_factory=list)  # ERROR issues left after fixing
+
+    @property
+    def changed(self) -> bool:
+        return sum(self.fixes.values()) > 0
+
+    def residual_report(self) -> str:
+        return "\n".join(f"ERROR: Line {i.line}: {i.message}" if i.line is not None else f"ERROR: {i.message}"
+                         for i in self.residual)
+
+    def summary(self) -> str:
+        applied = ", ".join(f"{rule}={count}" for rule, count in self.fixes.items() if count)
+        return (f"Auto-fix: {applied or 'no rules applied'}; "
+                f"{self.errors_before} -> {len(self.residual)} error(s)")
+
+
+class AutoFixer:
+    def __init__(self, rules=RULES, max_line_length: int = MAX_LINE_LENGTH):
+        """
+        Args:
+            rules: Names of the rules to apply, in order.
+            max_line_length: Screen characters per line incl. the line number.
+        """
+        unknown = set(rules) - set(RULES)
+        if unknown:
+            raise ValueError(f"Unknown auto-fix rule(s): {', '.join(sorted(unknown))}")
+        self.rules = tuple(rules)
+        self.max_line_length = max_line_length
+        # Totals over all fix() calls
+        self.rule_counts: Counter = Counter()
+        self.programs_fixed = 0  # programs left without errors by the rules alone
+        self.programs_escalated = 0  # programs that still had errors for the LLM
+
+    def fix(self, source: str, session: Optional[CheckerSession] = None) -> AutoFixResult:
+        """
+        Applies the rules until nothing changes and re-checks the result.
+
+        Args:
+            source: Program text.
+            session: Optional CheckerSession used for the checks.
+
+        Returns:
+            AutoFixResult with the fixed source (the input if the rewrite made
+            things worse), per-rule counts and the residual errors.
+        """
+        errors_before = self._errors(source, session)
+        lines = self._parse(source)
+        fixes: Counter = Counter()
+        for _ in range(MAX_PASSES):
+            applied = 0
+            for rule in self.rules:
+                count = getattr(self, f"_fix_{rule}")(lines)
+                fixes[rule] += count
+                applied += count
+            if not applied:
+                break
+        fixed = "\n".join(line.text() for line in lines) if sum(fixes.values()) else source
+        residual = self._errors(fixed, session) if fixed != source else errors_before
+        if len(residual) > len(errors_before):
+            logger.warning(f"Auto-fix discarded: {len(errors_before)} -> {len(residual)} error(s)")
+            fixed, residual, fixes = source, errors_before, Counter()
+            if session is not None:
+                session.update(source)
+        result = AutoFixResult(fixed, {rule: fixes[rule] for rule in self.rules}, len(errors_before), residual)
+        self.rule_counts.update(fixes)
+        if errors_before and not residual:
+            self.programs_fixed += 1
+        elif residual:
+            self.programs_escalated += 1
+        return result
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "rule_counts": {rule: self.rule_counts[rule] for rule in self.rules},
+            "programs_fixed": self.programs_fixed,
+            "programs_escalated": self.programs_escalated,
+        }
+
+    @staticmethod
+    def _errors(source: str, session: Optional[CheckerSession]) -> List[Issue]:
+        if session is not None:
+            checker = session.update(source)
+        else:
+            checker = SyntaxChecker()
+            checker.load(source)
+            checker.validate()
+        return [issue for issue in checker.issues if issue.severity == 'ERROR']
+
+    @staticmethod
+    def _parse(source: str) -> List[ProgramLine]:
+        lines = []
+        for raw in source.splitlines():
+            m = CRUNCH_LINE_RE.match(raw)
+            if m:
+                lines.append(ProgramLine(int(m.group(1)), m.group(2)))
+            else:
+                lines.append(ProgramLine(None, raw))
+        return lines
+
+    @staticmethod
+    def _next_number(lines: List[ProgramLine], index: int, number: int) -> Optional[int]:
+        """Number of the next line in file order that is above number, None at the end."""
+        for line in lines[index + 1:]:
+            if line.number is not None and line.number > number:
+                return line.number
+        return None
+
+    @staticmethod
+    def _free_number(low: int, high: Optional[int], used: set) -> Optional[int]:
+        """A free line number between low and high (exclusive), preferring round steps."""
+        high = MAX_LINE_NUMBER + 1 if high is None else high
+        for step in (10, 5, 2, 1):
+            candidate = (low // step + 1) * step
+            if candidate < high and candidate not in used:
+                return candidate
+        return None
+
+    # ------------------ Rules ------------------
+    def _fix_lowercase_keywords(self, lines: List[ProgramLine]) -> int:
+        count = 0
+        for line in lines:
+            if line.number is None or line.content == line.content.upper():
+                continue
+            upper = _upper_code(line.content)
+            if upper != line.content:
+                line.content = upper
+                count += 1
+        return count
+
+    def _fix_brace_macros(self, lines: List[ProgramLine]) -> int:
+        count = 0
+        for line in lines:
+            if line.number is None or "{" not in line.content:
+                continue
+            pieces = lex_line(line.content)
+            out: List[Piece] = []
+            i = 0
+            changed = False
+            while i < len(pieces):
+                kind, text = pieces[i]
+                if kind == CHAR and text == "{":
+                    # Collect the macro text up to the closing brace
+                    j = i + 1
+                    while j < len(pieces) and pieces[j][0] in (CHAR, TOKEN, SPACE) and pieces[j][1] != "}":
+                        j += 1
+                    if j < len(pieces) and pieces[j] == (CHAR, "}") and macro_to_bytes(join_pieces(pieces[i + 1:j])):
+                        macro = join_pieces(pieces[i:j + 1])
+                        if j + 1 < len(pieces) and pieces[j + 1][0] == STRING:
+                            # {CLR}"HELLO" -> "{CLR}HELLO"
+                            out.append((STRING, '"' + macro + pieces[j + 1][1][1:]))
+                            i = j + 2
+                        elif out and out[-1][0] == STRING and out[-1][1].endswith('"') and len(out[-1][1]) > 1:
+                            # "HELLO"{WHT} -> "HELLO{WHT}"
+                            out[-1] = (STRING, out[-1][1][:-1] + macro + '"')
+                            i = j + 1
+                        else:
+                            out.append((STRING, '"' + macro + '"'))
+                            i = j + 1
+                        changed = True
+                        continue
+                out.append(pieces[i])
+                i += 1
+            if changed:
+                line.content = join_pieces(out)
+                count += 1
+        return count
+
+    def _fix_unmatched_quote(self, lines: List[ProgramLine]) -> int:
+        count = 0
+        for line in lines:
+            if line.number is not None and line.content.count('"') % 2:
+                line.content += '"'
+                count += 1
+        return count
+
+    def _fix_missing_then(self, lines: List[ProgramLine]) -> int:
+        count = 0
+        for line in lines:
+            if line.number is None or "IF" not in line.content:
+                continue
+            pieces = lex_line(line.content)
+            try:
+                if_idx = pieces.index((TOKEN, "IF"))
+            except ValueError:
+                continue
+            rest = pieces[if_idx + 1:]
+            if (TOKEN, "THEN") in rest:
+                continue
+            insert_at = self._then_position(pieces, if_idx)
+            if insert_at is None:
+                continue
+            then = [(TOKEN, "THEN"), (SPACE, " ")]
+            if pieces[insert_at - 1][0] != SPACE:
+                then.insert(0, (SPACE, " "))
+            line.content = join_pieces(pieces[:insert_at] + then + pieces[insert_at:])
+            count += 1
+        return count
+
+    @staticmethod
+    def _then_position(pieces: List[Piece], if_idx: int) -> Optional[int]:
+        """Index where THEN belongs in an IF without THEN, None if it is not clear."""
+        end = if_idx + 1
+        while end < len(pieces) and pieces[end] != (CHAR, ":") and pieces[end][0] != REM_TEXT:
+            kind, text = pieces[end]
+            if kind == TOKEN and text in STATEMENT_KEYWORDS:
+                # The condition must not be empty
+                return end if any(p[0] != SPACE for p in pieces[if_idx + 1:end]) else None
+            end += 1
+        # IF A=1 100: a line number after the condition, separated by a space
+        j = end
+        while j > if_idx + 1 and pieces[j - 1][0] == SPACE:
+            j -= 1
+        start = j
+        while start > if_idx + 1 and pieces[start - 1][0] == CHAR and pieces[start - 1][1].isdigit():
+            start -= 1
+        if start == j or pieces[start - 1][0] != SPACE:
+            return None
+        k = start - 1
+        while k > if_idx and pieces[k][0] == SPACE:
+            k -= 1
+        if k <= if_idx:
+            return None
+        kind, text = pieces[k]
+        if kind == STRING or (kind == CHAR and (text.isalnum() or text in "$%)")):
+            return start
+        return None
+
+    def _fix_duplicate_line_numbers(self, lines: List[ProgramLine]) -> int:
+        count = 0
+        seen: Dict[int, set] = {}  # original number -> stripped contents seen under it
+        used = {line.number for line in lines if line.number is not None}
+        prev_number = None
+        index = 0
+        while index < len(lines):
+            line = lines[index]
+            if line.number is None:
+                index += 1
+                continue
+            number = line.number
+            if number in seen:
+                if line.content.strip() in seen[number]:
+                    del lines[index]
+                    count += 1
+                    continue
+                seen[number].add(line.content.strip())
+                # Only renumber a line that directly follows its original (or earlier renumbered copies)
+                if prev_number is not None and prev_number >= number:
+                    new_number = self._free_number(prev_number, self._next_number(lines, index, prev_number), used)
+                    if new_number is not None:
+                        line.number = new_number
+                        used.add(new_number)
+                        count += 1
+            else:
+                seen[number] = {line.content.strip()}
+            prev_number = line.number
+            index += 1
+        return count
+
+    def _fix_next_variable_mismatch(self, lines: List[ProgramLine]) -> int:
+        # ('FOR', var) and ('NEXT', var, line index, word span) events in program order
+        events = []
+        lexed: Dict[int, List[Piece]] = {}
+        for index, line in enumerate(lines):
+            if line.number is None or ("FOR" not in line.content and "NEXT" not in line.content):
+                continue
+            pieces = lex_line(line.content)
+            lexed[index] = pieces
+            pos = 0
+            for stmt in split_statements(pieces):
+                code = [(k, p) for k, p in enumerate(stmt) if p[0] != SPACE]
+                if code and code[0][1] == (TOKEN, "FOR"):
+                    words = _words(stmt, code[0][0] + 1, len(stmt))
+                    var = words[0][2] if words and VARIABLE_RE.match(words[0][2]) else None
+                    events.append(("FOR", var))
+                elif code and code[0][1] == (TOKEN, "NEXT"):
+                    words = _words(stmt, code[0][0] + 1, len(stmt))
+                    if any(p == (CHAR, ",") for p in stmt):
+                        events.append(("NEXT", None, None, None))  # variable lists are left alone
+                    elif words:
+                        first, end, var = words[0]
+                        events.append(("NEXT", var, index, (pos + first, pos + end)))
+                    else:
+                        events.append(("NEXT", None, None, None))
+                pos += len(stmt) + 1
+
+        count = 0
+        rewrites: Dict[int, List[Tuple[Tuple[int, int], str]]] = {}
+        stack: List[Optional[str]] = []
+        i = 0
+        while i < len(events):
+            event = events[i]
+            if event[0] == "FOR":
+                stack.append(event[1])
+                i += 1
+                continue
+            var = event[1]
+            nxt = events[i + 1] if i + 1 < len(events) else None
+            if (var is not None and len(stack) >= 2 and stack[-1] is not None and var != stack[-1]
+                    and var == stack[-2] and nxt is not None and nxt[0] == "NEXT" and nxt[1] == stack[-1]):
+                # FOR I..FOR J..NEXT I..NEXT J: swap the two NEXT variables
+                rewrites.setdefault(event[2], []).append((event[3], nxt[1]))
+                rewrites.setdefault(nxt[2], []).append((nxt[3], var))
+                stack = stack[:-2]
+                count += 1
+                i += 2
+                continue
+            if stack:
+                stack.pop()
+            i += 1
+
+        for index, spans in rewrites.items():
+            pieces = lexed[index]
+            for (start, end), var in sorted(spans, reverse=True):
+                pieces[start:end] = [(CHAR, var)]
+            lines[index].content = join_pieces(pieces)
+        return count
+
+    def _fix_long_lines(self, lines: List[ProgramLine]) -> int:
+        count = 0
+        used = {line.number for line in lines if line.number is not None}
+        index = 0
+        while index < len(lines):
+            line = lines[index]
+            if line.number is None or screen_length(line.text()) <= self.max_line_length:
+                index += 1
+                continue
+            pieces = lex_line(line.content)
+            if (TOKEN, "IF") in pieces:
+                index += 1
+                continue
+            statements = [join_pieces(stmt).strip() for stmt in split_statements(pieces)]
+            parts = self._pack(line.number, statements)
+            if parts is None:
+                index += 1
+                continue
+            numbers = [line.number]
+            next_number = self._next_number(lines, index, line.number)
+            for _ in parts[1:]:
+                new_number = self._free_number(numbers[-1], next_number, used)
+                if new_number is None:
+                    break
+                numbers.append(new_number)
+            if len(numbers) < len(parts):
+                index += 1
+                continue
+            used.update(numbers)
+            lead = " " if line.content.startswith(" ") else ""
+            lines[index:index + 1] = [ProgramLine(n, lead + part) for n, part in zip(numbers, parts)]
+            count += 1
+            index += len(parts)
+        return count
+
+    def _pack(self, number: int, statements: List[str]) -> Optional[List[str]]:
+        """Greedily packs statements into lines of at most max_line_length screen characters."""
+        if len(statements) < 2:
+            return None
+        # New lines get numbers of up to the same width
+        width = len(str(number)) + 1
+        parts: List[str] = []
+        for stmt in statements:
+            if parts and width + screen_length(parts[-1] + ":" + stmt) <= self.max_line_length:
+                parts[-1] += ":" + stmt
+            elif width + screen_length(stmt) <= self.max_line_length:
+                parts.append(stmt)
+            else:
+                return None
+        return parts if len(parts) > 1 else None
+
+
+def autofix_source(source_text: str, **options) -> AutoFixResult:
+    """Convenience wrapper around AutoFixer(**options).fix()."""
+    return AutoFixer(**options).fix(source_text)
+
+# -----------------------------------------------------------------------------
+# Command Line Interface
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply safe rule-based fixes to a C64 BASIC program.")
+    parser.add_argument('filename', nargs='?', help="Input filename (stdin if empty)")
+    parser.add_argument('-o', '--output', help="Output filename (stdout if empty)")
+    parser.add_argument('--rules', help=f"Comma-separated rules to apply (default: all of {','.join(RULES)})")
+
+    args = parser.parse_args()
+
+    if args.filename:
+        try:
+            with open(args.filename, 'r', encoding='utf-8', errors='replace') as f:
+                source_text = f.read()
+        except Exception as e:
+            logger.error(f"Error reading input: {e}")
+            sys.exit(3)
+    else:
+        source_text = sys.stdin.read()
+
+    try:
+        fixer = AutoFixer(rules=args.rules.split(",") if args.rules else RULES)
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(3)
+    result = fixer.fix(source_text)
+    print(result.summary(), file=sys.stderr)
+    if result.residual:
+        print(result.residual_report(), file=sys.stderr)
+
+    if args.output:
+        try:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(result.source + "\n")
+        except Exception as e:
+            logger.error(f"Unable to create output '{args.output}': {e}")
+            sys.exit(2)
+    else:
+        print(result.source)
+    sys.exit(1 if result.residual else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,407 @@
+"""
+C64 BASIC Cruncher
+
+Optional optimization pass that makes generated programs smaller and faster
+on a real C64 before they are tokenized by Bas2Prg:
+- Removes REM statements. REM-only lines that are jump targets are removed as
+  well and every GOTO/GOSUB/THEN/ON/RUN reference to them is redirected to
+  the next remaining line, which is where execution would continue anyway.
+- Drops the optional LET keyword.
+- Drops spaces outside strings, REM and DATA statements. A line is only
+  despaced if it still tokenizes to the same keywords afterwards.
+- Merges fall-through lines into the previous line while the result stays
+  within the 80 character entry limit. Lines that are jump targets and lines
+  following an IF are never merged.
+
+A GOTO, GOSUB or RUN whose target is computed (GOTO X, GOSUB A*10) can reach
+any line, so a program with one keeps all its lines: REM-only lines stay as
+a bare REM and no lines are merged.
+
+Lines are lexed with c64_ast.lex(), the lexer Bas2Prg tokenizes with
+(upper-case keywords, first match wins), so what the cruncher treats as a
+keyword is exactly what ends up as a token in the PRG.
+
+Usage:
+    python bas_crunch.py program.bas [-o crunched.bas]
+"""
+import argparse
+import sys
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from utils import c64_ast as ast
+    from utils.bas2prg import Bas2Prg
+except ModuleNotFoundError:
+    import c64_ast as ast
+    from bas2prg import Bas2Prg
+
+logger = logging.getLogger(__name__)
+
+MAX_LINE_LENGTH = 80
+CRUNCH_LINE_RE = re.compile(r'^\s*(\d+)(.*)$')
+
+# Piece kinds produced by lex_line
+TOKEN, STRING, REM_TEXT, SPACE, CHAR = "token", "string", "rem", "space", "char"
+
+JUMP_KEYWORDS = ("GOTO", "GOSUB", "THEN", "RUN")
+
+Piece = Tuple[str, str]
+
+
+def lex_line(content: str) -> List[Piece]:
+    """
+    Splits line content into (kind, text) pieces, using the lexemes of
+    c64_ast.lex() as Bas2Prg sees them. Keywords and operators are TOKEN
+    pieces (the sign of an exponent too, as Bas2Prg tokenizes it), text
+    after REM is a single REM_TEXT piece and strings (including unterminated
+    ones) are single STRING pieces. Everything else is split into one SPACE
+    or CHAR piece per character.
+    """
+    pieces: List[Piece] = []
+    for lexeme in ast.lex(content, fold_case=False):
+        kind, text = lexeme.kind, lexeme.text
+        if kind == ast.KEYWORD or kind == ast.OPERATOR:
+            pieces.append((TOKEN, text))
+        elif kind == ast.STRING:
+            pieces.append((STRING, text))
+        elif kind == ast.REM_TEXT:
+            pieces.append((REM_TEXT, text))
+        elif kind == ast.SPACE:
+            pieces.extend((SPACE, char) for char in text)
+        elif kind == ast.NUMBER:
+            pieces.extend((TOKEN if char in "+-" else CHAR, char) for char in text)
+        else:
+            pieces.extend((CHAR, char) for char in text)
+    return pieces
+
+
+def join_pieces(pieces: List[Piece]) -> str:
+    return "".join(text for _, text in pieces)
+
+
+def split_statements(pieces: List[Piece]) -> List[List[Piece]]:
+    statements: List[List[Piece]] = [[]]
+    for piece in pieces:
+        if piece == (CHAR, ":"):
+            statements.append([])
+        else:
+            statements[-1].append(piece)
+    return statements
+
+
+def _first_code_piece(statement: List[Piece]) -> Optional[Piece]:
+    return next((p for p in statement if p[0] != SPACE), None)
+
+
+def _number_run(pieces: List[Piece], start: int) -> Tuple[int, int]:
+    """Returns (first, end) piece indexes of the digit run at/after start, skipping spaces."""
+    while start < len(pieces) and pieces[start][0] == SPACE:
+        start += 1
+    end = start
+    while end < len(pieces) and pieces[end][0] == CHAR and pieces[end][1].isdigit():
+        end += 1
+    return start, end
+
+
+def find_jump_targets(pieces: List[Piece]) -> List[Tuple[int, int, int]]:
+    """
+    Finds literal line-number references in a lexed line.
+
+    Returns:
+        List of (first_piece, end_piece, line_number) for every target of
+        GOTO, GO TO, GOSUB, THEN, RUN and ON ... GOTO/GOSUB lists.
+    """
+    targets: List[Tuple[int, int, int]] = []
+    i = 0
+    while i < len(pieces):
+        kind, text = pieces[i]
+        if kind == TOKEN and text == "GO":
+            j = i + 1
+            while j < len(pieces) and pieces[j][0] == SPACE:
+                j += 1
+            if j < len(pieces) and pieces[j] == (TOKEN, "TO"):
+                i = j
+                text = "GOTO"
+        if kind == TOKEN and text in JUMP_KEYWORDS:
+            start, end = _number_run(pieces, i + 1)
+            if end > start:
+                targets.append((start, end, int(join_pieces(pieces[start:end]))))
+                # ON ... GOTO/GOSUB line lists continue after commas
+                while True:
+                    j = end
+                    while j < len(pieces) and pieces[j][0] == SPACE:
+                        j += 1
+                    if j < len(pieces) and pieces[j] == (CHAR, ","):
+                        start, end = _number_run(pieces, j + 1)
+                        if end > start:
+                            targets.append((start, end, int(join_pieces(pieces[start:end]))))
+                            continue
+                    break
+                i = end
+                continue
+        i += 1
+    return targets
+
+
+def find_computed_jumps(pieces: List[Piece]) -> int:
+    """
+    Counts the GOTO, GO TO, GOSUB and RUN in a lexed line whose target is an
+    expression instead of a line number. After THEN anything but a number is
+    a statement, not a target.
+    """
+    count = 0
+    for i, (kind, text) in enumerate(pieces):
+        if kind != TOKEN or text not in ("GOTO", "GOSUB", "RUN", "TO"):
+            continue
+        if text == "TO":
+            j = i - 1
+            while j >= 0 and pieces[j][0] == SPACE:
+                j -= 1
+            if j < 0 or pieces[j] != (TOKEN, "GO"):
+                continue
+        start, end = _number_run(pieces, i + 1)
+        if end == start and start < len(pieces) and pieces[start] != (CHAR, ":"):
+            count += 1
+    return count
+
+
+def rewrite_jump_targets(pieces: List[Piece], mapping: Dict[int, int]) -> List[Piece]:
+    """Returns a copy of the pieces with every jump target replaced via mapping."""
+    targets = find_jump_targets(pieces)
+    if not targets:
+        return list(pieces)
+    result: List[Piece] = []
+    pos = 0
+    for start, end, number in targets:
+        result.extend(pieces[pos:start])
+        result.append((CHAR, str(mapping.get(number, number))))
+        pos = end
+    result.extend(pieces[pos:])
+    return result
+
+
+def _strip_code_spaces(statement: List[Piece]) -> List[Piece]:
+    first = _first_code_piece(statement)
+    if first == (TOKEN, "DATA"):
+        # Unquoted DATA items keep their inner spaces when READ
+        idx = statement.index(first)
+        return statement[idx:]
+    return [p for p in statement if p[0] != SPACE]
+
+
+def _token_signature(tokenized: bytes) -> bytes:
+    """Tokenized bytes without spaces outside strings, REM and DATA."""
+    out = bytearray()
+    quoted = rem_mode = data_mode = False
+    for byte_val in tokenized:
+        if byte_val == 0x22:
+            quoted = not quoted
+        elif not quoted:
+            if byte_val == 0x8F:
+                rem_mode = True
+            elif byte_val == 0x83:
+                data_mode = True
+            elif byte_val == 0x3A:
+                data_mode = False
+        if byte_val == 0x20 and not (quoted or rem_mode or data_mode):
+            continue
+        out.append(byte_val)
+    return bytes(out)
+
+
+class BasicCruncher:
+    def __init__(self, remove_rems: bool = True, remove_let: bool = True,
+                 remove_spaces: bool = True, merge_lines: bool = True,
+                 max_line_length: int = MAX_LINE_LENGTH):
+        self.remove_rems = remove_rems
+        self.remove_let = remove_let
+        self.remove_spaces = remove_spaces
+        self.merge_lines = merge_lines
+        self.max_line_length = max_line_length
+        self._tokenizer = Bas2Prg()
+
+    def _crunch_statements(self, pieces: List[Piece], stats: Dict[str, int]) -> List[List[Piece]]:
+        kept: List[List[Piece]] = []
+        for statement in split_statements(pieces):
+            first = _first_code_piece(statement)
+            if first is None:
+                continue
+            if self.remove_rems and first == (TOKEN, "REM"):
+                stats["rems_removed"] += 1
+                continue
+            if self.remove_let and first == (TOKEN, "LET"):
+                idx = statement.index(first)
+                statement = statement[:idx] + statement[idx + 1:]
+                stats["lets_removed"] += 1
+            kept.append(statement)
+        return kept
+
+    def _despace(self, statements: List[List[Piece]], stats: Dict[str, int]) -> str:
+        spaced = ":".join(join_pieces(s) for s in statements)
+        if not self.remove_spaces:
+            return spaced
+        despaced = ":".join(join_pieces(_strip_code_spaces(s)) for s in statements)
+        if despaced == spaced:
+            return spaced
+        expected = _token_signature(self._tokenizer._tokenize_line(spaced))
+        if self._tokenizer._tokenize_line(despaced) != expected:
+            # Removing the spaces would form different keywords (e.g. "F OR" -> "FOR")
+            stats["lines_kept_spaced"] += 1
+            return spaced
+        stats["spaces_removed"] += len(spaced) - len(despaced)
+        return despaced
+
+    def crunch(self, source_text: str) -> Tuple[str, Dict[str, int]]:
+        """
+        Crunch a BASIC program.
+
+        Returns:
+            (crunched_source, report) where report holds the before/after
+            PRG sizes and per-optimization counters. The source is returned
+            unchanged if it has unnumbered, duplicate or unordered lines.
+        """
+        stats = {
+            "bytes_before": len(Bas2Prg().convert(source_text)),
+            "bytes_after": 0,
+            "lines_before": 0,
+            "lines_after": 0,
+            "rems_removed": 0,
+            "lets_removed": 0,
+            "spaces_removed": 0,
+            "lines_kept_spaced": 0,
+            "lines_merged": 0,
+            "targets_redirected": 0,
+            "computed_jumps": 0,
+        }
+
+        lines: List[Tuple[int, List[Piece]]] = []
+        for raw in source_text.splitlines():
+            if not raw.strip():
+                continue
+            m = CRUNCH_LINE_RE.match(raw)
+            if not m or (lines and int(m.group(1)) <= lines[-1][0]):
+                logger.warning(f"Crunch skipped: unnumbered, duplicate or unordered line '{raw}'")
+                stats["bytes_after"] = stats["bytes_before"]
+                stats["lines_before"] = stats["lines_after"] = len(source_text.splitlines())
+                return source_text, stats
+            lines.append((int(m.group(1)), lex_line(m.group(2))))
+        stats["lines_before"] = len(lines)
+
+        targets = set()
+        for _, pieces in lines:
+            targets.update(number for _, _, number in find_jump_targets(pieces))
+            stats["computed_jumps"] += find_computed_jumps(pieces)
+        # Any line may be the target of a computed jump
+        keep_lines = stats["computed_jumps"] > 0
+        if keep_lines:
+            logger.warning(f"{stats['computed_jumps']} GOTO/GOSUB/RUN with a computed target: "
+                           f"keeping REM-only lines and not merging lines")
+
+        # 1. Statement level crunching, REM-only lines disappear
+        crunched: List[Tuple[int, List[List[Piece]]]] = []
+        redirect: Dict[int, Optional[int]] = {}
+        pending_removed: List[int] = []
+        for number, pieces in lines:
+            statements = self._crunch_statements(pieces, stats)
+            if not statements and keep_lines:
+                statements = [[(TOKEN, "REM")]]
+            if not statements:
+                pending_removed.append(number)
+                continue
+            for removed in pending_removed:
+                redirect[removed] = number
+            pending_removed = []
+            crunched.append((number, statements))
+        if pending_removed:
+            # Trailing REM-only lines: keep the first targeted one as a bare REM
+            kept_tail = next((n for n in pending_removed if n in targets), None)
+            if kept_tail is not None:
+                crunched.append((kept_tail, [[(TOKEN, "REM")]]))
+                for removed in pending_removed:
+                    redirect[removed] = kept_tail
+
+        mapping = {old: new for old, new in redirect.items() if new is not None and old in targets}
+        stats["targets_redirected"] = len(mapping)
+        final_targets = {mapping.get(t, t) for t in targets}
+
+        # 2. Rewrite jump targets, despace
+        output: List[Tuple[int, str, bool]] = []
+        for number, statements in crunched:
+            rewritten = [rewrite_jump_targets(s, mapping) if mapping else s for s in statements]
+            has_if = any((TOKEN, "IF") in s or (TOKEN, "REM") in s for s in rewritten)
+            output.append((number, self._despace(rewritten, stats), has_if))
+
+        # 3. Merge fall-through lines
+        merged: List[Tuple[int, str, bool]] = []
+        for number, content, has_if in output:
+            if self.merge_lines and not keep_lines and merged and number not in final_targets:
+                prev_number, prev_content, prev_has_if = merged[-1]
+                candidate = f"{prev_content}:{content}"
+                if not prev_has_if and len(str(prev_number)) + 1 + len(candidate) <= self.max_line_length:
+                    merged[-1] = (prev_number, candidate, has_if)
+                    stats["lines_merged"] += 1
+                    continue
+            merged.append((number, content, has_if))
+
+        result = "\n".join(f"{number}{content}" for number, content, _ in merged)
+        stats["lines_after"] = len(merged)
+        stats["bytes_after"] = len(Bas2Prg().convert(result))
+        return result, stats
+
+
+def crunch_source(source_text: str, **options) -> Tuple[str, Dict[str, int]]:
+    """Convenience wrapper around BasicCruncher(**options).crunch()."""
+    return BasicCruncher(**options).crunch(source_text)
+
+
+def format_report(stats: Dict[str, int]) -> str:
+    saved = stats["bytes_before"] - stats["bytes_after"]
+    return (f"Crunched {stats['bytes_before']} -> {stats['bytes_after']} bytes ({saved} saved), "
+            f"{stats['lines_before']} -> {stats['lines_after']} lines, "
+            f"{stats['rems_removed']} REM(s) and {stats['lets_removed']} LET(s) removed, "
+            f"{stats['lines_merged']} line(s) merged, {stats['targets_redirected']} target(s) redirected"
+            + (f"; {stats['computed_jumps']} computed jump target(s), so all lines were kept unmerged"
+               if stats.get('computed_jumps') else ""))
+
+# -----------------------------------------------------------------------------
+# Command Line Interface
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Crunch a C64 BASIC program (smaller, faster PRG).")
+    parser.add_argument('filename', nargs='?', help="Input filename (stdin if empty)")
+    parser.add_argument('-o', '--output', help="Output filename (stdout if empty)")
+    parser.add_argument('--keep-rems', action='store_true', help="Do not remove REM statements")
+    parser.add_argument('--keep-spaces', action='store_true', help="Do not remove spaces")
+    parser.add_argument('--no-merge', action='store_true', help="Do not merge lines")
+
+    args = parser.parse_args()
+
+    if args.filename:
+        try:
+            with open(args.filename, 'r', encoding='utf-8', errors='replace') as f:
+                source_text = f.read()
+        except Exception as e:
+            logger.error(f"Error reading input: {e}")
+            sys.exit(3)
+    else:
+        source_text = sys.stdin.read()
+
+    crunched, stats = crunch_source(source_text, remove_rems=not args.keep_rems,
+                                    remove_spaces=not args.keep_spaces, merge_lines=not args.no_merge)
+    print(format_report(stats), file=sys.stderr)
+
+    if args.output:
+        try:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(crunched + "\n")
+        except Exception as e:
+            logger.error(f"Unable to create output '{args.output}': {e}")
+            sys.exit(2)
+    else:
+        print(crunched)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+"""
+C64 BASIC Renumber & Hot-Path Layout Optimizer
+
+C64 BASIC resolves GOTO/GOSUB/THEN/ON targets by walking the line link
+chain: from the line after the current one for forward jumps, from the
+program start otherwise. A subroutine at a high line number that is called
+from the main game loop therefore costs a scan over most of the program on
+every call.
+
+This tool:
+- Takes the control-flow graph from SyntaxChecker.validate() and treats lines
+  on CFG cycles (and inside FOR/NEXT spans) as hot.
+- Weighs every jump site by how hot its line is and estimates the total
+  line-search cost of the program.
+- Moves GOSUB routines that are called from hot lines to the program start,
+  behind a single GOTO to the original entry line. The moved block is the run
+  of lines from the GOSUB target to the first line that does not fall through;
+  it has to lie in the subroutine's extent (SyntaxChecker.subroutine_extents()),
+  no line may fall into it and it may not hold DATA.
+  Backward searches from the loop then only scan a few lines.
+- Renumbers the program and rewrites all GOTO/GO TO/GOSUB/THEN/ON/RUN targets.
+
+Usage:
+    python bas_renumber.py program.bas [-o out.bas] [--start 10] [--step 10] [--no-relayout]
+"""
+import argparse
+import sys
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    from utils.bas_crunch import (CRUNCH_LINE_RE, TOKEN, Piece, lex_line, join_pieces,
+                                  find_jump_targets, rewrite_jump_targets)
+    from utils.c64_syntax_checker import SyntaxChecker
+    from utils import c64_ast as ast
+except ModuleNotFoundError:
+    from bas_crunch import (CRUNCH_LINE_RE, TOKEN, Piece, lex_line, join_pieces,
+                            find_jump_targets, rewrite_jump_targets)
+    from c64_syntax_checker import SyntaxChecker
+    import c64_ast as ast
+
+logger = logging.getLogger(__name__)
+
+LOOP_WEIGHT = 10      # assumed iterations of a CFG cycle or a FOR/NEXT loop
+MAX_WEIGHT = 10 ** 6
+
+
+def _strongly_connected_loop_lines(edges: Dict[int, List[int]]) -> Set[int]:
+    """Lines that are part of a CFG cycle (iterative Kosaraju)."""
+    nodes = set(edges)
+    for targets in edges.values():
+        nodes.update(targets)
+    order: List[int] = []
+    visited: Set[int] = set()
+    for root in sorted(nodes):
+        if root in visited:
+            continue
+        visited.add(root)
+        stack = [(root, iter(edges.get(root, [])))]
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                order.append(node)
+            elif child not in visited:
+                visited.add(child)
+                stack.append((child, iter(edges.get(child, []))))
+    reverse: Dict[int, List[int]] = {}
+    for src, targets in edges.items():
+        for tgt in targets:
+            reverse.setdefault(tgt, []).append(src)
+    loop_lines: Set[int] = set()
+    assigned: Set[int] = set()
+    for root in reversed(order):
+        if root in assigned:
+            continue
+        component = [root]
+        assigned.add(root)
+        idx = 0
+        while idx < len(component):
+            for src in reverse.get(component[idx], []):
+                if src not in assigned:
+                    assigned.add(src)
+                    component.append(src)
+            idx += 1
+        if len(component) > 1 or root in edges.get(root, []):
+            loop_lines.update(component)
+    return loop_lines
+
+
+def _jump_sites(pieces: List[Piece]) -> List[Tuple[str, int]]:
+    """(keyword, target) for each jump target, keyword being the nearest preceding token."""
+    sites = []
+    for start, _, number in find_jump_targets(pieces):
+        keyword = next((text for kind, text in reversed(pieces[:start]) if kind == TOKEN), "")
+        sites.append(("GOTO" if keyword == "TO" else keyword, number))
+    return sites
+
+
+def search_cost(order: List[int], sites: Dict[int, List[Tuple[str, int]]], weights: Dict[int, int]) -> int:
+    """
+    Estimated number of line links followed to resolve all jumps, weighted by
+    how often each jump site runs. Forward jumps scan from the next line,
+    everything else from the program start, like the C64 ROM.
+    """
+    position = {number: idx for idx, number in enumerate(order)}
+    cost = 0
+    for line, line_sites in sites.items():
+        src = position[line]
+        for _, target in line_sites:
+            dst = position.get(target)
+            if dst is None:
+                continue
+            scanned = dst - src if dst > src else dst + 1
+            cost += weights.get(line, 1) * scanned
+    return cost
+
+
+class BasicRenumberer:
+    def __init__(self, start: int = 10, step: int = 10, relayout: bool = True):
+        self.start = start
+        self.step = step
+        self.relayout = relayout
+
+    def _line_weights(self, checker: SyntaxChecker, numbers: List[int]) -> Dict[int, int]:
+        """Per-line execution weight from the checker's CFG cycles and FOR/NEXT spans."""
+        loop_lines = _strongly_connected_loop_lines(checker.cfg_edges)
+
+        weights = {number: LOOP_WEIGHT if number in loop_lines else 1 for number in numbers}
+        # FOR/NEXT spans multiply the weight of the lines they enclose
+        open_fors: List[int] = []
+        for idx, number in enumerate(numbers):
+            fors = nexts = 0
+            for stmt in ast.iter_statements(checker.line_map[number].ast.statements):
+                if type(stmt) is ast.For:
+                    fors += 1
+                elif type(stmt) is ast.Next:
+                    # NEXT I,J closes two loops
+                    nexts += len(stmt.vars) or 1
+            open_fors.extend([idx] * fors)
+            depth = len(open_fors)
+            weights[number] = min(MAX_WEIGHT, weights[number] * LOOP_WEIGHT ** min(depth, 4))
+            for _ in range(min(nexts, len(open_fors))):
+                open_fors.pop()
+        return weights
+
+    def _subroutine_blocks(self, checker: SyntaxChecker, numbers: List[int],
+                           gosub_targets: Set[int]) -> Dict[int, List[int]]:
+        """
+        Movable subroutine blocks: target line -> the run of lines from the
+        target up to the first line that does not fall through. The run must
+        lie in the target's extent, or in the extent of a subroutine it falls
+        into, and must not hold DATA (moving it would change what READ returns).
+        """
+        position = {number: idx for idx, number in enumerate(numbers)}
+        edges = checker.cfg_edges
+        extents = checker.subroutine_extents()
+
+        def falls_into(line: int, following: int) -> bool:
+            # A RETURN line's CFG edge to the next line is the fall-through after GOSUB
+            return following in edges.get(line, []) and line not in checker.return_exits
+
+        blocks: Dict[int, List[int]] = {}
+        for target in sorted(gosub_targets & set(extents)):
+            idx = position[target]
+            if idx == 0 or falls_into(numbers[idx - 1], target):
+                continue
+            extent = set(extents[target].lines)
+            block: Optional[List[int]] = []
+            for pos in range(idx, len(numbers)):
+                line = numbers[pos]
+                if line in extents and line != target:
+                    extent.update(extents[line].lines)
+                if line not in extent or any(type(stmt) is ast.Data for stmt in
+                                             ast.iter_statements(checker.line_map[line].ast.statements)):
+                    block = None
+                    break
+                block.append(line)
+                if pos + 1 == len(numbers) or not falls_into(line, numbers[pos + 1]):
+                    break
+            if block:
+                blocks[target] = block
+        return blocks
+
+    def renumber(self, source_text: str) -> Tuple[str, Dict[str, object]]:
+        """
+        Returns:
+            (new_source, report) with the estimated search cost before and
+            after, the moved subroutines and the old -> new line mapping.
+        """
+        report: Dict[str, object] = {"cost_before": 0, "cost_after": 0, "moved_subroutines": [],
+                                     "line_mapping": {}, "warnings": []}
+        lexed: Dict[int, List[Piece]] = {}
+        for raw in source_text.splitlines():
+            if not raw.strip():
+                continue
+            m = CRUNCH_LINE_RE.match(raw)
+            if not m or int(m.group(1)) in lexed:
+                report["warnings"].append(f"Renumber skipped: unnumbered or duplicate line '{raw}'")
+                return source_text, report
+            lexed[int(m.group(1))] = lex_line(m.group(2).lstrip())
+        if not lexed:
+            return source_text, report
+
+        numbers = sorted(lexed)
+        sites = {number: _jump_sites(lexed[number]) for number in numbers}
+        checker = SyntaxChecker()
+        checker.enable_reachability_warnings = False
+        checker.load(source_text)
+        checker.validate()
+        weights = self._line_weights(checker, numbers)
+        report["cost_before"] = search_cost(numbers, sites, weights)
+
+        order = list(numbers)
+        entry_jump = None
+        if self.relayout:
+            call_freq: Dict[int, int] = {}
+            for line, line_sites in sites.items():
+                for keyword, target in line_sites:
+                    if keyword == "GOSUB":
+                        call_freq[target] = call_freq.get(target, 0) + weights[line]
+            blocks = self._subroutine_blocks(checker, numbers, set(call_freq))
+            moved: List[int] = []
+            taken: Set[int] = set()
+            for target in sorted(blocks, key=lambda t: -call_freq[t]):
+                block = blocks[target]
+                if call_freq[target] < LOOP_WEIGHT or taken.intersection(block):
+                    continue
+                moved.append(target)
+                taken.update(block)
+            if moved:
+                candidate = [line for t in moved for line in blocks[t]]
+                candidate += [line for line in numbers if line not in taken]
+                # Keep the program entry: a GOTO to the original first line sits in front
+                entry_jump = numbers[0]
+                jump_sites = {**sites, -1: [("GOTO", entry_jump)]}
+                cost_after = search_cost([-1] + candidate, jump_sites, {**weights, -1: 1})
+                if cost_after < report["cost_before"]:
+                    order = [-1] + candidate
+                    report["moved_subroutines"] = [
+                        {"line": t, "lines": len(blocks[t]), "calls_weighted": call_freq[t]} for t in moved]
+                else:
+                    entry_jump = None
+
+        mapping = {old: self.start + idx * self.step for idx, old in enumerate(order)}
+        if mapping[order[-1]] > 63999:
+            report["warnings"].append("Renumber skipped: line numbers would exceed 63999")
+            return source_text, report
+        report["line_mapping"] = {old: new for old, new in mapping.items() if old >= 0}
+
+        missing = {t for line_sites in sites.values() for _, t in line_sites if t not in lexed}
+        for target in sorted(missing):
+            report["warnings"].append(f"Jump target {target} does not exist and was left unchanged")
+
+        out_lines = []
+        for old in order:
+            if old == -1:
+                content = f"GOTO {mapping[entry_jump]}"
+            else:
+                content = join_pieces(rewrite_jump_targets(lexed[old], mapping))
+            line_text = f"{mapping[old]} {content}"
+            if len(line_text) > 80 and (old == -1 or len(f"{old} {join_pieces(lexed[old])}") <= 80):
+                report["warnings"].append(f"Line {mapping[old]} is longer than 80 characters after renumbering")
+            out_lines.append(line_text)
+
+        new_sites = {mapping[line]: [(k, mapping.get(t, t)) for k, t in line_sites] for line, line_sites in sites.items()}
+        if entry_jump is not None:
+            new_sites[mapping[-1]] = [("GOTO", mapping[entry_jump])]
+        new_weights = {mapping[line]: w for line, w in weights.items()}
+        report["cost_after"] = search_cost([mapping[o] for o in order], new_sites, new_weights)
+        return "\n".join(out_lines), report
+
+
+def renumber_source(source_text: str, **options) -> Tuple[str, Dict[str, object]]:
+    """Convenience wrapper around BasicRenumberer(**options).renumber()."""
+    return BasicRenumberer(**options).renumber(source_text)
+
+# -----------------------------------------------------------------------------
+# Command Line Interface
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Renumber a C64 BASIC program and move hot subroutines to the start.")
+    parser.add_argument('filename', nargs='?', help="Input filename (stdin if empty)")
+    parser.add_argument('-o', '--output', help="Output filename (stdout if empty)")
+    parser.add_argument('--start', type=int, default=10, help="First line number (default 10)")
+    parser.add_argument('--step', type=int, default=10, help="Line number increment (default 10)")
+    parser.add_argument('--no-relayout', action='store_true', help="Only renumber, keep the line order")
+
+    args = parser.parse_args()
+
+    if args.filename:
+        try:
+            with open(args.filename, 'r', encoding='utf-8', errors='replace') as f:
+                source_text = f.read()
+        except Exception as e:
+            logger.error(f"Error reading input: {e}")
+            sys.exit(3)
+    else:
+        source_text = sys.stdin.read()
+
+    new_source, report = renumber_source(source_text, start=args.start, step=args.step, relayout=not args.no_relayout)
+    print(f"Estimated line-search cost: {report['cost_before']} -> {report['cost_after']}", file=sys.stderr)
+    for sub in report["moved_subroutines"]:
+        print(f"Moved subroutine at line {sub['line']} ({sub['lines']} lines, weighted calls {sub['calls_weighted']})", file=sys.stderr)
+    for warning in report["warnings"]:
+        print(f"WARN: {warning}", file=sys.stderr)
+
+    if args.output:
+        try:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(new_source + "\n")
+        except Exception as e:
+            logger.error(f"Unable to create output '{args.output}': {e}")
+            sys.exit(2)
+    else:
+        print(new_source)
+
+if __name__ == '__main__':
+    main()
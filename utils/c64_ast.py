@@ -0,0 +1,1164 @@
+"""
+C64 BASIC V2 Parser
+
+One lexer and recursive-descent parser for the language, shared by the
+converter, the syntax checker and its expression checks:
+- lex() splits a line the way the C64 (and Bas2Prg) tokenizes it: keywords
+  are recognized anywhere outside strings and REM, first match in TOKENS
+  order wins, so crunched code such as FORI=1TO10 is read as FOR I=1 TO 10
+  and SCORE as SC OR E. Bas2Prg encodes its PRG bytes from these lexemes.
+- parse_line() builds a compact AST of one line: slotted statement and
+  expression nodes, plus the issues found while parsing, each tagged with
+  the checker category it belongs to.
+
+Both are cached per line text, so an edited program is lexed and parsed
+once per changed line, no matter how many analyses look at it. lex() also
+memoizes the lexemes of the whitespace-separated chunks of a line, so a new
+line is only lexed character by character where its chunks are new.
+
+Usage:
+    python c64_ast.py program.bas
+"""
+import argparse
+import re
+import sys
+import logging
+from functools import lru_cache
+from itertools import accumulate, chain
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Exact token list from tokens.c
+# Indices 0-127 correspond to bytes 0x80-0xFF
+TOKENS = [
+    "END",      "FOR",      "NEXT",     "DATA",     "INPUT#",   "INPUT",    "DIM",      "READ",
+    "LET",      "GOTO",     "RUN",      "IF",       "RESTORE",  "GOSUB",    "RETURN",   "REM",
+    "STOP",     "ON",       "WAIT",     "LOAD",     "SAVE",     "VERIFY",   "DEF",      "POKE",
+    "PRINT#",   "PRINT",    "CONT",     "LIST",     "CLR",      "CMD",      "SYS",      "OPEN",
+    "CLOSE",    "GET",      "NEW",      "TAB(",     "TO",       "FN",       "SPC(",     "THEN",
+    "NOT",      "STEP",     "+",        "-",        "*",        "/",        "^",        "AND",
+    "OR",       ">",        "=",        "<",        "SGN",      "INT",      "ABS",      "USR",
+    "FRE",      "POS",      "SQR",      "RND",      "LOG",      "EXP",      "COS",      "SIN",
+    "TAN",      "ATN",      "PEEK",     "LEN",      "STR$",     "VAL",      "ASC",      "CHR$",
+    "LEFT$",    "RIGHT$",   "MID$",     "GO",       "{cc}",     "{cd}",     "{ce}",     "{cf}",
+    "{d0}",     "{d1}",     "{d2}",     "{d3}",     "{d4}",     "{d5}",     "{d6}",     "{d7}",
+    "{d8}",     "{d9}",     "{da}",     "{db}",     "{dc}",     "{dd}",     "{de}",     "{df}",
+    "{e0}",     "{e1}",     "{e2}",     "{e3}",     "{e4}",     "{e5}",     "{e6}",     "{e7}",
+    "{e8}",     "{e9}",     "{ea}",     "{eb}",     "{ec}",     "{ed}",     "{ee}",     "{ef}",
+    "{f0}",     "{f1}",     "{f2}",     "{f3}",     "{f4}",     "{f5}",     "{f6}",     "{f7}",
+    "{f8}",     "{f9}",     "{fa}",     "{fb}",     "{fc}",     "{fd}",     "{fe}",     "{pi}"
+]
+
+# First-character buckets over TOKENS. Each bucket keeps the original array
+# order, so the first match inside a bucket is the same token C gettoken finds
+# when it walks the whole array.
+TOKEN_BUCKETS = {}
+# The C code maps index 0 to 0x80 (128).
+for _index, _token_str in enumerate(TOKENS):
+    TOKEN_BUCKETS.setdefault(_token_str[0], []).append((_token_str, _index + 128, len(_token_str)))
+# The same buckets for matching against upper-cased text (keywords in any case)
+FOLDED_TOKEN_BUCKETS = {}
+for _index, _token_str in enumerate(TOKENS):
+    _folded = _token_str.upper()
+    FOLDED_TOKEN_BUCKETS.setdefault(_folded[0], []).append((_folded, _index + 128, len(_folded)))
+del _index, _token_str, _folded
+
+TOKEN_REM = 0x8F
+TOKEN_PI = 0xFF
+OPERATOR_TOKENS = frozenset(TOKENS.index(op) + 128 for op in ("+", "-", "*", "/", "^", ">", "=", "<"))
+# Only A-Z are folded: str.upper() would change the length of some characters
+ASCII_UPPER = str.maketrans("abcdefghijklmnopqrstuvwxyz", "ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+
+# Lexeme kinds
+KEYWORD = 'keyword'
+OPERATOR = 'operator'
+NUMBER = 'number'
+STRING = 'string'
+NAME = 'name'
+PUNCT = 'punct'  # : ; , ( ) #
+SPACE = 'space'
+REM_TEXT = 'rem'
+OTHER = 'other'
+
+PUNCTUATION = frozenset(':;,()#')
+DIGITS = frozenset('0123456789')
+
+# Issue categories, in the order the checker reports them
+SYNTAX = 'syntax'
+IF_THEN = 'if_then'
+JUMPS = 'jumps'
+ON_JUMPS = 'on_jumps'
+EXPRESSIONS = 'expressions'
+
+FUNCTIONS = frozenset({'SGN', 'INT', 'ABS', 'USR', 'FRE', 'POS', 'SQR', 'RND', 'LOG', 'EXP', 'COS', 'SIN',
+                       'TAN', 'ATN', 'PEEK', 'LEN', 'STR$', 'VAL', 'ASC', 'CHR$', 'LEFT$', 'RIGHT$', 'MID$',
+                       'TAB(', 'SPC('})
+RELATIONAL = frozenset({'=', '<', '>', '<=', '>=', '<>'})
+# Two-lexeme relational operators; the C64 also accepts =< and =>
+RELATIONAL_PAIRS = {('<', '='): '<=', ('=', '<'): '<=', ('>', '='): '>=', ('=', '>'): '>=', ('<', '>'): '<>',
+                    ('>', '<'): '<>'}
+
+MAX_CACHED_LINES = 16384
+MAX_CACHED_CHUNKS = 4096  # per offset in the line
+
+# Chunks lex() memoizes: a run of text without whitespace (strings included,
+# with their spaces) and the whitespace after it. No lexeme crosses a chunk
+# border except REM text, so a chunk lexes the same in every line it is in.
+CHUNK_RE = re.compile(r'(?:[^\s"]+|"[^"]*"?)+\s*|\s+')
+# Per fold_case, indexed by offset in the line: chunk -> its lexemes
+_CHUNK_LEXEMES = {True: [], False: []}
+# Per fold_case: (line content, offset) -> lexemes of a chunk holding REM, which run to the line end
+_REM_LEXEMES = {True: {}, False: {}}
+
+
+# ------------------ Lexer ------------------
+class Lexeme:
+    __slots__ = ('kind', 'text', 'start', 'token')
+
+    def __init__(self, kind: str, text: str, start: int, token: Optional[int] = None):
+        self.kind = kind
+        self.text = text  # keywords in their TOKENS spelling (upper case when case-folded)
+        self.start = start  # offset in the line content
+        self.token = token  # PETSCII token byte of keywords and operators
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.text)
+
+    def __repr__(self):
+        return f"Lexeme({self.kind}, {self.text!r}, {self.start})"
+
+
+def _match_token(text: str, pos: int, buckets) -> Optional[Tuple[str, int, int]]:
+    bucket = buckets.get(text[pos])
+    if bucket:
+        for entry in bucket:
+            if text.startswith(entry[0], pos):
+                return entry
+    return None
+
+
+def _lex_chunk(content: str, text: str, i: int, n: int, buckets) -> Tuple[Tuple[Lexeme, ...], bool]:
+    """
+    Lexemes of text[i:n], a chunk of the line; text is the content, case-folded
+    for keyword matching. Also returns whether a REM ended the line.
+    """
+    out: List[Lexeme] = []
+    append = out.append
+    while i < n:
+        ch = text[i]
+        if ch == '"':
+            end = text.find('"', i + 1)
+            end = len(text) if end < 0 else end + 1
+            append(Lexeme(STRING, content[i:end], i))
+            i = end
+            continue
+        match = _match_token(text, i, buckets)
+        if match is not None:
+            token_str, token_val, token_len = match
+            append(Lexeme(OPERATOR if token_val in OPERATOR_TOKENS else KEYWORD, token_str, i, token_val))
+            i += token_len
+            if token_val == TOKEN_REM:
+                if i < len(text):
+                    append(Lexeme(REM_TEXT, content[i:], i))
+                return tuple(out), True
+            continue
+        if ch.isspace():
+            j = i + 1
+            while j < n and text[j].isspace():
+                j += 1
+            append(Lexeme(SPACE, content[i:j], i))
+            i = j
+            continue
+        if ch in DIGITS or ch == '.':
+            j = i
+            while j < n and text[j] in DIGITS:
+                j += 1
+            if j < n and text[j] == '.':
+                j += 1
+                while j < n and text[j] in DIGITS:
+                    j += 1
+            # Exponent, unless a keyword starts at the E (END, EXP)
+            if j < n and text[j] in 'Ee' and _match_token(text, j, buckets) is None:
+                k = j + 1
+                if k < n and text[k] in '+-':
+                    k += 1
+                if k < n and text[k] in DIGITS:
+                    while k < n and text[k] in DIGITS:
+                        k += 1
+                    j = k
+            append(Lexeme(NUMBER, text[i:j], i))
+            i = j
+            continue
+        if ch.isascii() and ch.isalpha():
+            j = i + 1
+            while j < n:
+                c = text[j]
+                if not (c.isascii() and c.isalnum()) or _match_token(text, j, buckets) is not None:
+                    break
+                j += 1
+            if j < n and text[j] in '$%':
+                j += 1
+            append(Lexeme(NAME, text[i:j], i))
+            i = j
+            continue
+        append(Lexeme(PUNCT if ch in PUNCTUATION else OTHER, content[i], i))
+        i += 1
+    return tuple(out), False
+
+
+@lru_cache(maxsize=MAX_CACHED_LINES)
+def lex(content: str, fold_case: bool = True) -> Tuple[Lexeme, ...]:
+    """
+    Splits the text after a line number into lexemes.
+
+    Args:
+        content: Line text without the line number.
+        fold_case: Recognize keywords in any case (the checker's view). The
+            converter passes False: like on the C64, only upper-case text is
+            tokenized.
+
+    Returns:
+        Tuple of lexemes covering the whole content. Text after REM is one
+        REM_TEXT lexeme; a string runs to its closing quote or the line end.
+
+    The line is split into chunks with one findall (CHUNK_RE), and the
+    lexemes of each chunk are looked up by chunk text and offset, so only
+    chunks not seen before are lexed character by character. Uncached, this
+    is faster than the checker's old character loop, which built bare token
+    strings (benchmarks/bench_syntax_checker.py).
+    """
+    chunks = CHUNK_RE.findall(content)
+    by_offset = _CHUNK_LEXEMES[fold_case]
+    if len(by_offset) <= len(content):
+        by_offset.extend({} for _ in range(len(content) + 1 - len(by_offset)))
+    # One C-level pass: the lexemes of each chunk at its offset, None if not seen yet
+    offsets = accumulate(map(len, chunks), initial=0)
+    spans = list(map(dict.get, map(by_offset.__getitem__, offsets), chunks))
+    if None in spans:
+        text = content.translate(ASCII_UPPER) if fold_case else content
+        buckets = FOLDED_TOKEN_BUCKETS if fold_case else TOKEN_BUCKETS
+        rem_cache = _REM_LEXEMES[fold_case]
+        idx = spans.index(None)
+        start = sum(map(len, chunks[:idx]))
+        while idx < len(spans):
+            chunk = chunks[idx]
+            end = start + len(chunk)
+            if spans[idx] is None:
+                key = (content, start)
+                span = rem_cache.get(key)
+                if span is None:
+                    span, has_rem = _lex_chunk(content, text, start, end, buckets)
+                    if not has_rem:
+                        cache = by_offset[start]
+                        if len(cache) >= MAX_CACHED_CHUNKS:
+                            cache.clear()
+                        spans[idx] = cache[chunk] = span
+                        idx += 1
+                        start = end
+                        continue
+                    if len(rem_cache) >= MAX_CACHED_CHUNKS:
+                        rem_cache.clear()
+                    rem_cache[key] = span
+                # The REM text takes the rest of the line
+                spans[idx:] = [span]
+                break
+            idx += 1
+            start = end
+    return tuple(chain.from_iterable(spans))
+
+
+def clear_chunk_cache():
+    """Forgets the lexemes of all chunks; lex.cache_clear() forgets the lexed lines."""
+    for cache in (*_CHUNK_LEXEMES.values(), *_REM_LEXEMES.values()):
+        cache.clear()
+
+
+# ------------------ AST nodes ------------------
+class Node:
+    __slots__ = ()
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, s) == getattr(other, s) for s in self.__slots__)
+
+    __hash__ = None
+
+
+# Expressions
+class Number(Node):
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class String(Node):
+    __slots__ = ('text', 'closed')
+
+    def __init__(self, text: str, closed: bool):
+        self.text = text  # including the quotes
+        self.closed = closed
+
+
+class Variable(Node):
+    __slots__ = ('name',)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class Call(Node):
+    """Function call (SGN(X), TAB(5), FN A(X)) or array element A(I,J)."""
+    __slots__ = ('name', 'args', 'closed', 'function')
+
+    def __init__(self, name: str, args: list, closed: bool, function: bool):
+        self.name = name  # FN calls are named 'FN' + name
+        self.args = args
+        self.closed = closed  # False if the closing parenthesis is missing
+        self.function = function
+
+
+class Paren(Node):
+    __slots__ = ('expr', 'closed')
+
+    def __init__(self, expr, closed: bool):
+        self.expr = expr
+        self.closed = closed
+
+
+class Unary(Node):
+    __slots__ = ('op', 'operand')
+
+    def __init__(self, op: str, operand):
+        self.op = op
+        self.operand = operand
+
+
+class Binary(Node):
+    __slots__ = ('op', 'left', 'right')
+
+    def __init__(self, op: str, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+    # Chains such as 1+2+3+... nest on the left; both walk that side in a loop instead of recursing
+
+    def __repr__(self):
+        chain = []
+        node = self
+        while type(node) is Binary:
+            chain.append(node)
+            node = node.left
+        text = repr(node)
+        for binary in reversed(chain):
+            text = f"Binary(op={binary.op!r}, left={text}, right={binary.right!r})"
+        return text
+
+    def __eq__(self, other):
+        node = self
+        while type(node) is Binary and type(other) is Binary:
+            if node.op != other.op or node.right != other.right:
+                return False
+            node, other = node.left, other.left
+        return type(node) is type(other) and node == other
+
+    __hash__ = None
+
+
+class Invalid(Node):
+    """A lexeme that cannot appear in an expression."""
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class Missing(Node):
+    """An operand is missing, e.g. the end of 'A=1+'."""
+    __slots__ = ()
+
+
+# Statements
+class Let(Node):
+    __slots__ = ('target', 'value')
+
+    def __init__(self, target, value):
+        self.target = target  # Variable or Call (array element)
+        self.value = value
+
+
+class Print(Node):
+    __slots__ = ('keyword', 'channel', 'items', 'separators')
+
+    def __init__(self, keyword: str, channel, items: list, separators: Optional[list] = None):
+        self.keyword = keyword  # PRINT, PRINT# or CMD
+        self.channel = channel
+        self.items = items  # expressions
+        # separators[i]: the ';' and ',' before items[i]; the last entry holds those after the last item
+        self.separators = separators if separators is not None else [''] * (len(items) + 1)
+
+
+class Input(Node):
+    __slots__ = ('keyword', 'channel', 'prompt', 'targets')
+
+    def __init__(self, keyword: str, channel, prompt, targets: list):
+        self.keyword = keyword  # INPUT, INPUT#, GET or GET#
+        self.channel = channel
+        self.prompt = prompt
+        self.targets = targets
+
+
+class If(Node):
+    __slots__ = ('condition', 'then_target', 'then_pos', 'body', 'has_then')
+
+    def __init__(self, condition, then_target: Optional[int], then_pos: int, body: list, has_then: bool):
+        self.condition = condition
+        self.then_target = then_target  # IF ... THEN 100
+        self.then_pos = then_pos  # offset of the THEN target in the line content
+        self.body = body  # statements executed if the condition holds (rest of the line)
+        self.has_then = has_then
+
+
+class For(Node):
+    __slots__ = ('var', 'start', 'end', 'step')
+
+    def __init__(self, var: Optional[str], start, end, step):
+        self.var = var
+        self.start = start
+        self.end = end
+        self.step = step
+
+
+class Next(Node):
+    __slots__ = ('vars',)
+
+    def __init__(self, vars: list):
+        self.vars = vars  # empty for a bare NEXT
+
+
+class Jump(Node):
+    """GOTO, GO TO or GOSUB with a literal target."""
+    __slots__ = ('keyword', 'target', 'target_pos')
+
+    def __init__(self, keyword: str, target: Optional[int], target_pos: int):
+        self.keyword = keyword  # GOTO or GOSUB
+        self.target = target  # None if missing or not a number
+        self.target_pos = target_pos
+
+
+class On(Node):
+    __slots__ = ('selector', 'mode', 'targets')
+
+    def __init__(self, selector, mode: Optional[str], targets: list):
+        self.selector = selector
+        self.mode = mode  # GOTO, GOSUB or None if missing
+        self.targets = targets  # (line number or None, offset)
+
+
+class Dim(Node):
+    __slots__ = ('arrays',)
+
+    def __init__(self, arrays: list):
+        self.arrays = arrays
+
+
+class Read(Node):
+    __slots__ = ('targets',)
+
+    def __init__(self, targets: list):
+        self.targets = targets
+
+
+class Data(Node):
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class Rem(Node):
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class Def(Node):
+    __slots__ = ('name', 'param', 'body')
+
+    def __init__(self, name: str, param: Optional[str], body):
+        self.name = name
+        self.param = param
+        self.body = body
+
+
+class Command(Node):
+    """Any other statement: POKE, SYS, RUN, RETURN, END, OPEN, ..."""
+    __slots__ = ('keyword', 'args')
+
+    def __init__(self, keyword: str, args: list):
+        self.keyword = keyword
+        self.args = args
+
+
+class Bad(Node):
+    """A statement that could not be parsed."""
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class Line(Node):
+    __slots__ = ('content', 'lexemes', 'statements', 'issues')
+
+    def __init__(self, content: str, lexemes: Tuple[Lexeme, ...], statements: list, issues: list):
+        self.content = content
+        self.lexemes = lexemes
+        self.statements = statements
+        # (category, severity, message, target): target is set for "target line
+        # does not exist" issues, which only apply if that line is missing
+        self.issues = issues
+
+
+def iter_statements(statements: list) -> Iterator[Node]:
+    """All statements in execution order, including those in IF bodies."""
+    for stmt in statements:
+        yield stmt
+        if type(stmt) is If:
+            yield from iter_statements(stmt.body)
+
+
+def statement_expressions(stmt) -> list:
+    """Expressions of one statement in source order (not those of nested IF bodies)."""
+    kind = type(stmt)
+    if kind is Let:
+        return [stmt.target, stmt.value]
+    if kind is Print:
+        return ([stmt.channel] if stmt.channel is not None else []) + stmt.items
+    if kind is Input:
+        return ([stmt.channel] if stmt.channel is not None else []) + stmt.targets
+    if kind is If:
+        return [stmt.condition]
+    if kind is For:
+        return [e for e in (stmt.start, stmt.end, stmt.step) if e is not None]
+    if kind is On:
+        return [stmt.selector]
+    if kind is Dim:
+        return stmt.arrays
+    if kind is Read:
+        return stmt.targets
+    if kind is Def:
+        return [stmt.body] if stmt.body is not None else []
+    if kind is Command:
+        return stmt.args
+    return []
+
+
+# ------------------ Parser ------------------
+# Statements whose arguments are a plain comma-separated expression list
+COMMAND_KEYWORDS = frozenset({'POKE', 'WAIT', 'SYS', 'OPEN', 'CLOSE', 'LOAD', 'SAVE', 'VERIFY', 'LIST', 'RUN'})
+NO_ARGUMENT_KEYWORDS = frozenset({'RESTORE', 'RETURN', 'END', 'STOP', 'CLR', 'CONT', 'NEW'})
+
+
+class Parser:
+    __slots__ = ('content', 'lexemes', 'pos', 'n', 'issues', 'statement_start')
+
+    def __init__(self, content: str, lexemes: Tuple[Lexeme, ...]):
+        self.content = content
+        self.lexemes = [lx for lx in lexemes if lx.kind != SPACE]
+        self.pos = 0
+        self.n = len(self.lexemes)
+        self.issues: List[Tuple[str, str, str, Optional[int]]] = []
+        self.statement_start = 0  # index of the first lexeme of the current statement
+
+    # -------- helpers --------
+    def peek(self, offset: int = 0) -> Optional[Lexeme]:
+        i = self.pos + offset
+        return self.lexemes[i] if i < self.n else None
+
+    def at(self, kind: str, text: Optional[str] = None) -> bool:
+        lx = self.peek()
+        return lx is not None and lx.kind == kind and (text is None or lx.text == text)
+
+    def at_end(self) -> bool:
+        """End of the statement: line end, ':' or a REM."""
+        lx = self.peek()
+        return lx is None or (lx.kind == PUNCT and lx.text == ':') or lx.token == TOKEN_REM
+
+    def issue(self, category: str, severity: str, message: str, target: Optional[int] = None):
+        self.issues.append((category, severity, message, target))
+
+    def rest_text(self) -> str:
+        """Source text from the current lexeme to the end of the statement."""
+        start = self.peek().start if self.peek() is not None else len(self.content)
+        end = start
+        i = self.pos
+        while i < self.n:
+            lx = self.lexemes[i]
+            if (lx.kind == PUNCT and lx.text == ':') or lx.token == TOKEN_REM:
+                break
+            end = lx.end
+            i += 1
+        return self.content[start:end].strip()
+
+    def skip_statement(self):
+        while not self.at_end():
+            self.pos += 1
+
+    def glued_word(self, index: int) -> Optional[Tuple[str, str]]:
+        """
+        If the lexeme at index is part of a run of letters that the tokenizer
+        split into names and keywords (SCORE -> SC OR E), returns the whole
+        word and the first keyword in it.
+        """
+        lexemes = self.lexemes
+        if not 0 <= index < self.n:
+            return None
+
+        def wordlike(lx):
+            return lx.kind == NAME or (lx.kind == KEYWORD and lx.text[0].isalpha())
+
+        if not wordlike(lexemes[index]):
+            return None
+        first = last = index
+        while first > 0 and wordlike(lexemes[first - 1]) and lexemes[first - 1].end == lexemes[first].start:
+            first -= 1
+        while last + 1 < self.n and wordlike(lexemes[last + 1]) and lexemes[last].end == lexemes[last + 1].start:
+            last += 1
+        run = lexemes[first:last + 1]
+        if len(run) < 2 or not any(lx.kind == NAME for lx in run):
+            return None
+        keyword = next((lx.text for lx in run if lx.kind == KEYWORD), None)
+        if keyword is None:
+            return None
+        return self.content[run[0].start:run[-1].end].upper(), keyword
+
+    def syntax_error(self, index: Optional[int] = None) -> Node:
+        """
+        Reports the current statement as a syntax error and skips it. If the
+        lexeme at index (default: the current one) belongs to a word that
+        hides a keyword, that is reported instead.
+        """
+        glued = self.glued_word(self.pos if index is None else index)
+        self.pos = self.statement_start
+        text = self.rest_text()
+        if glued is not None:
+            self.issue(SYNTAX, 'ERROR', f"Variable name '{glued[0]}' contains keyword {glued[1]}")
+        else:
+            self.issue(SYNTAX, 'ERROR', f"Syntax error at '{text}'")
+        self.skip_statement()
+        return Bad(text)
+
+    # -------- lines and statements --------
+    def parse_line(self) -> list:
+        statements = []
+        while self.pos < self.n:
+            lx = self.peek()
+            if lx.kind == PUNCT and lx.text == ':':
+                self.pos += 1
+                continue
+            stmt = self.parse_statement()
+            statements.append(stmt)
+            if type(stmt) is If or type(stmt) is Rem:
+                break  # both consume the rest of the line
+            if not self.at_end():
+                self.issue(EXPRESSIONS, 'WARN', f"Unexpected token '{self.peek().text}' after expression")
+                self.skip_statement()
+        return statements
+
+    def parse_statement(self) -> Node:
+        self.statement_start = self.pos
+        lx = self.peek()
+        if lx.kind == NAME:
+            return self.parse_let(None)
+        if lx.kind == OTHER and lx.text == '?':
+            self.pos += 1
+            return self.parse_print('PRINT')
+        if lx.kind != KEYWORD:
+            return self.syntax_error()
+        kw = lx.text
+        self.pos += 1
+        if kw == 'LET':
+            return self.parse_let(lx)
+        if kw in ('PRINT', 'PRINT#', 'CMD'):
+            return self.parse_print(kw)
+        if kw in ('INPUT', 'INPUT#'):
+            return self.parse_input(kw)
+        if kw == 'GET':
+            return self.parse_get()
+        if kw == 'IF':
+            return self.parse_if()
+        if kw == 'FOR':
+            return self.parse_for()
+        if kw == 'NEXT':
+            return self.parse_next()
+        if kw in ('GOTO', 'GOSUB'):
+            return self.parse_jump(kw)
+        if kw == 'GO':
+            if self.at(KEYWORD, 'TO'):
+                self.pos += 1
+                return self.parse_jump('GOTO')
+            self.pos -= 1
+            return self.syntax_error()
+        if kw == 'ON':
+            return self.parse_on()
+        if kw == 'DIM':
+            return Dim(self.parse_targets())
+        if kw == 'READ':
+            return Read(self.parse_targets())
+        if kw == 'DATA':
+            start = self.peek().start if self.peek() is not None else len(self.content)
+            end = start
+            while self.pos < self.n and not (self.at(PUNCT, ':')):
+                end = self.peek().end
+                self.pos += 1
+            return Data(self.content[start:end].strip())
+        if kw == 'REM':
+            text = self.peek().text if self.at(REM_TEXT) else ''
+            self.pos = self.n
+            return Rem(text)
+        if kw == 'DEF':
+            return self.parse_def()
+        if kw in NO_ARGUMENT_KEYWORDS:
+            return Command(kw, [])
+        if kw in COMMAND_KEYWORDS:
+            return Command(kw, self.parse_expression_list())
+        self.pos -= 1
+        return self.syntax_error()
+
+    def parse_let(self, let_lexeme: Optional[Lexeme]) -> Node:
+        start_index = self.pos
+        if not self.at(NAME):
+            # LET 1A=2: report the text up to '=' as the variable name
+            text = self.rest_text()
+            if let_lexeme is not None and '=' in text:
+                self.issue(EXPRESSIONS, 'ERROR', f"Invalid variable name '{text.split('=', 1)[0].strip()}'")
+                self.skip_statement()
+                return Bad(text)
+            return self.syntax_error()
+        target = self.parse_reference()
+        if not self.at(OPERATOR, '='):
+            return self.syntax_error(self.pos if self.glued_word(self.pos) else start_index)
+        self.pos += 1
+        return Let(target, self.parse_expression())
+
+    def parse_reference(self) -> Node:
+        """Variable or array element at the current NAME lexeme."""
+        name = self.peek().text.upper()
+        self.pos += 1
+        if self.at(PUNCT, '('):
+            self.pos += 1
+            args, closed = self.parse_arguments()
+            return Call(name, args, closed, False)
+        return Variable(name)
+
+    def parse_targets(self) -> list:
+        targets = []
+        while not self.at_end():
+            if self.at(NAME):
+                targets.append(self.parse_reference())
+            else:
+                targets.append(Invalid(self.peek().text))
+                self.issue(EXPRESSIONS, 'WARN', f"Unrecognized token '{self.peek().text}' in expression")
+                self.pos += 1
+            if self.at(PUNCT, ','):
+                self.pos += 1
+            else:
+                break
+        return targets
+
+    def parse_print(self, keyword: str) -> Node:
+        channel = None
+        if keyword != 'PRINT':
+            channel = self.parse_expression()
+            if self.at(PUNCT, ','):
+                self.pos += 1
+        items = []
+        separators = []
+        pending = ''
+        while not self.at_end():
+            if self.at(PUNCT, ';') or self.at(PUNCT, ','):
+                pending += self.peek().text
+                self.pos += 1
+                continue
+            separators.append(pending)
+            pending = ''
+            before = self.pos
+            items.append(self.parse_expression())
+            if self.pos == before:
+                # Nothing could be parsed, e.g. a stray ')'
+                items[-1] = Invalid(self.peek().text)
+                self.issue(EXPRESSIONS, 'WARN', f"Unrecognized token '{self.peek().text}' in expression")
+                self.pos += 1
+        separators.append(pending)
+        return Print(keyword, channel, items, separators)
+
+    def parse_input(self, keyword: str) -> Node:
+        channel = None
+        prompt = None
+        if keyword == 'INPUT#':
+            channel = self.parse_expression()
+            if self.at(PUNCT, ','):
+                self.pos += 1
+        elif self.at(STRING) and self.peek(1) is not None and self.peek(1).text == ';':
+            prompt = String(self.peek().text, self.peek().text.endswith('"') and len(self.peek().text) > 1)
+            self.pos += 2
+        return Input(keyword, channel, prompt, self.parse_targets())
+
+    def parse_get(self) -> Node:
+        keyword = 'GET'
+        channel = None
+        if self.at(PUNCT, '#'):
+            self.pos += 1
+            keyword = 'GET#'
+            channel = self.parse_expression()
+            if self.at(PUNCT, ','):
+                self.pos += 1
+        return Input(keyword, channel, None, self.parse_targets())
+
+    def parse_if(self) -> Node:
+        condition = self.parse_expression()
+        if self.at(KEYWORD, 'THEN'):
+            self.pos += 1
+            if self.at(NUMBER):
+                lx = self.peek()
+                self.pos += 1
+                target = int(lx.text) if lx.text.isdigit() else None
+                if target is not None:
+                    self.issue(JUMPS, 'WARN', f"THEN target line {target} does not exist", target)
+                if not self.at_end():
+                    self.issue(EXPRESSIONS, 'WARN', f"Unexpected token '{self.peek().text}' after expression")
+                    self.skip_statement()
+                return If(condition, target, lx.start, self.parse_line(), True)
+            return If(condition, None, -1, self.parse_line(), True)
+        if self.at(KEYWORD, 'GOTO') or (self.at(KEYWORD, 'GO') and self.peek(1) is not None and self.peek(1).text == 'TO'):
+            return If(condition, None, -1, self.parse_line(), False)
+        self.issue(IF_THEN, 'ERROR', 'IF without THEN')
+        return If(condition, None, -1, self.parse_line(), False)
+
+    def parse_for(self) -> Node:
+        if not self.at(NAME):
+            self.pos -= 1
+            return self.syntax_error()
+        var_index = self.pos
+        var = self.peek().text.upper()
+        self.pos += 1
+        if not self.at(OPERATOR, '='):
+            return self.syntax_error(var_index if not self.glued_word(self.pos) else self.pos)
+        self.pos += 1
+        start = self.parse_expression()
+        end = step = None
+        if self.at(KEYWORD, 'TO'):
+            self.pos += 1
+            end = self.parse_expression()
+            if self.at(KEYWORD, 'STEP'):
+                self.pos += 1
+                step = self.parse_expression()
+        else:
+            self.issue(SYNTAX, 'ERROR', f"FOR {var} without TO")
+        return For(var, start, end, step)
+
+    def parse_next(self) -> Node:
+        names = []
+        while self.at(NAME):
+            names.append(self.peek().text.upper())
+            self.pos += 1
+            if self.at(PUNCT, ','):
+                self.pos += 1
+            else:
+                break
+        return Next(names)
+
+    def parse_jump(self, keyword: str) -> Node:
+        if self.at_end():
+            self.issue(JUMPS, 'ERROR', f"{keyword} without target line")
+            return Jump(keyword, None, -1)
+        lx = self.peek()
+        if lx.kind != NUMBER or not lx.text.isdigit():
+            self.issue(JUMPS, 'ERROR', f"{keyword} target '{self.rest_text()}' is not a line number")
+            self.skip_statement()
+            return Jump(keyword, None, lx.start)
+        self.pos += 1
+        target = int(lx.text)
+        self.issue(JUMPS, 'WARN', f"{keyword} target line {target} does not exist", target)
+        return Jump(keyword, target, lx.start)
+
+    def parse_on(self) -> Node:
+        selector = self.parse_expression()
+        mode = None
+        if self.at(KEYWORD, 'GOTO') or self.at(KEYWORD, 'GOSUB'):
+            mode = self.peek().text
+            self.pos += 1
+        elif self.at(KEYWORD, 'GO') and self.peek(1) is not None and self.peek(1).text == 'TO':
+            mode = 'GOTO'
+            self.pos += 2
+        if mode is None:
+            self.issue(ON_JUMPS, 'ERROR', 'ON without GOTO/GOSUB')
+            self.skip_statement()
+            return On(selector, None, [])
+        targets = []
+        while not self.at_end():
+            lx = self.peek()
+            if lx.kind == PUNCT and lx.text == ',':
+                self.pos += 1
+                continue
+            # One list item runs to the next comma
+            start = lx.start
+            end = lx.end
+            self.pos += 1
+            while not self.at_end() and not self.at(PUNCT, ','):
+                end = self.peek().end
+                self.pos += 1
+            item = self.content[start:end].strip()
+            if item.isdecimal():
+                target = int(item)
+                targets.append((target, start))
+                self.issue(ON_JUMPS, 'WARN', f"ON {mode} target line {target} does not exist", target)
+            else:
+                targets.append((None, start))
+                self.issue(ON_JUMPS, 'ERROR', f"ON {mode} target '{item}' not a number")
+        if not targets:
+            self.issue(ON_JUMPS, 'ERROR', f"ON {mode} without line targets")
+        elif type(selector) is Number and selector.text.isdigit() and int(selector.text) > len(targets):
+            self.issue(ON_JUMPS, 'WARN', f"ON {mode} selector {selector.text} exceeds target list length {len(targets)}")
+        return On(selector, mode, targets)
+
+    def parse_def(self) -> Node:
+        if not self.at(KEYWORD, 'FN'):
+            self.pos -= 1
+            return self.syntax_error()
+        self.pos += 1
+        if not self.at(NAME):
+            self.pos -= 2
+            return self.syntax_error()
+        name = 'FN' + self.peek().text.upper()
+        self.pos += 1
+        param = None
+        if self.at(PUNCT, '('):
+            self.pos += 1
+            if self.at(NAME):
+                param = self.peek().text.upper()
+                self.pos += 1
+            if self.at(PUNCT, ')'):
+                self.pos += 1
+        if not self.at(OPERATOR, '='):
+            return self.syntax_error()
+        self.pos += 1
+        return Def(name, param, self.parse_expression())
+
+    def parse_expression_list(self) -> list:
+        args = []
+        while not self.at_end():
+            args.append(self.parse_expression())
+            if self.at(PUNCT, ','):
+                self.pos += 1
+            else:
+                break
+        return args
+
+    # -------- expressions --------
+    def parse_expression(self) -> Node:
+        return self.parse_or()
+
+    def parse_or(self) -> Node:
+        left = self.parse_and()
+        while self.at(KEYWORD, 'OR'):
+            self.pos += 1
+            left = Binary('OR', left, self.parse_and())
+        return left
+
+    def parse_and(self) -> Node:
+        left = self.parse_not()
+        while self.at(KEYWORD, 'AND'):
+            self.pos += 1
+            left = Binary('AND', left, self.parse_not())
+        return left
+
+    def parse_not(self) -> Node:
+        if self.at(KEYWORD, 'NOT'):
+            self.pos += 1
+            return Unary('NOT', self.parse_not())
+        return self.parse_relation()
+
+    def parse_relation(self) -> Node:
+        left = self.parse_add()
+        while self.at(OPERATOR) and self.peek().text in ('=', '<', '>'):
+            op = self.peek().text
+            self.pos += 1
+            nxt = self.peek()
+            if nxt is not None and nxt.kind == OPERATOR and (op, nxt.text) in RELATIONAL_PAIRS:
+                op = RELATIONAL_PAIRS[(op, nxt.text)]
+                self.pos += 1
+            left = Binary(op, left, self.parse_add())
+        return left
+
+    def parse_add(self) -> Node:
+        left = self.parse_mul()
+        while self.at(OPERATOR) and self.peek().text in ('+', '-'):
+            op = self.peek().text
+            self.pos += 1
+            left = Binary(op, left, self.parse_mul())
+        return left
+
+    def parse_mul(self) -> Node:
+        left = self.parse_unary()
+        while self.at(OPERATOR) and self.peek().text in ('*', '/'):
+            op = self.peek().text
+            self.pos += 1
+            left = Binary(op, left, self.parse_unary())
+        return left
+
+    def parse_unary(self) -> Node:
+        if self.at(OPERATOR) and self.peek().text in ('-', '+'):
+            op = self.peek().text
+            self.pos += 1
+            return Unary(op, self.parse_unary())
+        return self.parse_power()
+
+    def parse_power(self) -> Node:
+        left = self.parse_primary()
+        while self.at(OPERATOR, '^'):
+            self.pos += 1
+            # 2^-1 is valid; the sign binds to the exponent
+            if self.at(OPERATOR) and self.peek().text in ('-', '+'):
+                op = self.peek().text
+                self.pos += 1
+                right = Unary(op, self.parse_power_operand())
+            else:
+                right = self.parse_primary()
+            left = Binary('^', left, right)
+        return left
+
+    def parse_power_operand(self) -> Node:
+        if self.at(OPERATOR) and self.peek().text in ('-', '+'):
+            op = self.peek().text
+            self.pos += 1
+            return Unary(op, self.parse_power_operand())
+        return self.parse_primary()
+
+    def parse_primary(self) -> Node:
+        lx = self.peek()
+        if lx is None or self.at_end() or (lx.kind == PUNCT and lx.text in (',', ';', ')')):
+            return Missing()
+        kind = lx.kind
+        if kind == NUMBER:
+            self.pos += 1
+            return Number(lx.text)
+        if kind == STRING:
+            self.pos += 1
+            return String(lx.text, len(lx.text) > 1 and lx.text.endswith('"'))
+        if kind == NAME:
+            return self.parse_reference()
+        if kind == PUNCT and lx.text == '(':
+            self.pos += 1
+            inner = self.parse_expression()
+            if self.at(PUNCT, ')'):
+                self.pos += 1
+                return Paren(inner, True)
+            return Paren(inner, False)
+        if kind == KEYWORD:
+            name = lx.text
+            if name in FUNCTIONS:
+                self.pos += 1
+                if name.endswith('('):
+                    args, closed = self.parse_arguments()
+                    return Call(name[:-1], args, closed, True)
+                if self.at(PUNCT, '('):
+                    self.pos += 1
+                    args, closed = self.parse_arguments()
+                    return Call(name, args, closed, True)
+                return Call(name, [], True, True)
+            if name == 'FN':
+                self.pos += 1
+                fn_name = 'FN'
+                if self.at(NAME):
+                    fn_name += self.peek().text.upper()
+                    self.pos += 1
+                if self.at(PUNCT, '('):
+                    self.pos += 1
+                    args, closed = self.parse_arguments()
+                    return Call(fn_name, args, closed, True)
+                return Call(fn_name, [], True, True)
+            if lx.token == TOKEN_PI:
+                self.pos += 1
+                return Number(lx.text)
+        # Keywords like THEN or TO, stray characters
+        self.pos += 1
+        return Invalid(lx.text)
+
+    def parse_arguments(self) -> Tuple[list, bool]:
+        """Arguments after an opening parenthesis; returns (args, closed)."""
+        args = []
+        if self.at(PUNCT, ')'):
+            self.pos += 1
+            return args, True
+        while True:
+            args.append(self.parse_expression())
+            if self.at(PUNCT, ','):
+                self.pos += 1
+                continue
+            if self.at(PUNCT, ')'):
+                self.pos += 1
+                return args, True
+            return args, False
+
+
+@lru_cache(maxsize=MAX_CACHED_LINES)
+def parse_line(content: str) -> Line:
+    """Parses the text after a line number (keywords in any case). Cached per line text."""
+    lexemes = lex(content)
+    parser = Parser(content, lexemes)
+    statements = parser.parse_line()
+    return Line(content, lexemes, statements, parser.issues)
+
+
+def cache_info():
+    """Hit/miss statistics of the lexer and parser caches."""
+    return {"lex": lex.cache_info()._asdict(), "parse": parse_line.cache_info()._asdict()}
+
+# -----------------------------------------------------------------------------
+# Command Line Interface
+# -----------------------------------------------------------------------------
+
+LINE_RE = re.compile(r"^\s*(\d+)\s*(.*)$")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the AST of a C64 BASIC program.")
+    parser.add_argument('filename', nargs='?', help="Input filename (stdin if empty)")
+    parser.add_argument('--lexemes', action='store_true', help="Print the lexemes instead of the statements")
+
+    args = parser.parse_args()
+
+    if args.filename:
+        try:
+            with open(args.filename, 'r', encoding='utf-8', errors='replace') as f:
+                source_text = f.read()
+        except Exception as e:
+            logger.error(f"Error reading input: {e}")
+            sys.exit(3)
+    else:
+        source_text = sys.stdin.read()
+
+    for raw in source_text.splitlines():
+        m = LINE_RE.match(raw)
+        if not m:
+            continue
+        line = parse_line(m.group(2))
+        if args.lexemes:
+            print(m.group(1), [(lx.kind, lx.text) for lx in line.lexemes if lx.kind != SPACE])
+            continue
+        print(m.group(1), line.statements)
+        for category, severity, message, target in line.issues:
+            if target is None:
+                print(f"    {severity} [{category}] {message}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1617 @@
+"""
+Headless C64 BASIC V2 interpreter.
+
+Runs a program from its source text without a C64, so runtime errors like
+?TYPE MISMATCH, ?OUT OF DATA or ?RETURN WITHOUT GOSUB are found in
+milliseconds instead of after an upload to the hardware. The statements come
+from the shared parser (c64_ast) and are executed with the C64's rules:
+- numbers are 5-byte floats: every result is rounded to a 32-bit mantissa,
+  values beyond 1.70141183E+38 raise ?OVERFLOW ERROR
+- integer variables (A%) and AND/OR/NOT work on 16-bit signed values
+- variable names are significant to two characters plus the type suffix
+- PEEK/POKE work on 64 KB of memory; PRINT writes screen codes into the
+  40x25 screen RAM at $0400 and the text colour into the colour RAM at
+  $D800 (c64_display renders both)
+- GET and INPUT read scripted keys. GET only gets the next key after it
+  found none once, as a player types slower than a program polls, so loops
+  emptying the keyboard buffer (GET K$:IF K$<>"" THEN ...) leave the keys
+  alone. When the keys run out, GET returns "" and INPUT stops the run, as
+  the program waits for the user
+- the TI clock advances with the executed statements, so delay loops end
+
+A run stops at the first runtime error, at END/STOP or the end of the
+program, when the keys run out, when the program state repeats without any
+input in between (an infinite loop), or after a statement limit. Disk and
+tape I/O are not emulated and stop the run; SYS only knows a few KERNAL
+routines and ignores other addresses.
+
+Usage:
+    python utils/c64_basic.py game.bas [--max-statements N] [--keys "Y{RETURN}"] [--screen]
+"""
+import argparse
+import logging
+import math
+import random
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from utils import c64_ast as ast
+    from utils.c64_memory import BASIC_RAM_BYTES, MAX_STRING_LENGTH, variable_key
+    from utils.c64_petscii import byte_to_macro, macro_to_bytes, private_use_to_byte
+except ModuleNotFoundError:
+    import c64_ast as ast
+    from c64_memory import BASIC_RAM_BYTES, MAX_STRING_LENGTH, variable_key
+    from c64_petscii import byte_to_macro, macro_to_bytes, private_use_to_byte
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_STATEMENTS = 100000
+MAX_LINE_NUMBER = 63999
+
+# C64 floats: 32-bit mantissa, exponents 2^-127 .. 2^127
+MANTISSA_SCALE = 2.0 ** 32
+MIN_EXPONENT = -127
+MAX_FLOAT = 2.0 ** 127  # exclusive
+
+# Runtime errors, printed as ?<NAME> ERROR IN <line>
+SYNTAX_ERROR = "SYNTAX"
+TYPE_MISMATCH = "TYPE MISMATCH"
+OUT_OF_DATA = "OUT OF DATA"
+RETURN_WITHOUT_GOSUB = "RETURN WITHOUT GOSUB"
+NEXT_WITHOUT_FOR = "NEXT WITHOUT FOR"
+UNDEFD_STATEMENT = "UNDEF'D STATEMENT"
+UNDEFD_FUNCTION = "UNDEF'D FUNCTION"
+ILLEGAL_QUANTITY = "ILLEGAL QUANTITY"
+OVERFLOW = "OVERFLOW"
+DIVISION_BY_ZERO = "DIVISION BY ZERO"
+OUT_OF_MEMORY = "OUT OF MEMORY"
+FORMULA_TOO_COMPLEX = "FORMULA TOO COMPLEX"
+BAD_SUBSCRIPT = "BAD SUBSCRIPT"
+REDIMD_ARRAY = "REDIM'D ARRAY"
+STRING_TOO_LONG = "STRING TOO LONG"
+CANT_CONTINUE = "CAN'T CONTINUE"
+FILE_OPEN = "FILE OPEN"
+FILE_NOT_OPEN = "FILE NOT OPEN"
+NOT_INPUT_FILE = "NOT INPUT FILE"
+NOT_OUTPUT_FILE = "NOT OUTPUT FILE"
+
+# Run outcomes
+ENDED = 'ended'              # END, NEW or the end of the program
+STOPPED = 'stopped'          # STOP
+ERROR = 'error'              # a runtime error
+HANG = 'hang'                # the program state repeats without input
+WAITING = 'waiting'          # INPUT, GET or WAIT needs more keys than scripted
+LIMIT = 'limit'              # still running after the statement limit
+UNSUPPORTED = 'unsupported'  # disk/tape I/O
+
+# BASIC keeps FOR and GOSUB entries on the 6502 stack. Like on the C64, about
+# 10 nested FOR loops or 26 nested GOSUBs raise ?OUT OF MEMORY ERROR.
+STACK_BYTES = 188
+FOR = 'FOR'
+GOSUB = 'GOSUB'
+FRAME_BYTES = {FOR: 18, GOSUB: 7}
+
+# The clock: about a thousand statements per second
+STATEMENTS_PER_JIFFY = 16
+JIFFIES_PER_DAY = 24 * 60 * 60 * 60
+
+# Every HANG_CHECK_INTERVAL statements the program state is fingerprinted. A
+# fingerprint seen before, with no volatile reads (clock, RND, raster,
+# joystick) in between, means the program loops forever.
+HANG_CHECK_INTERVAL = 1024
+MAX_FINGERPRINTS = 4096
+
+# Memory map
+SCREEN_RAM = 0x0400
+COLOUR_RAM = 0xD800
+SCREEN_COLUMNS = 40
+SCREEN_ROWS = 25
+SCREEN_SIZE = SCREEN_COLUMNS * SCREEN_ROWS
+TEXT_COLOUR = 646
+VIC_CONTROL = 0xD011
+VIC_MEMORY_SETUP = 0xD018  # bit 1: lower/upper case character set
+LOWER_CASE_SET = 0x02
+CIA2_PORT_A = 0xDD00  # bits 0-1: VIC bank, inverted
+CURRENT_KEY = 197
+KEY_COUNT = 198
+CURSOR_COLUMN = 211
+CURSOR_ROW = 214
+NO_KEY = 64
+KEYBOARD_BUFFER_SIZE = 10
+# Registers read by SYS 65520 (PLOT) and SYS 65490 (CHROUT)
+REG_A, REG_X, REG_Y, REG_STATUS = 780, 781, 782, 783
+SYS_CHROUT = 0xFFD2
+SYS_PLOT = 0xFFF0
+SYS_CLEAR_SCREEN = 0xE544
+# Reads whose value changes without the program: clock, raster, SID noise, joystick, CIA timers
+VOLATILE_ADDRESSES = frozenset({160, 161, 162, CURRENT_KEY, 0xD011, 0xD012, 0xD41B, 0xD41C,
+                                0xDC00, 0xDC01, 0xDC04, 0xDC05, 0xDC06, 0xDC07})
+# Power-on values programs commonly PEEK
+INITIAL_MEMORY = {
+    CURRENT_KEY: NO_KEY,
+    TEXT_COLOUR: 14,         # light blue
+    648: 4,                  # screen RAM page
+    VIC_CONTROL: 0x1B,       # text mode, display on
+    0xD016: 0xC8,            # single colour characters
+    VIC_MEMORY_SETUP: 0x15,  # screen at $0400, upper case / graphics character set
+    0xD020: 0xFE,            # border: light blue
+    0xD021: 0xF6,            # background: blue
+    0xDC00: 0x7F,            # joystick 2: nothing pressed
+    0xDC01: 0xFF,            # joystick 1 / keyboard row: nothing pressed
+    CIA2_PORT_A: 0x97,       # VIC bank 0
+}
+
+NUMBER_RE = re.compile(r"([+-]?)(\d*(?:\.\d*)?)(?:E([+-]?\d+))?")
+
+
+class BasicError(Exception):
+    """A C64 BASIC runtime error, e.g. ?TYPE MISMATCH ERROR IN 120."""
+
+    def __init__(self, name: str, detail: str = "", line: Optional[int] = None):
+        super().__init__(name)
+        self.name = name
+        self.detail = detail
+        self.line = line
+
+    def message(self) -> str:
+        text = f"?{self.name} ERROR"
+        return text if self.line is None else f"{text} IN {self.line}"
+
+    def __str__(self):
+        return self.message() + (f" ({self.detail})" if self.detail else "")
+
+
+class _Halt(Exception):
+    """Ends a run without a runtime error (END, waiting for keys, ...)."""
+
+    def __init__(self, status: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# ------------------ Numbers and strings ------------------
+
+def c64_float(value: float) -> float:
+    """value rounded to the 32-bit mantissa of a C64 float; ?OVERFLOW ERROR beyond its range."""
+    if -MANTISSA_SCALE < value < MANTISSA_SCALE and value.is_integer():
+        # Whole numbers below 2^32 fit the mantissa
+        return value
+    try:
+        mantissa, exponent = math.frexp(value)
+        if exponent < MIN_EXPONENT:
+            return 0.0
+        result = math.ldexp(round(mantissa * MANTISSA_SCALE), exponent - 32)
+    except (OverflowError, ValueError):
+        raise BasicError(OVERFLOW) from None
+    if -MAX_FLOAT < result < MAX_FLOAT:
+        return result
+    raise BasicError(OVERFLOW)
+
+
+def format_number(value: float) -> str:
+    """A number as PRINT and STR$ show it: ' 5', '-1.5', ' .333333333', ' 1E+10'."""
+    if value == 0:
+        return " 0"
+    sign = "-" if value < 0 else " "
+    mantissa, exponent = f"{abs(value):.8e}".split("e")
+    exponent = int(exponent)
+    digits = mantissa.replace(".", "").rstrip("0")
+    if -3 < exponent < 9:
+        if exponent < 0:
+            return f"{sign}.{'0' * (-exponent - 1)}{digits}"
+        whole = digits[:exponent + 1].ljust(exponent + 1, "0")
+        fraction = digits[exponent + 1:]
+        return f"{sign}{whole}.{fraction}" if fraction else sign + whole
+    fraction = "." + digits[1:] if len(digits) > 1 else ""
+    return f"{sign}{digits[0]}{fraction}E{'+' if exponent >= 0 else '-'}{abs(exponent):02d}"
+
+
+def parse_number(text: str, strict: bool = False) -> Optional[float]:
+    """
+    The number at the start of text, spaces ignored, like VAL(). With strict,
+    the whole text has to be a number (INPUT, READ) or None is returned.
+    """
+    compact = text.replace(" ", "")
+    match = NUMBER_RE.match(compact)
+    sign, number, exponent = match.groups()
+    if strict and match.end() != len(compact):
+        return None
+    if number in ("", "."):
+        return 0.0
+    return c64_float(float(f"{sign}{number}e{exponent or 0}"))
+
+
+def petscii_text(text: str, macros: bool = True) -> str:
+    """
+    Source text as a BASIC string: one character per PETSCII byte. Brace
+    macros and C64 Pro Mono private use characters are translated like in
+    Bas2Prg; other characters above 255 become '?'.
+    """
+    out = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == '{' and macros:
+            end = text.find('}', i + 1)
+            codes = macro_to_bytes(text[i + 1:end]) if end > 0 else None
+            if codes is not None:
+                out.append(codes.decode('latin-1'))
+                i = end + 1
+                continue
+        if ord(char) > 255:
+            byte_val = private_use_to_byte(char)
+            char = chr(byte_val) if byte_val is not None else '?'
+        out.append(char)
+        i += 1
+    return "".join(out)
+
+
+def parse_keys(text: str) -> bytes:
+    """
+    Scripted keys as PETSCII bytes: a new line or {RETURN} is RETURN, brace
+    macros name other keys ({DOWN}, {F1}), letters are typed unshifted.
+    """
+    text = text.replace("\r\n", "\n").replace("\r", "\n").replace("\n", "{RETURN}")
+    return petscii_text(text.translate(ast.ASCII_UPPER)).encode('latin-1')
+
+
+def format_keys(keys: bytes) -> str:
+    """Scripted keys as text for parse_keys(): RETURN and the other keys without a character as brace macros."""
+    return "".join(chr(code) if 0x20 <= code <= 0x5F else byte_to_macro(code) for code in keys)
+
+
+def data_items(text: str) -> List[Tuple[bool, str]]:
+    """Items of a DATA statement as (quoted, text)."""
+    items = []
+    i = 0
+    n = len(text)
+    while True:
+        while i < n and text[i] == ' ':
+            i += 1
+        if i < n and text[i] == '"':
+            end = text.find('"', i + 1)
+            end = n if end < 0 else end
+            items.append((True, text[i + 1:end]))
+            comma = text.find(',', end)
+        else:
+            comma = text.find(',', i)
+            items.append((False, text[i:comma if comma >= 0 else n]))
+        if comma < 0:
+            return items
+        i = comma + 1
+
+
+# ------------------ Machine ------------------
+
+def petscii_to_screen_code(code: int) -> Optional[int]:
+    """Screen code PRINT puts into screen RAM for a PETSCII byte; None for control codes."""
+    if code < 0x20 or 0x80 <= code < 0xA0:
+        return None
+    if code < 0x40:
+        return code
+    if code < 0x60:
+        return code - 0x40
+    if code < 0x80:
+        return code - 0x20
+    if code < 0xC0:
+        return code - 0x40
+    if code < 0xFF:
+        return code - 0x80
+    return 0x5E
+
+
+SCREEN_CODES = [petscii_to_screen_code(code) for code in range(256)]
+# Text for screen codes 0-63 of the upper case set; graphics show as '#'
+SCREEN_CODE_TEXT = "@ABCDEFGHIJKLMNOPQRSTUVWXYZ[£]↑←" + "".join(chr(c) for c in range(32, 64))
+# Screen.write() splits a string into runs: printable characters, cursor downs,
+# cursor rights, HOME and single control codes
+SCREEN_RUN_RE = re.compile(r"([\x20-\x7f\xa0-\xff]+)|(\x11+)|(\x1d+)|(.)", re.DOTALL)
+PRINTABLE_RE = re.compile(r"[\x20-\x7f\xa0-\xff]+")
+# Printable characters (as PETSCII bytes) -> screen codes
+SCREEN_CODE_TABLE = bytes(code if screen_code is None else screen_code for code, screen_code in enumerate(SCREEN_CODES))
+REVERSE_MAP = bytes(code | 0x80 for code in range(256))
+# PETSCII colour codes -> colour number
+COLOUR_CODES = {0x90: 0, 0x05: 1, 0x1C: 2, 0x9F: 3, 0x9C: 4, 0x1E: 5, 0x1F: 6, 0x9E: 7,
+                0x81: 8, 0x95: 9, 0x96: 10, 0x97: 11, 0x98: 12, 0x99: 13, 0x9A: 14, 0x9B: 15}
+COLOUR_FILLS = [bytes([colour]) * SCREEN_COLUMNS for colour in range(16)]
+# The colour RAM under up to a row of characters, by colour and length
+COLOUR_RUNS = [[fill[:count] for count in range(SCREEN_COLUMNS + 1)] for fill in COLOUR_FILLS]
+RUN_TEXT, RUN_DOWN, RUN_RIGHT, RUN_HOME, RUN_CONTROL = range(5)
+MAX_CACHED_RUNS = 1024
+
+
+@lru_cache(maxsize=MAX_CACHED_RUNS)
+def screen_runs(text: str):
+    """
+    The runs Screen.write() prints a string as. A string of printable
+    characters only is kept as its screen codes, one character as its screen
+    code, and HOME with cursor moves as the row and column they lead to.
+    The runs are shared, so they are never changed.
+    """
+    if PRINTABLE_RE.fullmatch(text):
+        codes = text.encode('latin-1').translate(SCREEN_CODE_TABLE)
+        return codes[0] if len(codes) == 1 else codes
+    runs = []
+    for m in SCREEN_RUN_RE.finditer(text):
+        printable, down, right, control = m.groups()
+        if printable:
+            runs.append((RUN_TEXT, printable.encode('latin-1').translate(SCREEN_CODE_TABLE)))
+        elif down:
+            runs.append((RUN_DOWN, len(down)))
+        elif right:
+            runs.append((RUN_RIGHT, len(right)))
+        elif control == "\x13":
+            runs.append((RUN_HOME, 0))
+        else:
+            runs.append((RUN_CONTROL, ord(control)))
+    if runs and runs[0][0] == RUN_HOME:
+        return _home_position(runs) or runs
+    return runs
+
+
+def _home_position(runs: list) -> Optional[Tuple[int, int]]:
+    """Row and column HOME and the cursor moves after it lead to, None for other runs or when they scroll."""
+    row = column = 0
+    for kind, value in runs[1:]:
+        if kind == RUN_DOWN:
+            row += value
+        elif kind == RUN_RIGHT:
+            column += value
+            row += column // SCREEN_COLUMNS
+            column %= SCREEN_COLUMNS
+        elif kind != RUN_HOME:
+            return None
+        else:
+            row = column = 0
+        if row >= SCREEN_ROWS:
+            return None
+    return row, column
+
+
+class Screen:
+    """
+    The 40x25 text screen: PRINT output as screen codes in the screen RAM at
+    $0400, in the text colour (646) in the colour RAM at $D800.
+    """
+
+    def __init__(self, memory: bytearray, base: int = SCREEN_RAM, colour_base: int = COLOUR_RAM):
+        self.memory = memory
+        self.base = base
+        self.colour_base = colour_base
+        # The screen and colour RAM by offset on the screen; slice assignments
+        # through a memoryview skip the resizing checks of the bytearray
+        view = memoryview(memory)
+        self._chars = view[base:base + SCREEN_SIZE]
+        self._colours = view[colour_base:colour_base + SCREEN_SIZE]
+        self.row = 0
+        self.column = 0
+        self.reverse = False
+        # Characters printed and rows scrolled, for cost estimates
+        self.printed = 0
+        self.scrolls = 0
+        self._runs: Dict[str, list] = {}
+        self.clear()
+
+    def clear(self):
+        self.memory[self.base:self.base + SCREEN_SIZE] = b"\x20" * SCREEN_SIZE
+        # Like the later KERNALs, clearing fills the colour RAM with the text colour, so POKEd characters show
+        self.memory[self.colour_base:self.colour_base + SCREEN_SIZE] = \
+            COLOUR_FILLS[self.memory[TEXT_COLOUR] & 0x0F] * SCREEN_ROWS
+        self.row = self.column = 0
+
+    def write(self, text: str):
+        """Prints a BASIC string (one character per PETSCII byte) at the cursor."""
+        runs = self._runs.get(text)
+        if runs is None:
+            runs = self._split(text)
+        kind = type(runs)
+        if kind is tuple:
+            # HOME and cursor moves that stay on the screen
+            self.printed += len(text)
+            self.row, self.column = runs
+            return
+        if kind is int:
+            self.write_code(runs)
+            return
+        if kind is bytes:
+            self.write_codes(runs)
+            return
+        self.printed += len(text)
+        for kind, value in runs:
+            if kind == RUN_TEXT:
+                self._text(value.translate(REVERSE_MAP) if self.reverse else value)
+            elif kind == RUN_DOWN:
+                step = min(value, SCREEN_ROWS - 1 - self.row)
+                self.row += step
+                for _ in range(value - step):
+                    self._line_feed()
+            elif kind == RUN_RIGHT:
+                self.cursor_right(value)
+            elif kind == RUN_HOME:
+                self.row = self.column = 0
+            else:
+                self.put(value)
+
+    def write_code(self, code: int):
+        """Prints one printable character, given as its screen code."""
+        self.printed += 1
+        column = self.column
+        if column < SCREEN_COLUMNS - 1 and not self.reverse:
+            offset = self.row * SCREEN_COLUMNS + column
+            self._chars[offset] = code
+            self._colours[offset] = self.memory[TEXT_COLOUR] & 0x0F
+            self.column = column + 1
+        else:
+            self._text(bytes((code | 0x80 if self.reverse else code,)))
+
+    def write_codes(self, codes: bytes):
+        """Prints printable characters, given as their screen codes."""
+        count = len(codes)
+        self.printed += count
+        column = self.column
+        if column + count < SCREEN_COLUMNS and not self.reverse:
+            # Most often within the row
+            start = self.row * SCREEN_COLUMNS + column
+            self._chars[start:start + count] = codes
+            self._colours[start:start + count] = COLOUR_RUNS[self.memory[TEXT_COLOUR] & 0x0F][count]
+            self.column = column + count
+        else:
+            self._text(codes.translate(REVERSE_MAP) if self.reverse else codes)
+
+    def cursor_right(self, count: int):
+        """Moves the cursor count columns on, as the cursor right key, TAB( and SPC( do."""
+        if count <= 0:
+            return
+        self.column += count
+        while self.column >= SCREEN_COLUMNS:
+            self.column -= SCREEN_COLUMNS
+            self._line_feed()
+
+    def _split(self, text: str):
+        runs = screen_runs(text)
+        # Programs print the same few strings over and over
+        if len(self._runs) >= MAX_CACHED_RUNS:
+            self._runs.clear()
+        self._runs[text] = runs
+        return runs
+
+    def _text(self, codes: bytes):
+        """Screen codes written from the cursor on, wrapping at the end of a row."""
+        pos = 0
+        colours = COLOUR_FILLS[self.memory[TEXT_COLOUR] & 0x0F]
+        while pos < len(codes):
+            chunk = codes[pos:pos + SCREEN_COLUMNS - self.column]
+            start = self.row * SCREEN_COLUMNS + self.column
+            self._chars[start:start + len(chunk)] = chunk
+            self._colours[start:start + len(chunk)] = colours[:len(chunk)]
+            pos += len(chunk)
+            self.column += len(chunk)
+            if self.column == SCREEN_COLUMNS:
+                self.column = 0
+                self._line_feed()
+
+    def put(self, code: int):
+        screen_code = SCREEN_CODES[code]
+        if screen_code is not None:
+            offset = self.row * SCREEN_COLUMNS + self.column
+            self.memory[self.base + offset] = screen_code | 0x80 if self.reverse else screen_code
+            self.memory[self.colour_base + offset] = self.memory[TEXT_COLOUR] & 0x0F
+            self._advance()
+        elif code == 0x0D or code == 0x8D:
+            self.column = 0
+            self.reverse = False
+            self._line_feed()
+        elif code == 0x93:
+            self.clear()
+        elif code == 0x13:
+            self.row = self.column = 0
+        elif code == 0x11:
+            self._line_feed()
+        elif code == 0x91:
+            self.row = max(0, self.row - 1)
+        elif code == 0x1D:
+            self._advance()
+        elif code == 0x9D:
+            if self.column:
+                self.column -= 1
+            elif self.row:
+                self.row -= 1
+                self.column = SCREEN_COLUMNS - 1
+        elif code == 0x12:
+            self.reverse = True
+        elif code == 0x92:
+            self.reverse = False
+        elif code in COLOUR_CODES:
+            self.memory[TEXT_COLOUR] = COLOUR_CODES[code]
+        elif code == 0x0E:
+            self.memory[VIC_MEMORY_SETUP] |= LOWER_CASE_SET
+        elif code == 0x8E:
+            self.memory[VIC_MEMORY_SETUP] &= ~LOWER_CASE_SET & 0xFF
+        elif code == 0x14 and self.column:
+            # DEL: the rest of the row moves one column to the left
+            self.column -= 1
+            for base, blank in ((self.base, 0x20), (self.colour_base, self.memory[TEXT_COLOUR] & 0x0F)):
+                start = base + self.row * SCREEN_COLUMNS
+                end = start + SCREEN_COLUMNS
+                self.memory[start + self.column:end - 1] = self.memory[start + self.column + 1:end]
+                self.memory[end - 1] = blank
+
+    def _advance(self):
+        self.column += 1
+        if self.column == SCREEN_COLUMNS:
+            self.column = 0
+            self._line_feed()
+
+    def _line_feed(self):
+        if self.row < SCREEN_ROWS - 1:
+            self.row += 1
+            return
+        self.scrolls += 1
+        memory = self.memory
+        for base, blank in ((self.base, b"\x20" * SCREEN_COLUMNS),
+                            (self.colour_base, COLOUR_FILLS[memory[TEXT_COLOUR] & 0x0F])):
+            memory[base:base + SCREEN_SIZE - SCREEN_COLUMNS] = memory[base + SCREEN_COLUMNS:base + SCREEN_SIZE]
+            memory[base + SCREEN_SIZE - SCREEN_COLUMNS:base + SCREEN_SIZE] = blank
+
+    def text(self) -> str:
+        """The screen as text, trailing blanks removed."""
+        rows = []
+        for row in range(SCREEN_ROWS):
+            start = self.base + row * SCREEN_COLUMNS
+            codes = self.memory[start:start + SCREEN_COLUMNS]
+            rows.append("".join(SCREEN_CODE_TEXT[c & 0x7F] if c & 0x7F < 64 else '#' for c in codes).rstrip())
+        return "\n".join(rows).rstrip("\n")
+
+
+class Machine:
+    """Memory, screen, scripted keyboard, clock and random numbers of a headless C64."""
+
+    def __init__(self, keys: bytes = b"", seed: int = 0, paced_keys: bool = True):
+        self.memory = bytearray(0x10000)
+        for address, value in INITIAL_MEMORY.items():
+            self.memory[address] = value
+        self.screen = Screen(self.memory)
+        self.keys = bytes(keys)
+        self.key_pos = 0
+        # Paced keys: GET finds the next key only after it found none
+        self.paced_keys = paced_keys
+        self.key_ready = not paced_keys
+        self.rng = random.Random(seed)
+        self.statements = 0  # executed statements drive the clock
+        self.clock_offset = 0
+        # Counters for the infinite loop check
+        self.volatile_reads = 0
+        self.empty_gets = 0
+        self.notes: List[str] = []
+
+    def note(self, text: str):
+        if text not in self.notes:
+            self.notes.append(text)
+
+    # -------- keyboard --------
+    def keys_left(self) -> int:
+        return len(self.keys) - self.key_pos
+
+    def next_key(self) -> Optional[int]:
+        if self.key_pos >= len(self.keys):
+            self.empty_gets += 1
+            return None
+        if not self.key_ready:
+            self.key_ready = True
+            return None
+        self.key_ready = not self.paced_keys
+        self.key_pos += 1
+        return self.keys[self.key_pos - 1]
+
+    def read_line(self) -> Optional[str]:
+        """Keys up to the next RETURN, or None if the script has no RETURN left."""
+        end = self.keys.find(0x0D, self.key_pos)
+        if end < 0:
+            return None
+        line = self.keys[self.key_pos:end].decode('latin-1')
+        self.key_pos = end + 1
+        return line
+
+    # -------- clock and random numbers --------
+    def jiffies(self) -> int:
+        self.volatile_reads += 1
+        return (self.statements // STATEMENTS_PER_JIFFY + self.clock_offset) % JIFFIES_PER_DAY
+
+    def set_time(self, text: str):
+        """TI$ = "HHMMSS"."""
+        if len(text) != 6 or not text.isdigit():
+            raise BasicError(ILLEGAL_QUANTITY, f"TI$ needs six digits, not \"{text}\"")
+        jiffies = ((int(text[:2]) * 60 + int(text[2:4])) * 60 + int(text[4:])) * 60
+        self.clock_offset = jiffies - self.statements // STATEMENTS_PER_JIFFY
+
+    def time_string(self) -> str:
+        seconds = self.jiffies() // 60
+        return f"{seconds // 3600 % 24:02d}{seconds // 60 % 60:02d}{seconds % 60:02d}"
+
+    def rnd(self, x: float) -> float:
+        """RND(x): a negative x reseeds, 0 reads the hardware timer, a positive x continues the sequence."""
+        self.volatile_reads += 1
+        if x < 0:
+            self.rng.seed(x)
+        return math.floor(self.rng.random() * MANTISSA_SCALE) / MANTISSA_SCALE
+
+    # -------- memory --------
+    def peek(self, address: int) -> int:
+        if address in VOLATILE_ADDRESSES:
+            self.volatile_reads += 1
+            if 160 <= address <= 162:
+                return self.jiffies() >> (8 * (162 - address)) & 0xFF
+            if address == 0xD012:
+                return self.statements * 7 % 263 & 0xFF
+            if address == 0xD41B or address == 0xD41C:
+                return self.rng.randrange(256)
+            if 0xDC04 <= address <= 0xDC07:
+                return self.statements * 37 >> (8 * (address & 1)) & 0xFF
+        elif address == KEY_COUNT:
+            return min(self.keys_left(), KEYBOARD_BUFFER_SIZE)
+        elif address == CURSOR_COLUMN:
+            return self.screen.column
+        elif address == CURSOR_ROW:
+            return self.screen.row
+        return self.memory[address]
+
+    def poke(self, address: int, value: int):
+        if address == CURSOR_COLUMN:
+            self.screen.column = min(value, SCREEN_COLUMNS - 1)
+        elif address == CURSOR_ROW:
+            self.screen.row = min(value, SCREEN_ROWS - 1)
+        # POKE 198,0 flushes the buffer; scripted keys count as typed later and stay
+        self.memory[address] = value
+
+    def sys(self, address: int):
+        """The KERNAL routines programs call for screen output; other addresses are ignored."""
+        if address == SYS_PLOT:
+            if self.memory[REG_STATUS] & 1:
+                self.memory[REG_X], self.memory[REG_Y] = self.screen.row, self.screen.column
+            else:
+                self.screen.row = min(self.memory[REG_X], SCREEN_ROWS - 1)
+                self.screen.column = min(self.memory[REG_Y], SCREEN_COLUMNS - 1)
+        elif address == SYS_CHROUT:
+            self.screen.put(self.memory[REG_A])
+        elif address == SYS_CLEAR_SCREEN:
+            self.screen.clear()
+        else:
+            self.note(f"SYS {address} ignored (machine code is not emulated)")
+
+
+# ------------------ Program ------------------
+
+@dataclass
+class ProgramLine:
+    number: int
+    statements: list  # in execution order: an IF is followed by the statements of its body
+    length: int  # characters of source text, for FRE()
+
+
+class Program:
+    """The numbered lines of a source text, sorted like in C64 memory, and their DATA items."""
+
+    def __init__(self, source_text: str):
+        parsed: Dict[int, ast.Line] = {}
+        for raw in source_text.splitlines():
+            m = ast.LINE_RE.match(raw)
+            if not m or int(m.group(1)) > MAX_LINE_NUMBER:
+                continue
+            # A repeated line number replaces the earlier line, as when typed in
+            parsed[int(m.group(1))] = ast.parse_line(m.group(2))
+        self.lines = [ProgramLine(number, list(ast.iter_statements(parsed[number].statements)),
+                                  len(parsed[number].content))
+                      for number in sorted(parsed)]
+        self.index = {line.number: idx for idx, line in enumerate(self.lines)}
+        # (line number, quoted, text) of every DATA item in program order
+        self.data = [(line.number, quoted, text)
+                     for line in self.lines for stmt in line.statements if type(stmt) is ast.Data
+                     for quoted, text in data_items(stmt.text)]
+        self.size = sum(line.length + 5 for line in self.lines) + 2
+
+
+class Array:
+    __slots__ = ('dims', 'values')
+
+    def __init__(self, dims: Tuple[int, ...], default):
+        self.dims = dims
+        self.values = [default] * math.prod(d + 1 for d in dims)
+
+
+@dataclass
+class RunResult:
+    status: str
+    message: str  # e.g. ?OUT OF DATA ERROR IN 120 (detail)
+    line: Optional[int]  # line number where the run stopped
+    statements: int
+    elapsed_ms: float
+    lines_run: int
+    lines_total: int
+    keys_left: int
+    screen: str
+    notes: List[str] = field(default_factory=list)
+
+    @property
+    def failed(self) -> bool:
+        """A runtime error or an infinite loop."""
+        return self.status in (ERROR, HANG)
+
+    def summary(self) -> str:
+        if self.status == ERROR:
+            text = self.message
+        elif self.status == LIMIT:
+            text = f"No runtime error; still running in line {self.line} after the statement limit"
+        elif self.status == ENDED:
+            text = "Program ended" + (f" in line {self.line}" if self.line is not None else "")
+        else:
+            text = f"{self.message} (line {self.line})"
+        text += (f". {self.statements} statements in {self.elapsed_ms:.1f} ms, "
+                 f"{self.lines_run} of {self.lines_total} lines executed, {self.keys_left} scripted keys left")
+        for note in self.notes:
+            text += f". {note}"
+        return text
+
+
+# ------------------ Interpreter ------------------
+
+def _is_string(value) -> bool:
+    return type(value) is str
+
+
+class Interpreter:
+    """
+    Executes a Program statement by statement on a Machine. Statements and
+    expressions are dispatched on their AST node type; variables live in a
+    dict keyed by their two-character names.
+    """
+
+    def __init__(self, program: Program, machine: Optional[Machine] = None):
+        self.program = program
+        self.machine = machine or Machine()
+        self.li = 0  # line index of the next statement
+        self.si = 0  # statement index in that line
+        self.current = 0  # line index of the executing statement
+        self.line_counts = [0] * len(program.lines)
+        self._keys: Dict[str, str] = {}
+        self._literals: Dict[str, object] = {}
+        self._fingerprints: Dict[int, int] = {}
+        self._volatile_mark = -1
+        self._clear()
+        self._statements = {
+            ast.Let: self._let, ast.Print: self._print, ast.Input: self._input, ast.If: self._if,
+            ast.For: self._for, ast.Next: self._next, ast.Jump: self._jump, ast.On: self._on,
+            ast.Dim: self._dim, ast.Read: self._read, ast.Data: self._nothing, ast.Rem: self._nothing,
+            ast.Def: self._def, ast.Command: self._command, ast.Bad: self._bad,
+        }
+        self._commands = {
+            'POKE': self._poke, 'WAIT': self._wait, 'SYS': self._sys, 'OPEN': self._open, 'CLOSE': self._close,
+            'RESTORE': self._restore, 'RETURN': self._return, 'END': self._end, 'STOP': self._stop,
+            'CLR': self._clr, 'RUN': self._run, 'CONT': self._cont, 'NEW': self._end, 'LIST': self._end,
+            'LOAD': self._unsupported, 'SAVE': self._unsupported, 'VERIFY': self._unsupported,
+        }
+        self._evaluators = {
+            ast.Number: self._eval_number, ast.String: self._eval_string, ast.Variable: self._eval_variable,
+            ast.Call: self._eval_call, ast.Paren: self._eval_paren, ast.Unary: self._eval_unary,
+            ast.Binary: self._eval_binary, ast.Invalid: self._bad, ast.Missing: self._bad,
+        }
+        self._functions = {
+            'SGN': (1, lambda x: float((x > 0) - (x < 0))),
+            'INT': (1, lambda x: float(math.floor(x))),
+            'ABS': (1, abs),
+            'USR': (1, self._usr),
+            'FRE': (1, self._fre),
+            'POS': (1, lambda x: float(self.machine.screen.column)),
+            'SQR': (1, self._sqr),
+            'RND': (1, self._rnd),
+            'LOG': (1, self._log),
+            'EXP': (1, self._exp),
+            'COS': (1, lambda x: c64_float(math.cos(x))),
+            'SIN': (1, lambda x: c64_float(math.sin(x))),
+            'TAN': (1, self._tan),
+            'ATN': (1, lambda x: c64_float(math.atan(x))),
+            'PEEK': (1, lambda x: float(self.machine.peek(self._address(x)))),
+            'LEN': (1, lambda s: float(len(s))),
+            'STR$': (1, format_number),
+            'VAL': (1, parse_number),
+            'ASC': (1, self._asc),
+            'CHR$': (1, lambda x: chr(self._byte(x))),
+            'LEFT$': (2, lambda s, n: s[:self._byte(n)]),
+            'RIGHT$': (2, lambda s, n: s[len(s) - min(self._byte(n), len(s)):]),
+            'MID$': ((2, 3), self._mid),
+        }
+        # Argument types of the functions: '$' string, '' number, None any
+        self._function_args = {'LEN': '$', 'VAL': '$', 'ASC': '$', 'LEFT$': '$', 'RIGHT$': '$', 'MID$': '$',
+                               'FRE': None, 'POS': None}
+
+    def _clear(self):
+        """CLR: variables, arrays, functions, stack, DATA pointer and files."""
+        self.variables: Dict[str, object] = {}
+        self.arrays: Dict[str, Array] = {}
+        self.functions: Dict[str, Tuple[str, object]] = {}
+        self.stack: List[tuple] = []
+        self.stack_bytes = 0
+        self.data_pointer = 0
+        self.files: Dict[int, int] = {}
+
+    # -------- running --------
+    def run(self, max_statements: int = DEFAULT_MAX_STATEMENTS) -> RunResult:
+        """Runs until the program stops or max_statements more statements were executed."""
+        machine = self.machine
+        start_statements = machine.statements
+        start = time.perf_counter()
+        status, message, line = LIMIT, "", None
+        try:
+            self._execute(max_statements)
+            line = self._line_number()
+        except BasicError as e:
+            if e.line is None:
+                e.line = self._line_number()
+            status, message, line = ERROR, str(e), e.line
+        except _Halt as halt:
+            status, message = halt.status, halt.message
+            line = self._line_number() if self.li < len(self.program.lines) or status != ENDED else None
+        except RecursionError:
+            # A deeply nested expression; the C64 gives up much earlier
+            status, message, line = ERROR, f"?OUT OF MEMORY ERROR IN {self._line_number()}", self._line_number()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        return RunResult(
+            status=status,
+            message=message,
+            line=line,
+            statements=machine.statements - start_statements,
+            elapsed_ms=round(elapsed_ms, 3),
+            lines_run=sum(1 for count in self.line_counts if count),
+            lines_total=len(self.program.lines),
+            keys_left=machine.keys_left(),
+            screen=machine.screen.text(),
+            notes=list(machine.notes),
+        )
+
+    def _line_number(self) -> Optional[int]:
+        lines = self.program.lines
+        return lines[self.current].number if self.current < len(lines) else None
+
+    def _execute(self, max_statements: int):
+        lines = self.program.lines
+        handlers = self._statements
+        machine = self.machine
+        counts = self.line_counts
+        limit = machine.statements + max_statements
+        next_check = machine.statements + HANG_CHECK_INTERVAL
+        while machine.statements < limit:
+            if self.si == 0:
+                if self.li >= len(lines):
+                    raise _Halt(ENDED, "READY.")
+                counts[self.li] += 1
+            statements = lines[self.li].statements
+            if self.si >= len(statements):
+                self.li += 1
+                self.si = 0
+                continue
+            stmt = statements[self.si]
+            self.current = self.li
+            self.si += 1
+            machine.statements += 1
+            handlers[type(stmt)](stmt)
+            if machine.statements >= next_check:
+                next_check += HANG_CHECK_INTERVAL
+                self._check_hang()
+
+    def _check_hang(self):
+        machine = self.machine
+        if machine.volatile_reads != self._volatile_mark:
+            # The program looked at something that changes by itself; start over
+            self._volatile_mark = machine.volatile_reads
+            self._fingerprints.clear()
+            return
+        fingerprint = self._fingerprint()
+        empty_gets = self._fingerprints.get(fingerprint)
+        if empty_gets is not None:
+            if machine.empty_gets > empty_gets:
+                raise _Halt(WAITING, "GET waits for a key, the scripted keys are used up")
+            raise _Halt(HANG, "Infinite loop: the program repeats the same state without input")
+        if len(self._fingerprints) >= MAX_FINGERPRINTS:
+            self._fingerprints.clear()
+        self._fingerprints[fingerprint] = machine.empty_gets
+
+    def _fingerprint(self) -> int:
+        machine = self.machine
+        return hash((self.li, self.si, tuple(self.variables.items()),
+                     tuple((key, tuple(array.values)) for key, array in self.arrays.items()),
+                     tuple(self.stack), self.data_pointer, machine.key_pos, machine.key_ready, machine.clock_offset,
+                     machine.screen.row, machine.screen.column, machine.screen.reverse, bytes(machine.memory)))
+
+    def goto(self, number: int):
+        index = self.program.index.get(number)
+        if index is None:
+            raise BasicError(UNDEFD_STATEMENT, f"line {number} does not exist")
+        self.li = index
+        self.si = 0
+
+    def _push(self, frame: tuple):
+        size = FRAME_BYTES[frame[0]]
+        if self.stack_bytes + size > STACK_BYTES:
+            raise BasicError(OUT_OF_MEMORY, "too many nested FOR loops or GOSUBs")
+        self.stack.append(frame)
+        self.stack_bytes += size
+
+    def _truncate_stack(self, length: int):
+        del self.stack[length:]
+        self.stack_bytes = sum(FRAME_BYTES[frame[0]] for frame in self.stack)
+
+    # -------- values --------
+    def _key(self, name: str) -> str:
+        key = self._keys.get(name)
+        if key is None:
+            key = self._keys[name] = variable_key(name)
+        return key
+
+    @staticmethod
+    def _number(value) -> float:
+        if _is_string(value):
+            raise BasicError(TYPE_MISMATCH, "string where a number is expected")
+        return value
+
+    @staticmethod
+    def _string(value) -> str:
+        if not _is_string(value):
+            raise BasicError(TYPE_MISMATCH, "number where a string is expected")
+        return value
+
+    @staticmethod
+    def _integer(value) -> int:
+        """A 16-bit signed value, as for A% and AND/OR/NOT."""
+        result = math.floor(Interpreter._number(value))
+        if not -32768 <= result <= 32767:
+            raise BasicError(ILLEGAL_QUANTITY, f"{format_number(value).strip()} is not a 16-bit integer")
+        return result
+
+    @staticmethod
+    def _byte(value) -> int:
+        result = math.floor(Interpreter._number(value))
+        if not 0 <= result <= 255:
+            raise BasicError(ILLEGAL_QUANTITY, f"{format_number(value).strip()} is not in 0-255")
+        return result
+
+    @staticmethod
+    def _address(value) -> int:
+        result = math.floor(Interpreter._number(value))
+        if not 0 <= result <= 0xFFFF:
+            raise BasicError(ILLEGAL_QUANTITY, f"{format_number(value).strip()} is not an address")
+        return result
+
+    def _coerce(self, name: str, value):
+        """value converted for a variable named name; ?TYPE MISMATCH if it does not fit."""
+        if name.endswith('$'):
+            if not _is_string(value):
+                raise BasicError(TYPE_MISMATCH, f"number assigned to {name}")
+            return value
+        if _is_string(value):
+            raise BasicError(TYPE_MISMATCH, f"string assigned to {name}")
+        if name.endswith('%'):
+            return float(self._integer(value))
+        return value
+
+    def _element(self, node: ast.Call, create: bool = True) -> Tuple[Array, int]:
+        """The array and flat index of an element reference; undeclared arrays get DIM 10."""
+        if not node.closed:
+            raise BasicError(SYNTAX_ERROR, f"missing ')' after {node.name}(")
+        key = self._key(node.name)
+        indices = []
+        for arg in node.args:
+            index = math.floor(self._number(self._eval(arg)))
+            if not -32768 <= index <= 32767 or index < 0:
+                raise BasicError(ILLEGAL_QUANTITY, f"subscript {index} of {node.name}")
+            indices.append(index)
+        array = self.arrays.get(key)
+        if array is None:
+            array = self._dimension(node.name, (10,) * len(indices))
+        if len(indices) != len(array.dims):
+            raise BasicError(BAD_SUBSCRIPT, f"{node.name} has {len(array.dims)} dimension(s)")
+        flat = 0
+        for index, dim in zip(indices, array.dims):
+            if index > dim:
+                raise BasicError(BAD_SUBSCRIPT, f"{node.name}({','.join(map(str, indices))}) exceeds DIM {dim}")
+            flat = flat * (dim + 1) + index
+        return array, flat
+
+    def _dimension(self, name: str, dims: Tuple[int, ...]) -> Array:
+        key = self._key(name)
+        if key in self.arrays:
+            raise BasicError(REDIMD_ARRAY, f"{name} is already dimensioned")
+        elements = math.prod(d + 1 for d in dims)
+        element_bytes = 3 if name.endswith('$') else 2 if name.endswith('%') else 5
+        if elements * element_bytes > BASIC_RAM_BYTES - self.program.size:
+            raise BasicError(OUT_OF_MEMORY, f"DIM {name}{dims} needs {elements * element_bytes} bytes")
+        array = self.arrays[key] = Array(dims, "" if name.endswith('$') else 0.0)
+        return array
+
+    def _assign(self, target, value):
+        if type(target) is ast.Variable:
+            name = target.name
+            key = self._key(name)
+            if key == 'TI$':
+                self.machine.set_time(self._string(value))
+                return
+            if key == 'TI' or key == 'ST':
+                raise BasicError(SYNTAX_ERROR, f"{name} is a reserved variable")
+            self.variables[key] = self._coerce(name, value)
+        elif type(target) is ast.Call and not target.function:
+            array, index = self._element(target)
+            array.values[index] = self._coerce(target.name, value)
+        else:
+            raise BasicError(SYNTAX_ERROR)
+
+    # -------- expressions --------
+    def _eval(self, node):
+        return self._evaluators[type(node)](node)
+
+    def _eval_number(self, node: ast.Number) -> float:
+        value = self._literals.get(node.text)
+        if value is None:
+            text = node.text
+            value = parse_number(text) if text[0].isdigit() or text[0] == '.' else c64_float(math.pi)
+            self._literals[text] = value
+        return value
+
+    def _eval_string(self, node: ast.String) -> str:
+        value = self._literals.get(node.text)
+        if value is None:
+            value = self._literals[node.text] = petscii_text(node.text[1:-1] if node.closed else node.text[1:])
+        return value
+
+    def _eval_variable(self, node: ast.Variable):
+        key = self._key(node.name)
+        value = self.variables.get(key)
+        if value is not None:
+            return value
+        if key == 'TI':
+            return float(self.machine.jiffies())
+        if key == 'TI$':
+            return self.machine.time_string()
+        return "" if key.endswith('$') else 0.0
+
+    def _eval_paren(self, node: ast.Paren):
+        if not node.closed:
+            raise BasicError(SYNTAX_ERROR, "missing ')'")
+        return self._eval(node.expr)
+
+    def _eval_unary(self, node: ast.Unary):
+        value = self._number(self._eval(node.operand))
+        if node.op == '-':
+            return -value
+        if node.op == 'NOT':
+            return float(~self._integer(value))
+        return value
+
+    def _eval_binary(self, node: ast.Binary):
+        op = node.op
+        left = self._eval(node.left)
+        right = self._eval(node.right)
+        if op == '+':
+            if _is_string(left) and _is_string(right):
+                if len(left) + len(right) > MAX_STRING_LENGTH:
+                    raise BasicError(STRING_TOO_LONG, f"{len(left) + len(right)} characters")
+                return left + right
+            return c64_float(self._number(left) + self._number(right))
+        if op in ast.RELATIONAL:
+            if _is_string(left) != _is_string(right):
+                raise BasicError(TYPE_MISMATCH, f"comparing a string with a number")
+            if op == '=':
+                return -1.0 if left == right else 0.0
+            if op == '<>':
+                return -1.0 if left != right else 0.0
+            if op == '<':
+                return -1.0 if left < right else 0.0
+            if op == '>':
+                return -1.0 if left > right else 0.0
+            if op == '<=':
+                return -1.0 if left <= right else 0.0
+            return -1.0 if left >= right else 0.0
+        left = self._number(left)
+        right = self._number(right)
+        if op == '-':
+            return c64_float(left - right)
+        if op == '*':
+            return c64_float(left * right)
+        if op == '/':
+            if right == 0:
+                raise BasicError(DIVISION_BY_ZERO)
+            return c64_float(left / right)
+        if op == '^':
+            return self._power(left, right)
+        if op == 'AND':
+            return float(self._integer(left) & self._integer(right))
+        return float(self._integer(left) | self._integer(right))
+
+    @staticmethod
+    def _power(base: float, exponent: float) -> float:
+        if base == 0 and exponent < 0:
+            raise BasicError(DIVISION_BY_ZERO, "0 raised to a negative power")
+        if base < 0 and exponent != math.floor(exponent):
+            raise BasicError(ILLEGAL_QUANTITY, "negative number raised to a fractional power")
+        try:
+            return c64_float(base ** exponent)
+        except OverflowError:
+            raise BasicError(OVERFLOW) from None
+
+    def _eval_call(self, node: ast.Call):
+        if not node.function:
+            array, index = self._element(node)
+            return array.values[index]
+        if not node.closed:
+            raise BasicError(SYNTAX_ERROR, f"missing ')' after {node.name}(")
+        if node.name.startswith('FN'):
+            return self._call_fn(node)
+        spec = self._functions.get(node.name)
+        if spec is None:
+            # TAB( and SPC( outside PRINT
+            raise BasicError(SYNTAX_ERROR, f"{node.name} is only allowed in PRINT")
+        count, function = spec
+        if len(node.args) not in (count if type(count) is tuple else (count,)):
+            raise BasicError(SYNTAX_ERROR, f"wrong number of arguments for {node.name}")
+        args = [self._eval(arg) for arg in node.args]
+        kind = self._function_args.get(node.name, '')
+        if kind == '$':
+            self._string(args[0])
+            for arg in args[1:]:
+                self._number(arg)
+        elif kind == '':
+            for arg in args:
+                self._number(arg)
+        return function(*args)
+
+    def _call_fn(self, node: ast.Call) -> float:
+        key = 'FN' + self._key(node.name[2:]) if len(node.name) > 2 else node.name
+        definition = self.functions.get(key)
+        if definition is None:
+            raise BasicError(UNDEFD_FUNCTION, f"{node.name} is not defined")
+        if len(node.args) != 1:
+            raise BasicError(SYNTAX_ERROR, f"{node.name} needs one argument")
+        param, body = definition
+        argument = self._number(self._eval(node.args[0]))
+        saved = self.variables.get(param)
+        self.variables[param] = argument
+        try:
+            return self._number(self._eval(body))
+        finally:
+            if saved is None:
+                del self.variables[param]
+            else:
+                self.variables[param] = saved
+
+    # -------- functions --------
+    def _usr(self, x):
+        raise BasicError(ILLEGAL_QUANTITY, "USR() has no machine code routine")
+
+    def _fre(self, x) -> float:
+        used = (self.program.size + 7 * len(self.variables)
+                + sum(len(a.values) * 5 for a in self.arrays.values())
+                + sum(len(v) for v in self.variables.values() if _is_string(v)))
+        free = BASIC_RAM_BYTES - used
+        return float(free - 65536 if free > 32767 else free)
+
+    @staticmethod
+    def _sqr(x: float) -> float:
+        if x < 0:
+            raise BasicError(ILLEGAL_QUANTITY, "SQR of a negative number")
+        return c64_float(math.sqrt(x))
+
+    def _rnd(self, x: float) -> float:
+        return self.machine.rnd(x)
+
+    @staticmethod
+    def _log(x: float) -> float:
+        if x <= 0:
+            raise BasicError(ILLEGAL_QUANTITY, "LOG of a number <= 0")
+        return c64_float(math.log(x))
+
+    @staticmethod
+    def _exp(x: float) -> float:
+        try:
+            return c64_float(math.exp(x))
+        except OverflowError:
+            raise BasicError(OVERFLOW) from None
+
+    @staticmethod
+    def _tan(x: float) -> float:
+        if math.cos(x) == 0:
+            raise BasicError(DIVISION_BY_ZERO)
+        return c64_float(math.tan(x))
+
+    @staticmethod
+    def _asc(s: str) -> float:
+        if not s:
+            raise BasicError(ILLEGAL_QUANTITY, "ASC of an empty string")
+        return float(ord(s[0]))
+
+    def _mid(self, s: str, start, length=255.0) -> str:
+        start = self._byte(start)
+        if start == 0:
+            raise BasicError(ILLEGAL_QUANTITY, "MID$ start position 0")
+        return s[start - 1:start - 1 + self._byte(length)]
+
+    # -------- statements --------
+    def _nothing(self, stmt):
+        pass
+
+    def _bad(self, node):
+        text = getattr(node, 'text', '')
+        raise BasicError(SYNTAX_ERROR, f"at '{text}'" if text else "")
+
+    def _let(self, stmt: ast.Let):
+        self._assign(stmt.target, self._eval(stmt.value))
+
+    def _channel(self, expression, output: bool) -> int:
+        """Device of an open file number (PRINT#, INPUT#, GET#, CMD)."""
+        number = self._byte(self._eval(expression))
+        device = self.files.get(number)
+        if device is None:
+            raise BasicError(FILE_NOT_OPEN, f"file {number}")
+        if output and device == 0:
+            raise BasicError(NOT_OUTPUT_FILE, f"file {number} is the keyboard")
+        if not output and device == 3:
+            raise BasicError(NOT_INPUT_FILE, f"file {number} is the screen")
+        return device
+
+    def _print(self, stmt: ast.Print):
+        if stmt.channel is not None:
+            self._channel(stmt.channel, True)
+        screen = self.machine.screen
+        for separators, item in zip(stmt.separators, stmt.items):
+            self._print_separators(separators)
+            if type(item) is ast.Call and item.function and item.name in ('TAB', 'SPC'):
+                if not item.closed or len(item.args) != 1:
+                    raise BasicError(SYNTAX_ERROR, f"{item.name}( needs one argument and ')'")
+                count = self._byte(self._eval(item.args[0]))
+                if item.name == 'TAB':
+                    count -= screen.column
+                screen.cursor_right(count)
+                continue
+            value = self._eval(item)
+            # Numbers are followed by a cursor right
+            screen.write(value if _is_string(value) else format_number(value) + "\x1d")
+        self._print_separators(stmt.separators[-1])
+        if not stmt.separators[-1]:
+            screen.put(0x0D)
+
+    def _print_separators(self, separators: str):
+        screen = self.machine.screen
+        for separator in separators:
+            if separator == ',':
+                # Next column of ten
+                screen.cursor_right(10 - screen.column % 10)
+
+    def _input(self, stmt: ast.Input):
+        keyboard = True
+        if stmt.channel is not None:
+            keyboard = self._channel(stmt.channel, False) == 0
+        if not keyboard:
+            raise _Halt(UNSUPPORTED, f"{stmt.keyword} from a device is not emulated")
+        if not stmt.targets:
+            raise BasicError(SYNTAX_ERROR, f"{stmt.keyword} without variables")
+        if stmt.keyword.startswith('GET'):
+            for target in stmt.targets:
+                self._get(target)
+            return
+        prompt = self._eval_string(stmt.prompt) if stmt.prompt is not None else ""
+        screen = self.machine.screen
+        screen.write(prompt + ("? " if stmt.channel is None else ""))
+        fields: List[str] = []
+        first = True
+        while True:
+            line = self.machine.read_line()
+            if line is None:
+                raise _Halt(WAITING, f"{stmt.keyword} waits for input, the scripted keys are used up")
+            screen.write(line)
+            screen.put(0x0D)
+            if first and line == "":
+                # RETURN alone keeps the variables
+                return
+            first = False
+            fields.extend(self._input_fields(line))
+            values = []
+            for target, text in zip(stmt.targets, fields):
+                name = target.name if type(target) in (ast.Variable, ast.Call) else ''
+                if name.endswith('$'):
+                    values.append(text)
+                    continue
+                value = parse_number(text, strict=True)
+                if value is None:
+                    break
+                values.append(value)
+            else:
+                if len(fields) < len(stmt.targets):
+                    screen.write("?? ")
+                    continue
+                for target, value in zip(stmt.targets, values):
+                    self._assign(target, value)
+                if len(fields) > len(stmt.targets):
+                    screen.write("?EXTRA IGNORED\r")
+                return
+            screen.write("?REDO FROM START\r" + prompt + "? ")
+            fields = []
+            first = True
+
+    @staticmethod
+    def _input_fields(line: str) -> List[str]:
+        fields = []
+        for quoted, text in data_items(line):
+            fields.append(text if quoted else text.strip())
+        return fields
+
+    def _get(self, target):
+        key = self.machine.next_key()
+        char = chr(key) if key is not None else ""
+        name = target.name if type(target) in (ast.Variable, ast.Call) else ''
+        if name.endswith('$'):
+            self._assign(target, char)
+        elif char == "" or "0" <= char <= "9":
+            self._assign(target, float(char or 0))
+        else:
+            raise BasicError(SYNTAX_ERROR, f"GET {name} read the key '{char}'")
+
+    def _if(self, stmt: ast.If):
+        if not stmt.has_then and not (stmt.body and type(stmt.body[0]) is ast.Jump):
+            raise BasicError(SYNTAX_ERROR, "IF without THEN")
+        value = self._eval(stmt.condition)
+        if not (value != "" if _is_string(value) else value != 0):
+            self.li = self.current + 1
+            self.si = 0
+        elif stmt.then_target is not None:
+            self.goto(stmt.then_target)
+
+    def _for(self, stmt: ast.For):
+        if stmt.end is None:
+            raise BasicError(SYNTAX_ERROR, f"FOR {stmt.var} without TO")
+        name = stmt.var
+        if name.endswith('$'):
+            raise BasicError(TYPE_MISMATCH, f"FOR needs a number variable, not {name}")
+        key = self._key(name)
+        if name.endswith('%') or key in ('TI', 'ST'):
+            raise BasicError(SYNTAX_ERROR, f"FOR cannot count with {name}")
+        self.variables[key] = self._number(self._eval(stmt.start))
+        end = self._number(self._eval(stmt.end))
+        step = self._number(self._eval(stmt.step)) if stmt.step is not None else 1.0
+        # A loop of the same variable is replaced, with the loops opened after it
+        for idx in range(len(self.stack) - 1, -1, -1):
+            frame = self.stack[idx]
+            if frame[0] is GOSUB:
+                break
+            if frame[1] == key:
+                self._truncate_stack(idx)
+                break
+        self._push((FOR, key, end, step, self.li, self.si))
+
+    def _find_for(self, key: Optional[str]) -> int:
+        for idx in range(len(self.stack) - 1, -1, -1):
+            frame = self.stack[idx]
+            if frame[0] is GOSUB:
+                break
+            if key is None or frame[1] == key:
+                return idx
+        raise BasicError(NEXT_WITHOUT_FOR, f"no open FOR {key}" if key else "no open FOR loop")
+
+    def _next(self, stmt: ast.Next):
+        for name in stmt.vars or [None]:
+            idx = self._find_for(None if name is None else self._key(name))
+            self._truncate_stack(idx + 1)
+            _, key, end, step, li, si = self.stack[idx]
+            value = c64_float(self.variables.get(key, 0.0) + step)
+            self.variables[key] = value
+            # The loop ends when the variable passed the end in the direction of the step
+            if (value > end) - (value < end) != (step > 0) - (step < 0):
+                self.li, self.si = li, si
+                return
+            self._truncate_stack(idx)
+
+    def _jump(self, stmt: ast.Jump):
+        target = stmt.target
+        if target is None:
+            if stmt.target_pos >= 0:
+                raise BasicError(SYNTAX_ERROR, f"{stmt.keyword} target is not a line number")
+            target = 0  # a missing line number reads as 0
+        if stmt.keyword == 'GOSUB':
+            self._push((GOSUB, self.li, self.si))
+        self.goto(target)
+
+    def _on(self, stmt: ast.On):
+        if stmt.mode is None:
+            raise BasicError(SYNTAX_ERROR, "ON without GOTO/GOSUB")
+        selector = self._byte(self._eval(stmt.selector))
+        if not 1 <= selector <= len(stmt.targets):
+            return
+        target = stmt.targets[selector - 1][0]
+        if target is None:
+            raise BasicError(SYNTAX_ERROR, f"ON {stmt.mode} target {selector} is not a line number")
+        if stmt.mode == 'GOSUB':
+            self._push((GOSUB, self.li, self.si))
+        self.goto(target)
+
+    def _return(self, stmt: ast.Command):
+        for idx in range(len(self.stack) - 1, -1, -1):
+            if self.stack[idx][0] is GOSUB:
+                _, self.li, self.si = self.stack[idx]
+                self._truncate_stack(idx)
+                return
+        raise BasicError(RETURN_WITHOUT_GOSUB)
+
+    def _dim(self, stmt: ast.Dim):
+        for target in stmt.arrays:
+            if type(target) is ast.Call and not target.function:
+                if not target.closed:
+                    raise BasicError(SYNTAX_ERROR, f"missing ')' after {target.name}(")
+                dims = []
+                for arg in target.args:
+                    dim = math.floor(self._number(self._eval(arg)))
+                    if not 0 <= dim <= 32767:
+                        raise BasicError(ILLEGAL_QUANTITY, f"DIM {target.name} size {dim}")
+                    dims.append(dim)
+                self._dimension(target.name, tuple(dims))
+            elif type(target) is ast.Variable:
+                key = self._key(target.name)
+                self.variables.setdefault(key, "" if key.endswith('$') else 0.0)
+            else:
+                raise BasicError(SYNTAX_ERROR)
+
+    def _read(self, stmt: ast.Read):
+        for target in stmt.targets:
+            if self.data_pointer >= len(self.program.data):
+                raise BasicError(OUT_OF_DATA)
+            line, quoted, text = self.program.data[self.data_pointer]
+            self.data_pointer += 1
+            name = target.name if type(target) in (ast.Variable, ast.Call) else ''
+            if name.endswith('$'):
+                self._assign(target, petscii_text(text, macros=quoted))
+                continue
+            value = None if quoted else parse_number(text, strict=True)
+            if value is None:
+                # The C64 reports the DATA line
+                raise BasicError(SYNTAX_ERROR, f"READ {name} found '{text}'", line)
+            self._assign(target, value)
+
+    def _restore(self, stmt: ast.Command):
+        self.data_pointer = 0
+
+    def _def(self, stmt: ast.Def):
+        if stmt.param is None or stmt.param.endswith('$') or stmt.name.endswith('$'):
+            raise BasicError(SYNTAX_ERROR, f"DEF {stmt.name} needs a number parameter")
+        self.functions['FN' + self._key(stmt.name[2:])] = (self._key(stmt.param), stmt.body)
+
+    def _command(self, stmt: ast.Command):
+        self._commands[stmt.keyword](stmt)
+
+    def _args(self, stmt: ast.Command, low: int, high: int) -> list:
+        if not low <= len(stmt.args) <= high:
+            raise BasicError(SYNTAX_ERROR, f"wrong number of arguments for {stmt.keyword}")
+        return [self._eval(arg) for arg in stmt.args]
+
+    def _poke(self, stmt: ast.Command):
+        address, value = self._args(stmt, 2, 2)
+        self.machine.poke(self._address(address), self._byte(value))
+
+    def _wait(self, stmt: ast.Command):
+        args = self._args(stmt, 2, 3)
+        address = self._address(args[0])
+        mask = self._byte(args[1])
+        flip = self._byte(args[2]) if len(args) > 2 else 0
+        if (self.machine.peek(address) ^ flip) & mask:
+            return
+        if address == KEY_COUNT:
+            raise _Halt(WAITING, "WAIT waits for a key, the scripted keys are used up")
+        if address not in VOLATILE_ADDRESSES and not 0xD000 <= address <= 0xDFFF:
+            raise _Halt(HANG, f"Infinite loop: WAIT {address},{mask} waits for memory nothing changes")
+
+    def _sys(self, stmt: ast.Command):
+        address, = self._args(stmt, 1, 1)
+        self.machine.sys(self._address(address))
+
+    def _open(self, stmt: ast.Command):
+        args = self._args(stmt, 1, 4)
+        number = self._byte(args[0])
+        device = self._byte(args[1]) if len(args) > 1 else 1
+        if number in self.files:
+            raise BasicError(FILE_OPEN, f"file {number}")
+        if device not in (0, 3):
+            raise _Halt(UNSUPPORTED, f"OPEN {number},{device}: disk and tape I/O are not emulated")
+        self.files[number] = device
+
+    def _close(self, stmt: ast.Command):
+        number, = self._args(stmt, 1, 1)
+        self.files.pop(self._byte(number), None)
+
+    def _end(self, stmt: ast.Command):
+        raise _Halt(ENDED, "READY.")
+
+    def _stop(self, stmt: ast.Command):
+        raise _Halt(STOPPED, f"BREAK IN {self._line_number()}")
+
+    def _clr(self, stmt: ast.Command):
+        self._clear()
+
+    def _run(self, stmt: ast.Command):
+        args = self._args(stmt, 0, 1)
+        self._clear()
+        if args:
+            self.goto(math.floor(self._number(args[0])))
+        else:
+            self.li = self.si = 0
+
+    def _cont(self, stmt: ast.Command):
+        raise BasicError(CANT_CONTINUE)
+
+    def _unsupported(self, stmt: ast.Command):
+        raise _Halt(UNSUPPORTED, f"{stmt.keyword}: disk and tape I/O are not emulated")
+
+
+def run_program(source_text: str, keys="", max_statements: int = DEFAULT_MAX_STATEMENTS,
+                seed: int = 0) -> RunResult:
+    """
+    Runs a program headless. keys are typed in order for GET and INPUT
+    (text as for parse_keys() or PETSCII bytes); seed fixes the RND sequence.
+    """
+    machine = Machine(keys if isinstance(keys, bytes) else parse_keys(keys), seed=seed)
+    try:
+        return Interpreter(Program(source_text), machine).run(max_statements)
+    except RecursionError:
+        return formula_too_complex(source_text, machine)
+
+
+def formula_too_complex(source_text: str, machine: Machine) -> RunResult:
+    """
+    The result of a program with an expression nested too deeply to parse
+    (or compile): nothing runs, as on a C64 that stops with ?FORMULA TOO COMPLEX.
+    """
+    return RunResult(
+        status=ERROR,
+        message=f"?{FORMULA_TOO_COMPLEX} ERROR (an expression is nested too deeply)",
+        line=None,
+        statements=0,
+        elapsed_ms=0.0,
+        lines_run=0,
+        lines_total=sum(1 for line in source_text.splitlines() if line.strip()),
+        keys_left=machine.keys_left(),
+        screen=machine.screen.text(),
+        notes=list(machine.notes),
+    )
+
+# -----------------------------------------------------------------------------
+# Command Line Interface
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a C64 BASIC V2 program headless and report runtime errors.")
+    parser.add_argument('filename', nargs='?', help="Input filename (stdin if empty)")
+    parser.add_argument('--max-statements', type=int, default=DEFAULT_MAX_STATEMENTS,
+                        help=f"Statements to run at most (default {DEFAULT_MAX_STATEMENTS})")
+    parser.add_argument('--keys', default="", help="Keys for GET/INPUT; \\n or {RETURN} is RETURN")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the RND sequence")
+    parser.add_argument('--screen', action='store_true', help="Print the screen at the end of the run")
+
+    args = parser.parse_args()
+
+    if args.filename:
+        try:
+            with open(args.filename, 'r', encoding='utf-8', errors='replace') as f:
+                source_text = f.read()
+        except Exception as e:
+            logger.error(f"Error reading input: {e}")
+            sys.exit(3)
+    else:
+        source_text = sys.stdin.read()
+
+    result = run_program(source_text, keys=args.keys.replace("\\n", "\n"),
+                         max_statements=args.max_statements, seed=args.seed)
+    print(result.summary())
+    if args.screen:
+        print(result.screen)
+    sys.exit(1 if result.failed else 0)
+
+if __name__ == '__main__':
+    main()
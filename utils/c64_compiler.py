@@ -0,0 +1,1799 @@
+"""
+Compiled execution backend for the headless C64 BASIC V2 interpreter.
+
+c64_basic.Interpreter walks the AST of every statement each time it runs it.
+This backend translates the parsed lines (the c64_ast statements Bas2Prg and
+the syntax checker share) into Python source once, compiles it into one code
+object per program and then only calls functions, which runs games more than
+ten times as many statements per second (benchmarks/bench_interpreter.py):
+- every line becomes a few blocks, one per entry point (the line start and
+  the statements after FOR and GOSUB, where NEXT and RETURN continue). A
+  block is a function that runs its statements and returns the next block;
+  it runs on into the following lines while it falls through to them, into
+  the targets of GOTO and GOSUB and, after a GOSUB it ran on into, past
+  RETURN to the statement after the GOSUB. IF ... THEN nests the rest of its
+  line under a Python if. Each exit of a block adds the statements and the
+  lines it ran to the clock and the line counts at once
+- GOTO, GOSUB, IF ... THEN n and ON targets are resolved to blocks when the
+  program is compiled. The targets are searched like the C64 does, forward
+  from the next line when the high byte of the target is larger than the
+  one of the current line and from the program start otherwise, and the
+  number of lines the search steps over is kept for cost estimates
+- each variable is a global of the generated code, v<slot>, and each
+  one-dimensional array a<slot> holds its values, so both are read and
+  written without a lookup by name
+- expression types are known from the variable suffixes, so type checks
+  happen at compile time: an expression mixing strings and numbers compiles
+  to code that evaluates the operands and raises ?TYPE MISMATCH ERROR.
+  infer_bounds() finds the number variables that only ever hold whole
+  numbers and how large they get; with them and the % variables, integer
+  results that cannot leave the exact float range skip the rounding to a C64
+  float and assignments to % variables skip the range check when the value
+  always fits
+- PRINT of a string constant writes its screen codes, which are worked out
+  when the program is compiled, and TAB( to a column on the current row only
+  moves the cursor
+
+Each run executes the code object with its own globals, so one compiled
+program serves any number of interpreters. Runs give the same results as
+the tree-walking interpreter: the same errors in the same lines, screen, RND
+sequence, clock and statement counts. Only the statement limit, the infinite
+loop check and an idle GET loop are looked at between blocks, so a run
+stopped by them can stop some statements later and report another line.
+
+Usage:
+    python utils/c64_compiler.py game.bas [--max-statements N] [--keys "Y{RETURN}"] [--screen] [--code LINE]
+"""
+import argparse
+import bisect
+import logging
+import math
+import sys
+import time
+from dataclasses import dataclass, field
+from types import CodeType
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from utils import c64_ast as ast
+    from utils.c64_basic import (
+        BAD_SUBSCRIPT, CANT_CONTINUE, DEFAULT_MAX_STATEMENTS, DIVISION_BY_ZERO, ENDED, ERROR, FILE_NOT_OPEN,
+        FILE_OPEN, FOR, FRAME_BYTES, GOSUB, HANG, HANG_CHECK_INTERVAL, ILLEGAL_QUANTITY, JIFFIES_PER_DAY,
+        KEY_COUNT, LIMIT, MAX_FINGERPRINTS, NEXT_WITHOUT_FOR, NOT_INPUT_FILE, NOT_OUTPUT_FILE, OUT_OF_DATA, OUT_OF_MEMORY,
+        OVERFLOW, REDIMD_ARRAY, RETURN_WITHOUT_GOSUB, SCREEN_COLUMNS, STACK_BYTES, STOPPED, STRING_TOO_LONG, SYNTAX_ERROR,
+        TYPE_MISMATCH, UNDEFD_FUNCTION, UNDEFD_STATEMENT, UNSUPPORTED, VOLATILE_ADDRESSES, WAITING,
+        Array, BasicError, Interpreter, Machine, Program, RunResult, _Halt, c64_float, format_number,
+        formula_too_complex, parse_keys, parse_number, petscii_text, screen_runs,
+    )
+    from utils.c64_memory import BASIC_RAM_BYTES, MAX_STRING_LENGTH, variable_key
+except ModuleNotFoundError:
+    import c64_ast as ast
+    from c64_basic import (
+        BAD_SUBSCRIPT, CANT_CONTINUE, DEFAULT_MAX_STATEMENTS, DIVISION_BY_ZERO, ENDED, ERROR, FILE_NOT_OPEN,
+        FILE_OPEN, FOR, FRAME_BYTES, GOSUB, HANG, HANG_CHECK_INTERVAL, ILLEGAL_QUANTITY, JIFFIES_PER_DAY,
+        KEY_COUNT, LIMIT, MAX_FINGERPRINTS, NEXT_WITHOUT_FOR, NOT_INPUT_FILE, NOT_OUTPUT_FILE, OUT_OF_DATA, OUT_OF_MEMORY,
+        OVERFLOW, REDIMD_ARRAY, RETURN_WITHOUT_GOSUB, SCREEN_COLUMNS, STACK_BYTES, STOPPED, STRING_TOO_LONG, SYNTAX_ERROR,
+        TYPE_MISMATCH, UNDEFD_FUNCTION, UNDEFD_STATEMENT, UNSUPPORTED, VOLATILE_ADDRESSES, WAITING,
+        Array, BasicError, Interpreter, Machine, Program, RunResult, _Halt, c64_float, format_number,
+        formula_too_complex, parse_keys, parse_number, petscii_text, screen_runs,
+    )
+    from c64_memory import BASIC_RAM_BYTES, MAX_STRING_LENGTH, variable_key
+
+logger = logging.getLogger(__name__)
+
+# Expression types
+STRING = '$'
+NUMBER = ''
+
+# Deeper expressions are compiled into one assignment per operation, as
+# Python refuses too deeply nested parentheses
+MAX_INLINE_DEPTH = 32
+BLOCK_INDENT = " " * 4
+# A block runs on into the following lines while it falls through to them and
+# into the targets of GOTO, GOSUB and RETURN, for at most this many lines (or
+# parts of lines) and statements
+MAX_CHAINED_LINES = 16
+MAX_CHAINED_STATEMENTS = 40
+
+NOT_A_NUMBER = "string where a number is expected"
+NOT_A_STRING = "number where a string is expected"
+
+FUNCTION_CODE = {
+    'SGN': "sgn({})", 'INT': "float(floor({}))", 'ABS': "abs({})", 'USR': "usr({})", 'FRE': "fre({})",
+    'POS': "pos({})", 'SQR': "sqr({})", 'RND': "rnd({})", 'LOG': "log({})", 'EXP': "exp({})",
+    'COS': "flt(cos({}))", 'SIN': "flt(sin({}))", 'TAN': "tan({})", 'ATN': "flt(atn({}))",
+    'PEEK': "peek({})", 'LEN': "float(len({}))", 'STR$': "fmt({})", 'VAL': "val({})", 'ASC': "asc({})", 'CHR$': "chr(byte({}))",
+    'LEFT$': "{}[:byte({})]", 'RIGHT$': "right({}, {})", 'MID$': "mid({})",
+}
+# Argument counts and types ('$' string, '' number, None any) of the functions
+FUNCTION_ARGS = {name: ((1,), ('',)) for name in FUNCTION_CODE}
+FUNCTION_ARGS.update({
+    'FRE': ((1,), (None,)), 'POS': ((1,), (None,)), 'LEN': ((1,), ('$',)), 'VAL': ((1,), ('$',)),
+    'ASC': ((1,), ('$',)), 'LEFT$': ((2,), ('$', '')), 'RIGHT$': ((2,), ('$', '')), 'MID$': ((2, 3), ('$', '', '')),
+})
+RESULT_TYPES = {name: STRING if name.endswith('$') else NUMBER for name in FUNCTION_CODE}
+COMPARISONS = {'=': '==', '<>': '!=', '<': '<', '>': '>', '<=': '<=', '>=': '>='}
+# Below this many frames the stack cannot overflow
+SAFE_FRAMES = STACK_BYTES // max(FRAME_BYTES.values())
+# PEEKs of the clock, raster line and CIA timers, which depend on the statements run
+CLOCK_ADDRESSES = frozenset({160, 161, 162, 0xD012, 0xDC04, 0xDC05, 0xDC06, 0xDC07})
+# Whole numbers of this size need no rounding to a C64 float, see c64_float()
+EXACT_LIMIT = 2.0 ** 32
+# Below this size the rounding to a C64 float moves a number by less than
+# 1 - FRACTION_LIMIT, so INT of a number with a smaller fraction skips it
+FLOOR_LIMIT = 2.0 ** 24
+FRACTION_LIMIT = 0.99
+# Largest values of the functions that return whole numbers
+FUNCTION_BOUNDS = {'LEN': 255.0, 'ASC': 255.0, 'PEEK': 255.0, 'SGN': 1.0, 'POS': 39.0, 'FRE': 65536.0}
+# Whole numbers up to this magnitude are 16-bit integers (A%, AND, OR, NOT)
+INTEGER_LIMIT = 32767.0
+# Rounds of infer_bounds() before the bounds still growing are given up
+MAX_BOUND_ROUNDS = 8
+
+
+def _depth(node) -> int:
+    """Nesting depth of an expression."""
+    kind = type(node)
+    if kind is ast.Binary:
+        return 1 + max(_depth(node.left), _depth(node.right))
+    if kind is ast.Unary:
+        return 1 + _depth(node.operand)
+    if kind is ast.Paren:
+        return 1 + _depth(node.expr)
+    if kind is ast.Call:
+        return 1 + max((_depth(arg) for arg in node.args), default=0)
+    return 0
+
+
+def _byte(value) -> int:
+    """Interpreter._byte() with a shortcut for numbers in range."""
+    if type(value) is float and 0.0 <= value < 256.0:
+        return int(value)
+    return Interpreter._byte(value)
+
+
+def _integer_bound(node, bounds: Dict[str, Optional[float]]) -> Optional[float]:
+    """
+    Largest magnitude of an expression that always gives a whole number,
+    math.inf for whole numbers of any size and None for any other. bounds
+    are those of the variables, see infer_bounds().
+    """
+    kind = type(node)
+    if kind is ast.Paren:
+        return _integer_bound(node.expr, bounds) if node.closed else None
+    if kind is ast.Number:
+        try:
+            value = parse_number(node.text) if node.text[0].isdigit() or node.text[0] == '.' else None
+        except BasicError:
+            return None
+        return abs(value) if value is not None and value.is_integer() else None
+    if kind is ast.Variable:
+        return _variable_bound(node.name, bounds)
+    if kind is ast.Unary:
+        operand = _integer_bound(node.operand, bounds)
+        if node.op == 'NOT':
+            return min(operand + 1.0, 32768.0) if operand is not None else 32768.0
+        return operand
+    if kind is ast.Call:
+        if not node.function:
+            return 32768.0 if node.name.endswith('%') else None
+        if node.name in ('INT', 'ABS') and len(node.args) == 1:
+            operand = _integer_bound(node.args[0], bounds)
+            return operand if operand is not None else (math.inf if node.name == 'INT' else None)
+        return FUNCTION_BOUNDS.get(node.name)
+    if kind is not ast.Binary:
+        return None
+    if node.op in ast.RELATIONAL:
+        return 1.0
+    if node.op in ('AND', 'OR'):
+        return 32768.0
+    if node.op not in ('+', '-', '*'):
+        return None
+    left, right = _integer_bound(node.left, bounds), _integer_bound(node.right, bounds)
+    if left is None or right is None:
+        return None
+    result = left * right if node.op == '*' else left + right
+    return result if result < EXACT_LIMIT else math.inf
+
+
+def _variable_bound(name: str, bounds: Dict[str, Optional[float]]) -> Optional[float]:
+    if name.endswith('$'):
+        return None
+    if name.endswith('%'):
+        return 32768.0
+    key = variable_key(name)
+    if key == 'TI':
+        return float(JIFFIES_PER_DAY)
+    # Variables that are never assigned stay 0
+    return bounds.get(key, 0.0)
+
+
+def _assigned_values(stmt) -> List[Tuple[str, object]]:
+    """
+    The number variables a statement assigns and what: an expression, the
+    bound of the value or None for any number, and a (start, step) tuple of
+    the expressions of a FOR loop.
+    """
+    kind = type(stmt)
+    if kind is ast.Let:
+        return [(variable_key(stmt.target.name), stmt.value)] if type(stmt.target) is ast.Variable else []
+    if kind is ast.For:
+        return [(variable_key(stmt.var), (stmt.start, stmt.step))]
+    if kind is ast.Def:
+        # The parameter holds the argument during a call
+        return [(variable_key(stmt.param), None)] if stmt.param is not None else []
+    if kind is ast.Input or kind is ast.Read:
+        # GET reads a digit, INPUT and READ any number
+        value = 9.0 if kind is ast.Input and stmt.keyword.startswith('GET') else None
+        return [(variable_key(target.name), value) for target in stmt.targets if type(target) is ast.Variable]
+    return []
+
+
+def infer_bounds(program: Program) -> Dict[str, Optional[float]]:
+    """
+    The type of each assigned number variable, by variable key: the largest
+    magnitude of a variable that only ever holds whole numbers, math.inf for
+    whole numbers of any size and None for any number. The variables start
+    at 0 and their bounds grow with the values assigned to them until they
+    hold; a bound still growing after MAX_BOUND_ROUNDS becomes math.inf.
+    Variables with a suffix are typed by it.
+    """
+    sources: Dict[str, list] = {}
+    for line in program.lines:
+        for stmt in line.statements:
+            for key, value in _assigned_values(stmt):
+                if key[-1] not in '$%' and key not in ('TI', 'ST'):
+                    sources.setdefault(key, []).append(value)
+    bounds: Dict[str, Optional[float]] = dict.fromkeys(sources, 0.0)
+    rounds = 0
+    while True:
+        rounds += 1
+        changed = []
+        for key, values in sources.items():
+            bound = bounds[key]
+            for value in values:
+                if bound is None:
+                    break
+                if type(value) is tuple:
+                    # NEXT adds the step to the variable
+                    start, step = value
+                    integral = _integer_bound(start, bounds) is not None and \
+                        (step is None or _integer_bound(step, bounds) is not None)
+                    value = math.inf if integral else None
+                elif value is not None and type(value) is not float:
+                    value = _integer_bound(value, bounds)
+                bound = max(bound, value) if value is not None else None
+            if bound != bounds[key]:
+                bounds[key] = bound
+                changed.append(key)
+        if not changed:
+            break
+        if rounds >= MAX_BOUND_ROUNDS:
+            for key in changed:
+                if bounds[key] is not None:
+                    bounds[key] = math.inf
+    return bounds
+
+
+def variable_name(slot: int) -> str:
+    """Global of the generated code holding the variable of a slot."""
+    return f"v{slot}"
+
+
+def vector_name(slot: int) -> str:
+    """Global of the generated code holding the values of a one-dimensional array, empty before DIM."""
+    return f"a{slot}"
+
+
+def _target_name(target) -> str:
+    return target.name if type(target) in (ast.Variable, ast.Call) else ''
+
+
+# ------------------ Compiler ------------------
+
+@dataclass
+class Block:
+    line: Optional[int]  # line index, None for the end of the program
+    start: int  # statement index in the line
+    statements: int  # most statements one run of the block executes
+    # Per statement of the block, in the order of the generated code: its
+    # first source line there, its line index, the statements the block ran
+    # before it and not added to the clock yet and the lines it started by then
+    code_lines: List[int] = field(default_factory=list)
+    lines: List[int] = field(default_factory=list)
+    offsets: List[int] = field(default_factory=list)
+    started: List[Tuple[int, ...]] = field(default_factory=list)
+
+
+@dataclass
+class CompiledProgram:
+    program: Program
+    blocks: List[Block]
+    line_pcs: List[int]  # block of each line start
+    slots: List[str]  # variable key of each slot
+    array_slots: List[str]  # array key of each array slot
+    bounds: Dict[str, Optional[float]]  # type of each number variable, see infer_bounds()
+    code: CodeType  # defines the function _b<pc> of each block
+    sources: List[str]  # generated Python code of each line
+    # Lines the C64 steps over to find each jump target, by (line index, statement index)
+    search_steps: Dict[Tuple[int, int], Tuple[int, ...]] = field(default_factory=dict)
+    # Lines started on the way to each block exit that ran several, counted
+    # after the counts of the lines
+    exit_lines: List[Tuple[int, ...]] = field(default_factory=list)
+
+    @property
+    def end_pc(self) -> int:
+        return len(self.blocks) - 1
+
+
+def search_line(lines: list, number: int, li: int) -> Tuple[Optional[int], int]:
+    """
+    Line index of a jump target from line index li and the number of lines
+    the C64 looks at to find it. Only the high bytes of the line numbers are
+    compared: a target in a higher 256 block is searched from the next line
+    on, any other from the start of the program.
+    """
+    start = li + 1 if number >> 8 > lines[li].number >> 8 else 0
+    idx = bisect.bisect_left(lines, number, lo=start, key=lambda line: line.number)
+    steps = idx - start + 1
+    if idx < len(lines) and lines[idx].number == number:
+        return idx, steps
+    return None, steps
+
+
+class Compiler:
+    """
+    Translates the statements of a Program into Python source, one function
+    per block. The names the code uses besides them are the globals it runs
+    with, see CompiledInterpreter._environment().
+    """
+
+    def __init__(self, program: Program):
+        self.program = program
+        self.bounds = infer_bounds(program)
+        self.slots: Dict[str, int] = {}
+        self.array_slots: Dict[str, int] = {}
+        self.entries: Dict[Tuple[int, int], int] = {}
+        self.blocks: List[Block] = []
+        self.line_pcs: List[int] = []
+        self.search_steps: Dict[Tuple[int, int], Tuple[int, ...]] = {}
+        self.exit_counts: Dict[Tuple[int, ...], int] = {}
+        for li, line in enumerate(program.lines):
+            self.line_pcs.append(len(self.blocks))
+            for start in self._block_starts(line):
+                self.entries[(li, start)] = len(self.blocks)
+                self.blocks.append(Block(li, start, 0))
+        self.blocks.append(Block(None, 0, 0))
+        # Per statement being compiled
+        self.out: List[str] = []
+        self.indent = ""
+        self.offset = "0"  # statements of the block run so far, as code
+        self.flat = False
+        self.terminated = False  # the current path of the block has left it
+        self.path_indent = BLOCK_INDENT
+        self.open_ifs: List[Tuple[str, int]] = []  # indent and statement offset of the IFs of the line
+        self.temps = 0
+        self.functions = 0
+        self.stored: set = set()  # variables the block assigns, declared global
+        self.started: List[int] = []  # lines the block started so far
+        # Where a GOTO, GOSUB or RETURN outside an IF runs on to and where the GOSUB returns to
+        self.jump: Optional[Tuple[Tuple[int, int], Optional[Tuple[int, int]]]] = None
+        self.returns: List[Tuple[int, int]] = []  # where the GOSUBs the block ran on into return to
+        self.covered = 0  # how many of the returns FOR or CLR may have put other frames on or taken off
+        self._handlers = {
+            ast.Let: self._let, ast.Print: self._print, ast.Input: self._input, ast.If: self._if,
+            ast.For: self._for, ast.Next: self._next, ast.Jump: self._goto, ast.On: self._on,
+            ast.Dim: self._dim, ast.Read: self._read, ast.Data: self._nothing, ast.Rem: self._nothing,
+            ast.Def: self._def, ast.Command: self._command, ast.Bad: self._bad,
+        }
+
+    @staticmethod
+    def _block_starts(line) -> List[int]:
+        """Statement indices where blocks start: the line start and where NEXT or RETURN continue."""
+        starts = [0]
+        for si, stmt in enumerate(line.statements):
+            kind = type(stmt)
+            if kind is ast.For or (kind is ast.Jump and stmt.keyword == 'GOSUB') or \
+                    (kind is ast.On and stmt.mode == 'GOSUB'):
+                starts.append(si + 1)
+        return sorted(set(starts))
+
+    def compile(self) -> CompiledProgram:
+        sources = []
+        first_code_line = 1
+        for li, line in enumerate(self.program.lines):
+            source = self._compile_line(li, line, first_code_line)
+            sources.append(source)
+            first_code_line += source.count("\n")
+        # One compile() for the whole program, it has a large fixed cost
+        code = compile("".join(sources), "<program>", "exec")
+        return CompiledProgram(
+            program=self.program,
+            blocks=self.blocks,
+            line_pcs=self.line_pcs,
+            slots=list(self.slots),
+            array_slots=list(self.array_slots),
+            bounds=self.bounds,
+            code=code,
+            sources=sources,
+            search_steps=self.search_steps,
+            exit_lines=list(self.exit_counts),
+        )
+
+    # -------- lines and blocks --------
+    def _compile_line(self, li: int, line, first_code_line: int) -> str:
+        """The functions of the blocks starting in a line; their code starts at first_code_line of the program."""
+        body: List[str] = []
+        self.functions = 0
+        for start in self._block_starts(line):
+            pc = self.entries[(li, start)]
+            # The second line declares the variables the block assigns
+            self.out = [f"def _b{pc}():", ""]
+            self.indent = self.path_indent = BLOCK_INDENT
+            self.terminated = False
+            self.stored = set()
+            self.started = []
+            self.returns = []
+            self.covered = 0
+            self._compile_block(self.blocks[pc], li, start, first_code_line + len(body))
+            self.out[1] = BLOCK_INDENT + (f"global {', '.join(sorted(self.stored))}" if self.stored else "pass")
+            body.extend(self.out)
+        return "\n".join(body) + "\n"
+
+    def _compile_block(self, block: Block, li: int, start: int, first_code_line: int):
+        """
+        The statements of a block: from start to the next entry point of the
+        line, then on with what follows for as long as the block always gets
+        there: the next line it falls through to, the statements after a FOR
+        or GOSUB and the target of a GOTO, GOSUB or RETURN. The statements
+        are added to the clock when the block leaves and where the paths of
+        an IF meet again, the lines it started when it leaves.
+        """
+        lines = self.program.lines
+        pending = 0  # statements not added to the clock yet
+        for chained in range(MAX_CHAINED_LINES):
+            statements = lines[li].statements
+            resume = next((si for si in self._block_starts(lines[li]) if si > start), len(statements))
+            if start == 0:
+                self.started.append(li)
+            self.open_ifs = []
+            self.jump = None
+            for j, si in enumerate(range(start, resume)):
+                self.offset = str(pending + j + 1)
+                block.code_lines.append(first_code_line + len(self.out))
+                block.lines.append(li)
+                block.offsets.append(pending + j)
+                block.started.append(tuple(self.started))
+                block.statements += 1
+                self._statement(li, si, statements[si])
+                if self.jump is not None:
+                    resume = si + 1
+                    break
+            pending += resume - start
+            if self.jump is not None:
+                following = self.jump[0]
+            elif self.open_ifs:
+                if resume < len(statements) and not self.terminated:
+                    # NEXT or RETURN continue with a block of their own
+                    self._exit(pending, str(self._entry_pc((li, resume))))
+                pending = self._close_ifs(None if self.terminated or resume < len(statements) else pending)
+                following = (li + 1, 0)
+            elif self.terminated:
+                return
+            else:
+                following = (li, resume) if resume < len(statements) else (li + 1, 0)
+            if following[0] == len(lines) or chained + 1 == MAX_CHAINED_LINES or \
+                    block.statements + len(lines[following[0]].statements) - following[1] > MAX_CHAINED_STATEMENTS:
+                self._exit(pending, str(self._entry_pc(following)))
+                return
+            if self.jump is not None and self.jump[1] is not None:
+                self.returns.append(self.jump[1])
+            li, start = following
+
+    def _close_ifs(self, pending: Optional[int]) -> int:
+        """
+        Joins the paths through the IFs of a line at its end: the false
+        conditions and, unless None, the end of the last path with pending
+        statements. Returns the statements not added to the clock yet, which
+        are only known when one path arrives.
+        """
+        offsets = [offset for _, offset in self.open_ifs]
+        if pending is None and len(offsets) == 1:
+            # The path of the true condition left the block
+            result = offsets[0]
+        else:
+            if pending is not None:
+                self._emit(f"machine.statements += {pending}")
+            for indent, offset in reversed(self.open_ifs):
+                self.indent = indent
+                self._emit("else:")
+                self._emit(f"    machine.statements += {offset}")
+            result = 0
+        self.indent = self.path_indent = BLOCK_INDENT
+        self.terminated = False
+        self.open_ifs = []
+        return result
+
+    def _entry_pc(self, entry: Tuple[int, int]) -> int:
+        """Block of a line index and statement index, the end of the program after the last line."""
+        return self.entries.get(entry, len(self.blocks) - 1)
+
+    def _emit(self, text: str):
+        self.out.append(self.indent + text)
+
+    def _exit(self, statements: int, pc: str):
+        if self.started:
+            self._emit(f"counts[{self._count_index(tuple(self.started))}] += 1")
+        if statements:
+            self._emit(f"machine.statements += {statements}")
+        self._emit(f"return {pc}")
+        # Code after an unconditional exit of the path is never reached
+        self.terminated = self.terminated or self.indent == self.path_indent
+
+    def _count_index(self, lines: Tuple[int, ...]) -> int:
+        """Index in the counts of an exit after lines: the line itself or a counter of the lines."""
+        if len(lines) == 1:
+            return lines[0]
+        return len(self.program.lines) + self.exit_counts.setdefault(lines, len(self.exit_counts))
+
+    def _temp(self) -> str:
+        self.temps += 1
+        return f"_t{self.temps}"
+
+    def find_line(self, number: int, li: int) -> Tuple[Optional[int], int]:
+        return search_line(self.program.lines, number, li)
+
+    def _jump(self, number: int, li: int, statements: int):
+        """Code leaving the block for line number."""
+        target, steps = self.find_line(number, li)
+        if target is None:
+            self._emit(f"error({UNDEFD_STATEMENT!r}, {f'line {number} does not exist'!r})")
+            return steps
+        self._exit(statements, str(self.line_pcs[target]))
+        return steps
+
+    # -------- statements --------
+    def _statement(self, li: int, si: int, stmt):
+        self.temps = 0
+        expressions = [e for e in ast.statement_expressions(stmt) if e is not None]
+        try:
+            self.flat = max((_depth(e) for e in expressions), default=0) > MAX_INLINE_DEPTH
+            self._handlers[type(stmt)](li, si, stmt)
+        except RecursionError:
+            # As deeply nested as this, the C64 gives up too
+            self._emit(f"error({OUT_OF_MEMORY!r}, '')")
+
+    def _let(self, li, si, stmt: ast.Let):
+        value, kind = self._expr(stmt.value)
+        self._assign(stmt.target, value, kind, self._bound(stmt.value))
+
+    def _assign(self, target, value: str, kind: str, bound: Optional[float] = None):
+        """
+        Code storing value (evaluated first, as on the C64) into a variable or
+        array element; bound is the one of the value, see _integer_bound().
+        """
+        name = _target_name(target)
+        if type(target) is ast.Variable:
+            key = variable_key(name)
+            if key == 'TI$':
+                self._emit(f"set_time({self._as_string(value, kind)}, {self.offset})")
+            elif key in ('TI', 'ST'):
+                self._emit(f"error({SYNTAX_ERROR!r}, {f'{name} is a reserved variable'!r}, {value})")
+            else:
+                self._emit(f"{self._store(key)} = {self._coerce(name, value, kind, bound)}")
+            return
+        if type(target) is not ast.Call or target.function:
+            self._emit(f"error({SYNTAX_ERROR!r}, '', {value})")
+            return
+        if not target.closed:
+            self._emit(f"error({SYNTAX_ERROR!r}, {f'missing {chr(41)!r} after {name}('!r}, {value})")
+            return
+        slot = self._array_slot(name)
+        if kind != (STRING if name.endswith('$') else NUMBER):
+            # The element is looked up before the type is checked
+            temp = self._temp()
+            self._emit(f"{temp} = {value}")
+            self._emit(f"locate({slot}, {name!r}, {', '.join(self._indices(target))})")
+            self._emit(self._coerce(name, temp, kind))
+        elif len(target.args) == 1 and not name.endswith('%'):
+            self._emit(f"set1({value}, {slot}, {name!r}, {self._number(target.args[0])})")
+        else:
+            self._emit(f"store({value}, {slot}, {name!r}, {', '.join(self._indices(target))})")
+
+    @staticmethod
+    def _coerce(name: str, value: str, kind: str, bound: Optional[float] = None) -> str:
+        if name.endswith('$'):
+            return value if kind == STRING else f"error({TYPE_MISMATCH!r}, {f'number assigned to {name}'!r}, {value})"
+        if kind == STRING:
+            return f"error({TYPE_MISMATCH!r}, {f'string assigned to {name}'!r}, {value})"
+        if name.endswith('%') and not (bound is not None and bound <= INTEGER_LIMIT):
+            return f"float(integer({value}))"
+        return value
+
+    def _indices(self, call: ast.Call) -> List[str]:
+        return [f"index({self._number(arg)}, {call.name!r})" for arg in call.args]
+
+    def _slot(self, key: str) -> int:
+        return self.slots.setdefault(key, len(self.slots))
+
+    def _store(self, key: str) -> str:
+        """The global of a variable the block assigns."""
+        name = variable_name(self._slot(key))
+        self.stored.add(name)
+        return name
+
+    def _array_slot(self, name: str) -> int:
+        return self.array_slots.setdefault(variable_key(name), len(self.array_slots))
+
+    def _print(self, li, si, stmt: ast.Print):
+        if stmt.channel is not None:
+            self._emit(f"channel({self._any(stmt.channel)}, True)")
+        for separators, item in zip(stmt.separators, stmt.items):
+            self._separators(separators)
+            if type(item) is ast.Call and item.function and item.name in ('TAB', 'SPC'):
+                if not item.closed or len(item.args) != 1:
+                    self._emit(f"error({SYNTAX_ERROR!r}, {f'{item.name}( needs one argument and {chr(41)!r}'!r})")
+                    continue
+                value, kind = self._expr(item.args[0])
+                if item.name == 'TAB' and kind == NUMBER:
+                    # Most often a column on in the row
+                    column = self._temp()
+                    self._emit(f"if screen.column <= ({column} := {value}) < {float(SCREEN_COLUMNS)!r}:")
+                    self._emit(f"    screen.column = int({column})")
+                    self._emit("else:")
+                    self._emit(f"    tab({column})")
+                else:
+                    self._emit(f"{item.name.lower()}({value})")
+                continue
+            if type(item) is ast.String:
+                runs = screen_runs(petscii_text(item.text[1:-1] if item.closed else item.text[1:]))
+                if type(runs) is int:
+                    self._emit(f"write_code({runs})")
+                    continue
+                if type(runs) is bytes:
+                    self._emit(f"write_codes({runs!r})")
+                    continue
+            value, kind = self._expr(item)
+            self._emit(f"write({value})" if kind == STRING else f"write_number({value})")
+        self._separators(stmt.separators[-1])
+        if not stmt.separators[-1]:
+            self._emit("put(13)")
+
+    def _separators(self, separators: str):
+        for separator in separators:
+            if separator == ',':
+                self._emit("comma()")
+
+    def _input(self, li, si, stmt: ast.Input):
+        if stmt.channel is not None:
+            self._emit(f"keyboard({self._any(stmt.channel)}, {stmt.keyword!r})")
+        if not stmt.targets:
+            self._emit(f"error({SYNTAX_ERROR!r}, {f'{stmt.keyword} without variables'!r})")
+            return
+        if stmt.keyword.startswith('GET'):
+            for target in stmt.targets:
+                name = _target_name(target)
+                if name.endswith('$'):
+                    self._assign(target, "get_key()", STRING)
+                else:
+                    self._assign(target, f"get_number(get_key(), {name!r})", NUMBER, 9.0)
+            return
+        prompt = petscii_text(stmt.prompt.text[1:-1] if stmt.prompt.closed else stmt.prompt.text[1:]) \
+            if stmt.prompt is not None else ""
+        kinds = tuple(_target_name(target).endswith('$') for target in stmt.targets)
+        values = self._temp()
+        self._emit(f"{values} = read_input({stmt.keyword!r}, {prompt!r}, {kinds!r}, {stmt.channel is None})")
+        self._emit(f"if {values} is not None:")
+        indent = self.indent
+        self.indent += "    "
+        for idx, (target, is_string) in enumerate(zip(stmt.targets, kinds)):
+            self._assign(target, f"{values}[0][{idx}]", STRING if is_string else NUMBER)
+        self._emit(f"if {values}[1]:")
+        self._emit("    write('?EXTRA IGNORED\\r')")
+        self.indent = indent
+
+    def _if(self, li, si, stmt: ast.If):
+        if not stmt.has_then and not (stmt.body and type(stmt.body[0]) is ast.Jump):
+            self._emit(f"error({SYNTAX_ERROR!r}, 'IF without THEN')")
+            return
+        # The rest of the line runs in the path of the true condition, see _close_ifs()
+        self._emit(f"if {self._condition(stmt.condition)}:")
+        self.open_ifs.append((self.indent, int(self.offset)))
+        self.indent = self.path_indent = self.indent + "    "
+        if stmt.then_target is not None:
+            self.search_steps[(li, si)] = (self._jump(stmt.then_target, li, int(self.offset)),)
+
+    def _for(self, li, si, stmt: ast.For):
+        if stmt.end is None:
+            self._emit(f"error({SYNTAX_ERROR!r}, {f'FOR {stmt.var} without TO'!r})")
+            return
+        name = stmt.var
+        if name.endswith('$'):
+            self._emit(f"error({TYPE_MISMATCH!r}, {f'FOR needs a number variable, not {name}'!r})")
+            return
+        key = variable_key(name)
+        if name.endswith('%') or key in ('TI', 'ST'):
+            self._emit(f"error({SYNTAX_ERROR!r}, {f'FOR cannot count with {name}'!r})")
+            return
+        slot = self._slot(key)
+        self._emit(f"{self._store(key)} = {self._number(stmt.start)}")
+        step = self._number(stmt.step) if stmt.step is not None else "1.0"
+        self.covered = len(self.returns)
+        self._emit(f"for_({slot}, {self._number(stmt.end)}, {step}, {self.entries[(li, si + 1)]})")
+
+    def _next(self, li, si, stmt: ast.Next):
+        for name in stmt.vars or [None]:
+            slot = None if name is None else self._slot(variable_key(name))
+            temp = self._temp()
+            self._emit(f"{temp} = next_({slot}, {name!r})")
+            self._emit(f"if {temp} is not None:")
+            indent = self.indent
+            self.indent += "    "
+            self._exit(int(self.offset), temp)
+            self.indent = indent
+
+    def _goto(self, li, si, stmt: ast.Jump):
+        target = stmt.target
+        if target is None:
+            if stmt.target_pos >= 0:
+                self._emit(f"error({SYNTAX_ERROR!r}, {f'{stmt.keyword} target is not a line number'!r})")
+                return
+            target = 0  # a missing line number reads as 0
+        if stmt.keyword == 'GOSUB':
+            resume = self.entries[(li, si + 1)]
+            self._emit(f"if len(stack) < {SAFE_FRAMES}:")
+            self._emit(f"    stack.append({resume})")
+            self._emit("else:")
+            self._emit(f"    gosub({resume})")
+        if not self.terminated:
+            found, steps = self.find_line(target, li)
+            returns_to = (li, si + 1) if stmt.keyword == 'GOSUB' else None
+            if found is not None and self.indent == BLOCK_INDENT:
+                # Outside an IF the block runs on into the target, see _compile_block()
+                self.jump = ((found, 0), returns_to)
+                self.search_steps[(li, si)] = (steps,)
+                return
+        self.search_steps[(li, si)] = (self._jump(target, li, int(self.offset)),)
+
+    def _on(self, li, si, stmt: ast.On):
+        if stmt.mode is None:
+            self._emit(f"error({SYNTAX_ERROR!r}, 'ON without GOTO/GOSUB')")
+            return
+        pcs = []
+        steps = []
+        for number, _ in stmt.targets:
+            target, search = self.find_line(number, li) if number is not None else (None, 0)
+            pcs.append(self.line_pcs[target] if target is not None else None)
+            steps.append(search)
+        self.search_steps[(li, si)] = tuple(steps)
+        numbers = tuple(number for number, _ in stmt.targets)
+        resume = self.entries[(li, si + 1)] if stmt.mode == 'GOSUB' else None
+        temp = self._temp()
+        self._emit(f"{temp} = on({self._any(stmt.selector)}, {tuple(pcs)!r}, {numbers!r}, {resume}, {stmt.mode!r})")
+        self._emit(f"if {temp} is not None:")
+        indent = self.indent
+        self.indent += "    "
+        self._exit(int(self.offset), temp)
+        self.indent = indent
+
+    def _dim(self, li, si, stmt: ast.Dim):
+        for target in stmt.arrays:
+            if type(target) is ast.Call and not target.function:
+                if not target.closed:
+                    self._emit(f"error({SYNTAX_ERROR!r}, {f'missing {chr(41)!r} after {target.name}('!r})")
+                    return
+                sizes = [f"dim_size({self._number(arg)}, {target.name!r})" for arg in target.args]
+                self._emit(f"dim({self._array_slot(target.name)}, {target.name!r}, {', '.join(sizes)})")
+            elif type(target) is not ast.Variable:
+                self._emit(f"error({SYNTAX_ERROR!r}, '')")
+                return
+
+    def _read(self, li, si, stmt: ast.Read):
+        for target in stmt.targets:
+            name = _target_name(target)
+            if name.endswith('$'):
+                self._assign(target, "read_string()", STRING)
+            else:
+                self._assign(target, f"read_number({name!r})", NUMBER)
+
+    def _nothing(self, li, si, stmt):
+        self._emit("pass")
+
+    def _def(self, li, si, stmt: ast.Def):
+        if stmt.param is None or stmt.param.endswith('$') or stmt.name.endswith('$'):
+            self._emit(f"error({SYNTAX_ERROR!r}, {f'DEF {stmt.name} needs a number parameter'!r})")
+            return
+        if len(stmt.name) <= 2:
+            self._emit(f"error({SYNTAX_ERROR!r}, 'DEF FN without a name')")
+            return
+        # The body becomes a function; its argument o is the clock offset of the calling statement
+        function = f"_fn{self.functions}"
+        self.functions += 1
+        self._emit(f"def {function}(o):")
+        indent, offset = self.indent, self.offset
+        self.indent, self.offset = indent + "    ", "o"
+        self._emit(f"return {self._number(stmt.body)}")
+        self.indent, self.offset = indent, offset
+        key = 'FN' + variable_key(stmt.name[2:])
+        self._emit(f"define({key!r}, {self._slot(variable_key(stmt.param))}, {function})")
+
+    def _command(self, li, si, stmt: ast.Command):
+        keyword = stmt.keyword
+        counts = {'POKE': (2, 2), 'WAIT': (2, 3), 'SYS': (1, 1), 'OPEN': (1, 4), 'CLOSE': (1, 1), 'RUN': (0, 1)}
+        if keyword in counts:
+            low, high = counts[keyword]
+            if not low <= len(stmt.args) <= high:
+                self._emit(f"error({SYNTAX_ERROR!r}, {f'wrong number of arguments for {keyword}'!r})")
+                return
+        args = [self._any(arg) for arg in stmt.args]
+        if keyword == 'POKE':
+            self._emit(f"poke({', '.join(args)})")
+        elif keyword == 'WAIT':
+            self._emit(f"wait({self.offset}, {', '.join(args)})")
+        elif keyword == 'SYS':
+            self._emit(f"sys({args[0]})")
+        elif keyword == 'OPEN':
+            self._emit(f"open_({', '.join(args)})")
+        elif keyword == 'CLOSE':
+            self._emit(f"close({args[0]})")
+        elif keyword == 'RESTORE':
+            self._emit("restore()")
+        elif keyword == 'RETURN' and self.returns and not self.terminated:
+            # From a GOSUB the block ran on into: on after it
+            if len(self.returns) > self.covered:
+                # Its frame is the top one
+                self._emit("stack.pop()")
+            else:
+                self._emit("stack.pop() if stack and type(stack[-1]) is int else ret()")
+            if self.indent == BLOCK_INDENT:
+                self.jump = (self.returns.pop(), None)
+                self.covered = min(self.covered, len(self.returns))
+            else:
+                self._exit(int(self.offset), str(self._entry_pc(self.returns[-1])))
+        elif keyword == 'RETURN':
+            temp = self._temp()
+            self._emit(f"{temp} = stack.pop() if stack and type(stack[-1]) is int else ret()")
+            self._exit(int(self.offset), temp)
+        elif keyword in ('END', 'NEW', 'LIST'):
+            self._emit("end()")
+        elif keyword == 'STOP':
+            self._emit(f"stop({self.program.lines[li].number})")
+        elif keyword == 'CLR':
+            self.covered = len(self.returns)
+            self._emit("clear()")
+        elif keyword == 'RUN':
+            temp = self._temp()
+            self._emit(f"{temp} = run({args[0] if args else 'None'})")
+            self._exit(int(self.offset), temp)
+        elif keyword == 'CONT':
+            self._emit(f"error({CANT_CONTINUE!r}, '')")
+        elif keyword in ('LOAD', 'SAVE', 'VERIFY'):
+            self._emit(f"unsupported({keyword!r})")
+        else:
+            self._emit(f"error({SYNTAX_ERROR!r}, {keyword!r})")
+
+    def _bad(self, li, si, stmt: ast.Bad):
+        self._emit(f"error({SYNTAX_ERROR!r}, {self._bad_detail(stmt)!r})")
+
+    @staticmethod
+    def _bad_detail(node) -> str:
+        text = getattr(node, 'text', '')
+        return f"at '{text}'" if text else ""
+
+    # -------- expressions --------
+    def _expr(self, node) -> Tuple[str, str]:
+        """Python code of an expression and its type; the code evaluates in the C64's order."""
+        code, kind = self._compile_expr(node)
+        if self.flat and type(node) in (ast.Binary, ast.Unary, ast.Call):
+            temp = self._temp()
+            self._emit(f"{temp} = {code}")
+            return temp, kind
+        return code, kind
+
+    def _bound(self, node) -> Optional[float]:
+        return _integer_bound(node, self.bounds)
+
+    def _number(self, node) -> str:
+        code, kind = self._expr(node)
+        return f"error({TYPE_MISMATCH!r}, {NOT_A_NUMBER!r}, {code})" if kind == STRING else code
+
+    def _as_string(self, code: str, kind: str) -> str:
+        return code if kind == STRING else f"error({TYPE_MISMATCH!r}, {NOT_A_STRING!r}, {code})"
+
+    def _any(self, node) -> str:
+        return self._expr(node)[0]
+
+    def _condition(self, node) -> str:
+        """Code of a condition as a Python truth value."""
+        if self._is_boolean(node):
+            return self._truth(node)
+        bitwise = self._bitwise(node)
+        if bitwise is not None:
+            return bitwise
+        code, kind = self._expr(node)
+        return f"({code} != {'' if kind == STRING else 0.0!r})"
+
+    def _is_boolean(self, node) -> bool:
+        """Whether an expression only combines comparisons, so its value is -1 or 0."""
+        if self.flat:
+            return False
+        while type(node) is ast.Paren and node.closed:
+            node = node.expr
+        if type(node) is ast.Binary:
+            if node.op in ast.RELATIONAL:
+                return True
+            return node.op in ('AND', 'OR') and self._is_boolean(node.left) and self._is_boolean(node.right)
+        return type(node) is ast.Unary and node.op == 'NOT' and self._is_boolean(node.operand)
+
+    def _bitwise(self, node) -> Optional[str]:
+        """Code of AND or OR of 16-bit whole numbers as a Python int, None for other expressions."""
+        while type(node) is ast.Paren and node.closed:
+            node = node.expr
+        if type(node) is not ast.Binary or node.op not in ('AND', 'OR') or self._is_boolean(node):
+            return None
+        bounds = (self._bound(node.left), self._bound(node.right))
+        if None in bounds or max(bounds) > INTEGER_LIMIT:
+            return None
+        left, right = self._any(node.left), self._any(node.right)
+        return f"(int({left}) {'&' if node.op == 'AND' else '|'} int({right}))"
+
+    def _truth(self, node) -> str:
+        """Code of a boolean expression as a Python bool. & and | evaluate both operands, as the C64 does."""
+        while type(node) is ast.Paren:
+            node = node.expr
+        if type(node) is ast.Unary:
+            return f"(not {self._truth(node.operand)})"
+        if node.op == 'AND':
+            return f"({self._truth(node.left)} & {self._truth(node.right)})"
+        if node.op == 'OR':
+            return f"({self._truth(node.left)} | {self._truth(node.right)})"
+        left, left_kind = self._expr(node.left)
+        right, right_kind = self._expr(node.right)
+        if left_kind == right_kind:
+            return f"({left} {COMPARISONS[node.op]} {right})"
+        return f"error({TYPE_MISMATCH!r}, 'comparing a string with a number', {left}, {right})"
+
+    def _compile_expr(self, node) -> Tuple[str, str]:
+        kind = type(node)
+        if kind is ast.Number:
+            return self._literal_number(node.text), NUMBER
+        if kind is ast.String:
+            return repr(petscii_text(node.text[1:-1] if node.closed else node.text[1:])), STRING
+        if kind is ast.Variable:
+            return self._variable(node.name)
+        if kind is ast.Paren:
+            if not node.closed:
+                return f"error({SYNTAX_ERROR!r}, {chr(34)}missing ')'{chr(34)})", NUMBER
+            code, result = self._expr(node.expr)
+            return code, result
+        if kind is ast.Unary:
+            if node.op == 'NOT' and self._is_boolean(node.operand):
+                return f"(0.0 if {self._truth(node.operand)} else -1.0)", NUMBER
+            operand, operand_kind = self._expr(node.operand)
+            if operand_kind == STRING:
+                return f"error({TYPE_MISMATCH!r}, {NOT_A_NUMBER!r}, {operand})", NUMBER
+            if node.op == '-':
+                return f"(-{operand})", NUMBER
+            if node.op == 'NOT':
+                bound = self._bound(node.operand)
+                if bound is not None and bound <= INTEGER_LIMIT:
+                    return f"(-1.0 - {operand})", NUMBER
+                return f"bnot({operand})", NUMBER
+            return operand, NUMBER
+        if kind is ast.Binary:
+            return self._binary(node)
+        if kind is ast.Call:
+            return self._call(node)
+        return f"error({SYNTAX_ERROR!r}, {self._bad_detail(node)!r})", NUMBER
+
+    @staticmethod
+    def _literal_number(text: str) -> str:
+        try:
+            value = parse_number(text) if text[0].isdigit() or text[0] == '.' else c64_float(math.pi)
+        except BasicError as e:
+            return f"error({e.name!r}, '')"
+        return repr(value)
+
+    def _variable(self, name: str) -> Tuple[str, str]:
+        key = variable_key(name)
+        if key == 'TI':
+            return f"float(jiffies({self.offset}))", NUMBER
+        if key == 'TI$':
+            return f"time_string({self.offset})", STRING
+        return variable_name(self._slot(key)), STRING if key.endswith('$') else NUMBER
+
+    def _binary(self, node: ast.Binary) -> Tuple[str, str]:
+        op = node.op
+        if op in ('AND', 'OR'):
+            if self._is_boolean(node):
+                return f"(-1.0 if {self._truth(node)} else 0.0)", NUMBER
+            bitwise = self._bitwise(node)
+            if bitwise is not None:
+                return f"float{bitwise}", NUMBER
+        left, left_kind = self._expr(node.left)
+        right, right_kind = self._expr(node.right)
+        if op in ast.RELATIONAL:
+            if left_kind != right_kind:
+                return f"error({TYPE_MISMATCH!r}, 'comparing a string with a number', {left}, {right})", NUMBER
+            return f"(-1.0 if {left} {COMPARISONS[op]} {right} else 0.0)", NUMBER
+        if op == '+' and left_kind == STRING and right_kind == STRING:
+            return f"concat({left}, {right})", STRING
+        if left_kind == STRING or right_kind == STRING:
+            return f"error({TYPE_MISMATCH!r}, {NOT_A_NUMBER!r}, {left}, {right})", NUMBER
+        if op in ('+', '-', '*'):
+            bound = self._bound(node)
+            if bound is not None and bound < EXACT_LIMIT:
+                return f"({left} {op} {right})", NUMBER
+            temp = self._temp()
+            if bound is not None:
+                # Whole numbers stay whole, only large ones need rounding
+                return f"({temp} if {-EXACT_LIMIT!r} < ({temp} := {left} {op} {right}) < {EXACT_LIMIT!r} else flt({temp}))", NUMBER
+            # c64_float() inlined for the whole numbers most results are
+            return (f"({temp} if {-EXACT_LIMIT!r} < ({temp} := {left} {op} {right}) < {EXACT_LIMIT!r} "
+                    f"and {temp} % 1.0 == 0.0 else flt({temp}))"), NUMBER
+        if op == '/':
+            return f"div({left}, {right})", NUMBER
+        if op == '^':
+            return f"power({left}, {right})", NUMBER
+        return f"{'band' if op == 'AND' else 'bor'}({left}, {right})", NUMBER
+
+    def _unrounded(self, node) -> Optional[str]:
+        """Code of a sum, difference or product of numbers before it is rounded, None for other expressions."""
+        if type(node) is not ast.Binary or node.op not in ('+', '-', '*') or self._bound(node) is not None:
+            return None
+        left, left_kind = self._expr(node.left)
+        right, right_kind = self._expr(node.right)
+        if left_kind == STRING or right_kind == STRING:
+            return None
+        return f"({left} {node.op} {right})"
+
+    def _call(self, node: ast.Call) -> Tuple[str, str]:
+        name = node.name
+        if not node.function:
+            result = STRING if name.endswith('$') else NUMBER
+            if not node.closed:
+                return f"error({SYNTAX_ERROR!r}, {f'missing {chr(41)!r} after {name}('!r})", result
+            slot = self._array_slot(name)
+            if len(node.args) == 1:
+                index = self._number(node.args[0])
+                if self.flat:
+                    return f"get1({slot}, {name!r}, {index})", result
+                # The element of a dimensioned one-dimensional array is read directly
+                values, temp = self._temp(), self._temp()
+                return (f"({values}[int({temp})] if 0.0 <= ({temp} := {index}) < len({values} := {vector_name(slot)}) "
+                        f"else get1({slot}, {name!r}, {temp}))"), result
+            return f"getn({slot}, {name!r}, {', '.join(self._indices(node))})", result
+        if not node.closed:
+            return f"error({SYNTAX_ERROR!r}, {f'missing {chr(41)!r} after {name}('!r})", NUMBER
+        if name.startswith('FN'):
+            key = 'FN' + variable_key(name[2:]) if len(name) > 2 else name
+            lookup = f"lookup_fn({key!r}, {name!r})"
+            if len(node.args) != 1:
+                return f"error({SYNTAX_ERROR!r}, {f'{name} needs one argument'!r}, {lookup})", NUMBER
+            return f"call_fn({lookup}, {self._number(node.args[0])}, {self.offset})", NUMBER
+        spec = FUNCTION_ARGS.get(name)
+        if spec is None:
+            # TAB( and SPC( outside PRINT
+            return f"error({SYNTAX_ERROR!r}, {f'{name} is only allowed in PRINT'!r})", NUMBER
+        counts, types = spec
+        if len(node.args) not in counts:
+            return f"error({SYNTAX_ERROR!r}, {f'wrong number of arguments for {name}'!r})", NUMBER
+        args = [self._expr(arg) for arg in node.args]
+        for (code, kind), expected in zip(args, types):
+            if expected is not None and kind != expected:
+                detail = NOT_A_STRING if expected == STRING else NOT_A_NUMBER
+                codes = ", ".join(code for code, _ in args)
+                return f"error({TYPE_MISMATCH!r}, {detail!r}, {codes})", RESULT_TYPES[name]
+        codes = [code for code, _ in args]
+        if name == 'PEEK':
+            return f"peek({codes[0]}, {self.offset})", NUMBER
+        if name == 'INT' and self._bound(node.args[0]) is not None:
+            # Already whole; adding 0.0 turns -0.0 into 0.0 as floor() does
+            return f"({codes[0]} + 0.0)", NUMBER
+        if name == 'INT':
+            unrounded = self._unrounded(node.args[0])
+            if unrounded is not None:
+                # INT(RND(1)*N): rounding cannot reach the next whole number
+                value, whole = self._temp(), self._temp()
+                return (f"float({whole} if {-FLOOR_LIMIT!r} < ({value} := {unrounded}) < {FLOOR_LIMIT!r} "
+                        f"and {value} - ({whole} := floor({value})) < {FRACTION_LIMIT!r} else floor(flt({value})))"), NUMBER
+        if name == 'MID$':
+            return FUNCTION_CODE[name].format(", ".join(codes)), STRING
+        return FUNCTION_CODE[name].format(*codes), RESULT_TYPES[name]
+
+
+def compile_program(program: Program) -> CompiledProgram:
+    return Compiler(program).compile()
+
+
+# ------------------ Runtime ------------------
+
+class CompiledInterpreter:
+    """
+    Runs a CompiledProgram on a Machine. Has the interface of
+    c64_basic.Interpreter: run() returns a RunResult.
+    """
+
+    def __init__(self, compiled: CompiledProgram, machine: Optional[Machine] = None):
+        self.compiled = compiled
+        self.program = compiled.program
+        self.machine = machine or Machine()
+        # Globals of the variables and one-dimensional arrays, by slot, see variable_name()
+        self.names = [variable_name(slot) for slot in range(len(compiled.slots))]
+        self.vector_names = [vector_name(slot) for slot in range(len(compiled.array_slots))]
+        self.defaults = {name: "" if key.endswith('$') else 0.0 for name, key in zip(self.names, compiled.slots)}
+        self.arrays: List[Optional[Array]] = [None] * len(compiled.array_slots)
+        self.functions: Dict[str, Tuple[int, object]] = {}
+        self.stack: list = []
+        self.data_pointer = 0
+        self.files: Dict[int, int] = {}
+        # Block exits count the lines they started at once, see line_counts
+        self.counts = [0] * (len(self.program.lines) + len(compiled.exit_lines))
+        self.pc = compiled.line_pcs[0] if compiled.line_pcs else compiled.end_pc
+        self.current: Optional[int] = None  # line index of the last statement run
+        self._fingerprints: Dict[int, int] = {}
+        self._volatile_mark = -1
+        # The generated code runs with the environment and the variables as its globals
+        namespace = self.namespace = self._environment()
+        namespace.update(self.defaults)
+        namespace.update(dict.fromkeys(self.vector_names, ()))
+        exec(compiled.code, namespace)
+        # The function of each block, by pc
+        self.block_functions = [namespace[f"_b{pc}"] for pc in range(compiled.end_pc)]
+        self.block_functions.append(self._end_of_program)
+
+    @property
+    def line_counts(self) -> List[int]:
+        """Times each line started."""
+        counts = self.counts[:len(self.program.lines)]
+        for lines, count in zip(self.compiled.exit_lines, self.counts[len(counts):]):
+            if count:
+                for li in lines:
+                    counts[li] += count
+        return counts
+
+    @property
+    def variables(self) -> list:
+        """Values of the variables, by slot."""
+        return [self.namespace[name] for name in self.names]
+
+    def _environment(self) -> dict:
+        machine = self.machine
+        screen = machine.screen
+        return {
+            'counts': self.counts, 'machine': machine,
+            'error': self._error, 'flt': c64_float, 'concat': self._concat, 'div': self._div,
+            'power': Interpreter._power, 'band': self._band, 'bor': self._bor, 'bnot': self._bnot,
+            'integer': Interpreter._integer, 'byte': _byte, 'floor': math.floor,
+            'sgn': lambda x: float((x > 0) - (x < 0)), 'usr': self._usr, 'fre': self._fre,
+            'pos': lambda x: float(screen.column), 'sqr': Interpreter._sqr, 'rnd': machine.rnd,
+            'log': Interpreter._log, 'exp': Interpreter._exp, 'cos': math.cos, 'sin': math.sin,
+            'tan': Interpreter._tan, 'atn': math.atan, 'peek': self._peek, 'fmt': format_number,
+            'val': parse_number, 'asc': Interpreter._asc, 'right': self._right, 'mid': self._mid,
+            'jiffies': self._jiffies, 'time_string': self._time_string, 'set_time': self._set_time,
+            'get1': self._get1, 'set1': self._set1, 'getn': self._getn, 'store': self._store,
+            'locate': self._locate, 'index': self._index, 'dim': self._dim, 'dim_size': self._dim_size,
+            'stack': self.stack, 'gosub': self._gosub, 'ret': self._return, 'for_': self._for, 'next_': self._next, 'on': self._on,
+            'run': self._run, 'channel': self._channel, 'keyboard': self._keyboard, 'screen': screen,
+            'write': screen.write, 'write_code': screen.write_code, 'write_codes': screen.write_codes, 'put': screen.put, 'write_number': self._write_number, 'tab': self._tab, 'spc': self._spc,
+            'comma': self._comma, 'get_key': self._get_key, 'get_number': self._get_number,
+            'read_input': self._read_input, 'read_string': self._read_string, 'read_number': self._read_number,
+            'restore': self._restore, 'define': self._define, 'lookup_fn': self._lookup_fn,
+            'call_fn': self._call_fn, 'poke': self._poke, 'wait': self._wait, 'sys': self._sys,
+            'open_': self._open, 'close': self._close, 'end': self._end, 'stop': self._stop,
+            'clear': self._clear, 'unsupported': self._unsupported,
+        }
+
+    def _clear(self):
+        """CLR: variables, arrays, functions, stack, DATA pointer and files. The lists stay the same objects."""
+        self.namespace.update(self.defaults)
+        self.namespace.update(dict.fromkeys(self.vector_names, ()))
+        self.arrays[:] = [None] * len(self.arrays)
+        self.functions.clear()
+        self.stack.clear()
+        self.data_pointer = 0
+        self.files.clear()
+
+    # -------- running --------
+    def run(self, max_statements: int = DEFAULT_MAX_STATEMENTS) -> RunResult:
+        """Runs until the program stops or about max_statements more statements were executed."""
+        machine = self.machine
+        start_statements = machine.statements
+        start = time.perf_counter()
+        status, message, line = LIMIT, "", None
+        try:
+            self._execute(max_statements)
+            line = self._line_number()
+        except BasicError as e:
+            if e.line is None:
+                e.line = self._line_number()
+            status, message, line = ERROR, str(e), e.line
+        except _Halt as halt:
+            status, message, line = halt.status, halt.message, self._line_number()
+        except RecursionError:
+            status, message, line = ERROR, f"?OUT OF MEMORY ERROR IN {self._line_number()}", self._line_number()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        return RunResult(
+            status=status,
+            message=message,
+            line=line,
+            statements=machine.statements - start_statements,
+            elapsed_ms=round(elapsed_ms, 3),
+            lines_run=sum(1 for count in self.line_counts if count),
+            lines_total=len(self.program.lines),
+            keys_left=machine.keys_left(),
+            screen=machine.screen.text(),
+            notes=list(machine.notes),
+        )
+
+    def _line_number(self) -> Optional[int]:
+        li = self.current
+        return self.program.lines[li].number if li is not None else None
+
+    def _execute(self, max_statements: int):
+        functions = self.block_functions
+        machine = self.machine
+        limit = machine.statements + max_statements
+        next_check = machine.statements + HANG_CHECK_INTERVAL
+        # No block runs more statements than the longest one, so that many
+        # blocks can run before the statements are looked at again
+        longest = max((block.statements for block in self.compiled.blocks), default=1) or 1
+        pc = last = self.pc
+        self.current = None
+        try:
+            while True:
+                stop = min(limit, next_check)
+                while machine.statements < stop:
+                    for _ in range((stop - machine.statements - 1) // longest + 1):
+                        last = pc
+                        pc = functions[pc]()
+                if machine.statements >= next_check:
+                    # Every HANG_CHECK_INTERVAL statements like the tree-walker, give or take a block
+                    next_check += (machine.statements - next_check) // HANG_CHECK_INTERVAL * HANG_CHECK_INTERVAL \
+                        + HANG_CHECK_INTERVAL
+                    self.pc = pc
+                    self._check_hang()
+                if machine.statements >= limit:
+                    return
+        except BaseException as e:
+            self._count_partial_block(last, e.__traceback__)
+            raise
+        finally:
+            self.pc = pc
+            if self.current is None:
+                # Stopped between blocks: the line the last one started in
+                self.current = self.compiled.blocks[last].line
+
+    def _count_partial_block(self, pc: int, traceback):
+        """
+        Adds the statements of its line a block ran before it raised, up to
+        the raising one, to the clock, counts the lines it started and makes
+        that line the current one.
+        """
+        code = self.block_functions[pc].__code__
+        while traceback is not None and traceback.tb_frame.f_code is not code:
+            traceback = traceback.tb_next
+        block = self.compiled.blocks[pc]
+        if traceback is not None and block.code_lines:
+            idx = bisect.bisect_right(block.code_lines, traceback.tb_lineno) - 1
+            self.machine.statements += block.offsets[idx] + 1
+            self.current = block.lines[idx]
+            for li in block.started[idx]:
+                self.counts[li] += 1
+
+    def _end_of_program(self):
+        raise _Halt(ENDED, "READY.")
+
+    def _check_hang(self):
+        machine = self.machine
+        if machine.volatile_reads != self._volatile_mark:
+            # The program looked at something that changes by itself; start over
+            self._volatile_mark = machine.volatile_reads
+            self._fingerprints.clear()
+            return
+        fingerprint = self._fingerprint()
+        empty_gets = self._fingerprints.get(fingerprint)
+        if empty_gets is not None:
+            if machine.empty_gets > empty_gets:
+                raise _Halt(WAITING, "GET waits for a key, the scripted keys are used up")
+            raise _Halt(HANG, "Infinite loop: the program repeats the same state without input")
+        if len(self._fingerprints) >= MAX_FINGERPRINTS:
+            self._fingerprints.clear()
+        self._fingerprints[fingerprint] = machine.empty_gets
+
+    def _fingerprint(self) -> int:
+        machine = self.machine
+        return hash((self.pc, tuple(self.variables),
+                     tuple((slot, tuple(array.values)) for slot, array in enumerate(self.arrays) if array),
+                     tuple(self.stack), self.data_pointer, machine.key_pos, machine.key_ready, machine.clock_offset,
+                     machine.screen.row, machine.screen.column, machine.screen.reverse, bytes(machine.memory)))
+
+    # -------- values --------
+    @staticmethod
+    def _error(name: str, detail: str, *values):
+        """Raises a runtime error; values are the operands evaluated before it."""
+        raise BasicError(name, detail)
+
+    @staticmethod
+    def _concat(left: str, right: str) -> str:
+        if len(left) + len(right) > MAX_STRING_LENGTH:
+            raise BasicError(STRING_TOO_LONG, f"{len(left) + len(right)} characters")
+        return left + right
+
+    @staticmethod
+    def _div(left: float, right: float) -> float:
+        if right == 0:
+            raise BasicError(DIVISION_BY_ZERO)
+        return c64_float(left / right)
+
+    # The operands are numbers, checked at compile time; values in the 16-bit
+    # range skip the checks of Interpreter._integer()
+    @staticmethod
+    def _band(left: float, right: float) -> float:
+        if -32768.0 <= left < 32768.0 and -32768.0 <= right < 32768.0:
+            return float(math.floor(left) & math.floor(right))
+        return float(Interpreter._integer(left) & Interpreter._integer(right))
+
+    @staticmethod
+    def _bor(left: float, right: float) -> float:
+        if -32768.0 <= left < 32768.0 and -32768.0 <= right < 32768.0:
+            return float(math.floor(left) | math.floor(right))
+        return float(Interpreter._integer(left) | Interpreter._integer(right))
+
+    @staticmethod
+    def _bnot(value: float) -> float:
+        if -32768.0 <= value < 32768.0:
+            return float(~math.floor(value))
+        return float(~Interpreter._integer(value))
+
+    @staticmethod
+    def _right(s: str, n: float) -> str:
+        return s[len(s) - min(_byte(n), len(s)):]
+
+    @staticmethod
+    def _mid(s: str, start: float, length: float = 255.0) -> str:
+        if 1.0 <= start < 256.0 and 0.0 <= length < 256.0:
+            # The arguments are numbers, checked at compile time
+            start = int(start) - 1
+            return s[start:start + int(length)]
+        start = Interpreter._byte(start)
+        if start == 0:
+            raise BasicError(ILLEGAL_QUANTITY, "MID$ start position 0")
+        return s[start - 1:start - 1 + Interpreter._byte(length)]
+
+    def _usr(self, x):
+        raise BasicError(ILLEGAL_QUANTITY, "USR() has no machine code routine")
+
+    def _fre(self, x) -> float:
+        # Variables still holding their initial value count as not created yet
+        namespace = self.namespace
+        defined = [namespace[name] for name, default in self.defaults.items() if namespace[name] != default]
+        used = (self.program.size + 7 * len(defined)
+                + sum(len(a.values) * 5 for a in self.arrays if a is not None)
+                + sum(len(value) for value in defined if type(value) is str))
+        free = BASIC_RAM_BYTES - used
+        return float(free - 65536 if free > 32767 else free)
+
+    # The clock reads need the statements of the running block, which are
+    # only added to machine.statements when the block ends
+    def _jiffies(self, offset: int) -> int:
+        machine = self.machine
+        machine.statements += offset
+        try:
+            return machine.jiffies()
+        finally:
+            machine.statements -= offset
+
+    def _time_string(self, offset: int) -> str:
+        machine = self.machine
+        machine.statements += offset
+        try:
+            return machine.time_string()
+        finally:
+            machine.statements -= offset
+
+    def _set_time(self, text: str, offset: int):
+        machine = self.machine
+        machine.statements += offset
+        try:
+            machine.set_time(text)
+        finally:
+            machine.statements -= offset
+
+    def _peek(self, value: float, offset: int) -> float:
+        address = int(value) if 0.0 <= value < 65536.0 else Interpreter._address(value)
+        if address not in CLOCK_ADDRESSES:
+            return float(self.machine.peek(address))
+        machine = self.machine
+        machine.statements += offset
+        try:
+            return float(machine.peek(address))
+        finally:
+            machine.statements -= offset
+
+    # -------- arrays --------
+    def _get1(self, slot: int, name: str, index: float):
+        values = self.namespace[self.vector_names[slot]]
+        if 0 <= index < len(values):
+            return values[int(index)]
+        array, flat = self._locate(slot, name, self._index(index, name))
+        return array.values[flat]
+
+    def _set1(self, value, slot: int, name: str, index: float):
+        values = self.namespace[self.vector_names[slot]]
+        if 0 <= index < len(values):
+            values[int(index)] = value
+            return
+        array, flat = self._locate(slot, name, self._index(index, name))
+        array.values[flat] = value
+
+    def _getn(self, slot: int, name: str, *indices: int):
+        array, flat = self._locate(slot, name, *indices)
+        return array.values[flat]
+
+    def _store(self, value, slot: int, name: str, *indices: int):
+        array, flat = self._locate(slot, name, *indices)
+        array.values[flat] = float(Interpreter._integer(value)) if name.endswith('%') else value
+
+    @staticmethod
+    def _index(value: float, name: str) -> int:
+        index = math.floor(value)
+        if not -32768 <= index <= 32767 or index < 0:
+            raise BasicError(ILLEGAL_QUANTITY, f"subscript {index} of {name}")
+        return index
+
+    def _locate(self, slot: int, name: str, *indices: int) -> Tuple[Array, int]:
+        """The array and flat index of an element; undeclared arrays get DIM 10."""
+        array = self.arrays[slot]
+        if array is None:
+            array = self._dimension(slot, name, (10,) * len(indices))
+        if len(indices) != len(array.dims):
+            raise BasicError(BAD_SUBSCRIPT, f"{name} has {len(array.dims)} dimension(s)")
+        flat = 0
+        for index, dim in zip(indices, array.dims):
+            if index > dim:
+                raise BasicError(BAD_SUBSCRIPT, f"{name}({','.join(map(str, indices))}) exceeds DIM {dim}")
+            flat = flat * (dim + 1) + index
+        return array, flat
+
+    def _dimension(self, slot: int, name: str, dims: Tuple[int, ...]) -> Array:
+        if self.arrays[slot] is not None:
+            raise BasicError(REDIMD_ARRAY, f"{name} is already dimensioned")
+        elements = math.prod(d + 1 for d in dims)
+        element_bytes = 3 if name.endswith('$') else 2 if name.endswith('%') else 5
+        if elements * element_bytes > BASIC_RAM_BYTES - self.program.size:
+            raise BasicError(OUT_OF_MEMORY, f"DIM {name}{dims} needs {elements * element_bytes} bytes")
+        array = self.arrays[slot] = Array(dims, "" if name.endswith('$') else 0.0)
+        if len(dims) == 1:
+            self.namespace[self.vector_names[slot]] = array.values
+        return array
+
+    @staticmethod
+    def _dim_size(value: float, name: str) -> int:
+        dim = math.floor(value)
+        if not 0 <= dim <= 32767:
+            raise BasicError(ILLEGAL_QUANTITY, f"DIM {name} size {dim}")
+        return dim
+
+    def _dim(self, slot: int, name: str, *dims: int):
+        self._dimension(slot, name, dims)
+
+    # -------- control flow --------
+    # A GOSUB frame is the block to return to, a FOR frame a tuple
+    # (slot, end, step, block of the loop body)
+    def _stack_full(self, size: int) -> bool:
+        stack = self.stack
+        if len(stack) < SAFE_FRAMES:
+            return False
+        used = sum(FRAME_BYTES[GOSUB] if type(frame) is int else FRAME_BYTES[FOR] for frame in stack)
+        return used + size > STACK_BYTES
+
+    def _gosub(self, resume: int):
+        if self._stack_full(FRAME_BYTES[GOSUB]):
+            raise BasicError(OUT_OF_MEMORY, "too many nested FOR loops or GOSUBs")
+        self.stack.append(resume)
+
+    def _return(self) -> int:
+        stack = self.stack
+        for idx in range(len(stack) - 1, -1, -1):
+            resume = stack[idx]
+            if type(resume) is int:
+                del stack[idx:]
+                return resume
+        raise BasicError(RETURN_WITHOUT_GOSUB)
+
+    def _for(self, slot: int, end: float, step: float, resume: int):
+        # A loop of the same variable is replaced, with the loops opened after it
+        stack = self.stack
+        for idx in range(len(stack) - 1, -1, -1):
+            frame = stack[idx]
+            if type(frame) is int:
+                break
+            if frame[0] == slot:
+                del stack[idx:]
+                break
+        if self._stack_full(FRAME_BYTES[FOR]):
+            raise BasicError(OUT_OF_MEMORY, "too many nested FOR loops or GOSUBs")
+        stack.append((slot, end, step, resume))
+
+    def _next(self, slot: Optional[int], name: Optional[str]) -> Optional[int]:
+        """The block to continue the loop with, or None when it ended."""
+        stack = self.stack
+        for idx in range(len(stack) - 1, -1, -1):
+            frame = stack[idx]
+            if type(frame) is int or slot is None or frame[0] == slot:
+                break
+        else:
+            idx = -1
+        if idx < 0 or type(stack[idx]) is int:
+            key = variable_key(name) if name else None
+            raise BasicError(NEXT_WITHOUT_FOR, f"no open FOR {key}" if key else "no open FOR loop")
+        del stack[idx + 1:]
+        slot, end, step, resume = frame
+        name = self.names[slot]
+        value = c64_float(self.namespace[name] + step)
+        self.namespace[name] = value
+        # The loop ends when the variable passed the end in the direction of the step
+        if (value > end) - (value < end) != (step > 0) - (step < 0):
+            return resume
+        del stack[idx]
+        return None
+
+    def _on(self, value, pcs: tuple, numbers: tuple, resume: Optional[int], mode: str) -> Optional[int]:
+        selector = Interpreter._byte(value)
+        if not 1 <= selector <= len(pcs):
+            return None
+        number = numbers[selector - 1]
+        if number is None:
+            raise BasicError(SYNTAX_ERROR, f"ON {mode} target {selector} is not a line number")
+        if resume is not None:
+            self._gosub(resume)
+        pc = pcs[selector - 1]
+        if pc is None:
+            raise BasicError(UNDEFD_STATEMENT, f"line {number} does not exist")
+        return pc
+
+    def _goto(self, number: int) -> int:
+        index = self.program.index.get(number)
+        if index is None:
+            raise BasicError(UNDEFD_STATEMENT, f"line {number} does not exist")
+        return self.compiled.line_pcs[index]
+
+    def _run(self, value) -> int:
+        self._clear()
+        if value is None:
+            return self.compiled.line_pcs[0]
+        return self._goto(math.floor(Interpreter._number(value)))
+
+    # -------- input and output --------
+    def _channel(self, value, output: bool) -> int:
+        """Device of an open file number (PRINT#, INPUT#, GET#, CMD)."""
+        number = Interpreter._byte(value)
+        device = self.files.get(number)
+        if device is None:
+            raise BasicError(FILE_NOT_OPEN, f"file {number}")
+        if output and device == 0:
+            raise BasicError(NOT_OUTPUT_FILE, f"file {number} is the keyboard")
+        if not output and device == 3:
+            raise BasicError(NOT_INPUT_FILE, f"file {number} is the screen")
+        return device
+
+    def _keyboard(self, value, keyword: str):
+        if self._channel(value, False) != 0:
+            raise _Halt(UNSUPPORTED, f"{keyword} from a device is not emulated")
+
+    def _write_number(self, value: float):
+        # Numbers are followed by a cursor right
+        self.machine.screen.write(format_number(value) + "\x1d")
+
+    def _tab(self, value):
+        screen = self.machine.screen
+        if type(value) is float and screen.column <= value < SCREEN_COLUMNS:
+            screen.column = int(value)
+        else:
+            screen.cursor_right(_byte(value) - screen.column)
+
+    def _spc(self, value):
+        self.machine.screen.cursor_right(_byte(value))
+
+    def _comma(self):
+        # Next column of ten
+        screen = self.machine.screen
+        screen.cursor_right(10 - screen.column % 10)
+
+    def _get_key(self) -> str:
+        key = self.machine.next_key()
+        return chr(key) if key is not None else ""
+
+    @staticmethod
+    def _get_number(char: str, name: str) -> float:
+        if char == "" or "0" <= char <= "9":
+            return float(char or 0)
+        raise BasicError(SYNTAX_ERROR, f"GET {name} read the key '{char}'")
+
+    def _read_input(self, keyword: str, prompt: str, kinds: Tuple[bool, ...],
+                    keyboard: bool) -> Optional[Tuple[list, bool]]:
+        """
+        The values typed for INPUT and whether there were more than asked for,
+        or None when RETURN alone keeps the variables.
+        """
+        machine = self.machine
+        screen = machine.screen
+        screen.write(prompt + ("? " if keyboard else ""))
+        fields: List[str] = []
+        first = True
+        while True:
+            line = machine.read_line()
+            if line is None:
+                raise _Halt(WAITING, f"{keyword} waits for input, the scripted keys are used up")
+            screen.write(line)
+            screen.put(0x0D)
+            if first and line == "":
+                return None
+            first = False
+            fields.extend(Interpreter._input_fields(line))
+            values = []
+            for is_string, text in zip(kinds, fields):
+                if is_string:
+                    values.append(text)
+                    continue
+                value = parse_number(text, strict=True)
+                if value is None:
+                    break
+                values.append(value)
+            else:
+                if len(fields) < len(kinds):
+                    screen.write("?? ")
+                    continue
+                return values, len(fields) > len(kinds)
+            screen.write("?REDO FROM START\r" + prompt + "? ")
+            fields = []
+            first = True
+
+    def _next_data(self) -> Tuple[int, bool, str]:
+        if self.data_pointer >= len(self.program.data):
+            raise BasicError(OUT_OF_DATA)
+        item = self.program.data[self.data_pointer]
+        self.data_pointer += 1
+        return item
+
+    def _read_string(self) -> str:
+        _, quoted, text = self._next_data()
+        return petscii_text(text, macros=quoted)
+
+    def _read_number(self, name: str) -> float:
+        line, quoted, text = self._next_data()
+        value = None if quoted else parse_number(text, strict=True)
+        if value is None:
+            # The C64 reports the DATA line
+            raise BasicError(SYNTAX_ERROR, f"READ {name} found '{text}'", line)
+        return value
+
+    def _restore(self):
+        self.data_pointer = 0
+
+    # -------- functions --------
+    def _define(self, key: str, slot: int, body):
+        self.functions[key] = (slot, body)
+
+    def _lookup_fn(self, key: str, name: str) -> Tuple[int, object]:
+        definition = self.functions.get(key)
+        if definition is None:
+            raise BasicError(UNDEFD_FUNCTION, f"{name} is not defined")
+        return definition
+
+    def _call_fn(self, definition: Tuple[int, object], argument: float, offset: int) -> float:
+        slot, body = definition
+        namespace, name = self.namespace, self.names[slot]
+        saved = namespace[name]
+        namespace[name] = argument
+        try:
+            return body(offset)
+        finally:
+            namespace[name] = saved
+
+    # -------- commands --------
+    def _poke(self, address, value):
+        if type(address) is float and 0.0 <= address < 65536.0:
+            address = int(address)
+        else:
+            address = Interpreter._address(address)
+        self.machine.poke(address, _byte(value))
+
+    def _wait(self, offset: int, *args):
+        address = Interpreter._address(args[0])
+        mask = Interpreter._byte(args[1])
+        flip = Interpreter._byte(args[2]) if len(args) > 2 else 0
+        machine = self.machine
+        machine.statements += offset
+        try:
+            if (machine.peek(address) ^ flip) & mask:
+                return
+        finally:
+            machine.statements -= offset
+        if address == KEY_COUNT:
+            raise _Halt(WAITING, "WAIT waits for a key, the scripted keys are used up")
+        if address not in VOLATILE_ADDRESSES and not 0xD000 <= address <= 0xDFFF:
+            raise _Halt(HANG, f"Infinite loop: WAIT {address},{mask} waits for memory nothing changes")
+
+    def _sys(self, address):
+        self.machine.sys(Interpreter._address(address))
+
+    def _open(self, *args):
+        number = Interpreter._byte(args[0])
+        device = Interpreter._byte(args[1]) if len(args) > 1 else 1
+        if number in self.files:
+            raise BasicError(FILE_OPEN, f"file {number}")
+        if device not in (0, 3):
+            raise _Halt(UNSUPPORTED, f"OPEN {number},{device}: disk and tape I/O are not emulated")
+        self.files[number] = device
+
+    def _close(self, number):
+        self.files.pop(Interpreter._byte(number), None)
+
+    @staticmethod
+    def _end():
+        raise _Halt(ENDED, "READY.")
+
+    @staticmethod
+    def _stop(line: int):
+        raise _Halt(STOPPED, f"BREAK IN {line}")
+
+    @staticmethod
+    def _unsupported(keyword: str):
+        raise _Halt(UNSUPPORTED, f"{keyword}: disk and tape I/O are not emulated")
+
+
+def run_program(source_text: str, keys="", max_statements: int = DEFAULT_MAX_STATEMENTS,
+                seed: int = 0) -> RunResult:
+    """Like c64_basic.run_program(), with the compiled backend."""
+    machine = Machine(keys if isinstance(keys, bytes) else parse_keys(keys), seed=seed)
+    try:
+        return CompiledInterpreter(compile_program(Program(source_text)), machine).run(max_statements)
+    except RecursionError:
+        return formula_too_complex(source_text, machine)
+
+# -----------------------------------------------------------------------------
+# Command Line Interface
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a C64 BASIC V2 program headless with the compiled backend.")
+    parser.add_argument('filename', nargs='?', help="Input filename (stdin if empty)")
+    parser.add_argument('--max-statements', type=int, default=DEFAULT_MAX_STATEMENTS,
+                        help=f"Statements to run at most (default {DEFAULT_MAX_STATEMENTS})")
+    parser.add_argument('--keys', default="", help="Keys for GET/INPUT; \\n or {RETURN} is RETURN")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the RND sequence")
+    parser.add_argument('--screen', action='store_true', help="Print the screen at the end of the run")
+    parser.add_argument('--code', type=int, metavar='LINE', help="Print the Python code of a line instead of running")
+
+    args = parser.parse_args()
+
+    if args.filename:
+        try:
+            with open(args.filename, 'r', encoding='utf-8', errors='replace') as f:
+                source_text = f.read()
+        except Exception as e:
+            logger.error(f"Error reading input: {e}")
+            sys.exit(3)
+    else:
+        source_text = sys.stdin.read()
+
+    if args.code is not None:
+        compiled = compile_program(Program(source_text))
+        index = compiled.program.index.get(args.code)
+        if index is None:
+            logger.error(f"Line {args.code} does not exist")
+            sys.exit(2)
+        print(compiled.sources[index])
+        return
+
+    result = run_program(source_text, keys=args.keys.replace("\\n", "\n"),
+                         max_statements=args.max_statements, seed=args.seed)
+    print(result.summary())
+    if args.screen:
+        print(result.screen)
+    sys.exit(1 if result.failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,403 @@
+"""
+Virtual VIC-II text mode display of the headless C64.
+
+Shows what a program run with c64_basic or c64_compiler leaves on the
+screen, without the C64, camera and vision model CaptureC64Screen needs. The
+display reads the machine's memory like the VIC-II does:
+- the screen RAM ($0400 after power-on; $D018 and the VIC bank in $DD00 move
+  it) and the colour RAM at $D800. PRINT fills both, with PETSCII cursor and
+  colour codes, and POKEs change them directly
+- the border ($D020) and background ($D021-$D024) colours
+- the character set: the upper case/graphics or the lower/upper case set of
+  the character ROM (bit 1 of $D018, switched by CHR$(14) and CHR$(142) or
+  POKE 53272,23), or a character set the program built in RAM. Its empty
+  glyphs are drawn from the ROM, as programs copy the ROM into RAM with
+  machine code, which is not emulated
+- the extended background colour mode and a blanked screen. Bitmap and
+  multicolour modes are drawn as plain text mode; describe() says so
+
+text() renders the screen as Unicode text, with the graphics characters
+approximated by box and block characters. png() draws the picture with
+border; the character glyphs are blitted with NumPy when it is installed and
+in pure Python otherwise. The glyphs come from the C64 character ROM when a
+dump of it is given (VICE's 4 KB 'chargen' file, or $C64_CHARGEN), else from
+a built-in font in the style of the C64.
+
+Usage:
+    python utils/c64_display.py game.bas [--max-statements N] [--keys "Y{RETURN}"] [--png screen.png] [--scale 2]
+"""
+import argparse
+import logging
+import os
+import struct
+import sys
+import zlib
+from collections import Counter
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional: png() draws in pure Python
+    np = None
+
+try:
+    from utils.c64_basic import (
+        CIA2_PORT_A, COLOUR_RAM, DEFAULT_MAX_STATEMENTS, LOWER_CASE_SET, SCREEN_COLUMNS, SCREEN_ROWS,
+        SCREEN_SIZE, VIC_CONTROL, VIC_MEMORY_SETUP, Machine, Program, RunResult, parse_keys,
+    )
+    from utils.c64_compiler import CompiledInterpreter, compile_program
+except ModuleNotFoundError:
+    from c64_basic import (
+        CIA2_PORT_A, COLOUR_RAM, DEFAULT_MAX_STATEMENTS, LOWER_CASE_SET, SCREEN_COLUMNS, SCREEN_ROWS,
+        SCREEN_SIZE, VIC_CONTROL, VIC_MEMORY_SETUP, Machine, Program, RunResult, parse_keys,
+    )
+    from c64_compiler import CompiledInterpreter, compile_program
+
+logger = logging.getLogger(__name__)
+
+# VIC-II registers
+VIC_CONTROL_2 = 0xD016
+BORDER_COLOUR = 0xD020
+BACKGROUND_COLOUR = 0xD021  # $D022-$D024: extended background colours
+BITMAP_MODE = 0x20
+EXTENDED_COLOUR_MODE = 0x40
+DISPLAY_ENABLE = 0x10
+MULTICOLOUR_MODE = 0x10
+
+CHARGEN_ENV = "C64_CHARGEN"
+CHARGEN_SIZE = 4096
+CHARSET_SIZE = 2048
+# The character ROM shows at $1000-$1FFF of VIC banks 0 and 2
+ROM_BANKS = (0x0000, 0x8000)
+ROM_CHARSETS = {0x1000: 0, 0x1800: CHARSET_SIZE}
+
+GLYPH_SIZE = 8
+BORDER_WIDTH = 32
+BORDER_HEIGHT = 36
+PICTURE_WIDTH = SCREEN_COLUMNS * GLYPH_SIZE
+PICTURE_HEIGHT = SCREEN_ROWS * GLYPH_SIZE
+MAX_SCALE = 8
+
+# The VICE "pepto" palette
+PALETTE = [
+    (0x00, 0x00, 0x00), (0xFF, 0xFF, 0xFF), (0x68, 0x37, 0x2B), (0x70, 0xA4, 0xB2),
+    (0x6F, 0x3D, 0x86), (0x58, 0x8D, 0x43), (0x35, 0x28, 0x79), (0xB8, 0xC7, 0x6F),
+    (0x6F, 0x4F, 0x25), (0x43, 0x39, 0x00), (0x9A, 0x67, 0x59), (0x44, 0x44, 0x44),
+    (0x6C, 0x6C, 0x6C), (0x9A, 0xD2, 0x84), (0x6C, 0x5E, 0xB5), (0x95, 0x95, 0x95),
+]
+COLOUR_NAMES = ["black", "white", "red", "cyan", "purple", "green", "blue", "yellow",
+                "orange", "brown", "light red", "dark grey", "grey", "light green", "light blue", "light grey"]
+
+# Text of the screen codes 0-127 in both character sets; graphics characters
+# are approximated by box drawing and block characters
+UPPER_SET_TEXT = ("@ABCDEFGHIJKLMNOPQRSTUVWXYZ[£]↑← !\"#$%&'()*+,-./0123456789:;<=>?"
+                  "─♠│────││╮╰╯└╲╱┌┐●▁♥▏╭╳○♣▕♦┼▒│π◥ ▌▄▔▁▏▒▕▒◤▕├▗└┐▂┌┴┬┤▎▍▐▀▀▃┘▖▝┘▘▚")
+LOWER_SET_TEXT = ("@abcdefghijklmnopqrstuvwxyz" + UPPER_SET_TEXT[27:64]
+                  + "─ABCDEFGHIJKLMNOPQRSTUVWXYZ┼▒│▒▒" + UPPER_SET_TEXT[96:105] + "▒"
+                  + UPPER_SET_TEXT[106:122] + "✓" + UPPER_SET_TEXT[123:])
+# Reversed characters (screen codes 128-255) that look like another character
+REVERSED_TEXT = {" ": "█", "▌": "▐", "▐": "▌", "▄": "▀", "▀": "▄", "▖": "▜", "▗": "▛",
+                 "▘": "▟", "▝": "▙", "▚": "▞"}
+
+# Built-in font: 8 bytes per screen code 0-127 of the upper case/graphics set
+UPPER_SET_GLYPHS = """
+3C666E6E60623C00 183C667E66666600 7C66667C66667C00 3C66606060663C00 786C6666666C7800 7E60607860607E00 7E60607860606000 3C66606E66663C00
+6666667E66666600 3C18181818183C00 1E0C0C0C0C6C3800 666C7870786C6600 6060606060607E00 63777F6B63636300 66767E7E6E666600 3C66666666663C00
+7C66667C60606000 3C666666663C0E00 7C66667C786C6600 3C66603C06663C00 7E18181818181800 6666666666663C00 66666666663C1800 6363636B7F776300
+66663C183C666600 6666663C18181800 7E060C1830607E00 3C30303030303C00 0C12307C3062FC00 3C0C0C0C0C0C3C00 00183C7E18181818 0010307F7F301000
+0000000000000000 1818181800001800 6666660000000000 6666FF66FF666600 183E603C067C1800 62660C1830664600 3C663C3867663F00 060C180000000000
+0C18303030180C00 30180C0C0C183000 00663CFF3C660000 0018187E18180000 0000000000181830 0000007E00000000 0000000000181800 0003060C18306000
+3C666E7666663C00 1818381818187E00 3C66060C30607E00 3C66061C06663C00 060E1E667F060600 7E607C0606663C00 3C66607C66663C00 7E660C1818181800
+3C66663C66663C00 3C66663E06663C00 0000180000180000 0000180000181830 0E18306030180E00 00007E007E000000 70180C060C187000 3C66060C18001800
+000000FFFF000000 081C3E7F7F1C3E00 1818181818181818 000000FFFF000000 0000FFFF00000000 00FFFF0000000000 00000000FFFF0000 3030303030303030
+0C0C0C0C0C0C0C0C 000000E0F0381818 18181C0F07000000 181838F0E0000000 C0C0C0C0C0C0FFFF C0E070381C0E0703 03070E1C3870E0C0 FFFFC0C0C0C0C0C0
+FFFF030303030303 003C7E7E7E7E3C00 0000000000FFFF00 367F7F7F3E1C0800 6060606060606060 000000070F1C1818 C3E77E3C3C7EE7C3 003C7E66667E3C00
+1818666618183C00 0606060606060606 081C3E7F3E1C0800 181818FFFF181818 C0C03030C0C03030 1818181818181818 0000033E76363600 FF7F3F1F0F070301
+0000000000000000 F0F0F0F0F0F0F0F0 00000000FFFFFFFF FF00000000000000 00000000000000FF 8080808080808080 CCCC3333CCCC3333 0101010101010101
+00000000CCCC3333 FFFEFCF8F0E0C080 0303030303030303 1818181F1F181818 000000000F0F0F0F 1818181F1F000000 000000F8F8181818 000000000000FFFF
+0000001F1F181818 181818FFFF000000 000000FFFF181818 181818F8F8181818 C0C0C0C0C0C0C0C0 E0E0E0E0E0E0E0E0 0707070707070707 FFFF000000000000
+FFFFFF0000000000 0000000000FFFFFF 030303030303FFFF 00000000F0F0F0F0 0F0F0F0F00000000 181818F8F8000000 F0F0F0F000000000 F0F0F0F00F0F0F0F
+"""
+# Screen codes whose glyph differs in the lower/upper case set
+LOWER_SET_GLYPHS = {
+    1: "00003C063E663E00", 2: "0060607C66667C00", 3: "00003C6060603C00", 4: "0006063E66663E00",
+    5: "00003C667E603C00", 6: "000E183E18181800", 7: "00003E66663E067C", 8: "0060607C66666600",
+    9: "0018003818183C00", 10: "0006000606063C00", 11: "0060606C786C6600", 12: "0038181818183C00",
+    13: "0000667F7F6B6300", 14: "00007C6666666600", 15: "00003C6666663C00", 16: "00007C66667C6060",
+    17: "00003E66663E0606", 18: "00007C6660606000", 19: "00003E603C067C00", 20: "00187E1818180E00",
+    21: "0000666666663E00", 22: "00006666663C1800", 23: "0000636B7F3E3600", 24: "0000663C183C6600",
+    25: "00006666663E0C78", 26: "00007E0C18307E00",
+    94: "3333CCCC3333CCCC", 95: "993366CC993366CC", 105: "99CC663399CC6633", 122: "0103066C78706000",
+}
+LOWER_SET_GLYPHS.update({64 + code: UPPER_SET_GLYPHS.split()[code] for code in range(1, 27)})
+
+
+@lru_cache(maxsize=1)
+def builtin_chargen() -> bytes:
+    """The built-in font laid out like the character ROM: upper case set, lower case set, each followed by its reversed half."""
+    upper = [bytes.fromhex(glyph) for glyph in UPPER_SET_GLYPHS.split()]
+    lower = [bytes.fromhex(LOWER_SET_GLYPHS[code]) if code in LOWER_SET_GLYPHS else glyph
+             for code, glyph in enumerate(upper)]
+    rom = bytearray()
+    for glyphs in (upper, lower):
+        rom += b"".join(glyphs)
+        rom += bytes(byte ^ 0xFF for glyph in glyphs for byte in glyph)
+    return bytes(rom)
+
+
+def load_chargen(path: Optional[str] = None) -> bytes:
+    """The character ROM from path or $C64_CHARGEN, else the built-in font. Raises ValueError for a file of the wrong size."""
+    path = path or os.getenv(CHARGEN_ENV)
+    if not path:
+        return builtin_chargen()
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) != CHARGEN_SIZE:
+        raise ValueError(f"'{path}' has {len(data)} bytes, a character ROM has {CHARGEN_SIZE}")
+    return data
+
+
+def encode_png(width: int, height: int, pixels: bytes, palette: List[Tuple[int, int, int]]) -> bytes:
+    """An 8-bit palette PNG of width x height palette indices, row by row."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    # Filter type 0 (none) in front of every row
+    raw = b"".join(b"\x00" + pixels[y * width:(y + 1) * width] for y in range(height))
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0))
+            + chunk(b"PLTE", b"".join(bytes(rgb) for rgb in palette))
+            + chunk(b"IDAT", zlib.compress(raw, 9))
+            + chunk(b"IEND", b""))
+
+
+@lru_cache(maxsize=4096)
+def _glyph_row(bits: int, foreground: int, background: int) -> bytes:
+    return bytes(foreground if bits & (0x80 >> x) else background for x in range(GLYPH_SIZE))
+
+
+class VicDisplay:
+    """The text mode picture the VIC-II shows of a machine's memory, read when asked."""
+
+    def __init__(self, memory: bytearray, chargen: Optional[bytes] = None):
+        self.memory = memory
+        self.chargen = chargen if chargen is not None else builtin_chargen()
+
+    # -------- registers --------
+    @property
+    def bank(self) -> int:
+        return (3 - (self.memory[CIA2_PORT_A] & 0x03)) * 0x4000
+
+    @property
+    def screen_address(self) -> int:
+        return self.bank + (self.memory[VIC_MEMORY_SETUP] >> 4) * 0x0400
+
+    @property
+    def charset_address(self) -> int:
+        return self.bank + (self.memory[VIC_MEMORY_SETUP] & 0x0E) * 0x0400
+
+    @property
+    def rom_charset(self) -> bool:
+        """Whether the character set comes from the character ROM."""
+        return self.bank in ROM_BANKS and self.charset_address - self.bank in ROM_CHARSETS
+
+    @property
+    def lower_case(self) -> bool:
+        return bool(self.memory[VIC_MEMORY_SETUP] & LOWER_CASE_SET)
+
+    @property
+    def border(self) -> int:
+        return self.memory[BORDER_COLOUR] & 0x0F
+
+    @property
+    def background(self) -> int:
+        return self.memory[BACKGROUND_COLOUR] & 0x0F
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.memory[VIC_CONTROL] & DISPLAY_ENABLE)
+
+    @property
+    def extended_colour(self) -> bool:
+        return bool(self.memory[VIC_CONTROL] & EXTENDED_COLOUR_MODE)
+
+    def mode(self) -> str:
+        if not self.enabled:
+            return "screen off"
+        if self.memory[VIC_CONTROL] & BITMAP_MODE:
+            return "bitmap mode (drawn as text mode)"
+        if self.memory[VIC_CONTROL_2] & MULTICOLOUR_MODE:
+            return "multicolour text mode (drawn in single colour)"
+        return "extended background colour text mode" if self.extended_colour else "text mode"
+
+    # -------- memory --------
+    def screen_codes(self) -> bytes:
+        start = self.screen_address
+        return bytes(self.memory[start:start + SCREEN_SIZE])
+
+    def colours(self) -> bytes:
+        """The colour of every character, from the low nibble of the colour RAM."""
+        return bytes(value & 0x0F for value in self.memory[COLOUR_RAM:COLOUR_RAM + SCREEN_SIZE])
+
+    def charset(self) -> bytes:
+        """The 256 glyphs of 8 bytes the VIC-II reads."""
+        if self.rom_charset:
+            start = ROM_CHARSETS[self.charset_address - self.bank]
+            return self.chargen[start:start + CHARSET_SIZE]
+        start = self.charset_address
+        glyphs = bytearray(self.memory[start:start + CHARSET_SIZE])
+        # Programs copy the ROM with machine code, which is not emulated, and redefine a few glyphs
+        for offset in range(0, CHARSET_SIZE, GLYPH_SIZE):
+            if not any(glyphs[offset:offset + GLYPH_SIZE]):
+                glyphs[offset:offset + GLYPH_SIZE] = self.chargen[offset:offset + GLYPH_SIZE]
+        return bytes(glyphs)
+
+    def _cells(self) -> Tuple[bytes, bytes, bytes]:
+        """Glyph, foreground and background colour of every character."""
+        codes = self.screen_codes()
+        if not self.extended_colour:
+            return codes, self.colours(), bytes([self.background]) * SCREEN_SIZE
+        backgrounds = [self.memory[BACKGROUND_COLOUR + i] & 0x0F for i in range(4)]
+        return (bytes(code & 0x3F for code in codes), self.colours(),
+                bytes(backgrounds[code >> 6] for code in codes))
+
+    # -------- rendering --------
+    def text(self) -> str:
+        """The screen as text, trailing blanks removed."""
+        table = LOWER_SET_TEXT if self.lower_case and self.rom_charset else UPPER_SET_TEXT
+        codes = self._cells()[0]
+        rows = []
+        for row in range(SCREEN_ROWS):
+            chars = []
+            for code in codes[row * SCREEN_COLUMNS:(row + 1) * SCREEN_COLUMNS]:
+                char = table[code & 0x7F]
+                chars.append(REVERSED_TEXT.get(char, char) if code & 0x80 else char)
+            rows.append("".join(chars).rstrip())
+        return "\n".join(rows).rstrip("\n")
+
+    def describe(self) -> str:
+        """Mode, colours and character set in a line or two, for a reader that cannot see the picture."""
+        if self.rom_charset:
+            charset = "lower/upper case" if self.lower_case else "upper case/graphics"
+        else:
+            start = self.charset_address
+            defined = sum(1 for offset in range(start, start + CHARSET_SIZE, GLYPH_SIZE)
+                          if any(self.memory[offset:offset + GLYPH_SIZE]))
+            charset = (f"custom character set at ${start:04X} ({defined} glyphs defined, the others drawn from "
+                       f"the ROM; text shows the ROM characters)")
+        text = (f"{self.mode()}, border {COLOUR_NAMES[self.border]}, background {COLOUR_NAMES[self.background]}, "
+                f"{charset}")
+        if self.screen_address != 0x0400:
+            text += f", screen at ${self.screen_address:04X}"
+        glyphs = self.charset()
+        codes, foregrounds, _ = self._cells()
+        used = Counter(colour for code, colour in zip(codes, foregrounds)
+                       if any(glyphs[code * GLYPH_SIZE:(code + 1) * GLYPH_SIZE]))
+        if used:
+            text += "\nCharacter colours: " + ", ".join(f"{COLOUR_NAMES[colour]} {count}" for colour, count in used.most_common())
+        return text
+
+    def pixels(self, scale: int = 1) -> Tuple[int, int, bytes]:
+        """Width, height and palette index of every pixel of the picture with border."""
+        scale = max(1, min(scale, MAX_SCALE))
+        width, height = PICTURE_WIDTH + 2 * BORDER_WIDTH, PICTURE_HEIGHT + 2 * BORDER_HEIGHT
+        if np is not None:
+            image = self._blit_numpy(width, height)
+            if scale > 1:
+                image = image.repeat(scale, axis=0).repeat(scale, axis=1)
+            return width * scale, height * scale, image.tobytes()
+
+        rows = self._blit(width, height)
+        if scale > 1:
+            rows = [bytes(value for value in row for _ in range(scale)) for row in rows for _ in range(scale)]
+        return width * scale, height * scale, b"".join(rows)
+
+    def _blit_numpy(self, width: int, height: int):
+        image = np.full((height, width), self.border, dtype=np.uint8)
+        if not self.enabled:
+            return image
+        codes, foregrounds, backgrounds = (np.frombuffer(data, dtype=np.uint8).reshape(SCREEN_ROWS, SCREEN_COLUMNS)
+                                           for data in self._cells())
+        glyphs = np.unpackbits(np.frombuffer(self.charset(), dtype=np.uint8)).reshape(256, GLYPH_SIZE, GLYPH_SIZE)
+        # (rows, columns, y, x) -> (rows, y, columns, x): one picture row per glyph row
+        cells = np.where(glyphs[codes], foregrounds[:, :, None, None], backgrounds[:, :, None, None])
+        image[BORDER_HEIGHT:BORDER_HEIGHT + PICTURE_HEIGHT, BORDER_WIDTH:BORDER_WIDTH + PICTURE_WIDTH] = \
+            cells.transpose(0, 2, 1, 3).reshape(PICTURE_HEIGHT, PICTURE_WIDTH)
+        return image
+
+    def _blit(self, width: int, height: int) -> List[bytes]:
+        border_row = bytes([self.border]) * width
+        if not self.enabled:
+            return [border_row] * height
+        side = bytes([self.border]) * BORDER_WIDTH
+        glyphs = self.charset()
+        codes, foregrounds, backgrounds = self._cells()
+        rows = [border_row] * BORDER_HEIGHT
+        for row in range(SCREEN_ROWS):
+            cells = range(row * SCREEN_COLUMNS, (row + 1) * SCREEN_COLUMNS)
+            for y in range(GLYPH_SIZE):
+                rows.append(side + b"".join(_glyph_row(glyphs[codes[i] * GLYPH_SIZE + y], foregrounds[i], backgrounds[i])
+                                            for i in cells) + side)
+        return rows + [border_row] * BORDER_HEIGHT
+
+    def png(self, scale: int = 1) -> bytes:
+        return encode_png(*self.pixels(scale), PALETTE)
+
+
+def run_to_display(source_text: str, keys="", max_statements: int = DEFAULT_MAX_STATEMENTS, seed: int = 0,
+                   chargen: Optional[bytes] = None) -> Tuple[RunResult, VicDisplay]:
+    """Runs a program headless with the compiled backend and returns the result and the display at its end."""
+    machine = Machine(keys if isinstance(keys, bytes) else parse_keys(keys), seed=seed)
+    result = CompiledInterpreter(compile_program(Program(source_text)), machine).run(max_statements)
+    return result, VicDisplay(machine.memory, chargen)
+
+# -----------------------------------------------------------------------------
+# Command Line Interface
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a C64 BASIC V2 program headless and show the screen it leaves.")
+    parser.add_argument('filename', nargs='?', help="Input filename (stdin if empty)")
+    parser.add_argument('--max-statements', type=int, default=DEFAULT_MAX_STATEMENTS,
+                        help=f"Statements to run at most (default {DEFAULT_MAX_STATEMENTS})")
+    parser.add_argument('--keys', default="", help="Keys for GET/INPUT; \\n or {RETURN} is RETURN")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the RND sequence")
+    parser.add_argument('--png', help="Write the picture to this PNG file")
+    parser.add_argument('--scale', type=int, default=2, help=f"Pixel size of the PNG, 1-{MAX_SCALE} (default 2)")
+    parser.add_argument('--chargen', help=f"Character ROM dump (default ${CHARGEN_ENV} or the built-in font)")
+
+    args = parser.parse_args()
+
+    if args.filename:
+        try:
+            with open(args.filename, 'r', encoding='utf-8', errors='replace') as f:
+                source_text = f.read()
+        except Exception as e:
+            logger.error(f"Error reading input: {e}")
+            sys.exit(3)
+    else:
+        source_text = sys.stdin.read()
+
+    try:
+        chargen = load_chargen(args.chargen)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading the character ROM: {e}")
+        sys.exit(3)
+
+    result, display = run_to_display(source_text, keys=args.keys.replace("\\n", "\n"),
+                                     max_statements=args.max_statements, seed=args.seed, chargen=chargen)
+    print(result.summary())
+    print(display.describe())
+    print(display.text())
+    if args.png:
+        try:
+            with open(args.png, 'wb') as f:
+                f.write(display.png(args.scale))
+        except OSError as e:
+            logger.error(f"Error writing {args.png}: {e}")
+            sys.exit(2)
+    sys.exit(1 if result.failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,485 @@
+"""
+Fuzz play-testing of C64 BASIC games.
+
+Runs a program headless with the compiled backend (c64_compiler) many times,
+each run typing another key stream, and reports where it crashes and how
+much of the program the runs reach:
+- key streams are random keys or grammar-guided: built from what the program
+  itself looks for, i.e. the strings and key codes GET and INPUT results are
+  compared with, the words in DATA (the vocabulary of text adventures) and
+  numbers for INPUT, and RETURN. Programs that use a joystick port address
+  get a random joystick state per run
+- every run has its own RND seed, derived from the fuzz seed like its keys,
+  so a report is reproducible and independent of the number of workers
+- the runs are spread over a process pool whose workers compile the program
+  once
+- runs ending with a runtime error or an infinite loop are grouped into crash
+  sites by line and error. The first run of each site is minimized: keys are
+  removed by delta debugging for as long as the run crashes the same way,
+  and seed 0 without joystick is preferred, so RuntimeCheck reproduces it
+- line coverage: the lines any run executed and the ranges none did
+
+Usage:
+    python utils/c64_fuzz.py game.bas [--runs N] [--mode grammar|random|mixed] [--seed N] [-j 8]
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from utils import c64_ast as ast
+    from utils.c64_basic import (
+        ERROR, HANG, Machine, Program, data_items, format_keys, formula_too_complex, parse_number, petscii_text,
+    )
+    from utils.c64_compiler import CompiledInterpreter, CompiledProgram, compile_program
+except ModuleNotFoundError:
+    import c64_ast as ast
+    from c64_basic import (
+        ERROR, HANG, Machine, Program, data_items, format_keys, formula_too_complex, parse_number, petscii_text,
+    )
+    from c64_compiler import CompiledInterpreter, CompiledProgram, compile_program
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RUNS = 200
+DEFAULT_RUN_STATEMENTS = 20000
+DEFAULT_MAX_KEYS = 40
+DEFAULT_CHUNK_SIZE = 16
+MAX_MINIMIZE_RUNS = 200
+MAX_UNCOVERED_RANGES = 20
+MAX_WORD_LENGTH = 20
+
+# Key stream modes
+GRAMMAR = 'grammar'
+RANDOM = 'random'
+MIXED = 'mixed'  # every other run grammar-guided
+MODES = (GRAMMAR, RANDOM, MIXED)
+
+# Keys of random streams: letters, digits, space, RETURN, cursor keys, F1-F7 and some punctuation
+RANDOM_KEYS = (b"ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 \r"
+               b"\x11\x91\x1d\x9d\x85\x86\x87\x88,.+-*/")
+# Numbers typed into INPUT besides the ones the program contains
+EXTRA_NUMBERS = (b"0", b"1", b"-1", b"99999", b"1.5", b"X")
+
+JOYSTICK_PORTS = (0xDC00, 0xDC01)
+# Pressed joystick bits (active low): up 1, down 2, left 4, right 8, fire 16
+JOYSTICK_STATES = (0, 1, 2, 4, 8, 16, 5, 6, 9, 10, 20, 24)
+
+ERROR_NAME_RE = re.compile(r"\?(.+?) ERROR")
+
+
+@dataclass
+class KeyGrammar:
+    """What a program reads: single key presses, words and numbers for INPUT, joystick ports."""
+    keys: List[bytes] = field(default_factory=list)
+    words: List[bytes] = field(default_factory=list)
+    numbers: List[bytes] = field(default_factory=list)
+    has_get: bool = False
+    has_input: bool = False
+    joystick: bool = False
+
+
+@dataclass
+class FuzzCase:
+    index: int
+    keys: bytes
+    seed: int
+    joystick: int = 0  # pressed bits, see JOYSTICK_STATES
+
+
+@dataclass
+class CaseResult:
+    index: int
+    status: str
+    message: str
+    line: Optional[int]
+    statements: int
+    keys_used: int
+    covered: List[int]  # indexes of the executed lines
+
+    @property
+    def site(self) -> Optional[Tuple[str, Optional[int], str]]:
+        """(status, line, error) of a crash, None for other runs."""
+        if self.status not in (ERROR, HANG):
+            return None
+        m = ERROR_NAME_RE.match(self.message)
+        return self.status, self.line, m.group(1) if m else self.status
+
+
+@dataclass
+class CrashSite:
+    status: str
+    line: Optional[int]
+    message: str
+    runs: int  # runs that crashed here
+    case: FuzzCase  # minimized reproducer
+    statements: int
+
+    def describe(self) -> str:
+        text = self.message if self.status == ERROR else f"{self.message} (line {self.line})"
+        text += f": {self.runs} run(s); reproduce with keys \"{format_keys(self.case.keys)}\""
+        extras = []
+        if self.case.seed:
+            extras.append(f"RND seed {self.case.seed}")
+        if self.case.joystick:
+            extras.append(f"joystick bits {self.case.joystick} held")
+        return text + (f" ({', '.join(extras)})" if extras else "")
+
+
+@dataclass
+class FuzzReport:
+    runs: int
+    mode: str
+    seed: int
+    crashes: List[CrashSite]
+    covered: List[int]  # line numbers any run executed
+    line_numbers: List[int]
+    statuses: Dict[str, int]
+    statements: int
+    seconds: float
+
+    @property
+    def coverage(self) -> float:
+        return len(self.covered) / len(self.line_numbers) if self.line_numbers else 1.0
+
+    def uncovered_ranges(self) -> List[Tuple[int, int]]:
+        """(first, last) line numbers of the runs of consecutive lines no run executed."""
+        covered = set(self.covered)
+        result, open_range = [], None
+        for number in self.line_numbers:
+            if number in covered:
+                if open_range:
+                    result.append(tuple(open_range))
+                    open_range = None
+            elif open_range:
+                open_range[1] = number
+            else:
+                open_range = [number, number]
+        if open_range:
+            result.append(tuple(open_range))
+        return result
+
+    def summary(self) -> str:
+        out = [f"Fuzzed {self.runs} run(s) ({self.mode} keys, seed {self.seed}) in {self.seconds:.1f}s, "
+               f"{self.statements} statements: {len(self.crashes)} crash site(s), "
+               f"{len(self.covered)} of {len(self.line_numbers)} lines covered ({self.coverage * 100:.0f}%)"]
+        if self.crashes:
+            out.append("Crash sites:")
+            out.extend(f"- {crash.describe()}" for crash in self.crashes)
+        out.append("Runs ended: " + ", ".join(f"{status} {count}" for status, count in
+                                              sorted(self.statuses.items(), key=lambda item: -item[1])))
+        ranges = self.uncovered_ranges()
+        if ranges:
+            shown = ", ".join(str(first) if first == last else f"{first}-{last}"
+                              for first, last in ranges[:MAX_UNCOVERED_RANGES])
+            more = f" and {len(ranges) - MAX_UNCOVERED_RANGES} more" if len(ranges) > MAX_UNCOVERED_RANGES else ""
+            out.append(f"Lines no run executed: {shown}{more}")
+        return "\n".join(out)
+
+
+# ------------------ Key streams ------------------
+
+def _iter_nodes(node):
+    """The node and all expressions below it."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+        yield node
+        kind = type(node)
+        if kind is ast.Binary:
+            stack.extend((node.left, node.right))
+        elif kind is ast.Unary:
+            stack.append(node.operand)
+        elif kind is ast.Paren:
+            stack.append(node.expr)
+        elif kind is ast.Call:
+            stack.extend(node.args)
+
+
+def _literal(node) -> Optional[bytes]:
+    if type(node) is ast.String:
+        text = petscii_text(node.text[1:-1] if node.closed else node.text[1:])
+        return text.encode('latin-1', errors='replace') if text else None
+    return None
+
+
+def _number(node) -> Optional[float]:
+    return parse_number(node.text) if type(node) is ast.Number else None
+
+
+def build_grammar(program: Program) -> KeyGrammar:
+    """Collects the keys, words and numbers the program compares its input with."""
+    grammar = KeyGrammar()
+    keys, words, numbers = set(), set(), set()
+    for line in program.lines:
+        for stmt in line.statements:
+            if type(stmt) is ast.Data:
+                for _, item in data_items(stmt.text):
+                    item = petscii_text(item.strip())
+                    if 1 < len(item) <= MAX_WORD_LENGTH and parse_number(item) is None:
+                        words.add(item.encode('latin-1', errors='replace'))
+            if type(stmt) is ast.Input and stmt.channel is None:
+                if stmt.keyword == 'GET':
+                    grammar.has_get = True
+                else:
+                    grammar.has_input = True
+            for expr in ast.statement_expressions(stmt):
+                for node in _iter_nodes(expr):
+                    if type(node) is ast.Number:
+                        value = _number(node)
+                        if value is not None and 0 <= value <= 100 and value == int(value):
+                            numbers.add(str(int(value)).encode())
+                        # PEEK(56320) or JS=56320:...:PEEK(JS)
+                        grammar.joystick = grammar.joystick or value in JOYSTICK_PORTS
+                    elif type(node) is ast.Binary and node.op in ('=', '<>'):
+                        for this, other in ((node.left, node.right), (node.right, node.left)):
+                            literal = _literal(this)
+                            if literal is not None:
+                                (keys if len(literal) == 1 else words).add(literal)
+                            elif type(this) is ast.Call and this.name == 'ASC':
+                                value = _number(other)
+                                if value is not None and 0 <= value < 256 and value == int(value):
+                                    keys.add(bytes([int(value)]))
+    grammar.keys = sorted(keys)
+    grammar.words = sorted(words)
+    grammar.numbers = sorted(numbers) + list(EXTRA_NUMBERS)
+    return grammar
+
+
+def grammar_keys(grammar: KeyGrammar, rng: random.Random, max_keys: int) -> bytes:
+    """A key stream of tokens the program looks for, mixed with RETURN and random keys."""
+    keys = bytearray()
+    while len(keys) < max_keys:
+        choice = rng.random()
+        if choice < 0.5 and grammar.keys:
+            keys += rng.choice(grammar.keys)
+        elif choice < 0.7 and grammar.words and grammar.has_input:
+            # A command of one or two words
+            words = rng.choice(grammar.words)
+            if rng.random() < 0.5:
+                words += b" " + rng.choice(grammar.words)
+            keys += words + b"\r"
+        elif choice < 0.7 and grammar.words:
+            keys += rng.choice(grammar.words)
+        elif choice < 0.85 and grammar.has_input:
+            keys += rng.choice(grammar.numbers) + b"\r"
+        elif choice < 0.9:
+            keys += b"\r"
+        else:
+            keys.append(rng.choice(RANDOM_KEYS))
+    return bytes(keys[:max_keys])
+
+
+def generate_cases(grammar: KeyGrammar, runs: int, mode: str = MIXED, seed: int = 0,
+                   max_keys: int = DEFAULT_MAX_KEYS) -> List[FuzzCase]:
+    """The key streams, RND seeds and joystick states of all runs, fixed by seed."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of {', '.join(MODES)}")
+    rng = random.Random(seed)
+    cases = []
+    for index in range(runs):
+        length = rng.randint(1, max_keys)
+        if mode == GRAMMAR or (mode == MIXED and index % 2 == 0):
+            keys = grammar_keys(grammar, rng, length)
+        else:
+            keys = bytes(rng.choice(RANDOM_KEYS) for _ in range(length))
+        joystick = rng.choice(JOYSTICK_STATES) if grammar.joystick else 0
+        cases.append(FuzzCase(index, keys, rng.randrange(1 << 31), joystick))
+    return cases
+
+
+# ------------------ Runs ------------------
+
+_compiled: Optional[CompiledProgram] = None  # the program of this worker process
+
+
+def _init_worker(source_text: str):
+    global _compiled
+    _compiled = compile_program(Program(source_text))
+
+
+def run_case(compiled: CompiledProgram, case: FuzzCase, max_statements: int) -> CaseResult:
+    machine = Machine(case.keys, seed=case.seed)
+    for port in JOYSTICK_PORTS:
+        machine.memory[port] &= ~case.joystick & 0xFF
+    interpreter = CompiledInterpreter(compiled, machine)
+    result = interpreter.run(max_statements)
+    covered = [li for li, count in enumerate(interpreter.line_counts) if count]
+    return CaseResult(case.index, result.status, result.message, result.line, result.statements,
+                      len(case.keys) - result.keys_left, covered)
+
+
+def minimize_case(compiled: CompiledProgram, case: FuzzCase, max_statements: int,
+                  max_runs: int = MAX_MINIMIZE_RUNS) -> Tuple[FuzzCase, CaseResult]:
+    """The smallest case found that crashes at the same site, with the result of its run."""
+    best = run_case(compiled, case, max_statements)
+    site = best.site
+    runs = 1
+
+    def crashes(candidate: FuzzCase) -> bool:
+        nonlocal best, runs
+        runs += 1
+        result = run_case(compiled, candidate, max_statements)
+        if result.site != site:
+            return False
+        best = result
+        return True
+
+    # Keys the run never read, then the defaults RuntimeCheck uses
+    for change in ({'keys': case.keys[:best.keys_used]}, {'seed': 0}, {'joystick': 0}):
+        candidate = replace(case, **change)
+        if candidate != case and crashes(candidate):
+            case = candidate
+    # Delta debugging: drop ever smaller chunks of keys
+    keys = case.keys
+    if keys and crashes(replace(case, keys=b"")):
+        keys = b""
+    chunks = 2
+    while len(keys) > 1 and runs < max_runs:
+        size = -(-len(keys) // chunks)
+        for start in range(0, len(keys), size):
+            candidate = keys[:start] + keys[start + size:]
+            if crashes(replace(case, keys=candidate)):
+                keys = candidate
+                chunks = max(chunks - 1, 2)
+                break
+            if runs >= max_runs:
+                break
+        else:
+            if chunks >= len(keys):
+                break
+            chunks = min(len(keys), chunks * 2)
+    # best is the run of the last case that crashed, i.e. of the result
+    return replace(case, keys=keys), best
+
+
+def _run_chunk(cases: List[FuzzCase], max_statements: int) -> List[CaseResult]:
+    """Pool worker: runs a chunk of cases on the worker's program."""
+    return [run_case(_compiled, case, max_statements) for case in cases]
+
+
+def _minimize(case: FuzzCase, max_statements: int) -> Tuple[FuzzCase, CaseResult]:
+    """Pool worker: minimizes the reproducer of one crash site."""
+    return minimize_case(_compiled, case, max_statements)
+
+
+def fuzz_program(source_text: str, runs: int = DEFAULT_RUNS, mode: str = MIXED, seed: int = 0,
+                 max_statements: int = DEFAULT_RUN_STATEMENTS, max_keys: int = DEFAULT_MAX_KEYS,
+                 jobs: Optional[int] = None, minimize: bool = True) -> FuzzReport:
+    """
+    Runs the program under runs key streams and collects crash sites and line coverage.
+
+    Args:
+        source_text: BASIC source.
+        runs: Number of runs.
+        mode: GRAMMAR, RANDOM or MIXED key streams.
+        seed: Fixes the key streams, RND seeds and joystick states.
+        max_statements: Statements of one run at most.
+        max_keys: Length of the longest key stream.
+        jobs: Worker processes, started with spawn (default: CPU count; 1 runs
+            in this process).
+        minimize: Minimize the reproducer of every crash site.
+
+    Returns:
+        FuzzReport; crash sites ordered by line.
+    """
+    started = time.perf_counter()
+    try:
+        program = Program(source_text)
+    except RecursionError:
+        # Too deeply nested to parse: every run stops right away with the same error
+        result = formula_too_complex(source_text, Machine(b""))
+        crash = CrashSite(result.status, result.line, result.message, runs, FuzzCase(0, b"", seed), 0)
+        return FuzzReport(runs=runs, mode=mode, seed=seed, crashes=[crash], covered=[], line_numbers=[],
+                          statuses={result.status: runs}, statements=0, seconds=time.perf_counter() - started)
+    cases = generate_cases(build_grammar(program), runs, mode, seed, max_keys)
+    chunks = [cases[i:i + DEFAULT_CHUNK_SIZE] for i in range(0, len(cases), DEFAULT_CHUNK_SIZE)]
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(chunks)))
+
+    def collect(run_chunks, minimize_cases):
+        results = [result for chunk in run_chunks(chunks) for result in chunk]
+        # The first run of each site in case order, independent of the workers
+        first: Dict[tuple, CaseResult] = {}
+        hits: Counter = Counter()
+        for result in results:
+            if result.site is not None:
+                first.setdefault(result.site, result)
+                hits[result.site] += 1
+        sites = sorted(first, key=lambda site: (site[1] is None, site[1] or 0, site[0], site[2]))
+        found = [cases[first[site].index] for site in sites]
+        minimized = minimize_cases(found) if minimize else [(case, first[site]) for case, site in zip(found, sites)]
+        crashes = [CrashSite(result.status, result.line, result.message, hits[site], case, result.statements)
+                   for site, (case, result) in zip(sites, minimized)]
+        return results, crashes
+
+    if jobs == 1:
+        # A local program: the module global is only for worker processes
+        compiled = compile_program(program)
+        results, crashes = collect(lambda items: [[run_case(compiled, case, max_statements) for case in chunk] for chunk in items],
+                                   lambda items: [minimize_case(compiled, case, max_statements) for case in items])
+    else:
+        # Spawned, not forked: forking the threads of the agent server can deadlock the workers
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(source_text,)) as pool:
+            results, crashes = collect(lambda items: list(pool.map(_run_chunk, items, repeat(max_statements))),
+                                       lambda items: list(pool.map(_minimize, items, repeat(max_statements))))
+
+    covered = sorted({li for result in results for li in result.covered})
+    return FuzzReport(
+        runs=len(results), mode=mode, seed=seed, crashes=crashes,
+        covered=[program.lines[li].number for li in covered],
+        line_numbers=[line.number for line in program.lines],
+        statuses=dict(Counter(result.status for result in results)),
+        statements=sum(result.statements for result in results),
+        seconds=time.perf_counter() - started,
+    )
+
+# -----------------------------------------------------------------------------
+# Command Line Interface
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzz play-test a C64 BASIC V2 program headless.")
+    parser.add_argument('filename', nargs='?', help="Input filename (stdin if empty)")
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help=f"Number of runs (default {DEFAULT_RUNS})")
+    parser.add_argument('--mode', choices=MODES, default=MIXED, help="Key streams (default mixed)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the key streams and RND seeds")
+    parser.add_argument('--max-statements', type=int, default=DEFAULT_RUN_STATEMENTS,
+                        help=f"Statements of one run at most (default {DEFAULT_RUN_STATEMENTS})")
+    parser.add_argument('--max-keys', type=int, default=DEFAULT_MAX_KEYS,
+                        help=f"Keys of the longest key stream (default {DEFAULT_MAX_KEYS})")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--no-minimize', action='store_true', help="Report the first crashing run as found")
+
+    args = parser.parse_args()
+
+    if args.filename:
+        try:
+            with open(args.filename, 'r', encoding='utf-8', errors='replace') as f:
+                source_text = f.read()
+        except Exception as e:
+            logger.error(f"Error reading input: {e}")
+            sys.exit(3)
+    else:
+        source_text = sys.stdin.read()
+
+    report = fuzz_program(source_text, runs=max(1, args.runs), mode=args.mode, seed=args.seed,
+                          max_statements=args.max_statements, max_keys=max(1, args.max_keys),
+                          jobs=args.jobs, minimize=not args.no_minimize)
+    print(report.summary())
+    sys.exit(1 if report.crashes else 0)
+
+if __name__ == '__main__':
+    main()
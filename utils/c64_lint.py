@@ -0,0 +1,266 @@
+"""
+C64 BASIC Corpus Linter
+
+Runs the syntax checker over whole directory trees, e.g. thousands of
+archived generated games, to track generation quality over time:
+- Directories are walked lazily and files are sent to a process pool in
+  chunks; only a bounded number of chunks is in flight at any time.
+- One JSON line per file is streamed as soon as its chunk completes.
+- Aggregate stats at the end: files/sec, an error histogram by message
+  (line numbers and quoted tokens are folded, so "GOTO target line 120 does
+  not exist" and "... 450 ..." count as one message) and the slowest files.
+
+Memory stays bounded regardless of corpus size: nothing but the histogram,
+the slowest-files heap and the in-flight chunks is kept.
+
+Usage:
+    python c64_lint.py DIR_OR_FILE [...] [-o results.jsonl] [-j 8] [--chunk 32] [--top 10]
+"""
+import argparse
+import heapq
+import json
+import os
+import re
+import sys
+import time
+import logging
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
+
+try:
+    from utils.c64_syntax_checker import SyntaxChecker
+except ModuleNotFoundError:
+    from c64_syntax_checker import SyntaxChecker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 32
+DEFAULT_TOP = 10
+# Chunks submitted per worker before waiting for results
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+QUOTED_RE = re.compile(r"'[^']*'")
+NUMBER_RE = re.compile(r"\d+")
+
+
+def message_key(message: str) -> str:
+    """Folds line numbers, sizes and quoted tokens out of an issue message."""
+    return NUMBER_RE.sub("N", QUOTED_RE.sub("'...'", message))
+
+
+def iter_sources(paths: Iterable[str], pattern: str = ".bas") -> Iterator[str]:
+    """Yields source files below the given paths in a stable order, without listing the tree first."""
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(pattern):
+                    yield os.path.join(root, name)
+
+
+def _chunks(items: Iterator[str], size: int) -> Iterator[List[str]]:
+    chunk: List[str] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def lint_file(path: str, options: Dict[str, object]) -> Dict[str, object]:
+    """
+    Checks one file and returns its JSON line as a dict. A file that cannot be
+    read or checked gives {"file": ..., "error": ...} instead of stopping the run.
+    """
+    started = time.perf_counter()
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            source = f.read()
+    except OSError as e:
+        return {"file": path, "error": str(e)}
+    try:
+        checker = SyntaxChecker()
+        checker.enable_reachability_warnings = options.get("reachability_warnings", True)
+        checker.reachability_mode = options.get("reachability_mode", "strict")
+        checker.load(source)
+        checker.validate()
+        data = checker.structured()
+    except Exception as e:
+        # e.g. RecursionError on deeply nested parentheses; one file must not fail the chunk
+        logger.warning(f"Could not check {path}: {type(e).__name__}: {e}")
+        return {"file": path, "error": f"{type(e).__name__}: {e}"}
+    return {
+        "file": path,
+        "lines": len(checker.lines),
+        "errors": data["summary"]["errors"],
+        "warnings": data["summary"]["warnings"],
+        "issues": data["issues"],
+        "seconds": round(time.perf_counter() - started, 6),
+    }
+
+
+def _lint_chunk(paths: List[str], options: Dict[str, object]) -> List[Dict[str, object]]:
+    """Pool worker: lints a chunk of files. Only takes picklable arguments."""
+    return [lint_file(path, options) for path in paths]
+
+
+class LintStats:
+    def __init__(self, top: int = DEFAULT_TOP):
+        self.top = top
+        self.files = 0
+        self.lines = 0
+        self.files_with_errors = 0
+        self.unreadable = 0
+        self.errors = 0
+        self.warnings = 0
+        self.error_histogram: Counter = Counter()
+        self.slowest: List[tuple] = []  # min-heap of (seconds, file)
+        self.started = time.perf_counter()
+
+    def add(self, result: Dict[str, object]) -> None:
+        self.files += 1
+        if "error" in result:
+            self.unreadable += 1
+            return
+        self.lines += result["lines"]
+        self.errors += result["errors"]
+        self.warnings += result["warnings"]
+        if result["errors"]:
+            self.files_with_errors += 1
+        for issue in result["issues"]:
+            if issue["severity"] == "ERROR":
+                self.error_histogram[message_key(issue["message"])] += 1
+        entry = (result["seconds"], result["file"])
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, entry)
+        elif entry > self.slowest[0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def to_dict(self) -> Dict[str, object]:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "files": self.files,
+            "lines": self.lines,
+            "files_with_errors": self.files_with_errors,
+            "unreadable": self.unreadable,
+            "errors": self.errors,
+            "warnings": self.warnings,
+            "seconds": round(elapsed, 3),
+            "files_per_sec": round(self.files / elapsed, 1) if elapsed > 0 else None,
+            "error_histogram": self.error_histogram.most_common(self.top),
+            "slowest": [{"file": f, "seconds": s} for s, f in sorted(self.slowest, reverse=True)],
+        }
+
+    def summary(self) -> str:
+        data = self.to_dict()
+        out = [f"Linted {data['files']} file(s), {data['lines']} line(s) in {data['seconds']}s "
+               f"({data['files_per_sec']} files/sec): {data['errors']} error(s), {data['warnings']} warning(s), "
+               f"{data['files_with_errors']} file(s) with errors, {data['unreadable']} unreadable or not checkable"]
+        if data["error_histogram"]:
+            out.append("Most frequent errors:")
+            out.extend(f"  {count:7d}  {message}" for message, count in data["error_histogram"])
+        if data["slowest"]:
+            out.append("Slowest files:")
+            out.extend(f"  {entry['seconds'] * 1000:9.2f} ms  {entry['file']}" for entry in data["slowest"])
+        return "\n".join(out)
+
+
+def lint_paths(paths: Iterable[str], output: Optional[TextIO] = None, jobs: Optional[int] = None,
+               chunk_size: int = DEFAULT_CHUNK_SIZE, top: int = DEFAULT_TOP,
+               options: Optional[Dict[str, object]] = None, pattern: str = ".bas") -> LintStats:
+    """
+    Lints every source below paths on a process pool.
+
+    Args:
+        paths: Files and directories to lint.
+        output: Stream for the JSON lines (not written if None).
+        jobs: Number of worker processes (default: CPU count).
+        chunk_size: Files per submitted task.
+        top: Length of the error histogram and slowest-files lists.
+        options: reachability_warnings / reachability_mode for the checker.
+        pattern: File name suffix of the sources.
+
+    Returns:
+        LintStats with the aggregate numbers.
+    """
+    options = dict(options or {})
+    stats = LintStats(top=top)
+    jobs = jobs or os.cpu_count() or 1
+    max_in_flight = jobs * CHUNKS_IN_FLIGHT_PER_WORKER
+    chunks = _chunks(iter_sources(paths, pattern), chunk_size)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        in_flight = set()
+        exhausted = False
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) < max_in_flight:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                else:
+                    in_flight.add(pool.submit(_lint_chunk, chunk, options))
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                for result in future.result():
+                    stats.add(result)
+                    if output is not None:
+                        output.write(json.dumps(result) + "\n")
+            if output is not None:
+                output.flush()
+    return stats
+
+# -----------------------------------------------------------------------------
+# Command Line Interface
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Lint C64 BASIC files in parallel and stream JSON lines.")
+    parser.add_argument('paths', nargs='+', help="Files or directories to lint")
+    parser.add_argument('-o', '--output', help="JSON lines output file (default: stdout)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--chunk', type=int, default=DEFAULT_CHUNK_SIZE, help=f"Files per task (default {DEFAULT_CHUNK_SIZE})")
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help=f"Entries in the error histogram and slowest list (default {DEFAULT_TOP})")
+    parser.add_argument('--pattern', default=".bas", help="File name suffix to lint (default .bas)")
+    parser.add_argument('--no-reach', action='store_true', help="Disable unreachable line warnings")
+    parser.add_argument('--stats-json', help="Write the aggregate stats as JSON to this file")
+
+    args = parser.parse_args()
+
+    missing = [p for p in args.paths if not os.path.exists(p)]
+    if missing:
+        logger.error(f"Input not found: {', '.join(missing)}")
+        sys.exit(3)
+
+    options = {"reachability_warnings": not args.no_reach}
+    try:
+        output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    except OSError as e:
+        logger.error(f"Unable to create output '{args.output}': {e}")
+        sys.exit(2)
+    try:
+        stats = lint_paths(args.paths, output=output, jobs=args.jobs, chunk_size=max(1, args.chunk),
+                           top=args.top, options=options, pattern=args.pattern)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    # The JSON lines may go to stdout, so the summary goes to stderr
+    print(stats.summary(), file=sys.stderr)
+    if args.stats_json:
+        try:
+            with open(args.stats_json, 'w', encoding='utf-8') as f:
+                json.dump(stats.to_dict(), f, indent=2)
+        except OSError as e:
+            logger.error(f"Unable to create output '{args.stats_json}': {e}")
+            sys.exit(2)
+    sys.exit(1 if stats.errors else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,361 @@
+"""
+C64 BASIC Language Server
+
+A Language Server Protocol front-end for the syntax checker, so editors show
+checker issues while .bas files are hand-edited:
+- Incremental text sync: didChange ranges are applied to the stored lines
+  without rebuilding the whole document.
+- Diagnostics are published from the checker's Issue objects. Analysis is
+  debounced: a burst of keystrokes triggers one re-check after the document
+  has been quiet for the debounce delay. Each document keeps a
+  CheckerSession, so a re-check only analyzes the edited lines.
+- Go to definition on a GOTO / GOSUB / THEN / ON ... GOTO target jumps to the
+  target line.
+
+Only the standard library is used; messages are JSON-RPC with Content-Length
+framing on stdin/stdout.
+
+Usage:
+    python c64_lsp.py [--debounce 0.3] [--no-reach] [--reach strict|relaxed]
+"""
+import argparse
+import json
+import sys
+import threading
+import logging
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, List, Optional
+
+try:
+    from utils.c64_syntax_checker import LINE_RE, CheckerSession, SyntaxChecker
+    from utils import c64_ast as ast
+except ModuleNotFoundError:
+    from c64_syntax_checker import LINE_RE, CheckerSession, SyntaxChecker
+    import c64_ast as ast
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEBOUNCE_SECONDS = 0.3
+DIAGNOSTIC_SOURCE = "c64-basic"
+
+# LSP constants
+SYNC_INCREMENTAL = 2
+SEVERITY = {"ERROR": 1, "WARN": 2}
+METHOD_NOT_FOUND = -32601
+SERVER_NOT_INITIALIZED = -32002
+
+
+def utf16_to_index(text: str, character: int) -> int:
+    """Converts an LSP character offset (UTF-16 code units) to a str index."""
+    if text.isascii():
+        return min(character, len(text))
+    units = 0
+    for i, ch in enumerate(text):
+        if units >= character:
+            return i
+        units += 2 if ord(ch) > 0xFFFF else 1
+    return len(text)
+
+
+def index_to_utf16(text: str, index: int) -> int:
+    if text.isascii():
+        return index
+    return sum(2 if ord(ch) > 0xFFFF else 1 for ch in text[:index])
+
+
+@dataclass
+class Document:
+    uri: str
+    version: int
+    lines: List[str]
+    session: CheckerSession
+    checker: Optional[SyntaxChecker] = None
+    checked_version: Optional[int] = None
+    timer: Optional[threading.Timer] = None
+    # Document row of every BASIC line number, from the last check
+    rows: Dict[int, int] = field(default_factory=dict)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+    def apply_change(self, change: Dict[str, object]) -> None:
+        """Applies one TextDocumentContentChangeEvent."""
+        new_text = change["text"].replace("\r\n", "\n").replace("\r", "\n")
+        rng = change.get("range")
+        if rng is None:
+            self.lines = new_text.split("\n")
+            return
+        start, end = rng["start"], rng["end"]
+        last = len(self.lines) - 1
+        l1, l2 = min(start["line"], last), min(end["line"], last)
+        if start["line"] > last:
+            # Insert at the end of the document
+            prefix, l1 = self.lines[last], last
+        else:
+            prefix = self.lines[l1][:utf16_to_index(self.lines[l1], start["character"])]
+        suffix = "" if end["line"] > last else self.lines[l2][utf16_to_index(self.lines[l2], end["character"]):]
+        self.lines[l1:l2 + 1] = (prefix + new_text + suffix).split("\n")
+
+
+class C64LanguageServer:
+    def __init__(self, reader: BinaryIO, writer: BinaryIO, debounce: float = DEFAULT_DEBOUNCE_SECONDS,
+                 enable_reachability_warnings: bool = True, reachability_mode: str = 'strict'):
+        self.reader = reader
+        self.writer = writer
+        self.debounce = debounce
+        self.enable_reachability_warnings = enable_reachability_warnings
+        self.reachability_mode = reachability_mode
+        self.documents: Dict[str, Document] = {}
+        self.initialized = False
+        self.shutdown_requested = False
+        # Analysis runs on timer threads; one lock guards the documents, one the output stream
+        self.lock = threading.RLock()
+        self.write_lock = threading.Lock()
+        self.handlers = {
+            "initialize": self.on_initialize,
+            "initialized": lambda params: None,
+            "shutdown": self.on_shutdown,
+            "textDocument/didOpen": self.on_did_open,
+            "textDocument/didChange": self.on_did_change,
+            "textDocument/didSave": self.on_did_save,
+            "textDocument/didClose": self.on_did_close,
+            "textDocument/definition": self.on_definition,
+        }
+
+    # ------------------ JSON-RPC transport ------------------
+    def read_message(self) -> Optional[Dict[str, object]]:
+        """Reads one framed message; returns None at end of input."""
+        length = None
+        while True:
+            header = self.reader.readline()
+            if not header:
+                return None
+            header = header.strip()
+            if not header:
+                break
+            name, _, value = header.decode("ascii").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value.strip())
+        if length is None:
+            return None
+        return json.loads(self.reader.read(length).decode("utf-8"))
+
+    def send(self, message: Dict[str, object]) -> None:
+        message["jsonrpc"] = "2.0"
+        body = json.dumps(message).encode("utf-8")
+        with self.write_lock:
+            self.writer.write(f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body)
+            self.writer.flush()
+
+    def notify(self, method: str, params: Dict[str, object]) -> None:
+        self.send({"method": method, "params": params})
+
+    def serve(self) -> int:
+        """Handles messages until exit; returns the process exit code."""
+        while True:
+            message = self.read_message()
+            if message is None:
+                return 1
+            method = message.get("method")
+            if method == "exit":
+                return 0 if self.shutdown_requested else 1
+            self.dispatch(message)
+
+    def dispatch(self, message: Dict[str, object]) -> None:
+        method = message.get("method")
+        msg_id = message.get("id")
+        handler = self.handlers.get(method)
+        if handler is None:
+            if msg_id is not None:
+                self.send({"id": msg_id, "error": {"code": METHOD_NOT_FOUND, "message": f"Unknown method {method}"}})
+            return
+        if not self.initialized and method != "initialize":
+            if msg_id is not None:
+                self.send({"id": msg_id, "error": {"code": SERVER_NOT_INITIALIZED, "message": "Server not initialized"}})
+            return
+        try:
+            result = handler(message.get("params") or {})
+        except Exception as e:
+            logger.exception(f"Error handling {method}")
+            if msg_id is not None:
+                self.send({"id": msg_id, "error": {"code": -32603, "message": str(e)}})
+            return
+        if msg_id is not None:
+            self.send({"id": msg_id, "result": result})
+
+    # ------------------ Lifecycle ------------------
+    def on_initialize(self, params):
+        self.initialized = True
+        return {
+            "capabilities": {
+                "textDocumentSync": {"openClose": True, "change": SYNC_INCREMENTAL, "save": {"includeText": False}},
+                "definitionProvider": True,
+            },
+            "serverInfo": {"name": "c64-basic-lsp"},
+        }
+
+    def on_shutdown(self, params):
+        self.shutdown_requested = True
+        with self.lock:
+            for doc in self.documents.values():
+                if doc.timer is not None:
+                    doc.timer.cancel()
+        return None
+
+    # ------------------ Document sync ------------------
+    def on_did_open(self, params):
+        item = params["textDocument"]
+        session = CheckerSession()
+        session.enable_reachability_warnings = self.enable_reachability_warnings
+        session.reachability_mode = self.reachability_mode
+        text = item["text"].replace("\r\n", "\n").replace("\r", "\n")
+        with self.lock:
+            self.documents[item["uri"]] = Document(item["uri"], item.get("version", 0), text.split("\n"), session)
+        self.analyze(item["uri"])
+
+    def on_did_change(self, params):
+        uri = params["textDocument"]["uri"]
+        with self.lock:
+            doc = self.documents.get(uri)
+            if doc is None:
+                return
+            for change in params["contentChanges"]:
+                doc.apply_change(change)
+            doc.version = params["textDocument"].get("version", doc.version + 1)
+            self.schedule(doc)
+
+    def on_did_save(self, params):
+        self.analyze(params["textDocument"]["uri"])
+
+    def on_did_close(self, params):
+        uri = params["textDocument"]["uri"]
+        with self.lock:
+            doc = self.documents.pop(uri, None)
+            if doc is not None and doc.timer is not None:
+                doc.timer.cancel()
+        self.notify("textDocument/publishDiagnostics", {"uri": uri, "diagnostics": []})
+
+    # ------------------ Analysis ------------------
+    def schedule(self, doc: Document) -> None:
+        """Restarts the document's debounce timer."""
+        if doc.timer is not None:
+            doc.timer.cancel()
+        doc.timer = threading.Timer(self.debounce, self.analyze, args=(doc.uri,))
+        doc.timer.daemon = True
+        doc.timer.start()
+
+    def analyze(self, uri: str) -> Optional[Document]:
+        """Checks the current text of the document (if not checked yet) and publishes its diagnostics."""
+        with self.lock:
+            doc = self.documents.get(uri)
+            if doc is None:
+                return None
+            if doc.timer is not None:
+                doc.timer.cancel()
+                doc.timer = None
+            if doc.checked_version == doc.version and doc.checker is not None:
+                return doc
+            doc.checker = doc.session.update(doc.text)
+            doc.checked_version = doc.version
+            doc.rows = self._line_rows(doc.lines)
+            diagnostics = self._diagnostics(doc)
+            version = doc.version
+        self.notify("textDocument/publishDiagnostics", {"uri": uri, "version": version, "diagnostics": diagnostics})
+        return doc
+
+    @staticmethod
+    def _line_rows(lines: List[str]) -> Dict[int, int]:
+        rows = {}
+        for row, text in enumerate(lines):
+            m = LINE_RE.match(text.strip())
+            if m:
+                rows.setdefault(int(m.group(1)), row)
+        return rows
+
+    def _diagnostics(self, doc: Document) -> List[Dict[str, object]]:
+        diagnostics = []
+        for issue in doc.checker.issues:
+            # Program-wide issues (memory, missing RETURN) are shown on the first line
+            row = doc.rows.get(issue.line, 0) if issue.line is not None else 0
+            text = doc.lines[row] if row < len(doc.lines) else ""
+            diagnostics.append({
+                "range": {"start": {"line": row, "character": len(text) - len(text.lstrip())},
+                          "end": {"line": row, "character": index_to_utf16(text, len(text))}},
+                "severity": SEVERITY.get(issue.severity, 3),
+                "source": DIAGNOSTIC_SOURCE,
+                "message": issue.message,
+            })
+        return diagnostics
+
+    # ------------------ Go to definition ------------------
+    def on_definition(self, params):
+        uri = params["textDocument"]["uri"]
+        # Answer from the current text, even if the debounce timer is still pending
+        doc = self.analyze(uri)
+        if doc is None:
+            return None
+        with self.lock:
+            row = params["position"]["line"]
+            if row >= len(doc.lines):
+                return None
+            target = self.jump_target_at(doc, row, params["position"]["character"])
+            if target is None or target not in doc.rows:
+                return None
+            target_row = doc.rows[target]
+            return {"uri": uri, "range": {"start": {"line": target_row, "character": 0},
+                                          "end": {"line": target_row, "character": 0}}}
+
+    def jump_target_at(self, doc: Document, row: int, character: int) -> Optional[int]:
+        """Line number of the jump target under the cursor, or None."""
+        text = doc.lines[row]
+        m = LINE_RE.match(text.strip())
+        if not m:
+            return None
+        content_start = len(text) - len(text.lstrip()) + m.start(2)
+        cursor = utf16_to_index(text, character) - content_start
+        # Jump targets with their offsets in the content, from the parsed line
+        targets = []
+        for stmt in ast.iter_statements(ast.parse_line(m.group(2)).statements):
+            kind = type(stmt)
+            if kind is ast.Jump and stmt.target is not None:
+                targets.append((stmt.target, stmt.target_pos))
+            elif kind is ast.If and stmt.then_target is not None:
+                targets.append((stmt.then_target, stmt.then_pos))
+            elif kind is ast.On:
+                targets.extend((target, pos) for target, pos in stmt.targets if target is not None)
+        content = m.group(2)
+        for target, pos in targets:
+            end = pos
+            while end < len(content) and content[end].isdigit():
+                end += 1
+            # The cursor may also sit right behind the number, e.g. at the end of "GOTO 100"
+            if pos <= cursor <= end:
+                break
+        else:
+            return None
+        # Plain GOTO / GOSUB / THEN targets are edges of the CFG; ON lists are validated against the line map
+        edges = doc.checker.cfg_edges.get(int(m.group(1)), [])
+        return target if target in edges or target in doc.checker.line_map else None
+
+# -----------------------------------------------------------------------------
+# Command Line Interface
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="C64 BASIC language server (LSP over stdio).")
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE_SECONDS,
+                        help=f"Seconds of inactivity before re-checking (default {DEFAULT_DEBOUNCE_SECONDS})")
+    parser.add_argument('--no-reach', action='store_true', help="Disable unreachable line warnings")
+    parser.add_argument('--reach', choices=('strict', 'relaxed'), default='strict', help="Reachability mode")
+
+    args = parser.parse_args()
+
+    # stdout carries the protocol, so logging goes to stderr
+    logging.basicConfig(stream=sys.stderr, level=logging.WARNING)
+    server = C64LanguageServer(sys.stdin.buffer, sys.stdout.buffer, debounce=args.debounce,
+                               enable_reachability_warnings=not args.no_reach, reachability_mode=args.reach)
+    sys.exit(server.serve())
+
+if __name__ == '__main__':
+    main()
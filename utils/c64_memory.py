@@ -0,0 +1,760 @@
+"""
+C64 BASIC Memory Footprint Analyzer
+
+Estimates how much of the 38911 bytes of BASIC RAM ($0801-$9FFF) a program
+needs once it runs, so a program that would stop with ?OUT OF MEMORY is
+caught before it is converted and uploaded:
+- Program text: exact tokenized size, computed with Bas2Prg.
+- Simple variables: 7 bytes per variable (2 name + 5 value bytes for every
+  type) and per DEF FN function.
+- Arrays: 5 header bytes + 2 per dimension + 5/2/3 bytes per float/integer/
+  string element. DIM sizes are resolved from literals and variables that
+  are only ever assigned a constant; undimensioned arrays get the implicit
+  DIM of 10 per dimension.
+- String heap: estimated live string data. String literals and READ point
+  into the program text and take no heap; GET, INPUT, concatenation and
+  string functions do. Unknown lengths count as one screen row (40 chars).
+
+Variable names are significant to two characters plus the type suffix, the
+same way the interpreter stores them; TI, TI$ and ST take no space.
+
+Usage:
+    python c64_memory.py program.bas [--json]
+"""
+import argparse
+import ast
+import json
+import sys
+import logging
+from collections import Counter
+from dataclasses import dataclass, field, asdict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from utils.bas2prg import Bas2Prg, LINE_NUMBER_RE
+    from utils.bas_crunch import CRUNCH_LINE_RE, TOKEN, STRING, SPACE, CHAR, Piece, lex_line, join_pieces, split_statements
+except ModuleNotFoundError:
+    from bas2prg import Bas2Prg, LINE_NUMBER_RE
+    from bas_crunch import CRUNCH_LINE_RE, TOKEN, STRING, SPACE, CHAR, Piece, lex_line, join_pieces, split_statements
+
+logger = logging.getLogger(__name__)
+
+BASIC_RAM_BYTES = 38911
+VARIABLE_ENTRY_BYTES = 7
+ARRAY_HEADER_BYTES = 5
+ARRAY_DIMENSION_BYTES = 2
+ELEMENT_BYTES = {"float": 5, "integer": 2, "string": 3}
+DEFAULT_DIM = 10
+UNKNOWN_STRING_LENGTH = 40
+INPUT_BUFFER_LENGTH = 80
+MAX_STRING_LENGTH = 255
+SYSTEM_VARIABLES = {"TI", "TI$", "ST"}
+
+# Estimated result length of the string functions
+STRING_FUNCTION_LENGTHS = {"CHR$": 1, "STR$": 10}
+
+
+class ProgramTooLargeError(ValueError):
+    """Raised when a program cannot fit into BASIC RAM."""
+
+
+@dataclass
+class ArrayInfo:
+    name: str
+    dims: List[int]
+    element_type: str
+    bytes: int
+    declared: bool = True
+
+
+@dataclass
+class MemoryReport:
+    program_bytes: int = 0
+    variable_bytes: int = 0
+    array_bytes: int = 0
+    string_heap_bytes: int = 0
+    string_building_statements: int = 0
+    variables: List[str] = field(default_factory=list)
+    arrays: List[ArrayInfo] = field(default_factory=list)
+    notes: List[str] = field(default_factory=list)
+    basic_ram_bytes: int = BASIC_RAM_BYTES
+
+    @property
+    def static_bytes(self) -> int:
+        """Program text, variable table and arrays: known before the program runs."""
+        return self.program_bytes + self.variable_bytes + self.array_bytes
+
+    @property
+    def total_bytes(self) -> int:
+        return self.static_bytes + self.string_heap_bytes
+
+    @property
+    def free_bytes(self) -> int:
+        return self.basic_ram_bytes - self.total_bytes
+
+    @property
+    def fits(self) -> bool:
+        """False if program, variables and arrays alone exceed BASIC RAM."""
+        return self.static_bytes <= self.basic_ram_bytes
+
+    def to_dict(self) -> Dict[str, object]:
+        data = asdict(self)
+        data.update(static_bytes=self.static_bytes, total_bytes=self.total_bytes,
+                    free_bytes=self.free_bytes, fits=self.fits)
+        return data
+
+    def summary(self) -> str:
+        return (f"Program {self.program_bytes} bytes, variables {self.variable_bytes} bytes, "
+                f"arrays {self.array_bytes} bytes, string heap ~{self.string_heap_bytes} bytes: "
+                f"~{self.total_bytes} of {self.basic_ram_bytes} bytes of BASIC RAM")
+
+
+@dataclass
+class StatementFacts:
+    """What one statement contributes, independent of the rest of the program."""
+    pieces: List[Piece]
+    # (variable key, assigned expression); None for FOR, INPUT, READ and GET targets
+    assignments: List[Tuple[str, Optional[List[Piece]]]] = field(default_factory=list)
+    dims: List[Tuple[str, List[List[Piece]]]] = field(default_factory=list)  # DIM name(dim expressions)
+    function: Optional[Tuple[str, str]] = None  # DEF FN (key, name)
+    names: List[Tuple[str, str, Optional[int]]] = field(default_factory=list)  # (key, name, array dimensions)
+    string_inputs: List[Tuple[str, int]] = field(default_factory=list)  # GET/INPUT string targets and lengths
+    string_assignment: Optional[Tuple[str, List[Piece]]] = None  # (name, expression)
+
+
+def variable_key(name: str) -> str:
+    """Interpreter identity of a variable name: first two characters plus suffix."""
+    suffix = name[-1] if name[-1] in "$%" else ""
+    return name[:len(name) - len(suffix)][:2] + suffix
+
+
+def element_type(name: str) -> str:
+    if name.endswith("$"):
+        return "string"
+    if name.endswith("%"):
+        return "integer"
+    return "float"
+
+
+def tokenized_size(source_text: str, converter: Optional[Bas2Prg] = None) -> int:
+    """Size of the program in memory: the PRG without its 2 byte load address."""
+    converter = converter or Bas2Prg()
+    # The lines are added up instead of packed into a PRG: no buffer is built, the
+    # tokenized lines come from the converter's cache, and link addresses may
+    # overflow 16 bits
+    size = 2
+    for raw_line in source_text.splitlines():
+        if raw_line:
+            size += _line_bytes(raw_line, converter)
+    return size
+
+
+def _line_bytes(raw_line: str, converter: Bas2Prg) -> int:
+    """Bytes of one non-empty source line in memory: link, line number, tokens and terminator."""
+    content = LINE_NUMBER_RE.match(raw_line).group(2)
+    return 4 + len(converter._tokenize_cached(converter._prepare_content(content)))
+
+
+def _code_pieces(statement: List[Piece]) -> List[Piece]:
+    return [p for p in statement if p[0] != SPACE]
+
+
+def _read_name(pieces: List[Piece], i: int) -> Tuple[Optional[str], int]:
+    """Reads a variable name starting at pieces[i]; returns (name, next index)."""
+    if i >= len(pieces) or pieces[i][0] != CHAR or not pieces[i][1].isalpha():
+        return None, i
+    name = pieces[i][1]
+    i += 1
+    while i < len(pieces) and pieces[i][0] == CHAR and pieces[i][1].isalnum():
+        name += pieces[i][1]
+        i += 1
+    if i < len(pieces) and pieces[i][0] == CHAR and pieces[i][1] in "$%":
+        name += pieces[i][1]
+        i += 1
+    return name.upper(), i
+
+
+def _skip_number(pieces: List[Piece], i: int) -> int:
+    """Skips a numeric literal such as 12, .5 or 1E-3 starting at pieces[i]."""
+    while i < len(pieces) and pieces[i][0] == CHAR and (pieces[i][1].isdigit() or pieces[i][1] == "."):
+        i += 1
+    if i < len(pieces) and pieces[i] == (CHAR, "E"):
+        j = i + 1
+        if j < len(pieces) and pieces[j] in ((TOKEN, "+"), (TOKEN, "-")):
+            j += 1
+        if j < len(pieces) and pieces[j][0] == CHAR and pieces[j][1].isdigit():
+            i = j
+            while i < len(pieces) and pieces[i][0] == CHAR and pieces[i][1].isdigit():
+                i += 1
+    return i
+
+
+def _split_top_level(pieces: List[Piece]) -> List[List[Piece]]:
+    """Splits pieces on commas outside parentheses."""
+    parts: List[List[Piece]] = [[]]
+    depth = 0
+    for piece in pieces:
+        if piece[0] == CHAR and piece[1] == "(" or piece in ((TOKEN, "TAB("), (TOKEN, "SPC(")):
+            depth += 1
+        elif piece == (CHAR, ")"):
+            depth -= 1
+        elif piece == (CHAR, ",") and depth == 0:
+            parts.append([])
+            continue
+        parts[-1].append(piece)
+    return parts
+
+
+def _closing_paren(pieces: List[Piece], open_idx: int) -> int:
+    depth = 0
+    for idx in range(open_idx, len(pieces)):
+        if pieces[idx] == (CHAR, "(") or pieces[idx] in ((TOKEN, "TAB("), (TOKEN, "SPC(")):
+            depth += 1
+        elif pieces[idx] == (CHAR, ")"):
+            depth -= 1
+            if depth == 0:
+                return idx
+    return len(pieces)
+
+
+_ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Add, ast.Sub,
+                  ast.Mult, ast.Div, ast.USub, ast.UAdd)
+
+
+def _evaluate(pieces: List[Piece], constants: Dict[str, float]) -> Optional[float]:
+    """Evaluates a constant arithmetic expression, None if it depends on anything else."""
+    parts = []
+    i = 0
+    while i < len(pieces):
+        kind, text = pieces[i]
+        if kind == CHAR and (text.isdigit() or text == "."):
+            end = _skip_number(pieces, i)
+            parts.append(join_pieces(pieces[i:end]))
+            i = end
+            continue
+        name, end = _read_name(pieces, i)
+        if name is not None:
+            value = constants.get(variable_key(name))
+            if value is None:
+                return None
+            parts.append(repr(value))
+            i = end
+            continue
+        if (kind == TOKEN and text in "+-*/") or (kind == CHAR and text in "()"):
+            parts.append(text)
+            i += 1
+            continue
+        return None
+    return _evaluate_text("".join(parts))
+
+
+@lru_cache(maxsize=4096)
+def _evaluate_text(text: str) -> Optional[float]:
+    try:
+        tree = ast.parse(text, mode="eval")
+    except (SyntaxError, RecursionError):
+        # RecursionError: a very long chain such as 1+1+...+1 is too deep for Python's parser
+        return None
+    if not all(isinstance(node, _ALLOWED_NODES) for node in ast.walk(tree)):
+        return None
+    try:
+        return float(eval(compile(tree, "<dim>", "eval"), {"__builtins__": {}}))
+    except (ZeroDivisionError, OverflowError):
+        return None
+
+
+def _string_length(pieces: List[Piece], constants: Dict[str, float]) -> Tuple[int, bool]:
+    """
+    Estimated length of a string expression.
+
+    Returns:
+        (length, allocates): allocates is False for a bare string literal,
+        whose descriptor points into the program text.
+    """
+    code = _code_pieces(pieces)
+    if len(code) == 1 and code[0][0] == STRING:
+        return 0, False
+    length = 0
+    i = 0
+    while i < len(code):
+        kind, text = code[i]
+        if kind == STRING:
+            length += len(text.strip('"'))
+        elif kind == TOKEN and text in STRING_FUNCTION_LENGTHS:
+            length += STRING_FUNCTION_LENGTHS[text]
+            i = _closing_paren(code, i + 1)
+        elif kind == TOKEN and text in ("LEFT$", "RIGHT$", "MID$"):
+            close = _closing_paren(code, i + 1)
+            args = _split_top_level(code[i + 2:close])
+            count = _evaluate(args[-1], constants) if len(args) > 1 else None
+            if text == "MID$" and len(args) < 3:
+                count = None
+            length += int(count) if count is not None else UNKNOWN_STRING_LENGTH
+            i = close
+        elif kind == CHAR and text.isalpha():
+            name, end = _read_name(code, i)
+            if name.endswith("$"):
+                length += UNKNOWN_STRING_LENGTH
+            if end < len(code) and code[end] == (CHAR, "("):
+                end = _closing_paren(code, end) + 1
+            i = end
+            continue
+        i += 1
+    return min(length, MAX_STRING_LENGTH), True
+
+
+class MemoryAnalyzer:
+    def __init__(self, basic_ram_bytes: int = BASIC_RAM_BYTES):
+        self.basic_ram_bytes = basic_ram_bytes
+
+    def analyze(self, source_text: str, program_bytes: Optional[int] = None,
+                converter: Optional[Bas2Prg] = None,
+                line_cache: Optional[Dict[str, List[StatementFacts]]] = None) -> MemoryReport:
+        """
+        Args:
+            source_text: BASIC source with line numbers.
+            program_bytes: Tokenized program size if already known (PRG size
+                without the load address); computed with Bas2Prg otherwise.
+            converter: Bas2Prg used for the size, e.g. one with a warm line cache.
+            line_cache: Line content -> StatementFacts, kept by the caller so
+                unchanged lines are not lexed again when the program is edited.
+        """
+        report = MemoryReport(basic_ram_bytes=self.basic_ram_bytes)
+        if program_bytes is None:
+            program_bytes = tokenized_size(source_text, converter)
+        report.program_bytes = program_bytes
+
+        statements: List[StatementFacts] = []
+        for raw in source_text.splitlines():
+            m = CRUNCH_LINE_RE.match(raw)
+            if m:
+                statements.extend(self._line_facts(m.group(2), line_cache))
+
+        constants = self._constants(statements)
+        simple: Dict[str, str] = {}
+        arrays: Dict[str, ArrayInfo] = {}
+        string_lengths: Dict[str, int] = {}
+
+        def note(name: str, length: int) -> None:
+            key = variable_key(name)
+            string_lengths[key] = max(string_lengths.get(key, 0), length)
+
+        for facts in statements:
+            for name, dim_exprs in facts.dims:
+                arrays[variable_key(name)] = self._array(name, self._dimensions(name, dim_exprs, constants, report),
+                                                         declared=True)
+            if facts.function is not None:
+                simple.setdefault(*facts.function)
+            for key, name, num_dims in facts.names:
+                if num_dims is not None:
+                    if key not in arrays:
+                        arrays[key] = self._array(name, [DEFAULT_DIM] * num_dims, declared=False)
+                elif key not in SYSTEM_VARIABLES:
+                    simple.setdefault(key, name)
+            for name, length in facts.string_inputs:
+                note(name, length)
+            if facts.string_assignment is not None:
+                name, expr = facts.string_assignment
+                length, allocates = _string_length(expr, constants)
+                if allocates:
+                    report.string_building_statements += 1
+                    note(name, length)
+
+        report.variables = sorted(simple.values())
+        report.variable_bytes = VARIABLE_ENTRY_BYTES * len(simple)
+        report.arrays = sorted(arrays.values(), key=lambda a: a.name)
+        report.array_bytes = sum(a.bytes for a in arrays.values())
+
+        heap = 0
+        for key, length in string_lengths.items():
+            array = arrays.get(key)
+            if array is not None:
+                elements = 1
+                for dim in array.dims:
+                    elements *= dim + 1
+                heap += elements * length
+            else:
+                heap += length
+        report.string_heap_bytes = heap
+        return report
+
+    # ------------------ Passes ------------------
+    def _line_facts(self, content: str,
+                    line_cache: Optional[Dict[str, List[StatementFacts]]] = None) -> List[StatementFacts]:
+        facts = line_cache.get(content) if line_cache is not None else None
+        if facts is None:
+            facts = [self._statement_facts(_code_pieces(stmt)) for stmt in split_statements(lex_line(content))]
+            if line_cache is not None:
+                line_cache[content] = facts
+        return facts
+
+    def _statement_facts(self, stmt: List[Piece]) -> StatementFacts:
+        facts = StatementFacts(pieces=stmt)
+        self._collect_assignments(stmt, facts)
+        if not stmt or stmt[0] == (TOKEN, "DATA"):
+            return facts
+        first = stmt[0]
+        if first == (TOKEN, "DIM"):
+            for part in _split_top_level(stmt[1:]):
+                name, i = _read_name(part, 0)
+                if name is None or i >= len(part) or part[i] != (CHAR, "("):
+                    continue
+                close = _closing_paren(part, i)
+                facts.dims.append((name, _split_top_level(part[i + 1:close])))
+        if first == (TOKEN, "DEF"):
+            # DEF FN entries live in the variable table like simple variables
+            name, _ = _read_name(stmt, 2)
+            if name:
+                facts.function = ("FN" + variable_key(name), "FN" + name)
+        self._collect_names(stmt, facts)
+        self._collect_strings(stmt, facts)
+        return facts
+
+    def _collect_assignments(self, stmt: List[Piece], facts: StatementFacts) -> None:
+        body = stmt[1:] if stmt[:1] == [(TOKEN, "LET")] else stmt
+        name, i = _read_name(body, 0)
+        if name is not None and i < len(body) and body[i] == (TOKEN, "="):
+            facts.assignments.append((variable_key(name), body[i + 1:]))
+        # FOR, INPUT, READ and GET also assign: a constant there is not a constant
+        for j, piece in enumerate(body):
+            if piece in ((TOKEN, "FOR"), (TOKEN, "INPUT"), (TOKEN, "READ"), (TOKEN, "GET")):
+                for part in _split_top_level(body[j + 1:]):
+                    target, _ = _read_name([p for p in part if p[0] != STRING and p != (CHAR, ";")], 0)
+                    if target is not None:
+                        facts.assignments.append((variable_key(target), None))
+
+    def _constants(self, statements: List[StatementFacts]) -> Dict[str, float]:
+        """
+        Variables that are only ever assigned one constant expression, which
+        may use other such variables (N=100:M=N*2).
+        """
+        assigned: Dict[str, List[Optional[List[Piece]]]] = {}
+        for facts in statements:
+            for key, expr in facts.assignments:
+                assigned.setdefault(key, []).append(expr)
+
+        candidates = {key: exprs[0] for key, exprs in assigned.items()
+                      if exprs[0] is not None and all(e == exprs[0] for e in exprs)}
+        return self._resolve_constants(candidates)
+
+    @staticmethod
+    def _resolve_constants(candidates: Dict[str, List[Piece]]) -> Dict[str, float]:
+        """Values of the candidate expressions that are constant, given the other candidates."""
+        candidates = dict(candidates)
+        constants: Dict[str, float] = {}
+        changed = True
+        while changed:
+            changed = False
+            for key, expr in list(candidates.items()):
+                value = _evaluate(expr, constants)
+                if value is not None:
+                    constants[key] = value
+                    del candidates[key]
+                    changed = True
+        return constants
+
+    def _dimensions(self, name: str, dim_exprs: List[List[Piece]], constants: Dict[str, float],
+                    report: MemoryReport) -> List[int]:
+        dims = []
+        for dim_expr in dim_exprs:
+            value = _evaluate(dim_expr, constants)
+            if value is None:
+                report.notes.append(f"DIM {name}({join_pieces(dim_expr)}): size unknown, counted as {DEFAULT_DIM}")
+                value = DEFAULT_DIM
+            dims.append(max(0, int(value)))
+        return dims
+
+    def _array(self, name: str, dims: List[int], declared: bool) -> ArrayInfo:
+        etype = element_type(name)
+        elements = 1
+        for dim in dims:
+            elements *= dim + 1
+        size = ARRAY_HEADER_BYTES + ARRAY_DIMENSION_BYTES * len(dims) + ELEMENT_BYTES[etype] * elements
+        return ArrayInfo(name=name, dims=dims, element_type=etype, bytes=size, declared=declared)
+
+    def _collect_names(self, stmt: List[Piece], facts: StatementFacts) -> None:
+        i = 0
+        while i < len(stmt):
+            kind, text = stmt[i]
+            if kind == TOKEN and text == "FN":
+                # Function call: the name is not a variable
+                _, i = _read_name(stmt, i + 1)
+                continue
+            if kind == CHAR and (text.isdigit() or text == "."):
+                i = _skip_number(stmt, i)
+                continue
+            name, end = _read_name(stmt, i)
+            if name is None:
+                i += 1
+                continue
+            if end < len(stmt) and stmt[end] == (CHAR, "("):
+                close = _closing_paren(stmt, end)
+                facts.names.append((variable_key(name), name, len(_split_top_level(stmt[end + 1:close]))))
+            else:
+                facts.names.append((variable_key(name), name, None))
+            i = end
+
+    def _collect_strings(self, stmt: List[Piece], facts: StatementFacts) -> None:
+        first = stmt[0]
+        if first in ((TOKEN, "GET"), (TOKEN, "INPUT"), (TOKEN, "INPUT#")):
+            length = 1 if first == (TOKEN, "GET") else INPUT_BUFFER_LENGTH
+            for part in _split_top_level(stmt[1:]):
+                code = [p for p in part if p[0] != STRING and p != (CHAR, ";")]
+                # Skip the "#n" / prompt prefix
+                while code and not (code[0][0] == CHAR and code[0][1].isalpha()):
+                    code = code[1:]
+                name, _ = _read_name(code, 0)
+                if name and name.endswith("$"):
+                    facts.string_inputs.append((name, length))
+            return
+
+        body = stmt[1:] if first == (TOKEN, "LET") else stmt
+        name, i = _read_name(body, 0)
+        if name is None or not name.endswith("$"):
+            return
+        if i < len(body) and body[i] == (CHAR, "("):
+            i = _closing_paren(body, i) + 1
+        if i < len(body) and body[i] == (TOKEN, "="):
+            facts.string_assignment = (name, body[i + 1:])
+
+
+def _add_or_discard(items: set, item, sign: int):
+    if sign > 0:
+        items.add(item)
+    else:
+        items.discard(item)
+
+
+@dataclass(eq=False)
+class MemoryLine:
+    """What one source line contributes to a MemoryTracker; compared by identity."""
+    order: int  # position of the line, increasing through the program
+    bytes: int = 0
+    assignments: List[Tuple[str, Optional[Tuple[Piece, ...]]]] = field(default_factory=list)
+    dims: List[Tuple[str, List[List[Piece]]]] = field(default_factory=list)
+    simple: Dict[str, str] = field(default_factory=dict)  # variable key -> first name in the line
+    array_uses: Dict[str, Tuple[str, int]] = field(default_factory=dict)  # key -> first (name, dimensions)
+    string_inputs: List[Tuple[str, int]] = field(default_factory=list)  # (key, length)
+    # Assignments that allocate on the string heap: (key, expression), and
+    # (key, length) with the constants the lengths were estimated with
+    string_assignments: List[Tuple[str, List[Piece]]] = field(default_factory=list)
+    string_lengths: List[Tuple[str, int]] = field(default_factory=list)
+
+
+class MemoryTracker:
+    """
+    Memory footprint of a program that is edited line by line, e.g. by
+    c64_syntax_checker.CheckerSession. Lines are added and removed with
+    add_line() and remove_line(); report() then gives what
+    MemoryAnalyzer.analyze() gives for the whole program, but only looks at
+    the variables, arrays and constants the changed lines touch.
+    """
+    def __init__(self, converter: Optional[Bas2Prg] = None, basic_ram_bytes: int = BASIC_RAM_BYTES):
+        self.analyzer = MemoryAnalyzer(basic_ram_bytes)
+        self.converter = converter or Bas2Prg()
+        self.line_cache: Dict[str, List[StatementFacts]] = {}
+        self._bytes = 2
+        # Variable key -> Counter of the assigned expressions (None for FOR, INPUT, READ and GET)
+        self._assigned: Dict[str, Counter] = {}
+        self._constants: Dict[str, float] = {}
+        self._constants_stale = False
+        self._dim_lines: set = set()
+        self._declared: Dict[str, ArrayInfo] = {}  # arrays of the last DIM of each name
+        self._notes: List[str] = []
+        self._dims_stale = False
+        # Variable key -> name -> lines using it, for the name of the first use
+        self._simple: Dict[str, Dict[str, set]] = {}
+        self._array_uses: Dict[str, Dict[Tuple[str, int], set]] = {}
+        self._names: Dict[str, str] = {}
+        self._implicit: Dict[str, ArrayInfo] = {}
+        self._stale_keys: set = set()
+        self._string_lines: set = set()
+        self._string_lengths: Dict[str, Counter] = {}
+        self._string_building = 0
+
+    def add_line(self, raw: str, order: int) -> MemoryLine:
+        """Adds a source line at position order; returns the handle remove_line() takes."""
+        line = MemoryLine(order)
+        if raw:
+            line.bytes = _line_bytes(raw, self.converter)
+        m = CRUNCH_LINE_RE.match(raw)
+        for facts in (self.analyzer._line_facts(m.group(2), self.line_cache) if m else ()):
+            line.assignments.extend((key, tuple(expr) if expr is not None else None) for key, expr in facts.assignments)
+            line.dims.extend(facts.dims)
+            names = ([facts.function] if facts.function is not None else []) + \
+                [(key, name) for key, name, num_dims in facts.names if num_dims is None and key not in SYSTEM_VARIABLES]
+            for key, name in names:
+                line.simple.setdefault(key, name)
+            for key, name, num_dims in facts.names:
+                if num_dims is not None:
+                    line.array_uses.setdefault(key, (name, num_dims))
+            line.string_inputs.extend((variable_key(name), length) for name, length in facts.string_inputs)
+            if facts.string_assignment is not None:
+                name, expr = facts.string_assignment
+                length, allocates = _string_length(expr, self._constants)
+                if allocates:
+                    line.string_assignments.append((variable_key(name), expr))
+                    line.string_lengths.append((variable_key(name), length))
+        self._apply(line, 1)
+        return line
+
+    def remove_line(self, line: MemoryLine):
+        self._apply(line, -1)
+
+    def _apply(self, line: MemoryLine, sign: int):
+        """Adds (sign 1) or takes away (sign -1) what the line contributes."""
+        self._bytes += sign * line.bytes
+        for key, expr in line.assignments:
+            counter = self._assigned.setdefault(key, Counter())
+            counter[expr] += sign
+            if not counter[expr]:
+                del counter[expr]
+                if not counter:
+                    del self._assigned[key]
+            self._constants_stale = True
+        if line.dims:
+            _add_or_discard(self._dim_lines, line, sign)
+            self._dims_stale = True
+        for index, uses in ((self._simple, line.simple), (self._array_uses, line.array_uses)):
+            for key, use in uses.items():
+                lines = index.setdefault(key, {}).setdefault(use, set())
+                _add_or_discard(lines, line, sign)
+                if not lines:
+                    del index[key][use]
+                    if not index[key]:
+                        del index[key]
+                self._stale_keys.add(key)
+        if line.string_assignments:
+            _add_or_discard(self._string_lines, line, sign)
+            self._string_building += sign * len(line.string_assignments)
+        for key, length in line.string_inputs + line.string_lengths:
+            self._count_string(key, length, sign)
+
+    def _count_string(self, key: str, length: int, sign: int):
+        counter = self._string_lengths.setdefault(key, Counter())
+        counter[length] += sign
+        if not counter[length]:
+            del counter[length]
+            if not counter:
+                del self._string_lengths[key]
+
+    def report(self) -> MemoryReport:
+        analyzer = self.analyzer
+        report = MemoryReport(basic_ram_bytes=analyzer.basic_ram_bytes, program_bytes=self._bytes)
+        if self._constants_stale:
+            self._constants_stale = False
+            candidates = {key: list(next(iter(counter))) for key, counter in self._assigned.items()
+                          if len(counter) == 1 and next(iter(counter)) is not None}
+            constants = analyzer._resolve_constants(candidates)
+            if constants != self._constants:
+                # String lengths and DIM sizes may use the constants
+                self._constants = constants
+                self._dims_stale = True
+                for line in self._string_lines:
+                    for key, length in line.string_lengths:
+                        self._count_string(key, length, -1)
+                    line.string_lengths = [(key, _string_length(expr, constants)[0])
+                                           for key, expr in line.string_assignments]
+                    for key, length in line.string_lengths:
+                        self._count_string(key, length, 1)
+        if self._dims_stale:
+            self._dims_stale = False
+            # The last DIM of a name counts; the notes of all of them, in program order
+            declared: Dict[str, ArrayInfo] = {}
+            report.notes = []
+            for line in sorted(self._dim_lines, key=lambda line: line.order):
+                for name, dim_exprs in line.dims:
+                    dims = analyzer._dimensions(name, dim_exprs, self._constants, report)
+                    declared[variable_key(name)] = analyzer._array(name, dims, declared=True)
+            self._declared, self._notes = declared, report.notes
+        for key in self._stale_keys:
+            for index, names in ((self._simple, self._names), (self._array_uses, self._implicit)):
+                uses = index.get(key)
+                if not uses:
+                    names.pop(key, None)
+                    continue
+                # The use in the first line, usually the only spelling
+                use = next(iter(uses)) if len(uses) == 1 else \
+                    min(uses, key=lambda use: min(line.order for line in uses[use]))
+                if index is self._simple:
+                    names[key] = use
+                else:
+                    name, num_dims = use
+                    names[key] = analyzer._array(name, [DEFAULT_DIM] * num_dims, declared=False)
+        self._stale_keys.clear()
+
+        report.notes = list(self._notes)
+        report.variables = sorted(self._names.values())
+        report.variable_bytes = VARIABLE_ENTRY_BYTES * len(self._names)
+        arrays = dict(self._implicit)
+        arrays.update(self._declared)
+        report.arrays = sorted(arrays.values(), key=lambda a: a.name)
+        report.array_bytes = sum(a.bytes for a in arrays.values())
+        report.string_building_statements = self._string_building
+        heap = 0
+        for key, counter in self._string_lengths.items():
+            length = max(counter)
+            array = arrays.get(key)
+            if array is not None:
+                elements = 1
+                for dim in array.dims:
+                    elements *= dim + 1
+                heap += elements * length
+            else:
+                heap += length
+        report.string_heap_bytes = heap
+        return report
+
+
+def analyze_memory(source_text: str, program_bytes: Optional[int] = None,
+                   converter: Optional[Bas2Prg] = None,
+                   line_cache: Optional[Dict[str, List[StatementFacts]]] = None) -> MemoryReport:
+    return MemoryAnalyzer().analyze(source_text, program_bytes=program_bytes, converter=converter,
+                                    line_cache=line_cache)
+
+
+def ensure_fits(source_text: str, converter: Optional[Bas2Prg] = None,
+                program_bytes: Optional[int] = None) -> MemoryReport:
+    """
+    Raises:
+        ProgramTooLargeError: If program text, variables and arrays alone
+            exceed BASIC RAM.
+    """
+    report = analyze_memory(source_text, program_bytes=program_bytes, converter=converter)
+    if not report.fits:
+        raise ProgramTooLargeError(f"Program does not fit into BASIC RAM. {report.summary()}")
+    return report
+
+# -----------------------------------------------------------------------------
+# Command Line Interface
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate the BASIC RAM footprint of a C64 BASIC program.")
+    parser.add_argument('filename', help="Input BASIC filename")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    args = parser.parse_args()
+
+    try:
+        with open(args.filename, 'r', encoding='utf-8', errors='replace') as f:
+            source_text = f.read()
+    except Exception as e:
+        logger.error(f"Error reading input: {e}")
+        sys.exit(3)
+
+    report = analyze_memory(source_text)
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2))
+    else:
+        print(report.summary())
+        for array in report.arrays:
+            kind = "DIM" if array.declared else "implicit DIM"
+            print(f"  {kind} {array.name}({','.join(str(d) for d in array.dims)}): {array.bytes} bytes")
+        for note in report.notes:
+            print(f"  NOTE: {note}")
+    sys.exit(0 if report.fits else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+PETSCII helper tables shared by the BASIC converter and detokenizer.
+
+Control codes use the brace names known from petcat / C64 listing books,
+e.g. {CLR}, {WHT}, {RVS ON}. Bytes without a name are written as {$xx}.
+When reading macros, the usual long names ({CLEAR}, {WHITE}, {CRSR DOWN},
+{REVERSE ON}, ...) are accepted too, as are repeat counts like {3*DOWN} or
+{3 DOWN}. Macro names are case-insensitive.
+
+PETSCII listings set in the C64 Pro Mono font write each character as the
+private use code point U+EE00 + the screen code of the glyph the C64 lists
+for it; control codes list as reversed glyphs, e.g. {CLR} as a reversed heart
+(U+EED3) and {HOME} as a reversed S (U+EE93). The example programs in
+resources/examples use this encoding inside strings. Bytes whose glyph is
+shared with another byte (0x60-0x7F, 0xE0-0xFF) are written as U+EF00 + byte,
+so such listings still convert back to the exact bytes.
+"""
+import re
+from functools import lru_cache
+
+# Canonical brace name for each PETSCII control code (byte -> name)
+CONTROL_CODE_NAMES = {
+    0x03: "STOP",
+    0x05: "WHT",
+    0x08: "DISH",
+    0x09: "ENSH",
+    0x0D: "RETURN",
+    0x0E: "SWLC",
+    0x11: "DOWN",
+    0x12: "RVS ON",
+    0x13: "HOME",
+    0x14: "DEL",
+    0x1C: "RED",
+    0x1D: "RIGHT",
+    0x1E: "GRN",
+    0x1F: "BLU",
+    0x81: "ORNG",
+    0x85: "F1",
+    0x86: "F3",
+    0x87: "F5",
+    0x88: "F7",
+    0x89: "F2",
+    0x8A: "F4",
+    0x8B: "F6",
+    0x8C: "F8",
+    0x8D: "SHIFT RETURN",
+    0x8E: "SWUC",
+    0x90: "BLK",
+    0x91: "UP",
+    0x92: "RVS OFF",
+    0x93: "CLR",
+    0x94: "INST",
+    0x95: "BRN",
+    0x96: "LRED",
+    0x97: "GRY1",
+    0x98: "GRY2",
+    0x99: "LGRN",
+    0x9A: "LBLU",
+    0x9B: "GRY3",
+    0x9C: "PUR",
+    0x9D: "LEFT",
+    0x9E: "YEL",
+    0x9F: "CYN",
+}
+
+# Additional names accepted in brace macros (name -> byte)
+MACRO_ALIASES = {
+    "CLEAR": 0x93, "CLS": 0x93, "SC": 0x93,
+    "HOM": 0x13,
+    "WHITE": 0x05, "RED": 0x1C, "GREEN": 0x1E, "BLUE": 0x1F, "ORANGE": 0x81,
+    "BLACK": 0x90, "BROWN": 0x95, "LIGHT RED": 0x96, "PINK": 0x96,
+    "GRAY1": 0x97, "GREY1": 0x97, "DARK GRAY": 0x97, "DARK GREY": 0x97, "DKGRY": 0x97,
+    "GRAY2": 0x98, "GREY2": 0x98, "GRAY": 0x98, "GREY": 0x98, "MEDIUM GRAY": 0x98, "MEDIUM GREY": 0x98,
+    "LIGHT GREEN": 0x99, "LIGHT BLUE": 0x9A,
+    "GRAY3": 0x9B, "GREY3": 0x9B, "LIGHT GRAY": 0x9B, "LIGHT GREY": 0x9B, "LTGRY": 0x9B,
+    "PURPLE": 0x9C, "YELLOW": 0x9E, "CYAN": 0x9F,
+    "RVSON": 0x12, "RVS": 0x12, "REVERSE ON": 0x12, "RVON": 0x12,
+    "RVSOFF": 0x92, "REVERSE OFF": 0x92, "RVOF": 0x92,
+    "CRSR DOWN": 0x11, "CD": 0x11, "CUR DOWN": 0x11,
+    "CRSR UP": 0x91, "CU": 0x91, "CUR UP": 0x91,
+    "CRSR LEFT": 0x9D, "CL": 0x9D, "CUR LEFT": 0x9D,
+    "CRSR RIGHT": 0x1D, "CR": 0x1D, "CUR RIGHT": 0x1D,
+    "INS": 0x94, "INSERT": 0x94, "DELETE": 0x14,
+    "LOWER CASE": 0x0E, "UPPER CASE": 0x8E,
+    "SPACE": 0x20, "SHIFT SPACE": 0xA0, "POUND": 0x5C, "UP ARROW": 0x5E,
+    "LEFT ARROW": 0x5F, "PI": 0xFF,
+}
+
+# Precomputed macro lookup table: normalized name -> byte
+MACRO_TABLE = {name: byte_val for byte_val, name in CONTROL_CODE_NAMES.items()}
+MACRO_TABLE.update(MACRO_ALIASES)
+
+MACRO_REPEAT_RE = re.compile(r'^(\d+)\s*\*?\s*(\D.*)$')
+MAX_MACRO_REPEAT = 255
+
+PRIVATE_USE_BASE = 0xEE00
+PRIVATE_USE_RAW_BASE = 0xEF00
+
+
+def _listing_screen_code(byte_val: int):
+    """Screen code of the glyph a listing shows for a PETSCII byte; None if the glyph is shared."""
+    if byte_val < 0x20:
+        return byte_val + 0x80  # reversed @, A, B, ...
+    if byte_val < 0x40:
+        return byte_val
+    if byte_val < 0x60:
+        return byte_val - 0x40
+    if byte_val < 0x80:
+        return None  # same glyphs as 0xC0-0xDF
+    if byte_val < 0xA0:
+        return byte_val + 0x40  # reversed shifted glyphs
+    if byte_val < 0xC0:
+        return byte_val - 0x40
+    if byte_val < 0xE0:
+        return byte_val - 0x80
+    return None  # same glyphs as 0xA0-0xBF
+
+
+LISTING_SCREEN_CODES = [_listing_screen_code(b) for b in range(256)]
+SCREEN_CODE_BYTES = {code: b for b, code in enumerate(LISTING_SCREEN_CODES) if code is not None}
+# Reversed printable glyphs have no byte of their own; they read as the plain glyph
+for _code in range(0x80, 0x100):
+    SCREEN_CODE_BYTES.setdefault(_code, SCREEN_CODE_BYTES[_code & 0x7F])
+del _code
+
+
+def is_printable(byte_val: int) -> bool:
+    """True if the PETSCII byte is a plain ASCII-compatible character."""
+    return 0x20 <= byte_val <= 0x7E
+
+
+def byte_to_macro(byte_val: int) -> str:
+    """Brace macro for a PETSCII byte, e.g. 0x93 -> '{CLR}', 0xA0 -> '{$a0}'."""
+    name = CONTROL_CODE_NAMES.get(byte_val)
+    if name is not None:
+        return "{" + name + "}"
+    return "{$%02x}" % byte_val
+
+
+@lru_cache(maxsize=1024)
+def macro_to_bytes(macro: str):
+    """
+    PETSCII bytes for the text between the braces of a macro, e.g.
+    'CLR' -> 0x93, '3*DOWN' -> 0x11 0x11 0x11, '$a0' -> 0xA0.
+    Returns None for unknown names.
+    """
+    name = " ".join(macro.upper().replace("-", " ").replace("_", " ").split())
+    count = 1
+    repeat = MACRO_REPEAT_RE.match(name)
+    if repeat:
+        count = int(repeat.group(1))
+        name = repeat.group(2)
+        if not 0 < count <= MAX_MACRO_REPEAT:
+            return None
+    byte_val = MACRO_TABLE.get(name)
+    if byte_val is None and name.startswith("$") and 2 <= len(name) <= 3:
+        try:
+            byte_val = int(name[1:], 16)
+        except ValueError:
+            return None
+    if byte_val is None:
+        return None
+    return bytes([byte_val]) * count
+
+
+def byte_to_private_use(byte_val: int) -> str:
+    """C64 Pro Mono private use character for a PETSCII byte."""
+    code = LISTING_SCREEN_CODES[byte_val]
+    if code is None:
+        return chr(PRIVATE_USE_RAW_BASE + byte_val)
+    return chr(PRIVATE_USE_BASE + code)
+
+
+def private_use_to_byte(char: str):
+    """PETSCII byte for a C64 Pro Mono private use character, None otherwise."""
+    val = ord(char) - PRIVATE_USE_BASE
+    if 0 <= val <= 0xFF:
+        return SCREEN_CODE_BYTES[val]
+    if 0x100 <= val <= 0x1FF:
+        return val - 0x100
+    return None
@@ -0,0 +1,553 @@
+"""
+Per-line execution profiler with a C64 cost model.
+
+Generated action games often run sluggishly on a real C64 although they run
+fine headless: BASIC V2 spends most of its time on things a Python run does
+not pay for. The profiler runs a program with the tree-walking interpreter
+(c64_basic), counts how often every statement executes and weights each
+execution with the CPU cycles the C64's interpreter needs for it:
+- every statement is fetched and dispatched; REM and DATA are skipped byte
+  by byte
+- GOTO, GOSUB, IF ... THEN n and ON parse their target and search it line by
+  line, from the start of the program unless it is in a higher block of 256
+  line numbers (c64_compiler.search_line, the rule the compiler uses)
+- number literals are converted from their text every time they are read
+- variables and arrays are searched in the order they were created
+- float operations and functions: additions are cheap, multiplications and
+  divisions are not, SIN, COS, SQR and ^ cost thousands of cycles
+- new strings (computed values assigned to variables, GET and INPUT) fill
+  the free memory until a garbage collection moves the living strings; its
+  time grows with the square of the number of strings. FRE() collects too
+- printed characters and scrolled screens
+
+The cycles add up to an estimated C64 run time in seconds and jiffies
+(1/60 s, the unit of TI). Loops are the backward jumps of GOTO, IF ... THEN
+and ON. A loop whose iterations mostly change nothing (no variable gets
+another value, nothing is printed or POKEd) waits for the player or the
+raster; its lines are reported apart from the hot lines. Of the other
+loops, the one whose iterations cover the most estimated time is the main
+loop, and its time per iteration gives the frames per second a game
+reaches. The hot lines, with what their time goes into and how to speed
+them up, are what an LLM fix prompt needs to target the slow spots. The
+costs are estimates in the right order of magnitude, not a cycle-exact
+emulation. Holding joystick bits gets action games past their "press fire"
+screen.
+
+Usage:
+    python utils/c64_profile.py game.bas [--max-statements N] [--keys "Y{RETURN}"] [--joystick 16] [--seed N] [--top N]
+"""
+import argparse
+import logging
+import sys
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from utils import c64_ast as ast
+    from utils.c64_basic import Interpreter, Machine, Program, RunResult, formula_too_complex, parse_keys
+    from utils.c64_compiler import search_line
+    from utils.c64_fuzz import JOYSTICK_PORTS
+    from utils.c64_memory import BASIC_RAM_BYTES, VARIABLE_ENTRY_BYTES
+except ModuleNotFoundError:
+    import c64_ast as ast
+    from c64_basic import Interpreter, Machine, Program, RunResult, formula_too_complex, parse_keys
+    from c64_compiler import search_line
+    from c64_fuzz import JOYSTICK_PORTS
+    from c64_memory import BASIC_RAM_BYTES, VARIABLE_ENTRY_BYTES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_STATEMENTS = 100000
+DEFAULT_HOT_LINES = 8
+# Iterations a loop needs to count as the main loop
+MIN_LOOP_ITERATIONS = 2
+# Categories of a line with at least this share of its time get a hint
+HINT_SHARE = 0.25
+
+CPU_HZ = 985248  # PAL
+JIFFIES_PER_SECOND = 60
+
+# Where the time goes
+INTERPRET = 'statements'
+SEARCH = 'line search'
+NUMBERS = 'number literals'
+VARIABLES = 'variable search'
+MATH = 'float math'
+STRINGS = 'strings'
+GARBAGE = 'garbage collection'
+OUTPUT = 'screen output'
+
+HINTS = {
+    INTERPRET: "every statement and REM is interpreted each time; remove REMs from hot lines and do less per iteration",
+    SEARCH: "GOTO/GOSUB search their target line by line from the program start; move hot loops and subroutines to low line numbers",
+    NUMBERS: "number literals are converted from text each time; keep constants in variables (and use . for 0)",
+    VARIABLES: "variables are searched in the order they were created; create the hot variables first",
+    MATH: "float math is slow, SIN/COS/SQR/^ very slow; use tables computed before the loop and fewer multiplications",
+    STRINGS: "string functions and concatenation build new strings; prepare the strings before the loop",
+    GARBAGE: "new strings fill the memory until a garbage collection stops the game; avoid building strings in the loop",
+    OUTPUT: "printing costs per character and scrolling; print only what changed or POKE into the screen RAM",
+}
+
+# CPU cycles of the BASIC V2 interpreter (estimates)
+STATEMENT_CYCLES = 150
+SKIP_BYTE_CYCLES = 12
+ASSIGN_CYCLES = 100
+FOR_CYCLES = 600
+NEXT_CYCLES = 800
+GOSUB_CYCLES = 150
+RETURN_CYCLES = 250
+POKE_CYCLES = 300
+READ_CYCLES = 400
+GET_CYCLES = 400
+INPUT_CYCLES = 2000
+JUMP_CYCLES = 120
+LINE_NUMBER_DIGIT_CYCLES = 60
+SEARCH_STEP_CYCLES = 30
+NUMBER_CYCLES = 200
+NUMBER_DIGIT_CYCLES = 300
+PI_CYCLES = 100
+STRING_LITERAL_CYCLES = 80
+VARIABLE_CYCLES = 150
+VARIABLE_STEP_CYCLES = 25
+ARRAY_CYCLES = 300
+ARRAY_STEP_CYCLES = 30
+TO_INTEGER_CYCLES = 250
+INDEX_CYCLES = 350
+FN_CYCLES = 800
+CONCAT_CYCLES = 500
+STRING_COMPARE_CYCLES = 300
+OPERATOR_CYCLES = {'+': 300, '-': 320, '*': 1000, '/': 1800, '^': 16000, 'AND': 600, 'OR': 600,
+                   '=': 250, '<>': 250, '<': 250, '>': 250, '<=': 250, '>=': 250}
+UNARY_CYCLES = {'-': 80, '+': 0, 'NOT': 400}
+FUNCTION_CYCLES = {
+    'SGN': 100, 'INT': 350, 'ABS': 50, 'USR': 200, 'FRE': 300, 'POS': 200, 'SQR': 16000, 'RND': 1500,
+    'LOG': 8000, 'EXP': 9000, 'COS': 17000, 'SIN': 16000, 'TAN': 34000, 'ATN': 20000, 'PEEK': 350,
+    'LEN': 250, 'STR$': 3500, 'VAL': 2500, 'ASC': 250, 'CHR$': 500, 'LEFT$': 600, 'RIGHT$': 600,
+    'MID$': 700, 'TAB': 300, 'SPC': 300,
+}
+PRINT_CHARACTER_CYCLES = 180
+SCROLL_CYCLES = 20000
+GARBAGE_COLLECTION_CYCLES = 2000
+GARBAGE_DESCRIPTOR_CYCLES = 40
+GARBAGE_BYTE_CYCLES = 20
+SYSTEM_VARIABLES = ('TI', 'TI$', 'ST')
+MAX_FN_DEPTH = 8
+
+
+def _is_string(node) -> bool:
+    """Whether an expression has a string value, by its operands' names."""
+    kind = type(node)
+    if kind is ast.String:
+        return True
+    if kind is ast.Variable or kind is ast.Call:
+        return node.name.endswith('$')
+    if kind is ast.Paren:
+        return _is_string(node.expr)
+    if kind is ast.Binary and node.op == '+':
+        return _is_string(node.left)
+    return False
+
+
+def _builds_string(stmt) -> bool:
+    """Whether the strings a statement assigns are new ones, not pointers to program text or other variables."""
+    if type(stmt) is ast.Input:
+        return True
+    if type(stmt) is not ast.Let:
+        return False
+    value = stmt.value
+    while type(value) is ast.Paren:
+        value = value.expr
+    return not (type(value) in (ast.String, ast.Variable) or type(value) is ast.Call and not value.function)
+
+
+@dataclass
+class LineProfile:
+    number: int
+    executions: int
+    cycles: int
+    costs: Dict[str, int]  # cycles by category
+    waiting: bool = False  # in a loop waiting for input
+
+    def describe(self, total_cycles: int) -> str:
+        share = self.cycles / total_cycles if total_cycles else 0.0
+        per_execution = self.cycles // self.executions if self.executions else self.cycles
+        parts = sorted(self.costs.items(), key=lambda item: -item[1])
+        text = (f"line {self.number}: {share * 100:.0f}% of the time, {self.executions} executions, "
+                f"{per_execution} cycles each; "
+                + ", ".join(f"{category} {cycles / self.cycles * 100:.0f}%" for category, cycles in parts[:3]
+                            if self.cycles and cycles * 20 >= self.cycles))
+        hints = [HINTS[category] for category, cycles in parts if self.cycles and cycles >= HINT_SHARE * self.cycles]
+        return text + (". " + "; ".join(hints) if hints else "")
+
+
+@dataclass
+class MainLoop:
+    first: int  # line number the loop jumps back to
+    last: int  # line number of the jump back
+    iterations: int
+    cycles: int  # of all iterations
+
+    @property
+    def cycles_per_iteration(self) -> float:
+        return self.cycles / self.iterations
+
+    @property
+    def fps(self) -> float:
+        """Iterations per second, the frames per second of a game loop."""
+        return CPU_HZ / self.cycles_per_iteration if self.cycles else 0.0
+
+
+@dataclass
+class ProfileReport:
+    result: RunResult
+    cycles: int
+    lines: List[LineProfile]  # executed lines in program order
+    main_loop: Optional[MainLoop]
+    collections: int  # string garbage collections
+    costs: Dict[str, int] = field(default_factory=dict)  # cycles by category, without waiting lines
+
+    @property
+    def seconds(self) -> float:
+        """Estimated time of the run on a C64."""
+        return self.cycles / CPU_HZ
+
+    @property
+    def jiffies(self) -> int:
+        return round(self.seconds * JIFFIES_PER_SECOND)
+
+    @property
+    def busy_cycles(self) -> int:
+        """Cycles outside the loops waiting for input."""
+        return self.cycles - sum(line.cycles for line in self.lines if line.waiting)
+
+    def hot_lines(self, count: int = DEFAULT_HOT_LINES) -> List[LineProfile]:
+        busy = [line for line in self.lines if not line.waiting]
+        return sorted(busy, key=lambda line: (-line.cycles, line.number))[:count]
+
+    def summary(self, count: int = DEFAULT_HOT_LINES) -> str:
+        loop = self.main_loop
+        if loop is not None:
+            per_iteration = loop.cycles_per_iteration / CPU_HZ
+            text = (f"Estimated C64 speed: the main loop (lines {loop.first}-{loop.last}) runs {loop.fps:.1f} times "
+                    f"per second, {per_iteration * 1000:.0f} ms ({per_iteration * JIFFIES_PER_SECOND:.1f} jiffies) "
+                    f"per iteration over {loop.iterations} iterations.")
+        else:
+            text = "Estimated C64 speed: no main loop found (no loop doing work ran twice)."
+        text += (f"\nThe profiled run takes about {self.seconds:.1f} s ({self.jiffies} jiffies) on a C64"
+                 f" with {self.collections} string garbage collection(s): {self.result.summary()}")
+        waiting = [line for line in self.lines if line.waiting]
+        if waiting and self.cycles:
+            text += (f"\nWaiting for input in line(s) {', '.join(str(line.number) for line in waiting)}: "
+                     f"{(self.cycles - self.busy_cycles) / self.cycles * 100:.0f}% of the time, left out below.")
+        busy = self.busy_cycles
+        if busy:
+            text += "\nTime by cause: " + ", ".join(
+                f"{category} {cycles / busy * 100:.0f}%"
+                for category, cycles in sorted(self.costs.items(), key=lambda item: -item[1])
+                if cycles * 100 >= busy)
+            text += "\nHot lines:\n" + "\n".join(f"- {line.describe(busy)}" for line in self.hot_lines(count))
+        return text
+
+
+# ------------------ Profiler ------------------
+
+class ProfilingInterpreter(Interpreter):
+    """
+    An Interpreter that counts the executions of every statement and adds
+    up their estimated C64 cycles. The cycles of an execution are computed
+    when the statement first runs (variables keep their place in the
+    tables from their creation on); searches, new strings and printing are
+    added as they happen.
+    """
+
+    def __init__(self, program: Program, machine: Optional[Machine] = None):
+        super().__init__(program, machine)
+        self.cycles = 0
+        self.collections = 0
+        # By (line index, statement index)
+        self.counts: Dict[Tuple[int, int], int] = {}
+        self.costs: Dict[Tuple[int, int], Dict[str, int]] = {}  # of one execution
+        self.extra: Dict[Tuple[int, int], Counter] = {}  # searches, strings and printing of all executions
+        # Variable changes, output and POKEs; an iteration without any waits
+        self.effects = 0
+        # By (line index of the jump back, line index jumped to):
+        # [cycles and effects at the last jump, iterations, cycles, iterations with effects]
+        self.loops: Dict[Tuple[int, int], List[int]] = {}
+        self._totals: Dict[Tuple[int, int], int] = {}
+        self._position = (0, 0)
+        self._statement = None
+        self._heap = 0  # bytes of strings since the last garbage collection
+        self._space: Tuple[tuple, int] = ((), 0)
+        self._statements = {kind: self._profiled(handler) for kind, handler in self._statements.items()}
+
+    def _profiled(self, handler):
+        def run(stmt):
+            position = self._position = (self.current, self.si - 1)
+            self._statement = stmt
+            total = self._totals.get(position)
+            if total is None:
+                costs = self.costs[position] = self._statement_costs(stmt)
+                total = self._totals[position] = sum(costs.values())
+                self.counts[position] = 0
+            self.counts[position] += 1
+            self.cycles += total
+            screen = self.machine.screen
+            printed, scrolls = screen.printed, screen.scrolls
+            handler(stmt)
+            if screen.printed != printed or screen.scrolls != scrolls:
+                self.effects += 1
+                self._charge(OUTPUT, (screen.printed - printed) * PRINT_CHARACTER_CYCLES
+                             + (screen.scrolls - scrolls) * SCROLL_CYCLES)
+            elif type(stmt) is ast.Next or type(stmt) is ast.Command and stmt.keyword in ('POKE', 'SYS'):
+                self.effects += 1
+        return run
+
+    def _charge(self, category: str, cycles: int):
+        extra = self.extra.get(self._position)
+        if extra is None:
+            extra = self.extra[self._position] = Counter()
+        extra[category] += cycles
+        self.cycles += cycles
+
+    def _loop(self, target: int):
+        loop = self.loops.get((self.current, target))
+        if loop is None:
+            self.loops[(self.current, target)] = [self.cycles, self.effects, 0, 0, 0]
+            return
+        loop[2] += 1
+        loop[3] += self.cycles - loop[0]
+        if self.effects != loop[1]:
+            loop[4] += 1
+        loop[0], loop[1] = self.cycles, self.effects
+
+    # -------- dynamic costs --------
+    def goto(self, number: int):
+        super().goto(number)
+        _, steps = search_line(self.program.lines, number, self.current)
+        self._charge(SEARCH, steps * SEARCH_STEP_CYCLES)
+        stmt = self._statement
+        gosub = (type(stmt) is ast.Jump and stmt.keyword == 'GOSUB') or (type(stmt) is ast.On and stmt.mode == 'GOSUB')
+        if self.li <= self.current and not gosub:
+            self._loop(self.li)
+
+    def _assign(self, target, value):
+        if type(target) is not ast.Variable or self.variables.get(self._key(target.name)) != value:
+            self.effects += 1
+        super()._assign(target, value)
+        if type(value) is str and value and _builds_string(self._statement):
+            self._heap += len(value)
+            if self._heap > self._string_space():
+                self._collect()
+
+    def _fre(self, x) -> float:
+        self._collect()
+        return super()._fre(x)
+
+    def _string_space(self) -> int:
+        """Bytes between the variables and arrays and the end of the BASIC RAM."""
+        shape = (len(self.variables), tuple(len(array.values) for array in self.arrays.values()))
+        if shape != self._space[0]:
+            used = self.program.size + VARIABLE_ENTRY_BYTES * shape[0] + 5 * sum(shape[1])
+            self._space = (shape, BASIC_RAM_BYTES - used)
+        return self._space[1]
+
+    def _collect(self):
+        """A garbage collection: one pass over all string descriptors per living string."""
+        strings = [value for value in self.variables.values() if type(value) is str]
+        strings += [value for key, array in self.arrays.items() if key.endswith('$') for value in array.values]
+        living = [value for value in strings if value]
+        size = sum(len(value) for value in living)
+        self._heap = size
+        self.collections += 1
+        self._charge(GARBAGE, GARBAGE_COLLECTION_CYCLES + GARBAGE_DESCRIPTOR_CYCLES * len(strings) * (len(living) + 1)
+                     + GARBAGE_BYTE_CYCLES * size)
+
+    # -------- static costs --------
+    def _statement_costs(self, stmt) -> Dict[str, int]:
+        costs: Counter = Counter({INTERPRET: STATEMENT_CYCLES})
+        kind = type(stmt)
+        if kind is ast.Rem or kind is ast.Data:
+            costs[INTERPRET] += SKIP_BYTE_CYCLES * len(stmt.text)
+        elif kind is ast.Def:
+            return dict(costs)
+        elif kind is ast.Let:
+            costs[VARIABLES] += ASSIGN_CYCLES
+        elif kind is ast.For:
+            costs[INTERPRET] += FOR_CYCLES
+            if stmt.var is not None:
+                self._variable_costs(stmt.var, costs)
+        elif kind is ast.Next:
+            costs[MATH] += NEXT_CYCLES
+        elif kind is ast.Jump:
+            costs[SEARCH] += JUMP_CYCLES + LINE_NUMBER_DIGIT_CYCLES * len(str(stmt.target or 0))
+            if stmt.keyword == 'GOSUB':
+                costs[INTERPRET] += GOSUB_CYCLES
+        elif kind is ast.If and stmt.then_target is not None:
+            costs[SEARCH] += JUMP_CYCLES + LINE_NUMBER_DIGIT_CYCLES * len(str(stmt.then_target))
+        elif kind is ast.On:
+            # The targets before the chosen one are parsed too
+            digits = sum(len(str(number)) for number, _ in stmt.targets if number is not None)
+            costs[SEARCH] += JUMP_CYCLES + LINE_NUMBER_DIGIT_CYCLES * (digits + 1) // 2
+            if stmt.mode == 'GOSUB':
+                costs[INTERPRET] += GOSUB_CYCLES
+        elif kind is ast.Input:
+            costs[INTERPRET] += GET_CYCLES if stmt.keyword.startswith('GET') else INPUT_CYCLES
+        elif kind is ast.Read:
+            costs[INTERPRET] += READ_CYCLES * len(stmt.targets)
+        elif kind is ast.Command:
+            if stmt.keyword == 'RETURN':
+                costs[INTERPRET] += RETURN_CYCLES
+            elif stmt.keyword == 'POKE':
+                costs[INTERPRET] += POKE_CYCLES
+                costs[MATH] += 2 * TO_INTEGER_CYCLES
+        for expression in ast.statement_expressions(stmt):
+            if expression is not None:
+                self._expression_costs(expression, costs)
+        return dict(costs)
+
+    def _expression_costs(self, node, costs: Counter, depth: int = 0):
+        kind = type(node)
+        if kind is ast.Number:
+            text = node.text
+            if text[0].isdigit() or text[0] == '.':
+                costs[NUMBERS] += NUMBER_CYCLES + NUMBER_DIGIT_CYCLES * sum(c.isdigit() for c in text)
+            else:
+                costs[NUMBERS] += PI_CYCLES
+        elif kind is ast.String:
+            costs[INTERPRET] += STRING_LITERAL_CYCLES
+        elif kind is ast.Variable:
+            self._variable_costs(node.name, costs)
+        elif kind is ast.Call:
+            name = node.name
+            if not node.function:
+                key = self._key(name)
+                costs[VARIABLES] += ARRAY_CYCLES + ARRAY_STEP_CYCLES * self._place(key, self.arrays)
+                costs[MATH] += INDEX_CYCLES * len(node.args)
+            elif name.startswith('FN'):
+                costs[MATH] += FN_CYCLES
+                definition = self.functions.get('FN' + self._key(name[2:]) if len(name) > 2 else name)
+                if definition is not None and depth < MAX_FN_DEPTH:
+                    self._expression_costs(definition[1], costs, depth + 1)
+            elif name in ('TAB', 'SPC'):
+                costs[OUTPUT] += FUNCTION_CYCLES[name]
+            else:
+                costs[STRINGS if name.endswith('$') or name in ('LEN', 'ASC') else MATH] += FUNCTION_CYCLES.get(name, 0)
+            for arg in node.args:
+                self._expression_costs(arg, costs, depth)
+        elif kind is ast.Paren:
+            self._expression_costs(node.expr, costs, depth)
+        elif kind is ast.Unary:
+            costs[MATH] += UNARY_CYCLES.get(node.op, 0)
+            self._expression_costs(node.operand, costs, depth)
+        elif kind is ast.Binary:
+            if node.op == '+' and _is_string(node.left):
+                costs[STRINGS] += CONCAT_CYCLES
+            elif node.op in ast.RELATIONAL and _is_string(node.left):
+                costs[STRINGS] += STRING_COMPARE_CYCLES
+            else:
+                costs[MATH] += OPERATOR_CYCLES.get(node.op, 0)
+            self._expression_costs(node.left, costs, depth)
+            self._expression_costs(node.right, costs, depth)
+
+    def _variable_costs(self, name: str, costs: Counter):
+        key = self._key(name)
+        costs[VARIABLES] += VARIABLE_CYCLES
+        if key not in SYSTEM_VARIABLES:
+            costs[VARIABLES] += VARIABLE_STEP_CYCLES * self._place(key, self.variables)
+
+    @staticmethod
+    def _place(key: str, table: dict) -> int:
+        """Entries the C64 steps over to find key: its place in creation order, all for a new one."""
+        for place, name in enumerate(table):
+            if name == key:
+                return place
+        return len(table)
+
+    # -------- report --------
+    def report(self, result: RunResult) -> ProfileReport:
+        lines: Dict[int, Counter] = {}
+        for position, count in self.counts.items():
+            costs = lines.setdefault(position[0], Counter())
+            for category, cycles in self.costs[position].items():
+                costs[category] += cycles * count
+        for position, extra in self.extra.items():
+            lines.setdefault(position[0], Counter()).update(extra)
+        waiting = set()
+        for (source, target), (_, _, iterations, _, busy) in self.loops.items():
+            if iterations and busy * 2 < iterations:
+                waiting.update(range(target, source + 1))
+        profiles = [LineProfile(self.program.lines[li].number, self.line_counts[li], sum(costs.values()),
+                                {category: cycles for category, cycles in costs.items() if cycles}, li in waiting)
+                    for li, costs in sorted(lines.items())]
+        totals: Counter = Counter()
+        for li, costs in lines.items():
+            if li not in waiting:
+                totals.update(costs)
+
+        main_loop = None
+        loops = [(cycles, iterations, source, target)
+                 for (source, target), (_, _, iterations, cycles, busy) in self.loops.items()
+                 if iterations >= MIN_LOOP_ITERATIONS and busy * 2 >= iterations]
+        if loops:
+            # The outermost loop running again and again covers the most time
+            cycles, iterations, source, target = max(loops, key=lambda loop: (loop[0], -loop[1]))
+            program_lines = self.program.lines
+            main_loop = MainLoop(program_lines[target].number, program_lines[source].number, iterations, cycles)
+        return ProfileReport(result=result, cycles=self.cycles, lines=profiles, main_loop=main_loop,
+                             collections=self.collections,
+                             costs={category: cycles for category, cycles in totals.items() if cycles})
+
+
+def profile_program(source_text: str, keys="", max_statements: int = DEFAULT_PROFILE_STATEMENTS,
+                    seed: int = 0, joystick: int = 0) -> ProfileReport:
+    """
+    Runs a program headless like c64_basic.run_program() and estimates where
+    a C64 spends its time. joystick holds those bits (16 fire, 1 up, 2 down,
+    4 left, 8 right) pressed on both joystick ports.
+    """
+    machine = Machine(keys if isinstance(keys, bytes) else parse_keys(keys), seed=seed)
+    for port in JOYSTICK_PORTS:
+        machine.memory[port] &= ~joystick & 0xFF
+    try:
+        interpreter = ProfilingInterpreter(Program(source_text), machine)
+    except RecursionError:
+        return ProfileReport(result=formula_too_complex(source_text, machine), cycles=0, lines=[],
+                             main_loop=None, collections=0)
+    result = interpreter.run(max_statements)
+    return interpreter.report(result)
+
+# -----------------------------------------------------------------------------
+# Command Line Interface
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate the C64 speed of a BASIC V2 program and its hot lines.")
+    parser.add_argument('filename', nargs='?', help="Input filename (stdin if empty)")
+    parser.add_argument('--max-statements', type=int, default=DEFAULT_PROFILE_STATEMENTS,
+                        help=f"Statements to run at most (default {DEFAULT_PROFILE_STATEMENTS})")
+    parser.add_argument('--keys', default="", help="Keys for GET/INPUT; \\n or {RETURN} is RETURN")
+    parser.add_argument('--joystick', type=int, default=0, help="Joystick bits held on both ports, e.g. 16 for fire")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the RND sequence")
+    parser.add_argument('--top', type=int, default=DEFAULT_HOT_LINES,
+                        help=f"Hot lines to list (default {DEFAULT_HOT_LINES})")
+
+    args = parser.parse_args()
+
+    if args.filename:
+        try:
+            with open(args.filename, 'r', encoding='utf-8', errors='replace') as f:
+                source_text = f.read()
+        except Exception as e:
+            logger.error(f"Error reading input: {e}")
+            sys.exit(3)
+    else:
+        source_text = sys.stdin.read()
+
+    report = profile_program(source_text, keys=args.keys.replace("\\n", "\n"),
+                             max_statements=args.max_statements, seed=args.seed, joystick=args.joystick)
+    print(report.summary(max(1, args.top)))
+    sys.exit(1 if report.result.failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -8,16 +8,23 @@ Validates a Commodore 64 BASIC program for common structural & syntactic issues:
 - Unknown keywords (basic set; ignores after REM)
 - Quotation mark pairing
 - Parentheses balance
+- Statement syntax, from the shared C64 BASIC parser (c64_ast.py): keywords
+  are found the way the C64 tokenizes them, so crunched code (FORI=1TO10)
+  is understood and variable names hiding a keyword (SCORE) are reported
 - IF ... THEN structure
 - FOR / NEXT pairing (variable match when specified)
-- GOTO / GOSUB target existence
+- GOTO / GO TO / GOSUB / THEN target existence
 - ON <expr> GOTO/GOSUB line list validity
+- GOSUB targets without a RETURN (subroutine extents are available from
+  subroutine_extents() for other analyses)
 - Basic token case-insensitive
-- Expression sanity (missing operators, invalid variable names)
+- Expression types (string/numeric operands, assignments, comparisons) and
+  function argument counts
 - Control-flow graph reachability (flags unreachable lines)
+- Memory footprint: program text, variables, arrays and string heap against
+  the 38911 bytes of BASIC RAM (see c64_memory.py)
 
 Limitations:
-- Does not fully parse expressions or detect all illegal variable usages.
 - Does not evaluate numeric expressions; treats them as opaque.
 - Does not handle embedded control chars or tokenized PRG binary format.
 
@@ -30,12 +37,20 @@ from __future__ import annotations
 import re
 import sys
 import json
+from bisect import bisect_left, bisect_right, insort
+from itertools import compress
+from operator import ne
 from dataclasses import dataclass, field
 from typing import List, Dict, Tuple, Optional
 
-BASIC_KEYWORDS = {
-    'END','FOR','NEXT','DATA','INPUT','DIM','READ','LET','GOTO','RUN','IF','THEN','ELSE','RESTORE','GOSUB','RETURN','REM','STOP','ON','WAIT','LOAD','SAVE','VERIFY','DEF','POKE','PRINT','CONT','LIST','CLR','CMD','SYS','OPEN','CLOSE','GET','NEW','TAB','TO','FN','SPC','THEN','NOT','STEP','AND','OR','$','ABS','ASC','ATN','CHR$','COS','EXP','INT','LEFT$','LEN','LOG','MID$','PEEK','POS','RIGHT$','RND','SGN','SIN','SQR','STR$','TAN','VAL'}
-# Accept synonyms (e.g., '?' for PRINT) handled in tokenization.
+try:
+    from utils.bas2prg import Bas2Prg
+    from utils.c64_memory import MemoryLine, MemoryReport, MemoryTracker, StatementFacts, analyze_memory
+    from utils import c64_ast as ast
+except ModuleNotFoundError:
+    from bas2prg import Bas2Prg
+    from c64_memory import MemoryLine, MemoryReport, MemoryTracker, StatementFacts, analyze_memory
+    import c64_ast as ast
 
 # Built-in function metadata: return type, min args, max args (-1 means variadic / same as min)
 FUNC_INFO = {
@@ -47,26 +62,64 @@ FUNC_INFO = {
     'VAL': ('numeric',1,1),
     'ASC': ('numeric',1,1),
     'LEN': ('numeric',1,1),
-    'RND': ('numeric',0,1),
+    'RND': ('numeric',1,1),
     'INT': ('numeric',1,1),
     'ABS': ('numeric',1,1),
+    'SGN': ('numeric',1,1),
     'LOG': ('numeric',1,1),
+    'EXP': ('numeric',1,1),
     'SIN': ('numeric',1,1),
     'COS': ('numeric',1,1),
     'TAN': ('numeric',1,1),
+    'ATN': ('numeric',1,1),
     'SQR': ('numeric',1,1),
-    'PI': ('numeric',0,0), # treated as constant function w/ no args
+    'PEEK': ('numeric',1,1),
+    'FRE': ('numeric',1,1),
+    'POS': ('numeric',1,1),
+    'USR': ('numeric',1,1),
+    'TAB': ('unknown',1,1), # PRINT only
+    'SPC': ('unknown',1,1), # PRINT only
 }
 
+# Bump when checks or messages change, so cached check results are not reused
+CHECKER_VERSION = 3
+
 LINE_RE = re.compile(r"^(\d{1,5})\s*(.*)$")
-TOKEN_SPLIT_RE = re.compile(r"(?<!\$)[^A-Za-z0-9?$]\s*|")  # We'll do manual scanning instead.
 
 @dataclass
 class BasicLine:
     number: int
     raw: str
     content: str  # part after line number
-    tokens: List[str] = field(default_factory=list)
+    # Parsed line (c64_ast.Line), built once in SyntaxChecker.load() and shared by all checks
+    ast: Optional[ast.Line] = None
+
+@dataclass
+class Subroutine:
+    entry: int  # GOSUB target line
+    lines: List[int] = field(default_factory=list)  # lines reachable from the entry before returning
+    returns: List[int] = field(default_factory=list)  # lines of the extent holding a RETURN
+    calls: List[int] = field(default_factory=list)  # other subroutine entries reached from the extent
+
+@dataclass
+class LineSummary:
+    """Results of the line-local checks of one line, valid while its number and content are unchanged."""
+    quotes: List[Issue] = field(default_factory=list)
+    parens: List[Issue] = field(default_factory=list)
+    keywords: List[Issue] = field(default_factory=list)
+    if_then: List[Issue] = field(default_factory=list)
+    for_events: List[Tuple[str, Optional[str]]] = field(default_factory=list)  # ('FOR'|'NEXT', variable)
+    # (target, issue): reported if target is None or the target line does not exist
+    jumps: List[Tuple[Optional[int], Issue]] = field(default_factory=list)
+    on_jumps: List[Tuple[Optional[int], Issue]] = field(default_factory=list)
+    expressions: List[Issue] = field(default_factory=list)
+    has_input: bool = False
+    gosub_issues: List[Issue] = field(default_factory=list)
+    gosub_targets: List[int] = field(default_factory=list)
+    has_return: bool = False
+    return_exit: bool = False
+    edges: List[int] = field(default_factory=list)  # CFG edges without the fall-through
+    falls_through: bool = True
 
 @dataclass
 class Issue:
@@ -88,8 +141,20 @@ class SyntaxChecker:
         self.backward_goto_lines: set[int] = set()  # lines that end with unconditional backward GOTO (potential infinite loop)
         # Track subroutine targets for improved GOSUB/RETURN validation
         self.gosub_targets = set()  # set of subroutine entry line numbers targeted by GOSUB
+        self.return_index: List[int] = []  # sorted line numbers holding a RETURN (before REM)
+        self.return_exits: set[int] = set()  # lines whose RETURN is not behind an IF
+        self.source_text: str = ''
+        self.memory: Optional[MemoryReport] = None
+        # Where _add_issue appends; validate() points it at the current check's list
+        self._issue_sink: List[Issue] = self.issues
+        # Optional caches shared between checks of edited programs (see CheckerSession)
+        self.lex_cache: Optional[Dict[str, ast.Line]] = None
+        self.summary_cache: Optional[Dict[Tuple[int, str], LineSummary]] = None
+        self.converter: Optional[Bas2Prg] = None  # used for the tokenized program size
+        self.memory_cache: Optional[Dict[str, List[StatementFacts]]] = None
 
     def load(self, text: str):
+        self.source_text = text
         for idx, raw in enumerate(text.splitlines()):
             stripped = raw.strip()
             if not stripped:
@@ -105,422 +170,221 @@ class SyntaxChecker:
                 self._add_issue(num, 'ERROR', f"Duplicate line number {num}")
             content = m.group(2)
             bl = BasicLine(number=num, raw=raw, content=content)
-            bl.tokens = self._tokenize(content)
+            self._parse(bl)
             self.lines.append(bl)
             self.line_map[num] = bl
 
-    def _tokenize(self, content: str) -> List[str]:
-        tokens: List[str] = []
-        i = 0
-        in_string = False
-        current = ''
-        operator_chars = ':;,()=<>+-*/^'
-        while i < len(content):
-            c = content[i]
-            if c == '"':
-                current += c
-                i += 1
-                # collect until closing quote
-                while i < len(content):
-                    current += content[i]
-                    if content[i] == '"':
-                        i += 1
-                        break
-                    i += 1
-                tokens.append(current)
-                current = ''
-                continue
-            if c.isspace():
-                if current:
-                    tokens.append(current)
-                    current = ''
-                i += 1
-                continue
-            # separators & operators we treat as individual tokens
-            if c in operator_chars:
-                if current:
-                    tokens.append(current)
-                    current = ''
-                tokens.append(c)
-                i += 1
-                continue
-            current += c
-            i += 1
-        if current:
-            tokens.append(current)
-        return tokens
+    def _parse(self, bl: BasicLine):
+        """Attaches the line's AST; the lexemes and the parser's issues come with it."""
+        cache = self.lex_cache
+        parsed = cache.get(bl.content) if cache is not None else None
+        if parsed is None:
+            parsed = ast.parse_line(bl.content)
+            if cache is not None:
+                cache[bl.content] = parsed
+        bl.ast = parsed
 
     def validate(self):
-        self._check_quotes()
-        self._check_parentheses()
-        self._check_keywords()
-        self._check_if_then()
-        self._check_for_next()
-        self._check_goto_gosub()
-        self._check_on_goto_gosub()
-        self._check_expressions()
-        self._check_gosub_return()
-        self._build_cfg_and_flag_unreachable()
+        """
+        Runs the line-local checks once per line and builds the global checks
+        (FOR/NEXT nesting, jump targets, GOSUB/RETURN, reachability) from the
+        per-line summaries. Issues of each check are concatenated in the
+        original check order, so the report is the same as when every check
+        walked the whole program separately.
+        """
+        summaries = [self._summarize(bl) for bl in self.lines]
+        line_map = self.line_map
+        for_next: List[Issue] = []
+        for_stack: List[Tuple[int, Optional[str]]] = []
+        return_lines: List[int] = []
+        gosub_return: List[Issue] = []
+        cfg: List[Issue] = []
+        next_map = self._next_line_map()
+
+        for bl, summary in zip(self.lines, summaries):
+            for kind, var in summary.for_events:
+                if kind == 'FOR':
+                    for_stack.append((bl.number, var))
+                elif not for_stack:
+                    for_next.append(Issue(bl.number, 'ERROR', 'NEXT without matching FOR'))
+                else:
+                    start_line, for_var = for_stack.pop()
+                    if var and for_var and var != for_var:
+                        for_next.append(Issue(bl.number, 'WARN', f"NEXT variable {var} does not match FOR variable {for_var} (FOR at line {start_line})"))
+            if summary.has_input:
+                self.lines_with_input.add(bl.number)
+            gosub_return.extend(summary.gosub_issues)
+            self.gosub_targets.update(summary.gosub_targets)
+            if summary.has_return:
+                return_lines.append(bl.number)
+                if summary.return_exit:
+                    self.return_exits.add(bl.number)
+            edges = list(summary.edges)
+            if summary.falls_through:
+                nxt = next_map.get(bl.number)
+                if nxt is not None:
+                    edges.append(nxt)
+            self.cfg_edges[bl.number] = edges
+
+        if for_stack:
+            remaining = ', '.join(f"{v or '?'}@{ln}" for ln, v in for_stack)
+            for_next.append(Issue(None, 'ERROR', f"Unclosed FOR loops: {remaining}"))
+        self._finish_gosub_return(gosub_return, return_lines)
+        self._flag_unreachable(cfg)
+
+        issues = self.issues
+        for name in ('quotes', 'parens', 'keywords', 'if_then'):
+            for summary in summaries:
+                issues.extend(getattr(summary, name))
+        issues.extend(for_next)
+        for name in ('jumps', 'on_jumps'):
+            for summary in summaries:
+                issues.extend(issue for tgt, issue in getattr(summary, name) if tgt is None or tgt not in line_map)
+        for summary in summaries:
+            issues.extend(summary.expressions)
+        issues.extend(gosub_return)
+        issues.extend(cfg)
+        self._check_memory()
+
+    def _summarize(self, bl: BasicLine) -> LineSummary:
+        cache = self.summary_cache
+        if cache is not None:
+            summary = cache.get((bl.number, bl.content))
+            if summary is not None:
+                return summary
+        summary = LineSummary()
+        self._visit_quotes(bl, summary.quotes)
+        self._visit_parentheses(bl, summary.parens)
+        self._visit_keywords(bl, summary.keywords)
+        self._visit_if_then(bl, summary.if_then)
+        self._visit_for_next(bl, summary.for_events)
+        self._visit_goto_gosub(bl, summary.jumps)
+        self._visit_on_goto_gosub(bl, summary.on_jumps)
+        # The expression parser reports through _add_issue
+        self._issue_sink = summary.expressions
+        try:
+            summary.has_input = self._visit_expressions(bl)
+        finally:
+            self._issue_sink = self.issues
+        self._visit_gosub_return(bl, summary)
+        summary.edges, summary.falls_through = self._cfg_jumps(bl)
+        if cache is not None:
+            cache[(bl.number, bl.content)] = summary
+        return summary
 
     def _add_issue(self, line: Optional[int], severity: str, msg: str):
-        self.issues.append(Issue(line, severity, msg))
+        self._issue_sink.append(Issue(line, severity, msg))
 
-    def _check_quotes(self):
-        # tokenization already treats strings as single tokens; just ensure even number of '"'
-        for bl in self.lines:
-            if bl.content.count('"') % 2 != 0:
-                self._add_issue(bl.number, 'ERROR', 'Unmatched quotes')
+    def _parser_issues(self, bl: BasicLine, category: str):
+        """(target, issue) pairs the parser reported for one check category."""
+        return [(target, Issue(bl.number, severity, message))
+                for cat, severity, message, target in bl.ast.issues if cat == category]
 
-    def _check_parentheses(self):
-        for bl in self.lines:
-            stack = 0
-            for ch in bl.content:
-                if ch == '(':
+    def _visit_quotes(self, bl: BasicLine, issues: List[Issue]):
+        # A string runs to its closing quote or the line end; quotes after REM do not count
+        for lexeme in bl.ast.lexemes:
+            if lexeme.kind == ast.STRING and (len(lexeme.text) < 2 or not lexeme.text.endswith('"')):
+                issues.append(Issue(bl.number, 'ERROR', 'Unmatched quotes'))
+
+    def _visit_parentheses(self, bl: BasicLine, issues: List[Issue]):
+        if '(' not in bl.content and ')' not in bl.content:
+            return
+        stack = 0
+        for lexeme in bl.ast.lexemes:
+            text = lexeme.text
+            if lexeme.kind == ast.PUNCT:
+                if text == '(':
                     stack += 1
-                elif ch == ')':
+                elif text == ')':
                     stack -= 1
                     if stack < 0:
-                        self._add_issue(bl.number, 'ERROR', 'Closing parenthesis without matching opening')
+                        issues.append(Issue(bl.number, 'ERROR', 'Closing parenthesis without matching opening'))
                         break
-            if stack > 0:
-                self._add_issue(bl.number, 'ERROR', 'Unclosed parenthesis')
+            elif lexeme.kind == ast.KEYWORD and text.endswith('('):  # TAB( and SPC(
+                stack += 1
+        if stack > 0:
+            issues.append(Issue(bl.number, 'ERROR', 'Unclosed parenthesis'))
 
-    def _check_keywords(self):
-        for bl in self.lines:
-            # stop parsing after REM
-            for tok in bl.tokens:
-                u = tok.upper()
-                if u.startswith('"'):
-                    continue
-                if u == '?':
-                    continue  # synonym for PRINT
-                if u == 'REM':
-                    break
-                # Skip numeric literals, variable names, separators
-                if re.match(r'^\d+(\.\d+)?$', tok):
-                    continue
-                if tok in [':',';','(',',',')']:
-                    continue
-                # Skip operators
-                if u in ("=","+","-","/","*","^","<",">","<=",">=","<>"):
-                    continue
-                # function names with trailing $ or parenthesis handled by starting token
-                base = u.rstrip('()')
-                if base and base not in BASIC_KEYWORDS and not re.match(r'^[A-Z][A-Z0-9]*([\$%][A-Z0-9]*)?$', base):
-                    self._add_issue(bl.number, 'WARN', f"Unknown token '{tok}'")
+    def _visit_keywords(self, bl: BasicLine, issues: List[Issue]):
+        # Statements the parser could not read, then characters that are no part of BASIC
+        issues.extend(issue for _, issue in self._parser_issues(bl, ast.SYNTAX))
+        unknown = dict.fromkeys(lx.text for lx in bl.ast.lexemes if lx.kind == ast.OTHER and lx.text != '?')
+        issues.extend(Issue(bl.number, 'WARN', f"Unknown token '{text}'") for text in unknown)
 
-    def _check_if_then(self):
-        for bl in self.lines:
-            tokens_u = [t.upper() for t in bl.tokens]
-            if 'IF' in tokens_u:
-                # find THEN after IF before any colon
-                try:
-                    if_idx = tokens_u.index('IF')
-                    # ensure THEN exists
-                    if 'THEN' not in tokens_u[if_idx+1:]:
-                        self._add_issue(bl.number, 'ERROR', 'IF without THEN')
-                except ValueError:
-                    continue
+    def _visit_if_then(self, bl: BasicLine, issues: List[Issue]):
+        issues.extend(issue for _, issue in self._parser_issues(bl, ast.IF_THEN))
 
-    def _check_for_next(self):
-        # Track FOR variable stack
-        for_stack: List[Tuple[int, Optional[str]]] = []
-        for bl in self.lines:
-            # Ignore anything after REM in loop analysis to prevent false FOR in comments
-            effective_tokens = []
-            for t in bl.tokens:
-                if t.upper() == 'REM':
-                    break
-                effective_tokens.append(t)
-            tu = [t.upper() for t in effective_tokens]
-            i = 0
-            while i < len(tu):
-                if tu[i] == 'FOR':
-                    # expect variable name next like A= or A SPACE
-                    var = None
-                    j = i+1
-                    if j < len(effective_tokens):
-                        var_candidate = effective_tokens[j]
-                        if re.match(r'^[A-Za-z][A-Za-z0-9]*([\$%])?$', var_candidate):
-                            var = var_candidate.upper()
-                    for_stack.append((bl.number, var))
-                elif tu[i] == 'NEXT':
-                    # Support NEXT I,J,K : parse comma-separated identifiers after NEXT
-                    next_vars: List[str] = []
-                    k = i+1
-                    while k < len(effective_tokens):
-                        token = effective_tokens[k]
-                        if token == ',':
-                            k += 1
-                            continue
-                        if re.match(r'^[A-Za-z][A-Za-z0-9]*([\$%])?$', token):
-                            next_vars.append(token.upper())
-                            k += 1
-                            # If next token is not comma, break list
-                            if k >= len(effective_tokens) or effective_tokens[k] != ',':
-                                break
-                        else:
-                            break
-                    if not next_vars:
-                        next_vars = [None]  # single implicit NEXT without variable
-                    for nv in next_vars:
-                        if not for_stack:
-                            self._add_issue(bl.number, 'ERROR', 'NEXT without matching FOR')
-                        else:
-                            start_line, for_var = for_stack.pop()
-                            if nv and for_var and nv != for_var:
-                                self._add_issue(bl.number, 'WARN', f"NEXT variable {nv} does not match FOR variable {for_var} (FOR at line {start_line})")
-                i += 1
-        if for_stack:
-            remaining = ', '.join(f"{v or '?'}@{ln}" for ln, v in for_stack)
-            self._add_issue(None, 'ERROR', f"Unclosed FOR loops: {remaining}")
+    def _visit_for_next(self, bl: BasicLine, events: List[Tuple[str, Optional[str]]]):
+        for stmt in ast.iter_statements(bl.ast.statements):
+            kind = type(stmt)
+            if kind is ast.For:
+                events.append(('FOR', stmt.var))
+            elif kind is ast.Next:
+                # NEXT I,J closes two loops; a bare NEXT closes the innermost one
+                events.extend(('NEXT', var) for var in (stmt.vars or [None]))
 
-    def _check_goto_gosub(self):
-        for bl in self.lines:
-            tu = [t.upper() for t in bl.tokens]
-            for i, tok in enumerate(tu):
-                if tok in ('GOTO','GOSUB'):
-                    # next token should be a line number
-                    if i+1 >= len(bl.tokens):
-                        self._add_issue(bl.number, 'ERROR', f"{tok} without target line")
-                        continue
-                    target = bl.tokens[i+1]
-                    if not target.isdigit():
-                        self._add_issue(bl.number, 'ERROR', f"{tok} target '{target}' is not a line number")
-                        continue
-                    tnum = int(target)
-                    if tnum not in self.line_map:
-                        self._add_issue(bl.number, 'WARN', f"{tok} target line {tnum} does not exist")
-
-    def _check_on_goto_gosub(self):
-        for bl in self.lines:
-            tu = [t.upper() for t in bl.tokens]
-            for i, tok in enumerate(tu):
-                if tok == 'ON':
-                    # find GOTO/GOSUB later in line before REM/colon
-                    slice_tokens = tu[i+1:]
-                    mode = None
-                    if 'GOTO' in slice_tokens:
-                        mode = 'GOTO'
-                    elif 'GOSUB' in slice_tokens:
-                        mode = 'GOSUB'
-                    if not mode:
-                        self._add_issue(bl.number, 'ERROR', 'ON without GOTO/GOSUB')
-                        continue
-                    # line list after mode
-                    after_idx = slice_tokens.index(mode)
-                    line_list = bl.tokens[i+1+after_idx+1:]
-                    # collect numeric tokens until colon or end
-                    collected = []
-                    for t in line_list:
-                        if t == ':' or t.upper() == 'REM':
-                            break
-                        if t.endswith(','):
-                            t = t.rstrip(',')
-                        if t:
-                            collected.append(t)
-                    if not collected:
-                        self._add_issue(bl.number, 'ERROR', f"ON {mode} without line targets")
-                        continue
-                    for c in collected:
-                        if not c.isdigit():
-                            self._add_issue(bl.number, 'ERROR', f"ON {mode} target '{c}' not a number")
-                        else:
-                            tnum = int(c)
-                            if tnum not in self.line_map:
-                                self._add_issue(bl.number, 'WARN', f"ON {mode} target line {tnum} does not exist")
-                    # Static selector analysis: if expression immediately after ON is constant
-                    selector_tokens = bl.tokens[i+1:i+1+after_idx]  # tokens between ON and mode keyword
-                    if selector_tokens and len(selector_tokens) == 1 and selector_tokens[0].isdigit():
-                        sel_val = int(selector_tokens[0])
-                        # ON expr GOTO chooses line based on expr: 1 -> first list item
-                        if sel_val == 0:
-                            # falls through; warn if no fallthrough statement before end
-                            pass
-                        elif sel_val > len(collected):
-                            self._add_issue(bl.number, 'WARN', f"ON {mode} selector {sel_val} exceeds target list length {len(collected)}")
+    def _visit_goto_gosub(self, bl: BasicLine, issues: List[Tuple[Optional[int], Issue]]):
+        issues.extend(self._parser_issues(bl, ast.JUMPS))
 
-    # ------------------ Expression Checking ------------------
-    _OP_SET = {"+","-","*","/","^","AND","OR","=","<",">","<=",">=","<>"}
-
-    def _is_string(self, tok: str) -> bool:
-        return tok.startswith('"') and tok.endswith('"') and len(tok) >= 2
-
-    def _is_number(self, tok: str) -> bool:
-        return bool(re.match(r'^\d+(\.\d+)?$', tok))
-
-    def _is_identifier(self, tok: str) -> bool:
-        # Accept constructs like I%2 treating them as I% (type suffix before ignored trailing chars)
-        return bool(re.match(r'^[A-Za-z][A-Za-z0-9]*([\$%][A-Za-z0-9]*)?$', tok))
-
-    def _is_operator(self, tok: str) -> bool:
-        return tok.upper() in self._OP_SET
-
-    def _normalize_ops(self, tokens: List[str]) -> List[str]:
-        # Merge two-character comparison operators if tokenized separately (e.g., '>' '=')
-        merged = []
-        i = 0
-        while i < len(tokens):
-            t = tokens[i]
-            u = t.upper()
-            nxt = tokens[i+1] if i+1 < len(tokens) else None
-            pair = (u + (nxt.upper() if nxt else '')) if nxt else None
-            if nxt and pair in ('<=','>=','<>'):
-                merged.append(pair)
-                i += 2
-            else:
-                merged.append(t)
-                i += 1
-        return merged
-
-    def _split_statements(self, bl: BasicLine) -> List[List[str]]:
-        stmts: List[List[str]] = []
-        current: List[str] = []
-        for tok in bl.tokens:
-            if tok.upper() == 'REM':
-                # stop further processing on line
-                if current:
-                    stmts.append(current)
-                return stmts
-            if tok == ':':
-                stmts.append(current)
-                current = []
-            else:
-                current.append(tok)
-        if current:
-            stmts.append(current)
-        return stmts
-
-    def _find_expression_slices(self, stmt: List[str]) -> List[List[str]]:
-        """Return list of token slices that are likely expressions for basic validation.
-        Cases:
-        - LET var = expr
-        - var = expr (implicit LET)
-        - IF <expr> THEN ...
-        - FOR var = start TO end [STEP step]
-        """
-        slices: List[List[str]] = []
-        upper = [t.upper() for t in stmt]
-        # IF ... THEN
-        if 'IF' in upper and 'THEN' in upper:
-            i_if = upper.index('IF')
-            i_then = upper.index('THEN')
-            if i_then > i_if + 1:
-                slices.append(stmt[i_if+1:i_then])
-            # after THEN if first token numeric implies line number target; else remaining may be statements with expressions but we skip
-        # FOR var = start TO end STEP step
-        if len(stmt) >= 4 and upper[0] == 'FOR':
-            # find '=' then 'TO'
-            if '=' in stmt:
-                try:
-                    i_eq = stmt.index('=')
-                    if 'TO' in upper:
-                        i_to = upper.index('TO')
-                        if i_to > i_eq + 1:
-                            slices.append(stmt[i_eq+1:i_to])  # start expr
-                        # end expr until STEP or line end
-                        if 'STEP' in upper:
-                            i_step = upper.index('STEP')
-                            if i_step > i_to + 1:
-                                slices.append(stmt[i_to+1:i_step])
-                            if i_step + 1 < len(stmt):
-                                slices.append(stmt[i_step+1:])
-                        else:
-                            if i_to + 1 < len(stmt):
-                                slices.append(stmt[i_to+1:])
-                except ValueError:
-                    pass
-        # LET / implicit assignment
-        if upper and (upper[0] == 'LET' or (len(stmt) > 2 and stmt[1] == '=')):
-            if upper[0] == 'LET':
-                # expect pattern LET var = expr
-                if len(stmt) >= 4 and stmt[2] == '=':
-                    slices.append(stmt[3:])
-            else:
-                # implicit var = expr (even if var name invalid we still capture expression part)
-                if '=' in stmt:
-                    i_eq = stmt.index('=')
-                    if i_eq + 1 < len(stmt):
-                        slices.append(stmt[i_eq+1:])
-        return slices
-
-    def _validate_expression(self, expr_tokens: List[str], line_no: int):
-        if not expr_tokens:
-            return
-        parser = ExpressionParser(self, expr_tokens, line_no)
-        result_type = parser.parse_expression()
-        # Record type info if assignment target processed earlier via _check_expressions
-        # Type mismatch detection for '+' happens inside parser; here we could add more global checks if needed.
+    def _visit_on_goto_gosub(self, bl: BasicLine, issues: List[Tuple[Optional[int], Issue]]):
+        issues.extend(self._parser_issues(bl, ast.ON_JUMPS))
 
-    def _check_expressions(self):
-        for bl in self.lines:
-            stmts = self._split_statements(bl)
-            for stmt in stmts:
-                if not stmt:
-                    continue
-                upper0 = stmt[0].upper()
-                # Track dynamic input sources for relaxed reachability
-                if any(t.upper() in ('GET','INPUT') for t in stmt):
-                    self.lines_with_input.add(bl.number)
-                # Validate assignment LHS variable name (LET var = ... or implicit)
-                if upper0 == 'LET' and len(stmt) >= 3 and stmt[2] == '=':
-                    var_tok = stmt[1]
-                    if re.match(r'^[A-Za-z]', var_tok) and not self._is_identifier(var_tok):
-                        self._add_issue(bl.number, 'ERROR', f"Invalid variable name '{var_tok}'")
-                elif len(stmt) >= 3 and stmt[1] == '=':
-                    var_tok = stmt[0]
-                    if re.match(r'^[A-Za-z]', var_tok) and not self._is_identifier(var_tok):
-                        self._add_issue(bl.number, 'ERROR', f"Invalid variable name '{var_tok}'")
-                slices = self._find_expression_slices(stmt)
-                for expr in slices:
-                    self._validate_expression(expr, bl.number)
+    # ------------------ Expression Checking ------------------
+    def _visit_expressions(self, bl: BasicLine) -> bool:
+        """Validates the line's expressions; returns True if it reads input (GET / INPUT)."""
+        for _, issue in self._parser_issues(bl, ast.EXPRESSIONS):
+            self._add_issue(issue.line, issue.severity, issue.message)
+        has_input = False
+        checker = ExpressionParser(self, bl.number)
+        for stmt in ast.iter_statements(bl.ast.statements):
+            kind = type(stmt)
+            # Track dynamic input sources for relaxed reachability
+            if kind is ast.Input:
+                has_input = True
+            types = [checker.check(expr) for expr in ast.statement_expressions(stmt)]
+            if kind is ast.Let and 'unknown' not in types and types[0] != types[1]:
+                self._add_issue(bl.number, 'ERROR', f"Type mismatch assigning {types[1]} to {stmt.target.name}")
+        return has_input
 
     # ------------------ Control Flow Graph & Reachability ------------------
-    def _build_cfg_and_flag_unreachable(self):
-        if not self.lines:
-            return
+    def _next_line_map(self) -> Dict[int, Optional[int]]:
         ordered = sorted(self.line_map.keys())
-        next_map = {}
-        for idx, ln in enumerate(ordered):
-            next_map[ln] = ordered[idx+1] if idx+1 < len(ordered) else None
-        # Build edges
-        for bl in self.lines:
-            self.cfg_edges[bl.number] = []
-            terminating = False
-            stmts = self._split_statements(bl)
-            for stmt in stmts:
-                upper = [t.upper() for t in stmt]
-                if not stmt:
-                    continue
-                # IF with line-number THEN target
-                if 'IF' in upper and 'THEN' in upper:
-                    i_then = upper.index('THEN')
-                    if i_then + 1 < len(stmt) and stmt[i_then+1].isdigit():
-                        self.cfg_edges[bl.number].append(int(stmt[i_then+1]))
-                if upper and upper[0] in ('GOTO','GO','GOSUB'):
-                    # handle GOTO <n> or GOSUB <n>
-                    if len(stmt) >= 2 and stmt[1].isdigit():
-                        self.cfg_edges[bl.number].append(int(stmt[1]))
-                    if upper[0] == 'GOTO':
-                        terminating = True
-                        break
-                # Handle standalone GOTO/GOSUB inside line (not first token)
-                for i,tok in enumerate(upper):
-                    if tok in ('GOTO','GOSUB') and i+1 < len(stmt) and stmt[i+1].isdigit():
-                        self.cfg_edges[bl.number].append(int(stmt[i+1]))
-                        if tok == 'GOTO':
-                            terminating = True
+        return dict(zip(ordered, ordered[1:] + [None]))
+
+    def _cfg_jumps(self, bl: BasicLine) -> Tuple[List[int], bool]:
+        """Returns the line's jump edges and whether it falls through to the next line."""
+        edges: List[int] = []
+        for stmt in bl.ast.statements:
+            kind = type(stmt)
+            if kind is ast.Jump:
+                if stmt.target is not None:
+                    edges.append(stmt.target)
+                if stmt.keyword == 'GOTO':
+                    return edges, False
+            elif kind is ast.On:
+                # Out-of-range selectors continue with the next statement
+                edges.extend(target for target, _ in stmt.targets if target is not None)
+            elif kind is ast.If:
+                if stmt.then_target is not None:
+                    edges.append(stmt.then_target)
+                # The body ends the line; if the condition is false, the next line runs
+                for inner in ast.iter_statements(stmt.body):
+                    if type(inner) is ast.Jump and inner.target is not None:
+                        edges.append(inner.target)
+                        if inner.keyword == 'GOTO':
                             break
-                if terminating:
-                    break
-                if any(k in upper for k in ('END','STOP')):
-                    terminating = True
-                    break
-            if not terminating:
-                nxt = next_map.get(bl.number)
-                if nxt is not None:
-                    self.cfg_edges[bl.number].append(nxt)
-        # Reachability
+                    elif type(inner) is ast.On:
+                        edges.extend(target for target, _ in inner.targets if target is not None)
+                    elif type(inner) is ast.Command and inner.keyword in ('END', 'STOP'):
+                        break
+                return edges, True
+            elif kind is ast.Command and stmt.keyword in ('END', 'STOP'):
+                return edges, False
+        return edges, True
+
+    def _flag_unreachable(self, issues: List[Issue]):
+        if not self.lines:
+            return
         entry = min(self.line_map.keys())
         visited = set()
         stack = [entry]
@@ -532,11 +396,23 @@ class SyntaxChecker:
             for tgt in self.cfg_edges.get(ln, []):
                 if tgt in self.line_map and tgt not in visited:
                     stack.append(tgt)
-        for ln in ordered:
+        for ln in sorted(self.line_map.keys()):
             if ln not in visited:
                 self.unreachable.append(ln)
                 if self.enable_reachability_warnings:
-                    self._add_issue(ln, 'WARN', 'Unreachable line (no control-flow path)')
+                    issues.append(Issue(ln, 'WARN', 'Unreachable line (no control-flow path)'))
+
+    def _build_cfg_and_flag_unreachable(self):
+        if not self.lines:
+            return
+        next_map = self._next_line_map()
+        for bl in self.lines:
+            edges, falls_through = self._cfg_jumps(bl)
+            nxt = next_map.get(bl.number)
+            if falls_through and nxt is not None:
+                edges.append(nxt)
+            self.cfg_edges[bl.number] = edges
+        self._flag_unreachable(self.issues)
 
     def report(self, print_errors: bool = True, return_warnings: bool = True) -> Tuple[int,int]:
         """Return a human-readable text report of all issues.
@@ -582,227 +458,190 @@ class SyntaxChecker:
             },
             'unreachable': self.unreachable,
             'reachability_mode': self.reachability_mode,
+            'memory': self.memory.to_dict() if self.memory is not None else None,
         }
 
+    # --------------- Memory Footprint ---------------
+    def _check_memory(self):
+        if not self.lines:
+            return
+        self.memory = analyze_memory(self.source_text, converter=self.converter, line_cache=self.memory_cache)
+        if not self.memory.fits:
+            self._add_issue(None, 'ERROR', f"Out of memory: {self.memory.summary()}")
+        elif self.memory.free_bytes < 0:
+            self._add_issue(None, 'WARN', f"String heap may run out of memory: {self.memory.summary()}")
+
     # --------------- GOSUB / RETURN Matching ---------------
-    def _check_gosub_return(self):
-        # Collect all GOSUB target line numbers
-        for bl in self.lines:
-            tokens_before_rem = []
-            for t in bl.tokens:
-                if t.upper() == 'REM':
+    def _visit_gosub_return(self, bl: BasicLine, summary: LineSummary):
+        # Collect GOSUB target line numbers and the lines holding a RETURN
+        for stmt in ast.iter_statements(bl.ast.statements):
+            kind = type(stmt)
+            if kind is ast.Jump and stmt.keyword == 'GOSUB':
+                if stmt.target is None:
+                    summary.gosub_issues.append(Issue(bl.number,'ERROR','GOSUB without target line'))
+                else:
+                    summary.gosub_targets.append(stmt.target)
+            elif kind is ast.On and stmt.mode == 'GOSUB':
+                summary.gosub_targets.extend(target for target, _ in stmt.targets if target is not None)
+            elif kind is ast.Command and stmt.keyword == 'RETURN':
+                summary.has_return = True
+        if summary.has_return:
+            # Everything after THEN is conditional, including later statements
+            for stmt in bl.ast.statements:
+                if type(stmt) is ast.Command and stmt.keyword == 'RETURN':
+                    summary.return_exit = True
                     break
-                tokens_before_rem.append(t)
-            upper = [t.upper() for t in tokens_before_rem]
-            for i,tok in enumerate(upper):
-                if tok == 'GOSUB':
-                    if i+1 >= len(upper) or not upper[i+1].isdigit():
-                        self._add_issue(bl.number,'ERROR','GOSUB without target line')
-                    else:
-                        tgt = int(upper[i+1])
-                        self.gosub_targets.add(tgt)
-        # For each target line, ensure there's a RETURN after it
-        for tgt in sorted(self.gosub_targets):
-            has_return = False
-            for bl in self.lines:
-                if bl.number < tgt:
-                    continue
-                # stop scanning if we reach next subroutine start (another target) and haven't found RETURN yet? We still continue; single RETURN suffices.
-                tokens_before_rem = []
-                for t in bl.tokens:
-                    if t.upper() == 'REM':
-                        break
-                    tokens_before_rem.append(t)
-                if any(t.upper() == 'RETURN' for t in tokens_before_rem):
-                    has_return = True
+                if type(stmt) is ast.If:
                     break
-            if not has_return:
-                self._add_issue(None,'ERROR',f"Missing RETURN for GOSUB target line {tgt}")
+
+    def _finish_gosub_return(self, issues: List[Issue], return_lines: List[int]):
+        self.return_index = sorted(set(return_lines))
+        # For each target line, ensure there's a RETURN at or after it; a single RETURN suffices
+        for tgt in sorted(self.gosub_targets):
+            if self.next_return(tgt) is None:
+                issues.append(Issue(None,'ERROR',f"Missing RETURN for GOSUB target line {tgt}"))
         # Detect stray RETURN with no preceding GOSUB target line at all
         if not self.gosub_targets:
-            for bl in self.lines:
-                tokens_before_rem = []
-                for t in bl.tokens:
-                    if t.upper() == 'REM':
-                        break
-                    tokens_before_rem.append(t)
-                if any(t.upper() == 'RETURN' for t in tokens_before_rem):
-                    self._add_issue(bl.number,'WARN','RETURN appears but no GOSUB targets found')
+            for ln in return_lines:
+                issues.append(Issue(ln,'WARN','RETURN appears but no GOSUB targets found'))
+
+    def next_return(self, line: int) -> Optional[int]:
+        """First line number >= line that holds a RETURN, or None. Valid after validate()."""
+        idx = bisect_left(self.return_index, line)
+        return self.return_index[idx] if idx < len(self.return_index) else None
+
+    def subroutine_extents(self) -> Dict[int, Subroutine]:
+        """
+        Extent of every GOSUB target, derived from the CFG: the lines reachable
+        from the entry without passing an unconditional RETURN. Jumps into
+        another target are recorded as calls and not followed, so shared code
+        belongs to the subroutine that owns its entry. Valid after validate().
+        """
+        extents: Dict[int, Subroutine] = {}
+        for entry in sorted(self.gosub_targets):
+            if entry not in self.line_map:
+                continue
+            sub = Subroutine(entry)
+            visited = {entry}
+            calls = set()
+            stack = [entry]
+            while stack:
+                ln = stack.pop()
+                if ln in self.return_exits:
+                    continue
+                for tgt in self.cfg_edges.get(ln, []):
+                    if tgt in self.gosub_targets and tgt != entry:
+                        calls.add(tgt)
+                    elif tgt in self.line_map and tgt not in visited:
+                        visited.add(tgt)
+                        stack.append(tgt)
+            sub.lines = sorted(visited)
+            sub.returns = [ln for ln in sub.lines if self.next_return(ln) == ln]
+            sub.calls = sorted(calls)
+            extents[entry] = sub
+        return extents
 
-# ------------------ Expression Parser with Precedence ------------------
+# ------------------ Expression Type Checking ------------------
 class ExpressionParser:
-    def __init__(self, checker: SyntaxChecker, tokens: List[str], line_no: int):
+    """
+    Type checks expressions of the parsed line (c64_ast nodes): operand types
+    of every operator, function argument counts and unclosed parentheses.
+    """
+    def __init__(self, checker: SyntaxChecker, line_no: int):
         self.c = checker
-        self.toks = checker._normalize_ops(tokens)
-        self.pos = 0
         self.line_no = line_no
 
-    def peek(self) -> Optional[str]:
-        return self.toks[self.pos] if self.pos < len(self.toks) else None
-
-    def advance(self) -> Optional[str]:
-        t = self.peek()
-        if t is not None:
-            self.pos += 1
-        return t
-
-    def parse_expression(self) -> str:
-        etype = self.parse_or()
-        if self.peek() is not None:
-            # leftover tokens; mark as suspicious
-            self.c._add_issue(self.line_no,'WARN', f"Unexpected token '{self.peek()}' after expression")
-        return etype
-
-    # Precedence: OR > AND > REL > ADD > MUL > UNARY > PRIMARY
-    def parse_or(self) -> str:
-        left = self.parse_and()
-        while True:
-            tok = self.peek()
-            if tok and tok.upper() == 'OR':
-                self.advance()
-                right = self.parse_and()
-                left = self.combine_types(left,right,'OR')
-            else:
-                break
-        return left
-
-    def parse_and(self) -> str:
-        left = self.parse_rel()
-        while True:
-            tok = self.peek()
-            if tok and tok.upper() == 'AND':
-                self.advance()
-                right = self.parse_rel()
-                left = self.combine_types(left,right,'AND')
-            else:
-                break
-        return left
-
-    def parse_rel(self) -> str:
-        left = self.parse_add()
-        tok = self.peek()
-        if tok and tok.upper() in ('=','<','>','<=','>=','<>'):
-            self.advance()
-            right = self.parse_add()
-            # relational result numeric (treated as boolean numeric)
+    def check(self, node) -> str:
+        """Returns 'string', 'numeric' or 'unknown' and reports the issues found."""
+        return self.visit(node)
+
+    def issue(self, severity: str, message: str):
+        self.c._add_issue(self.line_no, severity, message)
+
+    def visit(self, node) -> str:
+        kind = type(node)
+        if kind is ast.Number:
             return 'numeric'
-        return left
-
-    def parse_add(self) -> str:
-        left = self.parse_mul()
-        while True:
-            tok = self.peek()
-            if tok in ('+','-'):
-                op = tok
-                self.advance()
-                right = self.parse_mul()
-                # Type rules for '+' (string concatenation) and '-' (numeric only)
-                if op == '+':
-                    if left == 'string' and right == 'string':
-                        left = 'string'
-                    elif left == 'numeric' and right == 'numeric':
-                        left = 'numeric'
-                    else:
-                        # Mixed types
-                        self.c._add_issue(self.line_no,'ERROR', f"Type mismatch for '+' between {left} and {right}")
-                        left = 'unknown'
-                else:  # '-'
-                    if left != 'numeric' or right != 'numeric':
-                        self.c._add_issue(self.line_no,'ERROR', "'-' applied to non-numeric operand")
-                        left = 'unknown'
-                    else:
-                        left = 'numeric'
-            else:
-                break
-        return left
-
-    def parse_mul(self) -> str:
-        left = self.parse_unary()
-        while True:
-            tok = self.peek()
-            if tok in ('*','/','^'):
-                self.advance()
-                right = self.parse_unary()
-                if left != 'numeric' or right != 'numeric':
-                    self.c._add_issue(self.line_no,'ERROR', f"Operator '{tok}' applied to non-numeric operand")
-                    left = 'unknown'
-                else:
-                    left = 'numeric'
-            else:
-                break
-        return left
-
-    def parse_unary(self) -> str:
-        tok = self.peek()
-        if tok and tok.upper() in ('-','NOT'):
-            self.advance()
-            inner = self.parse_unary()
-            if tok == '-' and inner != 'numeric':
-                self.c._add_issue(self.line_no,'ERROR', "Unary '-' on non-numeric operand")
+        if kind is ast.String:
+            return 'string'
+        if kind is ast.Variable:
+            return self.infer_var_type(node.name)
+        if kind is ast.Binary:
+            return self.visit_binary(node)
+        if kind is ast.Unary:
+            inner = self.visit(node.operand)
+            if node.op == 'NOT':
+                return self.combine_types(inner, 'numeric', 'NOT')
+            if inner != 'numeric':
+                self.issue('ERROR', f"Unary '{node.op}' on non-numeric operand")
                 return 'unknown'
             return inner
-        return self.parse_primary()
-
-    def parse_primary(self) -> str:
-        tok = self.peek()
-        if tok is None:
-            self.c._add_issue(self.line_no,'ERROR','Empty expression')
-            return 'unknown'
-        u = tok.upper()
-        # Parenthesized expression
-        if tok == '(':
-            self.advance()
-            inner = self.parse_or()
-            if self.peek() != ')':
-                self.c._add_issue(self.line_no,'ERROR','Missing closing parenthesis in expression')
-            else:
-                self.advance()
+        if kind is ast.Paren:
+            inner = self.visit(node.expr)
+            if not node.closed:
+                self.issue('ERROR', 'Missing closing parenthesis in expression')
             return inner
-        # String literal
-        if self.c._is_string(tok):
-            self.advance(); return 'string'
-        # Number literal
-        if self.c._is_number(tok):
-            self.advance(); return 'numeric'
-        # Built-in constant PI
-        if u == 'PI':
-            self.advance(); return 'numeric'
-        # Identifier / function / array
-        if self.c._is_identifier(tok):
-            name = tok.upper(); self.advance()
-            # Array or function call if next token '('
-            if self.peek() == '(':
-                self.advance()  # consume '('
-                args: List[str] = []
-                if self.peek() == ')':
-                    self.advance()
-                else:
-                    while True:
-                        arg_type = self.parse_or()
-                        args.append(arg_type)
-                        if self.peek() == ',':
-                            self.advance(); continue
-                        elif self.peek() == ')':
-                            self.advance(); break
-                        else:
-                            self.c._add_issue(self.line_no,'ERROR', 'Function/array call missing closing )')
-                            break
-                if name in FUNC_INFO:
-                    ret_type, min_args, max_args = FUNC_INFO[name]
-                    argc = len(args)
-                    if argc < min_args or (max_args >= 0 and argc > max_args):
-                        self.c._add_issue(self.line_no,'ERROR', f"{name} expects {min_args}-{max_args} args, got {argc}")
-                    return ret_type
-                else:
-                    # Treat as array usage; no type change
-                    return self.infer_var_type(name)
-            # Plain variable
-            return self.infer_var_type(name)
-        # Fallback
-        self.c._add_issue(self.line_no,'WARN', f"Unrecognized token '{tok}' in expression")
-        self.advance()
+        if kind is ast.Call:
+            return self.visit_call(node)
+        if kind is ast.Missing:
+            self.issue('ERROR', 'Empty expression')
+            return 'unknown'
+        if kind is ast.Invalid:
+            self.issue('WARN', f"Unrecognized token '{node.text}' in expression")
         return 'unknown'
 
+    def visit_binary(self, node) -> str:
+        # The left operands of a chain (1+2+3+...) are walked in a loop, so a long sum does not recurse
+        chain = []
+        while type(node) is ast.Binary:
+            chain.append(node)
+            node = node.left
+        result = self.visit(node)
+        for binary in reversed(chain):
+            result = self.binary_type(binary.op, result, self.visit(binary.right))
+        return result
+
+    def binary_type(self, op: str, left: str, right: str) -> str:
+        # Type rules for '+' (string concatenation) and '-' (numeric only)
+        if op == '+':
+            if left == right and left != 'unknown':
+                return left
+            if 'unknown' in (left, right):
+                return 'unknown'
+            self.issue('ERROR', f"Type mismatch for '+' between {left} and {right}")
+            return 'unknown'
+        if op == '-':
+            if left != 'numeric' or right != 'numeric':
+                self.issue('ERROR', "'-' applied to non-numeric operand")
+                return 'unknown'
+            return 'numeric'
+        if op in ('*', '/', '^'):
+            if left != 'numeric' or right != 'numeric':
+                self.issue('ERROR', f"Operator '{op}' applied to non-numeric operand")
+                return 'unknown'
+            return 'numeric'
+        if op in ast.RELATIONAL:
+            # Strings compare with strings, numbers with numbers; the result is numeric
+            if 'unknown' not in (left, right) and left != right:
+                self.issue('ERROR', f"Type mismatch for '{op}' between {left} and {right}")
+            return 'numeric'
+        return self.combine_types(left, right, op)
+
+    def visit_call(self, node) -> str:
+        args = [self.visit(arg) for arg in node.args]
+        if not node.closed:
+            self.issue('ERROR', 'Function/array call missing closing )')
+        if node.function and node.name in FUNC_INFO:
+            ret_type, min_args, max_args = FUNC_INFO[node.name]
+            argc = len(args)
+            if argc < min_args or (max_args >= 0 and argc > max_args):
+                self.issue('ERROR', f"{node.name} expects {min_args}-{max_args} args, got {argc}")
+            return ret_type
+        if node.function:
+            return 'numeric'  # FN
+        # Array element: typed like the array
+        return self.infer_var_type(node.name)
+
     def infer_var_type(self, name: str) -> str:
         # Derive type from suffix
         if name.endswith('$'): return 'string'
@@ -812,12 +651,547 @@ class ExpressionParser:
 
     def combine_types(self, left: str, right: str, op: str) -> str:
         # Logical ops expect numeric (boolean) operands; treat non-numeric as error
+        if left == 'unknown' or right == 'unknown':
+            return 'unknown'
         if left != 'numeric' or right != 'numeric':
-            self.c._add_issue(self.line_no,'ERROR', f"Operator {op} applied to non-numeric operand(s) {left}/{right}")
+            self.issue('ERROR', f"Operator {op} applied to non-numeric operand(s) {left}/{right}")
             return 'unknown'
         return 'numeric'
 
 
+# Gap between the order keys of neighbouring lines of a CheckerSession, so
+# lines inserted between two others rarely need the keys renumbered
+ORDER_GAP = 1 << 20
+# Parent links CheckerSession follows to tell whether a line is still reached
+# from the program start before it searches the control-flow graph again
+MAX_PARENT_STEPS = 64
+
+
+@dataclass(eq=False)
+class SourceRow:
+    """One source line of a CheckerSession and what it contributes; compared by identity."""
+    order: int  # increases through the program, see ORDER_GAP
+    raw: str
+    line: Optional[BasicLine] = None  # None for empty lines and lines without a line number
+    summary: Optional[LineSummary] = None
+    range_issues: List[Issue] = field(default_factory=list)
+    duplicate: bool = False
+    jump_issues: List[Issue] = field(default_factory=list)  # reported jumps and ON jumps
+    on_jump_issues: List[Issue] = field(default_factory=list)
+    # FOR stacks before and after the line's FOR and NEXT, as (entry, rest) pairs
+    for_before: object = None
+    for_after: object = None
+    for_issues: List[Issue] = field(default_factory=list)
+    memory: Optional[MemoryLine] = None
+
+
+class CheckerSession:
+    """
+    Re-checks successive versions of a program, e.g. inside the fix loop.
+
+    The session keeps every source line with its parsed line, the results of
+    its line-local checks and what it adds to the program-wide checks, so
+    update() only analyzes the lines that changed. The program-wide checks
+    are kept up to date the same way instead of being rebuilt:
+    - line numbers map to their lines, which gives duplicates, the line map
+      and the jumps to missing lines, looked at again only for the numbers
+      that appear or disappear
+    - the FOR stack is kept before and after each line with FOR or NEXT and
+      replayed from each changed one until it matches the kept stack
+    - GOSUB targets, RETURN lines and the lines with input are counted, so
+      the missing RETURNs come from the last RETURN line
+    - every reached line keeps the line it was reached from; a removed edge
+      only matters when it was that one, and the line is then hooked to
+      another reached line or the graph is searched again
+    - the memory footprint comes from a c64_memory.MemoryTracker
+    The result is identical to a cold check, and a small edit takes well
+    under a millisecond for a typical generated game of a few hundred lines
+    and about half a millisecond at 2500 lines
+    (benchmarks/bench_syntax_checker.py). Only splitting the new source and
+    comparing it with the kept lines still grows with the program.
+
+    update() returns the session's own checker, updated in place by the next
+    update().
+    """
+    def __init__(self):
+        self.enable_reachability_warnings: bool = True
+        self.reachability_mode: str = 'strict'
+        self.checker: Optional[SyntaxChecker] = None
+        self.source: Optional[str] = None
+        self.changed_lines: int = 0  # lines analyzed by the last update()
+        self._lex_cache: Dict[str, ast.Line] = {}
+        self._summary_cache: Dict[Tuple[int, str], LineSummary] = {}
+        self._converter = Bas2Prg()
+        self._reset()
+
+    def _reset(self):
+        self._rows: List[SourceRow] = []
+        self._lineless: List[int] = []  # orders of the rows without a line number
+        self._raw: List[str] = []
+        self._by_number: Dict[int, List[SourceRow]] = {}
+        self._numbers: List[int] = []  # sorted line numbers in use
+        self._for_rows: List[SourceRow] = []  # rows with FOR or NEXT, in program order
+        self._for_issue_rows: set = set()
+        self._jumps_to: Dict[int, set] = {}  # target -> rows jumping there
+        self._load_rows: set = set()
+        self._local_rows: set = set()
+        self._jump_rows: set = set()
+        self._return_rows: set = set()
+        self._gosub_counts: Dict[int, int] = {}
+        self._sorted_targets: List[int] = []
+        self._return_counts: Dict[int, int] = {}
+        self._exit_counts: Dict[int, int] = {}
+        self._input_counts: Dict[int, int] = {}
+        self._missing_issues: Dict[int, Issue] = {}
+        self._preds: Dict[int, set] = {}
+        self._parent: Dict[int, Optional[int]] = {}
+        self._reached: set = set()
+        self._unreached: set = set()
+        self._unreached_changed = False
+        self._cfg_issues: List[Issue] = []
+        self._entry: Optional[int] = None
+        self._memory = MemoryTracker(self._converter)
+        self._local_issues: Dict[str, List[Issue]] = {}
+        self._for_next: List[Issue] = []
+        self._jump_issues: List[Issue] = []
+        checker = self.checker = SyntaxChecker()
+        checker.lex_cache = self._lex_cache
+        checker.summary_cache = self._summary_cache
+        checker.converter = self._converter
+
+    def update(self, new_source: str) -> SyntaxChecker:
+        """Checks new_source and returns the validated checker."""
+        checker = self.checker
+        settings = (self.enable_reachability_warnings, self.reachability_mode)
+        if new_source == self.source and settings == (checker.enable_reachability_warnings, checker.reachability_mode):
+            self.changed_lines = 0
+            return checker
+        self._unreached_changed = settings != (checker.enable_reachability_warnings, checker.reachability_mode)
+        checker.enable_reachability_warnings, checker.reachability_mode = settings
+        raws = new_source.splitlines()
+        old = self._raw
+        self._touched: set = set()
+        self._new_rows: List[SourceRow] = []
+        self._for_changed: List[int] = []
+        self._local_changed = self._jumps_changed = False
+        self.changed_lines = 0
+        if len(raws) == len(old):
+            # Edited lines: each one is replaced on its own
+            for idx in compress(range(len(raws)), map(ne, raws, old)):
+                self._replace(idx, idx + 1, raws[idx:idx + 1])
+        else:
+            # Lines inserted or removed: the lines between the common start and end are replaced
+            size = min(len(raws), len(old))
+            start = next(compress(range(size), map(ne, raws, old)), size)
+            end = next(compress(range(size - start), map(ne, reversed(raws), reversed(old))), size - start)
+            self._replace(start, len(old) - end, raws[start:len(raws) - end])
+        self._raw = raws
+        self._settle()
+        checker.source_text = new_source
+        self.source = new_source
+        self._prune()
+        return checker
+
+    # ------------------ Lines ------------------
+    def _replace(self, start: int, stop: int, raws: List[str]):
+        """Replaces the rows start:stop with rows for raws."""
+        rows = self._rows
+        # Where the rows' lines are in checker.lines
+        first = start - (bisect_left(self._lineless, rows[start].order) if start < len(rows) else len(self._lineless))
+        last = first + sum(1 for row in rows[start:stop] if row.line is not None)
+        for row in rows[start:stop]:
+            self._remove_row(row)
+        step = ORDER_GAP
+        if stop - start == len(raws):
+            orders = [row.order for row in rows[start:stop]]
+        else:
+            low = rows[start - 1].order if start else 0
+            high = rows[stop].order if stop < len(rows) else low + (len(raws) + 1) * ORDER_GAP
+            step = (high - low) // (len(raws) + 1)
+            orders = [low + step * (i + 1) for i in range(len(raws))]
+        rows[start:stop] = new_rows = [self._add_row(raw, order) for raw, order in zip(raws, orders)]
+        self.checker.lines[first:last] = [row.line for row in new_rows if row.line is not None]
+        if not step:
+            # No room left between the neighbours
+            for i, row in enumerate(rows):
+                row.order = row.memory.order = (i + 1) * ORDER_GAP
+            self._lineless = [row.order for row in rows if row.line is None]
+            self._for_changed = [row.order for row in rows]
+
+    def _add_row(self, raw: str, order: int) -> SourceRow:
+        row = SourceRow(order, raw)
+        self._new_rows.append(row)
+        row.memory = self._memory.add_line(raw, order)
+        stripped = raw.strip()
+        m = LINE_RE.match(stripped)
+        if not m:
+            insort(self._lineless, order)
+            if stripped:
+                self._load_rows.add(row)
+            return row
+        num = int(m.group(1))
+        if not (0 <= num <= 63999):
+            row.range_issues.append(Issue(num, 'ERROR', f"Line number {num} out of range (0-63999)"))
+        bl = row.line = BasicLine(number=num, raw=raw, content=m.group(2))
+        checker = self.checker
+        checker._parse(bl)
+        if (num, bl.content) not in self._summary_cache:
+            self.changed_lines += 1
+        summary = row.summary = checker._summarize(bl)
+        insort(self._by_number.setdefault(num, []), row, key=_order)
+        self._touched.add(num)
+        self._index(row, 1)
+        return row
+
+    def _remove_row(self, row: SourceRow):
+        self._memory.remove_line(row.memory)
+        self._load_rows.discard(row)
+        if row.line is None:
+            del self._lineless[bisect_left(self._lineless, row.order)]
+            return
+        num = row.line.number
+        rows = self._by_number[num]
+        del rows[_position(rows, row)]
+        self._touched.add(num)
+        self._index(row, -1)
+
+    def _index(self, row: SourceRow, sign: int):
+        """Adds (sign 1) or takes away (sign -1) what the row contributes to the program-wide checks."""
+        summary, num = row.summary, row.line.number
+        if summary.for_events:
+            if sign > 0:
+                insort(self._for_rows, row, key=_order)
+            else:
+                del self._for_rows[_position(self._for_rows, row)]
+                self._for_issue_rows.discard(row)
+            self._for_changed.append(row.order)
+        if summary.quotes or summary.parens or summary.keywords or summary.if_then or summary.expressions \
+                or summary.gosub_issues:
+            _add_or_discard(self._local_rows, row, sign)
+            self._local_changed = True
+        for target in {target for target, _ in summary.jumps + summary.on_jumps if target is not None}:
+            rows = self._jumps_to.setdefault(target, set())
+            _add_or_discard(rows, row, sign)
+            if not rows:
+                del self._jumps_to[target]
+        if sign < 0 and row in self._jump_rows:
+            self._jump_rows.discard(row)
+            self._jumps_changed = True
+        for target in summary.gosub_targets:
+            if _count(self._gosub_counts, target, sign):
+                if sign > 0:
+                    self.checker.gosub_targets.add(target)
+                    insort(self._sorted_targets, target)
+                else:
+                    self.checker.gosub_targets.discard(target)
+                    self._sorted_targets.remove(target)
+        if summary.has_return:
+            _add_or_discard(self._return_rows, row, sign)
+            if _count(self._return_counts, num, sign):
+                if sign > 0:
+                    insort(self.checker.return_index, num)
+                else:
+                    self.checker.return_index.remove(num)
+            if summary.return_exit and _count(self._exit_counts, num, sign):
+                _add_or_discard(self.checker.return_exits, num, sign)
+        if summary.has_input and _count(self._input_counts, num, sign):
+            _add_or_discard(self.checker.lines_with_input, num, sign)
+
+    # ------------------ Program-wide checks ------------------
+    def _settle(self):
+        """Brings the program-wide checks up to date with the replaced rows."""
+        checker = self.checker
+        line_map = checker.line_map
+        numbers = self._numbers
+        added, removed = [], []
+        for num in self._touched:
+            rows = self._by_number.get(num)
+            if not rows:
+                self._by_number.pop(num, None)
+                if line_map.pop(num, None) is not None:
+                    del numbers[bisect_left(numbers, num)]
+                    removed.append(num)
+                continue
+            if num not in line_map:
+                insort(numbers, num)
+                added.append(num)
+            line_map[num] = rows[-1].line
+            for i, row in enumerate(rows):
+                row.duplicate = i > 0
+                _add_or_discard(self._load_rows, row, 1 if row.range_issues or row.duplicate else -1)
+
+        # Jumps to lines that appeared or disappeared, and those of the new rows
+        recheck = {row for row in self._new_rows if row.line is not None}
+        for num in added + removed:
+            recheck.update(self._jumps_to.get(num, ()))
+        for row in recheck:
+            summary = row.summary
+            row.jump_issues = [issue for tgt, issue in summary.jumps if tgt is None or tgt not in line_map]
+            row.on_jump_issues = [issue for tgt, issue in summary.on_jumps if tgt is None or tgt not in line_map]
+            _add_or_discard(self._jump_rows, row, 1 if row.jump_issues or row.on_jump_issues else -1)
+            self._jumps_changed = True
+
+        self._replay_for_next()
+        self._update_cfg(added, removed)
+        self._collect_issues()
+        checker.memory = self._memory.report() if checker.lines else None
+        checker.issues = self._issues_with_memory(checker.memory)
+
+    def _replay_for_next(self):
+        """Replays the FOR stack from each changed row with FOR or NEXT until it matches the kept one."""
+        if not self._for_changed:
+            return
+        rows = self._for_rows
+        changed = sorted(self._for_changed)
+        idx = bisect_left(rows, changed[0], key=_order)
+        stack = rows[idx - 1].for_after if idx else None
+        while idx < len(rows):
+            row = rows[idx]
+            pending = bisect_left(changed, row.order)
+            if row.for_before is stack and (pending == len(changed) or changed[pending] > row.order):
+                # The kept stack again: skip to the next change
+                if pending == len(changed):
+                    break
+                idx = bisect_left(rows, changed[pending], key=_order)
+                stack = rows[idx - 1].for_after
+                continue
+            idx += 1
+            row.for_before = stack
+            row.for_issues = issues = []
+            number = row.line.number
+            for kind, var in row.summary.for_events:
+                if kind == 'FOR':
+                    stack = ((number, var), stack)
+                elif stack is None:
+                    issues.append(Issue(number, 'ERROR', 'NEXT without matching FOR'))
+                else:
+                    (start_line, for_var), stack = stack
+                    if var and for_var and var != for_var:
+                        issues.append(Issue(number, 'WARN', f"NEXT variable {var} does not match FOR variable {for_var} (FOR at line {start_line})"))
+            row.for_after = stack
+            _add_or_discard(self._for_issue_rows, row, 1 if issues else -1)
+        for_next = [issue for row in sorted(self._for_issue_rows, key=_order) for issue in row.for_issues]
+        stack = rows[-1].for_after if rows else None
+        if stack is not None:
+            remaining = []
+            while stack is not None:
+                entry, stack = stack
+                remaining.append(entry)
+            remaining = ', '.join(f"{v or '?'}@{ln}" for ln, v in reversed(remaining))
+            for_next.append(Issue(None, 'ERROR', f"Unclosed FOR loops: {remaining}"))
+        self._for_next = for_next
+
+    def _edges(self, num: int) -> Optional[List[int]]:
+        """CFG edges of a line number, None if there is no such line."""
+        rows = self._by_number.get(num)
+        if not rows:
+            return None
+        summary = rows[-1].summary
+        edges = list(summary.edges)
+        if summary.falls_through:
+            idx = bisect_right(self._numbers, num)
+            if idx < len(self._numbers):
+                edges.append(self._numbers[idx])
+        return edges
+
+    def _update_cfg(self, added: List[int], removed: List[int]):
+        cfg_edges = self.checker.cfg_edges
+        numbers = self._numbers
+        # Lines that changed, and the ones before lines that appeared or disappeared, which fall through elsewhere now
+        affected = set(self._touched)
+        for num in added + removed:
+            idx = bisect_left(numbers, num)
+            if idx:
+                affected.add(numbers[idx - 1])
+        removed_edges, added_edges = [], []
+        for num in affected:
+            edges = self._edges(num)
+            before = cfg_edges.pop(num, None)
+            if edges is not None:
+                cfg_edges[num] = edges
+            if edges == before:
+                continue
+            before, after = set(before or ()), set(edges or ())
+            for target in before - after:
+                preds = self._preds[target]
+                preds.discard(num)
+                if not preds:
+                    del self._preds[target]
+                removed_edges.append((num, target))
+            for target in after - before:
+                self._preds.setdefault(target, set()).add(num)
+                added_edges.append((num, target))
+        self._update_reachability(added, removed, added_edges, removed_edges)
+
+    def _update_reachability(self, added: List[int], removed: List[int], added_edges: List[Tuple[int, int]],
+                             removed_edges: List[Tuple[int, int]]):
+        line_map = self.checker.line_map
+        reached, parent, unreached = self._reached, self._parent, self._unreached
+        entry = self._numbers[0] if self._numbers else None
+        if entry != self._entry:
+            self._entry = entry
+            self._reach_all()
+            return
+        unreached.update(added)
+        if added or removed:
+            self._unreached_changed = True
+        for num in removed:
+            unreached.discard(num)
+            if num in reached:
+                reached.discard(num)
+                del parent[num]
+        # Lines reached over a removed edge: hooked to another reached line that is not reached through them
+        damaged = {target for source, target in removed_edges if target in reached and parent[target] == source}
+        progress = True
+        while damaged and progress:
+            progress = False
+            for num in list(damaged):
+                source = next((pred for pred in self._preds.get(num, ()) if pred in reached
+                               and self._rooted(pred, damaged)), None)
+                if source is not None:
+                    parent[num] = source
+                    damaged.discard(num)
+                    progress = True
+        if damaged:
+            self._reach_all()
+            return
+        frontier = []
+        for source, target in added_edges:
+            if source in reached and target in line_map and target not in reached:
+                self._reach(target, source, frontier)
+        for num in added:
+            source = next((pred for pred in self._preds.get(num, ()) if pred in reached), None)
+            if source is not None and num not in reached:
+                self._reach(num, source, frontier)
+        self._search(frontier)
+
+    def _rooted(self, num: int, damaged: set) -> bool:
+        """Whether the parent links lead from a reached line to the program start without passing damaged lines."""
+        parent = self._parent
+        for _ in range(MAX_PARENT_STEPS):
+            if num in damaged:
+                return False
+            num = parent[num]
+            if num is None:
+                return True
+        return False
+
+    def _reach(self, num: int, source: Optional[int], frontier: List[int]):
+        self._reached.add(num)
+        self._unreached.discard(num)
+        self._unreached_changed = True
+        self._parent[num] = source
+        frontier.append(num)
+
+    def _search(self, frontier: List[int]):
+        """Breadth-first from the newly reached lines, so the parent links stay short."""
+        line_map, reached, cfg_edges = self.checker.line_map, self._reached, self.checker.cfg_edges
+        for num in frontier:
+            for target in cfg_edges[num]:
+                if target in line_map and target not in reached:
+                    self._reach(target, num, frontier)
+
+    def _reach_all(self):
+        self._reached = set()
+        self._parent = {}
+        self._unreached = set(self._numbers)
+        self._unreached_changed = True
+        frontier = []
+        if self._entry is not None:
+            self._reach(self._entry, None, frontier)
+        self._search(frontier)
+
+    # ------------------ Issues ------------------
+    def _collect_issues(self):
+        checker = self.checker
+        if self._local_changed:
+            local_rows = sorted(self._local_rows, key=_order)
+            self._local_issues = {name: [issue for row in local_rows for issue in getattr(row.summary, name)]
+                                  for name in ('quotes', 'parens', 'keywords', 'if_then', 'expressions', 'gosub_issues')}
+        if self._jumps_changed:
+            jump_rows = sorted(self._jump_rows, key=_order)
+            self._jump_issues = [issue for row in jump_rows for issue in row.jump_issues] + \
+                [issue for row in jump_rows for issue in row.on_jump_issues]
+        load = []
+        for row in sorted(self._load_rows, key=_order):
+            if row.line is None:
+                idx = self._rows.index(row)
+                load.append(Issue(None, 'ERROR', f"Missing/invalid line number on line {idx+1}: '{row.raw}'"))
+                continue
+            load.extend(row.range_issues)
+            if row.duplicate:
+                load.append(Issue(row.line.number, 'ERROR', f"Duplicate line number {row.line.number}"))
+        # A GOSUB target needs a RETURN at or after it
+        targets = self._sorted_targets
+        missing = targets[bisect_right(targets, checker.return_index[-1]):] if checker.return_index else targets
+        gosub_return = list(self._local_issues.get('gosub_issues', ()))
+        for target in missing:
+            issue = self._missing_issues.get(target)
+            if issue is None:
+                issue = self._missing_issues[target] = Issue(None, 'ERROR', f"Missing RETURN for GOSUB target line {target}")
+            gosub_return.append(issue)
+        if not checker.gosub_targets:
+            gosub_return.extend(Issue(row.line.number, 'WARN', 'RETURN appears but no GOSUB targets found')
+                                for row in sorted(self._return_rows, key=_order))
+        if self._unreached_changed:
+            checker.unreachable = sorted(self._unreached) if checker.lines else []
+            self._cfg_issues = [Issue(ln, 'WARN', 'Unreachable line (no control-flow path)') for ln in checker.unreachable] \
+                if checker.enable_reachability_warnings else []
+        local = self._local_issues
+        self._issues = load + [issue for name in ('quotes', 'parens', 'keywords', 'if_then') for issue in local.get(name, ())] \
+            + self._for_next + self._jump_issues + local.get('expressions', []) + gosub_return + self._cfg_issues
+
+    def _issues_with_memory(self, memory: Optional[MemoryReport]) -> List[Issue]:
+        issues = list(self._issues)
+        if memory is not None and not memory.fits:
+            issues.append(Issue(None, 'ERROR', f"Out of memory: {memory.summary()}"))
+        elif memory is not None and memory.free_bytes < 0:
+            issues.append(Issue(None, 'WARN', f"String heap may run out of memory: {memory.summary()}"))
+        return issues
+
+    def _prune(self):
+        # Drop entries of removed or edited lines once they outnumber the live ones
+        lines = self.checker.lines
+        if len(self._summary_cache) > 2 * len(lines):
+            live = {(bl.number, bl.content) for bl in lines}
+            self._summary_cache = {k: v for k, v in self._summary_cache.items() if k in live}
+            self.checker.summary_cache = self._summary_cache
+        if len(self._lex_cache) > 2 * len(lines):
+            contents = {bl.content for bl in lines}
+            self._lex_cache = {k: v for k, v in self._lex_cache.items() if k in contents}
+            self.checker.lex_cache = self._lex_cache
+        memory_cache = self._memory.line_cache
+        if len(memory_cache) > 2 * len(self._rows):
+            # The memory tracker keys on the content as Bas2Prg sees it, so rebuild from scratch
+            memory_cache.clear()
+
+
+def _order(row: SourceRow) -> int:
+    return row.order
+
+
+def _position(rows: List[SourceRow], row: SourceRow) -> int:
+    """Index of a row in a list of rows sorted by order."""
+    return bisect_left(rows, row.order, key=_order)
+
+
+def _add_or_discard(items: set, item, sign: int):
+    if sign > 0:
+        items.add(item)
+    else:
+        items.discard(item)
+
+
+def _count(counts: Dict[int, int], key: int, sign: int) -> bool:
+    """Counts key up or down; True when it was counted for the first time or no longer counts."""
+    count = counts.get(key, 0) + sign
+    if count:
+        counts[key] = count
+    else:
+        del counts[key]
+    return count == (1 if sign > 0 else 0)
+
+
 def check_file(path: str, return_structured: bool = False):
     with open(path, 'r', encoding='utf-8') as f:
         text = f.read()
@@ -839,7 +1213,8 @@ def check_file(path: str, return_structured: bool = False):
     return 1 if errors else 0
 
 
-def check_source(source: str, return_structured: bool = False, print_errors: bool = True, return_warnings: bool = True) -> str | Dict[str, object]:
+def check_source(source: str, return_structured: bool = False, print_errors: bool = True, return_warnings: bool = True,
+                 session: Optional[CheckerSession] = None) -> str | Dict[str, object]:
     """Validate C64 BASIC source provided directly as a string.
 
     This now returns a textual report when `return_structured` is False instead
@@ -854,20 +1229,25 @@ def check_source(source: str, return_structured: bool = False, print_errors: boo
         source: Full BASIC program text with line-numbered lines.
         return_structured: If True, returns structured dict (issues + summary).
         print_errors: If True, also prints the textual report to stdout.
+        session: Optional CheckerSession; only lines changed since its last
+            check are analyzed again.
 
     Returns:
         str: Multiline textual report (when return_structured=False)
         dict: Structured issues + summary (when return_structured=True)
     """
-    sc = SyntaxChecker()
+    sc = session if session is not None else SyntaxChecker()
     import os
     if os.getenv('C64_NO_REACH') == '1':
         sc.enable_reachability_warnings = False
     reach_mode_env = os.getenv('C64_REACH_MODE')
     if reach_mode_env in ('strict','relaxed'):
         sc.reachability_mode = reach_mode_env
-    sc.load(source)
-    sc.validate()
+    if session is not None:
+        sc = session.update(source)
+    else:
+        sc.load(source)
+        sc.validate()
     if return_structured:
         return sc.structured()
     report_text = sc.report(print_errors=print_errors, return_warnings=return_warnings)
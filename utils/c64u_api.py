@@ -1,9 +1,13 @@
 import asyncio
 import aiohttp
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Union
 
 DEFAULT_TIMEOUT_SECONDS = 10
 
+# Request bodies are passed to aiohttp as they are, so a memoryview of the
+# converter's buffer (Bas2Prg.convert_view) is uploaded without a copy
+BytesLike = Union[bytes, bytearray, memoryview]
+
 class C64UApiClient:
     def __init__(self, api_base: str, timeout_seconds: int = DEFAULT_TIMEOUT_SECONDS):
         self.api_base = api_base.rstrip("/")
@@ -23,7 +27,7 @@ class C64UApiClient:
         endpoint = endpoint.lstrip("/")
         return f"{self.api_base}/v1/{endpoint}"
     
-    def prg_load_address(self, prg: bytes) -> Optional[int]:
+    def prg_load_address(self, prg: BytesLike) -> Optional[int]:
         if len(prg) < 2:
             return None
         return prg[0] | (prg[1] << 8)
@@ -34,7 +38,7 @@ class C64UApiClient:
         endpoint: str,
         params: Optional[Dict[str, Any]] = None,
         json_data: Optional[Dict[str, Any]] = None,
-        raw_data: Optional[bytes] = None,
+        raw_data: Optional[BytesLike] = None,
         headers: Optional[Dict[str, str]] = None,
     ) -> Dict[str, Any]:
         if not self.api_base:
@@ -101,7 +105,7 @@ class C64UApiClient:
             return False
         return True
 
-    async def run_prg_binary(self, prg_data_binary: bytes) -> Dict[str, Any]:
+    async def run_prg_binary(self, prg_data_binary: BytesLike) -> Dict[str, Any]:
         load_addr = self.prg_load_address(prg_data_binary)
         # Check if load_addr is valid (must be within C64 address space)
         if load_addr is None or load_addr > 0xFFFF:
@@ -119,6 +123,20 @@ class C64UApiClient:
         return resp
 
 
+    async def mount_disk_image(self, image_data: BytesLike, drive: str = "a", image_type: str = "d64") -> Dict[str, Any]:
+        """Uploads a disk image (e.g. a D64 built by utils.d64) and mounts it on the given drive."""
+        resp = await self.request(
+            method="POST",
+            endpoint=f"drives/{drive}:mount",
+            params={"type": image_type},
+            raw_data=image_data,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+
+        resp["size_bytes"] = len(image_data)
+        return resp
+
+
 async def main() -> None:
 
     api_base_test = "http://192.168.1.100"
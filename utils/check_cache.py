@@ -0,0 +1,183 @@
+"""
+Syntax Check Result Cache
+
+The agent often checks exactly the same source several times in a row, e.g.
+when the model re-checks without changing anything or the user asks again.
+In LLM mode every one of those checks is a paid model round trip. Results
+are cached under (source hash, checker mode, checker version, model id):
+- An in-memory LRU tier, always on.
+- An optional SQLite tier shared between sessions and restarts. Entries
+  older than the TTL are treated as misses and deleted.
+
+Hits and misses are counted per tier; stats() reports them with the hit rate.
+
+Environment:
+    SYNTAX_CHECK_CACHE_DB   Path of the SQLite file (no disk tier if unset)
+    SYNTAX_CHECK_CACHE_TTL  Disk entry lifetime in seconds (default 7 days)
+
+Usage:
+    python check_cache.py cache.sqlite [--purge]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MEMORY_CACHE_SIZE = 256
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+
+def check_cache_key(source_code: str, mode: str, checker_version: str, model_id: str = "") -> str:
+    """Hash of the source plus everything that can change the check result."""
+    h = hashlib.sha256(source_code.encode("utf-8"))
+    h.update(json.dumps({"mode": mode, "version": checker_version, "model": model_id}, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class SyntaxCheckCache:
+    def __init__(self, max_entries: int = MEMORY_CACHE_SIZE, db_path: Optional[str] = None,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        """
+        Args:
+            max_entries: Size of the in-memory LRU tier.
+            db_path: SQLite file for the disk tier, None for memory only.
+            ttl_seconds: Lifetime of disk entries.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, Dict[str, object]]" = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.db_path = db_path
+        self.db: Optional[sqlite3.Connection] = None
+        # Tool calls may come from different threads
+        self.lock = threading.Lock()
+        if db_path:
+            try:
+                self.db = sqlite3.connect(db_path, check_same_thread=False)
+                self.db.execute("CREATE TABLE IF NOT EXISTS check_results "
+                                "(key TEXT PRIMARY KEY, result TEXT NOT NULL, created REAL NOT NULL)")
+                self.db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Syntax check disk cache '{db_path}' is not available: {e}")
+                self.db = None
+
+    @classmethod
+    def from_env(cls) -> "SyntaxCheckCache":
+        ttl = os.getenv("SYNTAX_CHECK_CACHE_TTL")
+        return cls(db_path=os.getenv("SYNTAX_CHECK_CACHE_DB") or None,
+                   ttl_seconds=float(ttl) if ttl else DEFAULT_TTL_SECONDS)
+
+    def get(self, key: str) -> Optional[Dict[str, object]]:
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+                self.memory_hits += 1
+                return result
+            result = self._disk_get(key)
+            if result is not None:
+                self.disk_hits += 1
+                self._remember(key, result)
+                return result
+            self.misses += 1
+            return None
+
+    def put(self, key: str, result: Dict[str, object]) -> None:
+        """Stores a JSON-serializable result in both tiers."""
+        with self.lock:
+            self._remember(key, result)
+            if self.db is None:
+                return
+            try:
+                self.db.execute("INSERT OR REPLACE INTO check_results (key, result, created) VALUES (?, ?, ?)",
+                                (key, json.dumps(result), time.time()))
+                self.db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Unable to store syntax check result: {e}")
+
+    def purge_expired(self) -> int:
+        """Deletes expired disk entries; returns how many were removed."""
+        if self.db is None:
+            return 0
+        with self.lock:
+            cursor = self.db.execute("DELETE FROM check_results WHERE created < ?", (time.time() - self.ttl_seconds,))
+            self.db.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "lookups": lookups,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.entries),
+            "disk": self.db_path if self.db is not None else None,
+        }
+
+    def close(self) -> None:
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def _remember(self, key: str, result: Dict[str, object]) -> None:
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[Dict[str, object]]:
+        if self.db is None:
+            return None
+        try:
+            row = self.db.execute("SELECT result, created FROM check_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[1] > self.ttl_seconds:
+                self.db.execute("DELETE FROM check_results WHERE key = ?", (key,))
+                self.db.commit()
+                return None
+            return json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Unable to read syntax check result: {e}")
+            return None
+
+# -----------------------------------------------------------------------------
+# Command Line Interface
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or purge a syntax check disk cache.")
+    parser.add_argument('db_path', help="SQLite cache file")
+    parser.add_argument('--purge', action='store_true', help="Delete expired entries")
+    parser.add_argument('--ttl', type=float, default=DEFAULT_TTL_SECONDS, help="Entry lifetime in seconds for --purge")
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db_path):
+        logger.error(f"Cache file '{args.db_path}' does not exist")
+        sys.exit(3)
+    cache = SyntaxCheckCache(db_path=args.db_path, ttl_seconds=args.ttl)
+    if cache.db is None:
+        sys.exit(1)
+    if args.purge:
+        print(f"Removed {cache.purge_expired()} expired entries")
+    count, oldest = cache.db.execute("SELECT COUNT(*), MIN(created) FROM check_results").fetchone()
+    age = f", oldest {(time.time() - oldest) / 3600:.1f} h old" if oldest else ""
+    print(f"{count} cached result(s){age}")
+    cache.close()
+
+if __name__ == '__main__':
+    main()
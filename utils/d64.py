@@ -0,0 +1,290 @@
+"""
+D64 (1541 disk image) writer
+
+Packs PRG files, e.g. the output of Bas2Prg.convert, into a standard 35 track
+D64 image so a whole batch of programs can be mounted once instead of being
+uploaded one by one.
+
+Layout follows the 1541 DOS:
+- Track 18 sector 0 holds the BAM and the disk name, the directory chain
+  starts at 18/1 and uses an interleave of 3 on track 18.
+- File data is allocated starting next to the directory track, alternating
+  below and above it, with an interleave of 10 sectors within a track.
+- Each data sector starts with a link to the next track/sector; the last
+  sector stores 0 and the index of its last used byte.
+
+The image is updated in place: replacing one file only frees and rewrites
+that file's sectors plus the BAM and directory, so rebuilding after a single
+change does not re-write the rest of the disk.
+
+Usage:
+    python d64.py -o games.d64 [-n "DISK NAME"] game1.prg game2.prg ...
+"""
+import argparse
+import sys
+import os
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+NUM_TRACKS = 35
+SECTOR_SIZE = 256
+DATA_BYTES_PER_SECTOR = 254
+DIR_TRACK = 18
+FILE_INTERLEAVE = 10
+DIR_INTERLEAVE = 3
+DIR_ENTRIES_PER_SECTOR = 8
+FILE_TYPE_PRG = 0x82  # closed PRG
+PAD = 0xA0
+
+def sectors_per_track(track: int) -> int:
+    if track <= 17:
+        return 21
+    if track <= 24:
+        return 19
+    if track <= 30:
+        return 18
+    return 17
+
+# Byte offset of sector 0 of each track (index 0 unused)
+TRACK_OFFSETS = [0] * (NUM_TRACKS + 2)
+for _track in range(1, NUM_TRACKS + 1):
+    TRACK_OFFSETS[_track + 1] = TRACK_OFFSETS[_track] + sectors_per_track(_track) * SECTOR_SIZE
+del _track
+IMAGE_SIZE = TRACK_OFFSETS[NUM_TRACKS + 1]  # 174848 bytes, 683 sectors
+
+# Tracks used for file data: closest to the directory first, like the 1541 DOS
+ALLOC_TRACK_ORDER = [t for pair in zip(range(DIR_TRACK - 1, 0, -1), range(DIR_TRACK + 1, NUM_TRACKS + 1)) for t in pair]
+ALLOC_TRACK_ORDER += [t for t in range(DIR_TRACK + 1, NUM_TRACKS + 1) if t not in ALLOC_TRACK_ORDER]
+
+def _interleaved_order(num_sectors: int, first: int, interleave: int) -> List[int]:
+    order = []
+    sector = first
+    used = set()
+    while len(order) < num_sectors - first:
+        while sector in used or sector < first:
+            sector = (sector + 1) % num_sectors
+        order.append(sector)
+        used.add(sector)
+        sector = (sector + interleave) % num_sectors
+    return order
+
+# Directory sectors in chain order (18/0 is the BAM)
+DIR_SECTOR_ORDER = _interleaved_order(sectors_per_track(DIR_TRACK), 1, DIR_INTERLEAVE)
+MAX_FILES = len(DIR_SECTOR_ORDER) * DIR_ENTRIES_PER_SECTOR
+
+def sector_offset(track: int, sector: int) -> int:
+    return TRACK_OFFSETS[track] + sector * SECTOR_SIZE
+
+def petscii_filename(name: str) -> bytes:
+    """Upper-cases the name and maps it to PETSCII, at most 16 characters."""
+    name = name.upper()[:16]
+    return bytes(ord(c) if 0x20 <= ord(c) <= 0x5F else ord('?') for c in name)
+
+
+class D64Image:
+    def __init__(self, disk_name: str = "VIBEC64", disk_id: str = "64"):
+        self.disk_name = petscii_filename(disk_name)
+        self.disk_id = petscii_filename(disk_id)[:2].ljust(2, b' ')
+        self.image = bytearray(IMAGE_SIZE)
+        # free[track] is the set of free sectors on that track
+        self.free: Dict[int, set] = {t: set(range(sectors_per_track(t))) for t in range(1, NUM_TRACKS + 1)}
+        self.free[DIR_TRACK] = set()  # track 18 is reserved for BAM + directory
+        # Ordered directory: PETSCII name -> (data, sector chain)
+        self.files: Dict[bytes, Tuple[bytes, List[Tuple[int, int]]]] = {}
+        self._write_directory()
+
+    def blocks_free(self) -> int:
+        return sum(len(s) for t, s in self.free.items() if t != DIR_TRACK)
+
+    def add_file(self, name: str, prg_data: bytes) -> bool:
+        """
+        Adds a PRG or replaces the file with the same name.
+
+        Returns:
+            False if an identical file is already present (nothing written),
+            True otherwise.
+
+        Raises:
+            ValueError: If the directory or the disk is full.
+        """
+        key = petscii_filename(name)
+        prg_data = bytes(prg_data)
+        existing = self.files.get(key)
+        if existing is not None and existing[0] == prg_data:
+            return False
+        if existing is None and len(self.files) >= MAX_FILES:
+            raise ValueError(f"Directory full ({MAX_FILES} files)")
+
+        needed = max(1, -(-len(prg_data) // DATA_BYTES_PER_SECTOR))
+        if existing is not None:
+            self._free_chain(existing[1])
+        if needed > self.blocks_free():
+            if existing is not None:
+                self._claim_chain(existing[1])
+            raise ValueError(f"Disk full: '{name}' needs {needed} blocks, {self.blocks_free()} free")
+
+        chain = self._allocate(needed)
+        self._write_chain(chain, prg_data)
+        self.files[key] = (prg_data, chain)
+        self._write_directory()
+        return True
+
+    def remove_file(self, name: str) -> bool:
+        key = petscii_filename(name)
+        entry = self.files.pop(key, None)
+        if entry is None:
+            return False
+        self._free_chain(entry[1])
+        self._write_directory()
+        return True
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.image)
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            f.write(self.image)
+
+    # ------------------ Allocation ------------------
+    def _free_chain(self, chain: List[Tuple[int, int]]) -> None:
+        for track, sector in chain:
+            self.free[track].add(sector)
+
+    def _claim_chain(self, chain: List[Tuple[int, int]]) -> None:
+        for track, sector in chain:
+            self.free[track].discard(sector)
+
+    def _allocate(self, count: int) -> List[Tuple[int, int]]:
+        chain: List[Tuple[int, int]] = []
+        for track in ALLOC_TRACK_ORDER:
+            free = self.free[track]
+            if not free:
+                continue
+            spt = sectors_per_track(track)
+            sector = 0
+            while free and len(chain) < count:
+                while sector not in free:
+                    sector = (sector + 1) % spt
+                free.remove(sector)
+                chain.append((track, sector))
+                sector = (sector + FILE_INTERLEAVE) % spt
+            if len(chain) == count:
+                break
+        return chain
+
+    # ------------------ Sector Writers ------------------
+    def _write_chain(self, chain: List[Tuple[int, int]], data: bytes) -> None:
+        view = memoryview(data)
+        for idx, (track, sector) in enumerate(chain):
+            offset = sector_offset(track, sector)
+            chunk = view[idx * DATA_BYTES_PER_SECTOR:(idx + 1) * DATA_BYTES_PER_SECTOR]
+            if idx + 1 < len(chain):
+                next_track, next_sector = chain[idx + 1]
+            else:
+                # Last sector: track 0, sector byte is the index of the last used byte
+                next_track, next_sector = 0, len(chunk) + 1
+            self.image[offset:offset + SECTOR_SIZE] = bytes(SECTOR_SIZE)
+            self.image[offset] = next_track
+            self.image[offset + 1] = next_sector
+            self.image[offset + 2:offset + 2 + len(chunk)] = chunk
+
+    def _write_directory(self) -> None:
+        entries = list(self.files.items())
+        num_dir_sectors = max(1, -(-len(entries) // DIR_ENTRIES_PER_SECTOR))
+        dir_sectors = DIR_SECTOR_ORDER[:num_dir_sectors]
+
+        for idx, sector in enumerate(DIR_SECTOR_ORDER):
+            offset = sector_offset(DIR_TRACK, sector)
+            self.image[offset:offset + SECTOR_SIZE] = bytes(SECTOR_SIZE)
+            if idx >= num_dir_sectors:
+                continue
+            if idx + 1 < num_dir_sectors:
+                self.image[offset] = DIR_TRACK
+                self.image[offset + 1] = dir_sectors[idx + 1]
+            else:
+                self.image[offset + 1] = 0xFF
+            for slot, (name, (data, chain)) in enumerate(entries[idx * DIR_ENTRIES_PER_SECTOR:(idx + 1) * DIR_ENTRIES_PER_SECTOR]):
+                entry = offset + slot * 32
+                self.image[entry + 2] = FILE_TYPE_PRG
+                self.image[entry + 3] = chain[0][0]
+                self.image[entry + 4] = chain[0][1]
+                self.image[entry + 5:entry + 21] = name.ljust(16, bytes([PAD]))
+                self.image[entry + 30] = len(chain) & 0xFF
+                self.image[entry + 31] = len(chain) >> 8
+
+        self._write_bam(dir_sectors)
+
+    def _write_bam(self, dir_sectors: List[int]) -> None:
+        offset = sector_offset(DIR_TRACK, 0)
+        bam = bytearray(SECTOR_SIZE)
+        bam[0] = DIR_TRACK
+        bam[1] = DIR_SECTOR_ORDER[0]
+        bam[2] = 0x41  # 'A' - 1541 DOS format
+        dir_free = set(range(sectors_per_track(DIR_TRACK))) - {0} - set(dir_sectors)
+        for track in range(1, NUM_TRACKS + 1):
+            free = dir_free if track == DIR_TRACK else self.free[track]
+            bitmap = 0
+            for sector in free:
+                bitmap |= 1 << sector
+            entry = 4 + (track - 1) * 4
+            bam[entry] = len(free)
+            bam[entry + 1] = bitmap & 0xFF
+            bam[entry + 2] = (bitmap >> 8) & 0xFF
+            bam[entry + 3] = (bitmap >> 16) & 0xFF
+        bam[0x90:0xA0] = self.disk_name.ljust(16, bytes([PAD]))
+        bam[0xA0:0xA2] = bytes([PAD, PAD])
+        bam[0xA2:0xA4] = self.disk_id
+        bam[0xA4] = PAD
+        bam[0xA5:0xA7] = b"2A"
+        bam[0xA7:0xAB] = bytes([PAD] * 4)
+        self.image[offset:offset + SECTOR_SIZE] = bam
+
+
+def build_d64(programs: Dict[str, bytes], disk_name: str = "VIBEC64", disk_id: str = "64") -> bytes:
+    """
+    Builds a D64 image from a {filename: prg_bytes} mapping (in directory order).
+    """
+    image = D64Image(disk_name=disk_name, disk_id=disk_id)
+    for name, prg_data in programs.items():
+        image.add_file(name, prg_data)
+    return image.to_bytes()
+
+# -----------------------------------------------------------------------------
+# Command Line Interface
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack PRG files into a D64 disk image.")
+    parser.add_argument('filenames', nargs='+', help="PRG files to add")
+    parser.add_argument('-o', '--output', required=True, help="Output D64 filename")
+    parser.add_argument('-n', '--name', default="VIBEC64", help="Disk name (default VIBEC64)")
+    parser.add_argument('-i', '--id', default="64", help="Disk ID (default 64)")
+
+    args = parser.parse_args()
+
+    programs = {}
+    for filename in args.filenames:
+        try:
+            with open(filename, 'rb') as f:
+                programs[os.path.splitext(os.path.basename(filename))[0]] = f.read()
+        except Exception as e:
+            logger.error(f"Error reading input: {e}")
+            sys.exit(3)
+
+    try:
+        image_data = build_d64(programs, disk_name=args.name, disk_id=args.id)
+    except ValueError as e:
+        logger.error(f"Unable to build image: {e}")
+        sys.exit(1)
+
+    try:
+        with open(args.output, 'wb') as f:
+            f.write(image_data)
+    except Exception as e:
+        logger.error(f"Unable to create output '{args.output}': {e}")
+        sys.exit(2)
+
+if __name__ == '__main__':
+    main()
@@ -18,6 +18,9 @@ from typing import Optional, Union
 
 logger = logging.getLogger(__name__)
 
+# In-memory program data accepted by the send functions
+BytesLike = Union[bytes, bytearray, memoryview]
+
 
 class KungFuFlashUSB:
     """
@@ -187,15 +190,31 @@ class KungFuFlashUSB:
                 
         return False
         
-    def send_prg(self, filename: Union[str, Path], verbose: bool = False) -> bool:
+    def _load_payload(self, source: Union[str, Path, BytesLike], kind: str) -> memoryview:
+        """
+        Returns the payload as a memoryview: bytes-like data is used as it is,
+        a path is read from disk.
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return memoryview(source).cast('B')
+        filepath = Path(source)
+        if not filepath.exists():
+            raise FileNotFoundError(f"{kind} file not found: {source}")
+        with open(filepath, 'rb') as f:
+            return memoryview(f.read())
+
+    def send_prg(self, filename: Union[str, Path, BytesLike], verbose: bool = False) -> bool:
         """
-        Send a PRG file to the KungFuFlash cartridge and execute it.
+        Send a PRG to the KungFuFlash cartridge and execute it.
         
-        This function sends a PRG file via USB and starts it on the C64.
+        This function sends a PRG via USB and starts it on the C64.
         The cartridge must be in the launcher menu for this to work.
         
         Args:
-            filename: Path to the PRG file to send
+            filename: Path to the PRG file to send, or the PRG data itself
+                (bytes, bytearray or memoryview, e.g. Bas2Prg.convert_view).
+                In-memory data is chunked through memoryview slices, so it
+                is never copied here.
             verbose: Print progress information
             
         Returns:
@@ -208,20 +227,14 @@ class KungFuFlashUSB:
         if not self.serial or not self.serial.is_open:
             raise RuntimeError("Serial port not connected")
             
-        filepath = Path(filename)
-        if not filepath.exists():
-            raise FileNotFoundError(f"PRG file not found: {filename}")
-            
-        # Read the PRG file
-        with open(filepath, 'rb') as f:
-            prg_data = f.read()
+        prg_data = self._load_payload(filename, "PRG")
             
         if len(prg_data) < 2:
             logger.error("Error: PRG file too small (must be at least 2 bytes)")
             return False
             
         if verbose:
-            logger.info(f"Loaded PRG file: {filepath.name} ({len(prg_data)} bytes)")
+            logger.info(f"Loaded PRG ({len(prg_data)} bytes)")
             
         # Send handshake
         if verbose:
@@ -252,6 +265,7 @@ class KungFuFlashUSB:
                 remaining = len(prg_data) - offset
                 send_size = min(remaining, chunk_size)
                 
+                # memoryview slice: the chunk is not copied
                 chunk = prg_data[offset:offset + send_size]
                 
                 # Send chunk size (little-endian 16-bit)
@@ -355,14 +369,14 @@ class KungFuFlashUSB:
         
         return True
         
-    def send_crt(self, filename: Union[str, Path], verbose: bool = False) -> bool:
+    def send_crt(self, filename: Union[str, Path, BytesLike], verbose: bool = False) -> bool:
         """
         Send a CRT file to the KungFuFlash cartridge.
         
         Note: This is a basic implementation. The full CRT protocol is more complex.
         
         Args:
-            filename: Path to the CRT file to send
+            filename: Path to the CRT file to send, or the CRT data itself
             verbose: Print progress information
             
         Returns:
@@ -375,16 +389,10 @@ class KungFuFlashUSB:
         if not self.serial or not self.serial.is_open:
             raise RuntimeError("Serial port not connected")
             
-        filepath = Path(filename)
-        if not filepath.exists():
-            raise FileNotFoundError(f"CRT file not found: {filename}")
-            
-        # Read the CRT file
-        with open(filepath, 'rb') as f:
-            crt_data = f.read()
+        crt_data = self._load_payload(filename, "CRT")
             
         if verbose:
-            logger.info(f"Loaded CRT file: {filepath.name} ({len(crt_data)} bytes)")
+            logger.info(f"Loaded CRT ({len(crt_data)} bytes)")
             
         # Send handshake
         if verbose:
@@ -0,0 +1,183 @@
+import struct
+import argparse
+import sys
+import logging
+
+try:
+    from utils.bas2prg import Bas2Prg, TOKENS
+    from utils.c64_petscii import byte_to_macro, byte_to_private_use, is_printable
+except ModuleNotFoundError:
+    from bas2prg import Bas2Prg, TOKENS
+    from c64_petscii import byte_to_macro, byte_to_private_use, is_printable
+
+logger = logging.getLogger(__name__)
+
+TOKEN_REM = 0x8F
+QUOTE = 0x22
+
+# Reverse token table: byte value -> keyword text (0x80-0xFF)
+TOKEN_TEXT = {index + 128: token_str for index, token_str in enumerate(TOKENS)}
+
+# Literal byte tables used inside strings and after REM (and for non-token
+# bytes outside of them). Listing mode writes control codes as brace macros
+# such as {CLR}; raw mode writes C64 Pro Mono private use characters, which
+# Bas2Prg converts back to the exact same byte.
+LISTING_CHARS = [chr(b) if is_printable(b) else byte_to_macro(b) for b in range(256)]
+RAW_CHARS = [chr(b) if is_printable(b) else byte_to_private_use(b) for b in range(256)]
+
+
+class Prg2Bas:
+    def __init__(self, control_codes=True):
+        """
+        Args:
+            control_codes: If True, non-printable PETSCII bytes are written as
+                brace macros ({CLR}, {$a0}) for a readable listing. If False,
+                they are written as C64 Pro Mono private use characters so
+                the listing converts back to an identical PRG.
+        """
+        self.control_codes = control_codes
+        self.literal_chars = LISTING_CHARS if control_codes else RAW_CHARS
+        self.load_addr = None
+
+    def _decode_line(self, body):
+        """
+        Converts the tokenized bytes of one line (without the null terminator)
+        back to text, mirroring the quote/REM state tracking of Bas2Prg.
+        """
+        literal_chars = self.literal_chars
+        parts = []
+        quoted = False
+        rem_mode = False
+        for byte_val in body:
+            if byte_val == QUOTE:
+                quoted = not quoted
+                parts.append('"')
+            elif byte_val >= 0x80 and not (quoted or rem_mode):
+                if byte_val == TOKEN_REM:
+                    rem_mode = True
+                parts.append(TOKEN_TEXT[byte_val])
+            else:
+                parts.append(literal_chars[byte_val])
+        return "".join(parts)
+
+    def iter_lines(self, prg):
+        """
+        Streams (line_number, text) tuples by walking the line link chain.
+
+        The PRG is accessed through a memoryview, so no line body is copied
+        before it is decoded. If a link does not point to the byte after the
+        line's terminator (e.g. a PRG saved from a different start address),
+        the next line is taken from the terminator, the same way LOAD relinks.
+        """
+        data = prg if isinstance(prg, (bytes, bytearray)) else bytes(prg)
+        view = memoryview(data)
+        if len(view) < 2:
+            raise ValueError("PRG too small (must be at least 2 bytes)")
+        self.load_addr = struct.unpack_from('<H', view, 0)[0]
+        pos = 2
+        while pos + 2 <= len(view):
+            link = struct.unpack_from('<H', view, pos)[0]
+            if link == 0:
+                break
+            if pos + 4 > len(view):
+                raise ValueError(f"Truncated line header at offset {pos}")
+            line_num = struct.unpack_from('<H', view, pos + 2)[0]
+            end = data.find(0, pos + 4)
+            if end < 0:
+                raise ValueError(f"Line {line_num} is not terminated")
+            yield line_num, self._decode_line(view[pos + 4:end])
+
+            next_pos = link - self.load_addr + 2
+            if next_pos != end + 1:
+                logger.debug(f"Relinking after line {line_num}: link ${link:04X} does not follow the line")
+                next_pos = end + 1
+            pos = next_pos
+
+    def detokenize(self, prg):
+        """
+        Convert PRG bytes to a BASIC listing.
+        """
+        return "\n".join(f"{line_num}{text}" for line_num, text in self.iter_lines(prg))
+
+
+def verify_roundtrip(prg, **converter_options):
+    """
+    Asserts that convert(detokenize(prg)) == prg.
+
+    The listing is produced in raw mode so control codes survive the round
+    trip. Converter options (e.g. start_addr) are passed to Bas2Prg; the
+    start address defaults to the PRG's load address. Brace macros are off
+    by default, since a string may contain literal {...} text.
+
+    Returns:
+        The detokenized listing.
+
+    Raises:
+        AssertionError: With the first differing offset if the PRGs differ.
+    """
+    data = bytes(prg)
+    detokenizer = Prg2Bas(control_codes=False)
+    listing = detokenizer.detokenize(data)
+    converter_options.setdefault("start_addr", detokenizer.load_addr)
+    converter_options.setdefault("brace_macros", False)
+    rebuilt = bytes(Bas2Prg(**converter_options).convert(listing))
+    if rebuilt != data:
+        offset = next((i for i, (a, b) in enumerate(zip(rebuilt, data)) if a != b), min(len(rebuilt), len(data)))
+        raise AssertionError(
+            f"Round trip mismatch at offset {offset} (original {len(data)} bytes, rebuilt {len(rebuilt)} bytes)")
+    return listing
+
+# -----------------------------------------------------------------------------
+# Command Line Interface
+# -----------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert C64 PRG file to BASIC text.")
+    parser.add_argument('filenames', nargs='*', help="Input PRG filename(s) (stdin if empty)")
+    parser.add_argument('-o', '--output', help="Output filename")
+    parser.add_argument('-r', '--raw', action='store_true', help="Write control codes as C64 Pro Mono characters instead of {macros}")
+    parser.add_argument('-v', '--verify', action='store_true', help="Verify that each PRG survives a PRG->BASIC->PRG round trip")
+
+    args = parser.parse_args()
+
+    if args.verify:
+        failures = 0
+        for filename in args.filenames:
+            with open(filename, 'rb') as f:
+                prg_data = f.read()
+            try:
+                verify_roundtrip(prg_data)
+                print(f"OK    {filename}")
+            except (AssertionError, ValueError) as e:
+                failures += 1
+                print(f"FAIL  {filename}: {e}")
+        sys.exit(1 if failures else 0)
+
+    if args.filenames:
+        try:
+            with open(args.filenames[0], 'rb') as f:
+                prg_data = f.read()
+        except Exception as e:
+            logger.error(f"Error reading input: {e}")
+            sys.exit(3)
+    else:
+        prg_data = sys.stdin.buffer.read()
+
+    try:
+        listing = Prg2Bas(control_codes=not args.raw).detokenize(prg_data)
+    except ValueError as e:
+        logger.error(f"Invalid PRG: {e}")
+        sys.exit(1)
+
+    if args.output:
+        try:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(listing + "\n")
+        except Exception as e:
+            logger.error(f"Unable to create output '{args.output}': {e}")
+            sys.exit(2)
+    else:
+        print(listing)
+
+if __name__ == '__main__':
+    main()
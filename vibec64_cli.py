@@ -76,6 +76,10 @@ vibec64_agent_instructions = f"""
     - Use the WriteC64BasicCode tool to generate syntactically correct code based on the design plan created by DesignGamePlan. Don't specify code in the description, only the design plan.
     - After generating the code, use the SyntaxChecker tool to ensure there are no synAtax errors.
     - If there are syntax errors, correct them using the FixSyntaxErrors tool and re-check them using the SyntaxChecker tool until the code is error-free.
+    - When the code is free of syntax errors, use the RuntimeCheck tool to run it in the headless interpreter, with keys for the GET/INPUT prompts the game starts with. If it reports a runtime error or an infinite loop, fix it with the FixSyntaxErrors tool (pass the reported error as user-reported error) and check again.
+    - To check what the game shows (texts, layout, colours), use the CaptureVirtualScreen tool with the same keys; it runs the game headless and needs no C64 hardware.
+    - Then use the FuzzTest tool to play the game headless with many key sequences. Fix each crash site it reports with the FixSyntaxErrors tool (pass the error and its reproducing keys as user-reported error), confirm the fix with RuntimeCheck and those keys, and fuzz again.
+    - For action games, or when the user finds the game slow, use the ProfileSpeed tool (hold joystick bit 16 for fire if the game waits for it). If the main loop runs fewer than about 10 times per second, use the OptimizeSpeed tool, then check the syntax and the runtime again.
     { "Use the RunC64Program tool to load and run the final C64 BASIC V2.0 program on the connected Commodore 64 hardware." if hw_access_tools.is_kungfuflash_connected() else "" }
     { "If at any point you need to restart the C64 hardware, use the RestartC64 tool." if testing_tools.is_c64keyboard_connected() else "" }
     { "Use the CaptureC64Screen tool to capture the current screen of the C64 and analyze what is displayed, i.e to verify if the program started and looks good." if testing_tools.is_capture_device_connected() else "" }